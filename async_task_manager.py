@@ -5,12 +5,15 @@ Labyrinthia AI - 异步任务管理器
 
 import asyncio
 import logging
+import multiprocessing
 import time
-from typing import Dict, Optional, Set, Callable, Any
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from config import config
 
@@ -66,6 +69,10 @@ class AsyncTaskManager:
         # 线程池管理
         self.llm_executor: Optional[ThreadPoolExecutor] = None
         self.io_executor: Optional[ThreadPoolExecutor] = None
+        # CPU 密集任务（地图生成/校验）专用进程池，由配置开关启用
+        self.cpu_executor: Optional[ProcessPoolExecutor] = None
+        # 进程池未启用时 CPU 密集任务使用的独立线程池，不占用 io_executor 的保存线程
+        self.cpu_thread_executor: Optional[ThreadPoolExecutor] = None
         
         # 并发控制
         self.llm_semaphore: Optional[asyncio.Semaphore] = None
@@ -83,6 +90,21 @@ class AsyncTaskManager:
             for task_type in TaskType
         }
         
+        self.cpu_stats: Dict[str, Any] = {
+            "submitted": 0,
+            "completed": 0,
+            "errors": 0,
+            "pool_restarts": 0,
+            "total_time": 0.0,
+        }
+
+        # 对冲请求统计（按调用方描述分组）
+        self.hedge_stats: Dict[str, Dict[str, Any]] = {}
+
+        # 事件循环延迟采样（实际唤醒时间 - 预期唤醒时间）
+        self.loop_lag_samples: Deque[float] = deque(maxlen=1024)
+        self._loop_lag_task: Optional[asyncio.Task] = None
+
         # 初始化标志
         self._initialized = False
     
@@ -106,10 +128,209 @@ class AsyncTaskManager:
         
         # 创建LLM并发控制信号量
         self.llm_semaphore = asyncio.Semaphore(config.game.max_concurrent_llm_requests)
-        
+
+        # 创建CPU密集任务进程池（地图生成/校验）
+        if config.game.map_generation_process_pool:
+            self.cpu_executor = self._create_cpu_executor()
+        else:
+            self.cpu_thread_executor = ThreadPoolExecutor(
+                max_workers=max(1, config.game.map_generation_process_workers),
+                thread_name_prefix="cpu_worker"
+            )
+
         self._initialized = True
         logger.info("AsyncTaskManager initialized successfully")
     
+    def _create_cpu_executor(self) -> ProcessPoolExecutor:
+        # spawn：子进程不继承父进程的线程与锁状态（fork 在多线程服务里不安全）
+        return ProcessPoolExecutor(
+            max_workers=max(1, config.game.map_generation_process_workers),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    @property
+    def process_pool_enabled(self) -> bool:
+        """CPU 密集任务是否走进程池"""
+        if not self._initialized:
+            self.initialize()
+        return self.cpu_executor is not None
+
+    async def run_cpu_bound(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        在进程池中执行 CPU 密集函数，事件循环在此期间保持响应
+
+        func 必须是模块级函数，参数与返回值必须可 pickle（尽量使用紧凑表示）。
+        进程池未启用时退回 CPU 专用线程池执行（与 io_executor 隔离，地图生成不会占满保存线程），
+        调用方需保证 func 线程安全（例如不依赖全局 random 状态）。
+        进程池崩溃时重建一次并重试。
+        """
+        if not self._initialized:
+            self.initialize()
+
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        self.cpu_stats["submitted"] += 1
+        try:
+            if self.cpu_executor is None:
+                result = await loop.run_in_executor(self.cpu_thread_executor, func, *args)
+            else:
+                try:
+                    result = await loop.run_in_executor(self.cpu_executor, func, *args)
+                except BrokenProcessPool:
+                    logger.warning("CPU process pool broken, restarting and retrying once")
+                    self.cpu_stats["pool_restarts"] += 1
+                    self.cpu_executor.shutdown(wait=False)
+                    self.cpu_executor = self._create_cpu_executor()
+                    result = await loop.run_in_executor(self.cpu_executor, func, *args)
+        except Exception:
+            self.cpu_stats["errors"] += 1
+            raise
+
+        self.cpu_stats["completed"] += 1
+        self.cpu_stats["total_time"] += time.perf_counter() - start_time
+        return result
+
+    async def run_hedged(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        hedge: Callable[[], Awaitable[Any]],
+        delay: float,
+        *,
+        validate: Optional[Callable[[Any], None]] = None,
+        labels: Tuple[str, str] = ("primary", "hedge"),
+        description: str = "hedged",
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        对冲执行：先发出 primary，超过 delay 秒仍未返回（或 primary 已失败）时并发发出 hedge，
+        取先到达的有效结果并取消另一个。
+
+        validate 对结果做校验，抛异常即视为无效结果（继续等待另一个）。
+        两者都失败时抛出最后一个异常。返回 (结果, 对冲信息)。
+        """
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        info: Dict[str, Any] = {
+            "hedged": False,
+            "trigger": "",
+            "winner": "",
+            "winner_is_hedge": False,
+            "latency_ms": 0.0,
+            "errors": {},
+        }
+        pending: Dict[asyncio.Task, str] = {asyncio.create_task(primary()): labels[0]}
+        hedge_started = False
+        last_error: Optional[BaseException] = None
+
+        def _launch_hedge(trigger: str) -> None:
+            nonlocal hedge_started
+            hedge_started = True
+            info["hedged"] = True
+            info["trigger"] = trigger
+            pending[asyncio.create_task(hedge())] = labels[1]
+
+        try:
+            while pending:
+                timeout = None if hedge_started else max(0.0, started_at + delay - loop.time())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    _launch_hedge("delay")
+                    continue
+                for task in done:
+                    label = pending.pop(task)
+                    try:
+                        result = task.result()
+                        if validate is not None:
+                            validate(result)
+                    except Exception as exc:
+                        last_error = exc
+                        info["errors"][label] = str(exc)
+                        continue
+                    info["winner"] = label
+                    info["winner_is_hedge"] = label == labels[1]
+                    info["latency_ms"] = round((loop.time() - started_at) * 1000, 2)
+                    self._record_hedge(description, info)
+                    return result, info
+                if not pending and not hedge_started:
+                    _launch_hedge("primary_failed")
+        finally:
+            # 取消落败的一方；不等待其结束，避免拖慢胜者返回
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        info["latency_ms"] = round((loop.time() - started_at) * 1000, 2)
+        self._record_hedge(description, info)
+        raise last_error if last_error is not None else RuntimeError(f"{description}: no result")
+
+    def _record_hedge(self, description: str, info: Dict[str, Any]) -> None:
+        stats = self.hedge_stats.setdefault(
+            description, {"runs": 0, "hedged": 0, "hedge_wins": 0, "failures": 0, "wins": {}}
+        )
+        stats["runs"] += 1
+        if info.get("hedged"):
+            stats["hedged"] += 1
+        if info.get("winner_is_hedge"):
+            stats["hedge_wins"] += 1
+        winner = info.get("winner")
+        if winner:
+            stats["wins"][winner] = stats["wins"].get(winner, 0) + 1
+        else:
+            stats["failures"] += 1
+
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """对冲请求统计：hedge_win_rate 为发出对冲的请求中由对冲方胜出的比例"""
+        return {
+            description: {
+                **stats,
+                "wins": dict(stats["wins"]),
+                "hedge_win_rate": round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0,
+            }
+            for description, stats in self.hedge_stats.items()
+        }
+
+    def is_llm_saturated(self) -> bool:
+        """LLM 并发槽位是否已全部占用（后台预取类任务据此让路）"""
+        return self.llm_semaphore is not None and self.llm_semaphore.locked()
+
+    def start_loop_lag_monitor(self, interval: Optional[float] = None) -> None:
+        """启动事件循环延迟采样（需在事件循环内调用）"""
+        if self._loop_lag_task is not None and not self._loop_lag_task.done():
+            return
+        sample_interval = interval if interval is not None else config.game.loop_lag_sample_interval
+        if sample_interval <= 0:
+            return
+        self._loop_lag_task = asyncio.create_task(self._sample_loop_lag(sample_interval))
+
+    async def _sample_loop_lag(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag_samples.append(max(0.0, loop.time() - expected))
+
+    def get_loop_lag_stats(self) -> Dict[str, Any]:
+        """事件循环延迟统计（毫秒）"""
+        samples = sorted(self.loop_lag_samples)
+        if not samples:
+            return {"samples": 0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+        p95_index = min(len(samples) - 1, int(len(samples) * 0.95))
+        return {
+            "samples": len(samples),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p95_ms": round(samples[p95_index] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+            "last_ms": round(self.loop_lag_samples[-1] * 1000, 2),
+        }
+
+    def get_cpu_stats(self) -> Dict[str, Any]:
+        """CPU 密集任务执行统计"""
+        completed = self.cpu_stats["completed"]
+        return {
+            "process_pool": self.cpu_executor is not None,
+            **self.cpu_stats,
+            "avg_time": round(self.cpu_stats["total_time"] / completed, 4) if completed else 0.0,
+        }
+
     def create_task(
         self,
         coro,
@@ -294,6 +515,10 @@ class AsyncTaskManager:
         
         # 取消所有活跃任务
         await self.cancel_all_tasks(wait=True)
+
+        if self._loop_lag_task is not None:
+            self._loop_lag_task.cancel()
+            self._loop_lag_task = None
         
         # 关闭线程池
         if self.llm_executor:
@@ -303,6 +528,16 @@ class AsyncTaskManager:
         if self.io_executor:
             self.io_executor.shutdown(wait=True)
             logger.info("IO executor shutdown complete")
+
+        if self.cpu_executor:
+            self.cpu_executor.shutdown(wait=True)
+            self.cpu_executor = None
+            logger.info("CPU process pool shutdown complete")
+
+        if self.cpu_thread_executor:
+            self.cpu_thread_executor.shutdown(wait=True)
+            self.cpu_thread_executor = None
+            logger.info("CPU thread executor shutdown complete")
         
         # 打印统计信息
         if config.debug.show_performance_metrics:
@@ -0,0 +1,333 @@
+"""地图生成基准与回归检查
+
+覆盖两条生成链路，全部离线运行（不依赖 LLM 或网络）：
+- local：LocalMapProvider.generate_map
+- blueprint：ContentGenerator.generate_dungeon_map 的蓝图落地部分，LLM 由桩函数代替，
+  按场景返回下方录制好的蓝图与地图信息
+
+场景矩阵 = 尺寸 × 层数 × 主题 × 生成契约。每个场景用固定种子 0..runs-1 各跑一次
+（地图缓存在基准期间关闭），输出 p50/p95 延迟、tiles/sec、峰值内存（tracemalloc，单独一轮）
+以及校验修复率：
+- local：需要可达性修复的比例（unreachable_targets_before > 0）与修复后仍不可达的比例
+- blueprint：蓝图需修正 / 走廊补连的比例、回退到稳定算法的比例、可达性证明失败的比例
+
+用法：
+    python bench_map_generation.py                      # 跑基准并与基线对比，回归时返回 1
+    python bench_map_generation.py --update-baseline    # 重写基线
+    python bench_map_generation.py --quick --chain local
+
+基线默认写在 bench_map_generation_baseline.json；延迟与机器相关，换机器后请先重写基线。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import config
+from content_generator import content_generator
+from data_models import GameMap
+from llm_service import llm_service
+from local_map_provider import local_map_provider
+
+BASELINE_PATH = Path(__file__).with_name("bench_map_generation_baseline.json")
+BASELINE_VERSION = 1
+
+SIZES: List[Tuple[int, int]] = [(20, 20), (40, 40), (60, 60)]
+THEMES: List[str] = ["normal", "cave", "magic"]
+QUEST_TYPES: Dict[str, str] = {"normal": "exploration", "cave": "rescue", "magic": "boss_fight"}
+CONTRACTS: Dict[str, Optional[Dict[str, Any]]] = {
+    "default": None,
+    "strict": {
+        "safety": {"trap_density_cap": 0.1},
+        "blueprint": {"max_nodes": 8, "max_edges": 16},
+    },
+}
+
+# 录制的 LLM 蓝图（与线上 schema 一致，按主题选用）
+RECORDED_BLUEPRINTS: Dict[str, Dict[str, Any]] = {
+    "normal": {
+        "room_nodes": [
+            {"id": "entry", "role": "entrance", "size": "small", "placement_policy": "edge"},
+            {"id": "hall", "role": "normal", "size": "large", "placement_policy": "center",
+             "event_intents": ["story"]},
+            {"id": "store", "role": "treasure", "size": "small", "placement_policy": "branch",
+             "event_intents": ["treasure"]},
+            {"id": "shrine", "role": "special", "size": "medium", "event_intents": ["mystery"]},
+            {"id": "exit", "role": "exit", "size": "small", "placement_policy": "edge"},
+        ],
+        "corridor_edges": [
+            {"from": "entry", "to": "hall", "kind": "main"},
+            {"from": "hall", "to": "store", "kind": "branch"},
+            {"from": "hall", "to": "shrine", "kind": "branch"},
+            {"from": "shrine", "to": "exit", "kind": "main"},
+        ],
+        "key_path": ["entry", "hall", "shrine", "exit"],
+    },
+    "cave": {
+        "room_nodes": [
+            {"id": "mouth", "role": "entrance", "size": "small"},
+            {"id": "tunnel", "role": "normal", "size": "medium", "monster_intents": {"difficulty": "easy", "count": 2}},
+            {"id": "grotto", "role": "special", "size": "medium", "event_intents": ["trap"]},
+            {"id": "camp", "role": "normal", "size": "small"},
+            {"id": "den", "role": "treasure", "size": "small"},
+            {"id": "exit", "role": "exit", "size": "small"},
+        ],
+        "corridor_edges": [
+            {"from": "mouth", "to": "tunnel"},
+            {"from": "tunnel", "to": "grotto"},
+            {"from": "tunnel", "to": "camp"},
+            {"from": "camp", "to": "den"},
+            {"from": "grotto", "to": "exit", "risk_level": "high"},
+        ],
+        "key_path": ["mouth", "tunnel", "grotto", "exit"],
+    },
+    "magic": {
+        "room_nodes": [
+            {"id": "gate", "role": "entrance", "size": "small"},
+            {"id": "library", "role": "normal", "size": "large", "event_intents": ["mystery", "story"]},
+            {"id": "vault", "role": "treasure", "size": "small"},
+            {"id": "altar", "role": "special", "size": "medium"},
+            {"id": "sanctum", "role": "boss", "size": "large", "monster_intents": {"difficulty": "boss", "count": 1}},
+        ],
+        "corridor_edges": [
+            {"from": "gate", "to": "library"},
+            {"from": "library", "to": "vault"},
+            {"from": "library", "to": "altar"},
+            {"from": "altar", "to": "sanctum", "locked": True},
+        ],
+        "key_path": ["gate", "library", "altar", "sanctum"],
+    },
+}
+
+
+def _quest_context(theme: str, depth: int, contract: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    context: Dict[str, Any] = {
+        "quest_type": QUEST_TYPES.get(theme, "exploration"),
+        "title": f"bench::{theme}",
+        "description": f"基准场景 {theme}",
+        "map_themes": [theme],
+        "special_events": [
+            {"id": f"bench-{theme}-main", "name": "关键目标", "event_type": "story",
+             "is_mandatory": True, "location_hint": f"第{depth}层"},
+            {"id": f"bench-{theme}-side", "name": "支线", "event_type": "mystery", "location_hint": f"第{depth}层"},
+        ],
+        "special_monsters": [{"name": "守卫", "location_hint": f"第{depth}层"}],
+    }
+    if contract is not None:
+        context["generation_contract"] = contract
+    return context
+
+
+def _scenarios(quick: bool) -> List[Dict[str, Any]]:
+    sizes = SIZES[:2] if quick else SIZES
+    depths = [1, config.game.max_quest_floors]
+    scenarios = []
+    for width, height in sizes:
+        for depth in depths:
+            for theme in THEMES:
+                for contract_name, contract in CONTRACTS.items():
+                    scenarios.append(
+                        {
+                            "name": f"{width}x{height}/d{depth}/{theme}/{contract_name}",
+                            "width": width,
+                            "height": height,
+                            "depth": depth,
+                            "theme": theme,
+                            "quest_context": _quest_context(theme, depth, contract),
+                        }
+                    )
+    return scenarios
+
+
+# ---------------------------------------------------------------------- runners
+
+def _run_local(scenario: Dict[str, Any], seed: int) -> GameMap:
+    game_map, _ = local_map_provider.generate_map(
+        scenario["width"], scenario["height"], scenario["depth"], scenario["theme"],
+        scenario["quest_context"], seed=seed,
+    )
+    return game_map
+
+
+def _install_llm_stub(theme: str) -> None:
+    async def _recorded_llm_json(_prompt: str, schema: Optional[Dict[str, Any]] = None, **_kwargs: Any):
+        if schema is not None:
+            return json.loads(json.dumps(RECORDED_BLUEPRINTS[theme]))
+        return {"name": f"基准-{theme}", "description": "录制的地图信息", "floor_theme": theme}
+
+    llm_service._async_generate_json = _recorded_llm_json
+
+
+def _run_blueprint(scenario: Dict[str, Any], seed: int) -> GameMap:
+    _install_llm_stub(scenario["theme"])
+    return asyncio.run(
+        content_generator.generate_dungeon_map(
+            scenario["width"], scenario["height"], scenario["depth"], scenario["theme"],
+            scenario["quest_context"], seed=seed,
+        )
+    )
+
+
+def _local_outcome(game_map: GameMap) -> Dict[str, bool]:
+    report = game_map.generation_metadata.get("local_validation", {})
+    return {
+        "repaired": int(report.get("unreachable_targets_before", 0) or 0) > 0,
+        "failed": not bool(report.get("connectivity_ok", False)),
+    }
+
+
+def _blueprint_outcome(game_map: GameMap) -> Dict[str, bool]:
+    meta = game_map.generation_metadata
+    blueprint_report = meta.get("blueprint_report") or {}
+    corridor_report = meta.get("corridor_report") or {}
+    proof = meta.get("reachability_proof") or {}
+    return {
+        "repaired": bool(blueprint_report.get("fixes")) or bool(corridor_report.get("repairs")),
+        "fallback": not bool(meta.get("blueprint_used", False)),
+        "failed": not bool(proof.get("proof_ok", False)),
+    }
+
+
+CHAINS: Dict[str, Tuple[Callable[[Dict[str, Any], int], GameMap], Callable[[GameMap], Dict[str, bool]]]] = {
+    "local": (_run_local, _local_outcome),
+    "blueprint": (_run_blueprint, _blueprint_outcome),
+}
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _measure(chain: str, scenario: Dict[str, Any], runs: int) -> Dict[str, Any]:
+    runner, outcome_of = CHAINS[chain]
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+    for seed in range(runs):
+        # 先回收上一轮的瓦片对象，避免分代 GC 的停顿落在计时区间里
+        gc.collect()
+        t0 = time.perf_counter()
+        game_map = runner(scenario, seed)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        for key, hit in outcome_of(game_map).items():
+            outcomes[key] = outcomes.get(key, 0) + int(hit)
+
+    tracemalloc.start()
+    runner(scenario, 0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tiles = scenario["width"] * scenario["height"]
+    p50 = statistics.median(latencies)
+    return {
+        "runs": runs,
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "tiles_per_sec": round(tiles / (p50 / 1000.0), 1) if p50 > 0 else 0.0,
+        "peak_kb": round(peak / 1024.0, 1),
+        **{f"{key}_rate": round(count / float(runs), 4) for key, count in sorted(outcomes.items())},
+    }
+
+
+# ---------------------------------------------------------------------- baseline
+
+def _compare(
+    results: Dict[str, Dict[str, Dict[str, Any]]],
+    baseline: Dict[str, Any],
+    latency_tolerance: float,
+    rate_tolerance: float,
+) -> List[str]:
+    regressions: List[str] = []
+    base_results = baseline.get("results", {})
+    for chain, scenarios in results.items():
+        for name, current in scenarios.items():
+            base = base_results.get(chain, {}).get(name)
+            if not base:
+                continue
+            if current["p95_ms"] > base["p95_ms"] * (1.0 + latency_tolerance):
+                regressions.append(f"{chain} {name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+            for key, value in current.items():
+                if key.endswith("_rate") and value > float(base.get(key, 0.0)) + rate_tolerance:
+                    regressions.append(f"{chain} {name}: {key} {base.get(key, 0.0)} -> {value}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Map generation benchmark / regression check")
+    parser.add_argument("--chain", choices=["all", *CHAINS], default="all")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--quick", action="store_true", help="只跑较小尺寸，runs 降为 5")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--latency-tolerance", type=float, default=0.30, help="p95 允许的相对增幅")
+    parser.add_argument("--rate-tolerance", type=float, default=0.05, help="修复/失败率允许的绝对增幅")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    config.game.map_cache_enabled = False
+    runs = 5 if args.quick else max(1, args.runs)
+    chains = list(CHAINS) if args.chain == "all" else [args.chain]
+    original_llm = llm_service._async_generate_json
+
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    try:
+        for chain in chains:
+            print(f"\n===== {chain} =====")
+            print(f"{'scenario':<28} | {'p50 ms':>8} | {'p95 ms':>8} | {'tiles/s':>10} | {'peak KB':>8} | rates")
+            print("-" * 100)
+            results[chain] = {}
+            for scenario in _scenarios(args.quick):
+                row = _measure(chain, scenario, runs)
+                results[chain][scenario["name"]] = row
+                rates = " ".join(f"{k[:-5]}={v:.2f}" for k, v in row.items() if k.endswith("_rate"))
+                print(
+                    f"{scenario['name']:<28} | {row['p50_ms']:>8.2f} | {row['p95_ms']:>8.2f} | "
+                    f"{row['tiles_per_sec']:>10.0f} | {row['peak_kb']:>8.1f} | {rates}"
+                )
+    finally:
+        llm_service._async_generate_json = original_llm
+        logging.disable(logging.NOTSET)
+
+    if args.update_baseline:
+        payload = {
+            "version": BASELINE_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "runs": runs,
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(payload, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("version") != BASELINE_VERSION:
+        print(f"\nBaseline version mismatch ({baseline.get('version')} != {BASELINE_VERSION}); skipping comparison.")
+        return 0
+
+    regressions = _compare(results, baseline, args.latency_tolerance, args.rate_tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) vs {args.baseline}:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\nNo regressions vs {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
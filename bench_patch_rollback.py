@@ -0,0 +1,125 @@
+"""Patch 事务回滚基准
+
+对比两种补丁事务实现在 20x20 与 50x50 地图上的开销：
+- deepcopy 快照：每个补丁前深拷贝 tiles/monsters/quests/pending_events/generation_metrics（旧实现）
+- 逆操作日志：PatchJournal 只保存补丁触碰对象的原值（当前实现）
+
+每种地图跑同一组 6 个补丁（加怪/改怪/删怪/加事件/任务绑定），分别测量
+"记录 + 回滚" 的总耗时，输出 ms 与加速比。纯本地计算，不依赖 LLM 或网络。
+"""
+
+from __future__ import annotations
+
+import copy
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from data_models import GameMap, GameState, MapTile, Monster, TerrainType
+from game_state_modifier import game_state_modifier
+from patch_journal import PatchJournal
+
+MAP_SIZES = [(20, 20), (50, 50)]
+MONSTER_COUNT = 12
+RUNS = 30
+
+
+def _build_state(width: int, height: int) -> GameState:
+    game_state = GameState()
+    game_map = GameMap(width=width, height=height, depth=1)
+    for x in range(width):
+        for y in range(height):
+            terrain = TerrainType.WALL if x in {0, width - 1} or y in {0, height - 1} else TerrainType.FLOOR
+            game_map.tiles[(x, y)] = MapTile(x=x, y=y, terrain=terrain)
+    game_state.current_map = game_map
+    game_state.player.position = (1, 1)
+    for idx in range(MONSTER_COUNT):
+        monster = Monster(name=f"怪物{idx}")
+        monster.position = (2 + idx, height // 2)
+        game_state.monsters.append(monster)
+    game_map.rebuild_entity_index(game_state.player, game_state.monsters)
+    return game_state
+
+
+def _patches(height: int) -> List[Dict[str, Any]]:
+    row = height // 2
+    return [
+        {"id": "m-add", "op": "add", "target": "monster", "tile": "3,3", "risk_level": "low",
+         "payload": {"name": "新怪", "stats": {"hp": 5, "max_hp": 5}}},
+        {"id": "m-update", "op": "update", "target": "monster", "tile": f"2,{row}", "risk_level": "low",
+         "payload": {"name": "改名", "stats": {"hp": 1}}},
+        {"id": "m-remove", "op": "remove", "target": "monster", "tile": f"3,{row}", "risk_level": "low"},
+        {"id": "e-add", "op": "update", "target": "event", "tile": "4,4", "risk_level": "low",
+         "payload": {"event_type": "story", "event_data": {"id": "bench"}}},
+        {"id": "t-items", "op": "update", "target": "tile", "tile": "5,5", "risk_level": "low",
+         "payload": {"items": [{"name": "药水", "item_type": "consumable"}]}},
+        {"id": "bind", "op": "add", "target": "quest_binding", "risk_level": "low",
+         "payload": {"quest_monster_id": "qm-bench"}},
+    ]
+
+
+def _make_snapshot(game_state: GameState) -> Dict[str, Any]:
+    return {
+        "tiles": copy.deepcopy(game_state.current_map.tiles),
+        "monsters": copy.deepcopy(game_state.monsters),
+        "quests": copy.deepcopy(game_state.quests),
+        "pending_events": copy.deepcopy(game_state.pending_events),
+        "generation_metrics": copy.deepcopy(game_state.generation_metrics),
+    }
+
+
+def _restore_snapshot(game_state: GameState, snapshot: Dict[str, Any]) -> None:
+    game_state.current_map.tiles = snapshot["tiles"]
+    game_state.monsters = snapshot["monsters"]
+    game_state.quests = snapshot["quests"]
+    game_state.pending_events = snapshot["pending_events"]
+    game_state.generation_metrics = snapshot["generation_metrics"]
+    game_state.current_map.rebuild_entity_index(game_state.player, game_state.monsters)
+
+
+def _run_deepcopy(game_state: GameState, patches: List[Dict[str, Any]]) -> None:
+    snapshots = []
+    for patch in patches:
+        snapshots.append(_make_snapshot(game_state))
+        game_state_modifier._apply_single_patch(game_state, patch, "bench")
+    _restore_snapshot(game_state, snapshots[0])
+
+
+def _run_journal(game_state: GameState, patches: List[Dict[str, Any]]) -> None:
+    journals = []
+    for patch in patches:
+        journal = PatchJournal(game_state, label=patch["id"])
+        journals.append(journal)
+        game_state_modifier._patch_journal = journal
+        try:
+            game_state_modifier._apply_single_patch(game_state, patch, "bench")
+        finally:
+            game_state_modifier._patch_journal = None
+    game_state_modifier._rollback_patch_journals(journals)
+
+
+def _measure(runner: Callable[[GameState, List[Dict[str, Any]]], None], width: int, height: int) -> List[float]:
+    samples: List[float] = []
+    patches = _patches(height)
+    for _ in range(RUNS):
+        game_state = _build_state(width, height)
+        t0 = time.perf_counter()
+        runner(game_state, patches)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+        assert len(game_state.monsters) == MONSTER_COUNT, "rollback did not restore monsters"
+    return samples
+
+
+def main() -> int:
+    print(f"{'map':>7} | {'deepcopy p50 ms':>15} | {'journal p50 ms':>14} | {'speedup':>7}")
+    print("-" * 54)
+    for width, height in MAP_SIZES:
+        deep = statistics.median(_measure(_run_deepcopy, width, height))
+        journal = statistics.median(_measure(_run_journal, width, height))
+        speedup = deep / journal if journal > 0 else float("inf")
+        print(f"{width:>3}x{height:<3} | {deep:>15.2f} | {journal:>14.2f} | {speedup:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,21 +1,47 @@
-"""TTS Provider 真实性能基准
+"""TTS 基准
 
-用相同的 3 段叙事文本（短/中/长）分别跑 mimo_openai_compatible 与 qwen_gradio
-两个 provider，每段 2 次合成（取最小 latency 避免网络抖动），输出同维度对比表。
+两种模式：
 
-注意：
-- 直接读 .env 中的真实 TTS_* 配置；如果 mimo 那条链路在你的环境里没配 key，
-  脚本会跳过 mimo 段并继续跑 qwen 段。
-- 不会打印任何 api_key 内容。
-- 输出仅包含耗时、字节数、ms/char 等可发布指标。
+offline（默认）：本机起一个模拟 MiMo chat/completions 协议的替身 TTS 服务，
+延迟 = base_ms + per_char_ms × 字数 ± jitter_ms（按 (seed, 文本) 确定），音频为
+bytes_per_char × 字数 的 PCM WAV；服务端同时最多处理 server_slots 个请求（模拟上游容量）。
+请求走真实链路：TTSGateway.get_provider → MimoTTSProvider（异步 httpx）→
+main._synthesize_tts_bytes / 内容寻址缓存 / 分段并行 / 流式管线。不消耗任何 provider 配额。
+
+- scaling：关闭缓存与分段，按不同客户端并发跑唯一文本，输出吞吐（req/s、chars/s）与 p50/p95 延迟
+- cache：开启缓存，从有限文本池中按幂律分布重复抽取，输出命中率、合并数、命中/未命中延迟
+- ttfb：长文本在整段合成 / 分段并行 / 流式三种方式下的首字节时间与总耗时
+
+live（--live）：用相同的 3 段叙事文本（短/中/长）分别跑 mimo_openai_compatible 与
+qwen_gradio 两个真实 provider，每段 2 次合成（取最小 latency 避免网络抖动），输出同维度对比表。
+直接读 .env 中的真实 TTS_* 配置；mimo 没配 key 时跳过 mimo 段；不会打印任何 api_key 内容。
+
+用法：
+    python bench_tts_providers.py                               # 全部离线基准
+    python bench_tts_providers.py --suite cache --requests 200 --output tts_bench.json
+    python bench_tts_providers.py --concurrency 1,4,16 --server-slots 4 --jitter-ms 80
+    python bench_tts_providers.py --live
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import statistics
+import struct
 import sys
+import tempfile
+import threading
 import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -24,6 +50,7 @@ load_dotenv()
 import config
 import tts_gateway
 import qwen_tts_adapter  # noqa: F401  注册 qwen_gradio
+from tts_cache import TTSCache
 
 
 TEXTS: List[Tuple[str, str]] = [
@@ -166,12 +193,427 @@ def _format_compare(
         print(f"  {label:<14} mimo={m_mc:<10} qwen={q_mc:<10}")
 
 
-def main() -> int:
+def run_live() -> int:
     mimo_results = _bench_provider("mimo_openai_compatible", runs=2)
     qwen_results = _bench_provider("qwen_gradio", runs=2)
     _format_compare(mimo_results, qwen_results)
     return 0
 
 
+# ---------------------------------------------------------------------- offline
+
+SUITES = ("scaling", "cache", "ttfb")
+STAND_IN_MODEL = "stand-in-tts"
+STAND_IN_SAMPLE_RATE = 16000
+
+# 离线语料：叙事片段按序号组合出唯一文本，长文本用于分段 / 流式
+CORPUS_PIECES: List[str] = [text for _, text in TEXTS] + [
+    "潮湿的石壁上挂着锈迹斑斑的锁链，滴水声在空旷的大厅里回荡。",
+    "一只地精从阴影中窜出，挥舞着豁口的短刀向你扑来！",
+    "宝箱的铜扣已经松动，里面隐约传来硬币碰撞的轻响。",
+    "你在祭坛前停下脚步，符文的光芒随着你的呼吸明灭不定。",
+]
+
+
+@dataclass
+class StandInModel:
+    """替身 TTS 的确定性延迟 / 体积模型"""
+
+    base_ms: float = 120.0
+    per_char_ms: float = 4.0
+    jitter_ms: float = 30.0
+    bytes_per_char: int = 3200
+    server_slots: int = 8
+    seed: int = 0
+
+    def latency_s(self, text: str) -> float:
+        rng = random.Random(f"{self.seed}:{text}")
+        jitter = rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return max(0.0, self.base_ms + self.per_char_ms * len(text) + jitter) / 1000.0
+
+    def render(self, text: str) -> bytes:
+        fmt = struct.pack("<HHIIHH", 1, 1, STAND_IN_SAMPLE_RATE, STAND_IN_SAMPLE_RATE * 2, 2, 16)
+        size = max(2, self.bytes_per_char * len(text)) & ~1
+        pcm = bytes(size)
+        return (
+            b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + size) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"data" + struct.pack("<I", size) + pcm
+        )
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """只实现 MiMo TTS 用到的 POST {base}/chat/completions"""
+
+    server: "StandInTTSServer"
+
+    def do_POST(self) -> None:  # noqa: N802 - BaseHTTPRequestHandler 约定
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            text = next(
+                str(message.get("content") or "")
+                for message in reversed(payload.get("messages") or [])
+                if message.get("role") == "assistant"
+            )
+        except (ValueError, StopIteration):
+            self.send_error(400, "bad request")
+            return
+
+        self.server.serve_one(text)
+        audio = self.server.model.render(text)
+        body = json.dumps({
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": "",
+                    "audio": {"data": base64.b64encode(audio).decode("ascii")},
+                },
+            }],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        return
+
+
+class StandInTTSServer(ThreadingHTTPServer):
+    """本机替身 TTS 服务（后台线程运行），统计请求数与服务端峰值并发"""
+
+    daemon_threads = True
+
+    def __init__(self, model: StandInModel):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.model = model
+        self._slots = threading.BoundedSemaphore(max(1, model.server_slots))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def serve_one(self, text: str) -> None:
+        with self._slots:
+            with self._lock:
+                self.requests += 1
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+            try:
+                time.sleep(self.model.latency_s(text))
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.peak_active = self.active
+
+    def __enter__(self) -> "StandInTTSServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stand-in-tts", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 2) if samples else 0.0,
+        "p95_ms": round(_percentile(samples, 0.95) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+def _unique_text(index: int) -> str:
+    return f"{CORPUS_PIECES[index % len(CORPUS_PIECES)]}（第{index + 1}段）"
+
+
+def _long_text(index: int, pieces: int = 5) -> str:
+    return "".join(CORPUS_PIECES[(index + offset) % len(CORPUS_PIECES)] for offset in range(pieces)) + f"（{index + 1}）"
+
+
+class OfflineBench:
+    """把 config / 缓存切到替身服务，跑离线基准；退出时还原"""
+
+    def __init__(self, server: StandInTTSServer, cache_dir: str):
+        import main as app_main
+
+        self.app = app_main
+        self.server = server
+        self.cache_dir = cache_dir
+        self._saved_tts: Dict[str, Any] = {}
+        self._saved_cache = None
+        self._saved_use_proxy = None
+
+    def __enter__(self) -> "OfflineBench":
+        tts = config.config.tts
+        overrides = {
+            "enabled": True,
+            "provider": "mimo_openai_compatible",
+            "base_url": self.server.base_url,
+            "api_key": "offline-bench",
+            "model_name": STAND_IN_MODEL,
+            "default_voice": "mimo_default",
+            "output_format": "wav",
+        }
+        for key, value in overrides.items():
+            self._saved_tts[key] = getattr(tts, key)
+            setattr(tts, key, value)
+        for key in ("cache_enabled", "cache_persist", "segment_min_chars", "segment_max_concurrency", "max_concurrency"):
+            self._saved_tts[key] = getattr(tts, key)
+        self._saved_use_proxy = config.config.llm.use_proxy
+        config.config.llm.use_proxy = False
+        self._saved_cache = self.app.tts_cache
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        for key, value in self._saved_tts.items():
+            setattr(config.config.tts, key, value)
+        config.config.llm.use_proxy = self._saved_use_proxy
+        self.app.tts_cache = self._saved_cache
+
+    def _configure(self, *, cache: bool, segment_min_chars: int = 0, segment_concurrency: int = 3) -> None:
+        tts = config.config.tts
+        tts.cache_enabled = cache
+        tts.cache_persist = False
+        tts.segment_min_chars = segment_min_chars
+        tts.segment_max_concurrency = segment_concurrency
+        self.app.tts_cache = TTSCache(cache_dir=self.cache_dir)
+        self.server.reset_stats()
+
+    async def _drive(self, texts: List[str], concurrency: int, call) -> Tuple[float, List[Any]]:
+        """以 concurrency 个并发客户端依次提交 texts，返回 (总耗时, 各请求结果)"""
+        from openai_api_tool import close_async_http_clients
+
+        gate = asyncio.Semaphore(max(1, concurrency))
+
+        async def _one(text: str) -> Any:
+            async with gate:
+                return await call(text)
+
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(_one(text) for text in texts))
+        finally:
+            await close_async_http_clients()
+        return time.perf_counter() - started, list(results)
+
+    async def _timed_bytes(self, text: str) -> Tuple[float, int]:
+        started = time.perf_counter()
+        audio, _ = await self.app._synthesize_tts_bytes(text)
+        return time.perf_counter() - started, len(audio)
+
+    async def _timed_entry(self, text: str) -> Tuple[float, str]:
+        started = time.perf_counter()
+        _, state = await self.app._synthesize_tts_entry(text)
+        return time.perf_counter() - started, state
+
+    async def _timed_stream(self, text: str) -> Tuple[float, float, int]:
+        job = self.app._prepare_tts_job(text)
+        started = time.perf_counter()
+        first = None
+        total_bytes = 0
+        async for chunk, _ in self.app._iter_tts_stream(job):
+            if first is None:
+                first = time.perf_counter() - started
+            total_bytes += len(chunk)
+        return first or 0.0, time.perf_counter() - started, total_bytes
+
+    # ------------------------------------------------------------------ suites
+
+    def run_scaling(self, levels: List[int], requests: int) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        texts = [_unique_text(index) for index in range(requests)]
+        chars = sum(len(text) for text in texts)
+        for level in levels:
+            self._configure(cache=False)
+            wall, results = asyncio.run(self._drive(texts, level, self._timed_bytes))
+            latencies = [latency for latency, _ in results]
+            rows.append({
+                "concurrency": level,
+                "requests": requests,
+                "wall_s": round(wall, 4),
+                "req_per_s": round(requests / wall, 2) if wall else 0.0,
+                "chars_per_s": round(chars / wall, 1) if wall else 0.0,
+                "audio_mb": round(sum(size for _, size in results) / 1024 / 1024, 2),
+                "server_peak_concurrency": self.server.peak_active,
+                **_latency_summary(latencies),
+            })
+        return rows
+
+    def run_cache(self, requests: int, distinct: int, concurrency: int, seed: int) -> Dict[str, Any]:
+        rng = random.Random(seed)
+        pool = [_unique_text(index) for index in range(max(1, distinct))]
+        # 幂律分布：少数热门文本（开场白 / 常见提示）被反复朗读
+        weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+        texts = rng.choices(pool, weights=weights, k=requests)
+
+        self._configure(cache=True)
+        wall, results = asyncio.run(self._drive(texts, concurrency, self._timed_entry))
+        by_state: Dict[str, List[float]] = {}
+        for latency, state in results:
+            by_state.setdefault(state, []).append(latency)
+        stats = self.app.tts_cache.get_stats()
+        return {
+            "requests": requests,
+            "distinct_texts": len(set(texts)),
+            "concurrency": concurrency,
+            "wall_s": round(wall, 4),
+            "req_per_s": round(requests / wall, 2) if wall else 0.0,
+            "upstream_requests": self.server.requests,
+            "hit_rate": stats.get("hit_rate", 0.0),
+            "states": {state: len(samples) for state, samples in sorted(by_state.items())},
+            "latency_by_state": {state: _latency_summary(samples) for state, samples in sorted(by_state.items())},
+        }
+
+    def run_ttfb(self, samples: int, segment_min_chars: int, segment_concurrency: int) -> Dict[str, Any]:
+        texts = [_long_text(index) for index in range(samples)]
+        modes: Dict[str, Dict[str, Any]] = {}
+
+        self._configure(cache=False)
+        _, full = asyncio.run(self._drive(texts, 1, self._timed_bytes))
+        modes["full"] = {"ttfb": _latency_summary([t for t, _ in full]), "total": _latency_summary([t for t, _ in full])}
+
+        self._configure(cache=False, segment_min_chars=segment_min_chars, segment_concurrency=segment_concurrency)
+        _, segmented = asyncio.run(self._drive(texts, 1, self._timed_bytes))
+        modes["segmented"] = {
+            "ttfb": _latency_summary([t for t, _ in segmented]),
+            "total": _latency_summary([t for t, _ in segmented]),
+        }
+
+        self._configure(cache=False, segment_min_chars=segment_min_chars, segment_concurrency=segment_concurrency)
+        _, streamed = asyncio.run(self._drive(texts, 1, self._timed_stream))
+        modes["stream"] = {
+            "ttfb": _latency_summary([first for first, _, _ in streamed]),
+            "total": _latency_summary([total for _, total, _ in streamed]),
+        }
+        return {
+            "samples": samples,
+            "avg_chars": round(sum(len(text) for text in texts) / len(texts), 1) if texts else 0.0,
+            "segment_min_chars": segment_min_chars,
+            "segment_concurrency": segment_concurrency,
+            "modes": modes,
+        }
+
+
+def _print_offline(results: Dict[str, Any]) -> None:
+    if "scaling" in results:
+        print("\n===== scaling（缓存 / 分段关闭） =====")
+        print(f"{'conc':>5} | {'req/s':>8} | {'chars/s':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'server peak':>11}")
+        print("-" * 64)
+        for row in results["scaling"]:
+            print(
+                f"{row['concurrency']:>5} | {row['req_per_s']:>8.2f} | {row['chars_per_s']:>9.1f} | "
+                f"{row['p50_ms']:>8.1f} | {row['p95_ms']:>8.1f} | {row['server_peak_concurrency']:>11}"
+            )
+    if "cache" in results:
+        row = results["cache"]
+        print("\n===== cache =====")
+        print(
+            f"requests={row['requests']} distinct={row['distinct_texts']} upstream={row['upstream_requests']} "
+            f"hit_rate={row['hit_rate']:.2%} req/s={row['req_per_s']:.2f}"
+        )
+        for state, summary in row["latency_by_state"].items():
+            print(f"  {state:<10} n={row['states'][state]:<5} p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms")
+    if "ttfb" in results:
+        row = results["ttfb"]
+        print(f"\n===== ttfb（{row['samples']} 条，平均 {row['avg_chars']} 字） =====")
+        for mode, summary in row["modes"].items():
+            print(
+                f"  {mode:<10} ttfb p50={summary['ttfb']['p50_ms']:.1f}ms p95={summary['ttfb']['p95_ms']:.1f}ms | "
+                f"total p50={summary['total']['p50_ms']:.1f}ms"
+            )
+
+
+def run_offline(args: argparse.Namespace) -> int:
+    # 替身服务在本机，避免环境代理变量把请求转走
+    no_proxy = os.environ.get("NO_PROXY", "")
+    os.environ["NO_PROXY"] = ",".join(filter(None, [no_proxy, "127.0.0.1", "localhost"]))
+
+    model = StandInModel(
+        base_ms=args.base_ms,
+        per_char_ms=args.per_char_ms,
+        jitter_ms=args.jitter_ms,
+        bytes_per_char=args.bytes_per_char,
+        server_slots=args.server_slots,
+        seed=args.seed,
+    )
+    suites = list(SUITES) if args.suite == "all" else [args.suite]
+    levels = sorted({max(1, int(level)) for level in args.concurrency.split(",") if level.strip()})
+
+    logging.disable(logging.WARNING)
+    results: Dict[str, Any] = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="tts_bench_") as cache_dir, StandInTTSServer(model) as server:
+            with OfflineBench(server, cache_dir) as bench:
+                if "scaling" in suites:
+                    results["scaling"] = bench.run_scaling(levels, args.requests)
+                if "cache" in suites:
+                    results["cache"] = bench.run_cache(
+                        args.requests, args.distinct, max(levels), args.seed
+                    )
+                if "ttfb" in suites:
+                    results["ttfb"] = bench.run_ttfb(
+                        args.ttfb_samples, args.segment_min_chars, args.segment_concurrency
+                    )
+    finally:
+        logging.disable(logging.NOTSET)
+        tts_gateway.TTSProviderBase.shutdown_executors()
+
+    _print_offline(results)
+    payload = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "stand_in": asdict(model),
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(payload, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="TTS benchmark (offline stand-in server or live providers)")
+    parser.add_argument("--live", action="store_true", help="对真实 provider 跑对比（消耗配额）")
+    parser.add_argument("--suite", choices=["all", *SUITES], default="all")
+    parser.add_argument("--requests", type=int, default=48, help="scaling / cache 每轮请求数")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="scaling 的客户端并发档位（逗号分隔）")
+    parser.add_argument("--distinct", type=int, default=12, help="cache 文本池大小")
+    parser.add_argument("--ttfb-samples", type=int, default=6)
+    parser.add_argument("--segment-min-chars", type=int, default=60)
+    parser.add_argument("--segment-concurrency", type=int, default=3)
+    parser.add_argument("--base-ms", type=float, default=StandInModel.base_ms)
+    parser.add_argument("--per-char-ms", type=float, default=StandInModel.per_char_ms)
+    parser.add_argument("--jitter-ms", type=float, default=StandInModel.jitter_ms)
+    parser.add_argument("--bytes-per-char", type=int, default=StandInModel.bytes_per_char)
+    parser.add_argument("--server-slots", type=int, default=StandInModel.server_slots, help="替身服务同时处理的请求数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="把结果写成 JSON")
+    args = parser.parse_args(argv)
+
+    if args.live:
+        return run_live()
+    return run_offline(args)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -97,6 +97,37 @@ class TTSConfig:
     opening_cache_ttl_seconds: int = 600
     opening_cache_max_entries: int = 64
     opening_fetch_wait_seconds: float = 2.0
+    # 内容寻址音频缓存：相同 (provider, 模型, 音色, 风格, 格式, 文本) 直接复用
+    cache_enabled: bool = True
+    cache_memory_max_bytes: int = 32 * 1024 * 1024
+    cache_disk_max_bytes: int = 256 * 1024 * 1024
+    cache_persist: bool = True                   # 落盘到 <cache_dir>/tts_cache
+    cache_browser_max_age: int = 86400           # 浏览器侧 Cache-Control max-age（秒）
+    # 按句流式合成：文本不短于 stream_min_chars 时前端改用 /api/tts/stream 边合成边播放
+    stream_enabled: bool = True
+    stream_min_chars: int = 60
+    # 分段并行合成：不短于 segment_min_chars 的文本按句切分（单段不超过 segment_max_chars），
+    # 各段独立缓存；segment_max_concurrency 为单个请求同时在合成的分段数
+    segment_min_chars: int = 60
+    segment_max_chars: int = 200
+    segment_max_concurrency: int = 3
+    # 每个 provider 跨请求的同时合成上限；0 表示使用 provider 默认值（mimo 8 / qwen 2）
+    max_concurrency: int = 0
+    # qwen_gradio 热 client 池：同一 upstream 最多保留的 client 数与闲置重建阈值（秒）
+    qwen_pool_size: int = 2
+    qwen_pool_max_idle_seconds: float = 300.0
+    # 预测式预合成：叙事 / 事件 / 选项汇总返回时即在后台合成并写入缓存；
+    # 同时进行的预合成超过 prefetch_max_concurrent 或 LLM 并发已满时直接丢弃
+    prefetch_enabled: bool = True
+    prefetch_max_concurrent: int = 2
+    prefetch_min_chars: int = 12
+    # 可选转码：本机有 ffmpeg 且客户端 Accept 显式接受时，把 WAV 转为 Opus(OGG) / MP3
+    # transcode_formats 按优先级排列；转码结果与源音频一起进入内容寻址缓存
+    transcode_enabled: bool = True
+    transcode_formats: str = "opus,mp3"
+    transcode_bitrate_kbps: int = 32
+    transcode_ffmpeg_path: str = ""              # 留空时从 PATH 查找 ffmpeg
+    transcode_timeout_seconds: float = 15.0
 
     # ---- 语音白名单分级（默认朗读） ----
     # 这些字段会作为前端 voice_whitelist_defaults 下发，前端的用户偏好（localStorage）会覆盖此处。
@@ -293,6 +324,35 @@ class GameConfig:
     request_retry_count: int = 3
     request_retry_delay: float = 1.0
 
+    # 动作幂等存储（从环境变量加载，见 _load_from_env）
+    idempotency_store_backend: str = "memory"   # memory | sqlite（多进程部署需使用 sqlite）
+    idempotency_sqlite_path: str = ""           # 为空时使用 <cache_dir>/action_idempotency.sqlite3
+    idempotency_ttl_seconds: int = 120
+    idempotency_max_entries: int = 256          # 每局游戏保留的最大幂等记录数
+
+    # 预生成地图池（从环境变量加载，见 _load_from_env；仅作用于本地地图提供器）
+    map_pool_enabled: bool = False
+    map_pool_size: int = 2                      # 每个规格（尺寸/层数/主题/任务形状）保留的现成地图数
+    map_pool_max_depth: int = 1                 # 只为不超过该层数的楼层预生成
+    map_pool_max_specs: int = 16                # 同时维护的规格数上限（按最近使用淘汰）
+
+    # 内容寻址地图缓存（仅缓存显式指定 seed 的生成请求；从环境变量加载，见 _load_from_env）
+    map_cache_enabled: bool = True
+    map_cache_max_entries: int = 64
+    map_cache_persist: bool = False             # 落盘到 <cache_dir>/map_cache
+
+    # CPU 密集的地图生成/校验放入进程池，避免阻塞事件循环（从环境变量加载，见 _load_from_env）
+    map_generation_process_pool: bool = False
+    map_generation_process_workers: int = 2      # 进程池进程数；未启用进程池时为 CPU 专用线程池线程数
+    loop_lag_sample_interval: float = 0.25      # 事件循环延迟采样间隔（秒），<=0 关闭采样
+
+    # 地图生成对冲请求（秒，<=0 关闭；从环境变量加载，见 _load_from_env）
+    map_blueprint_hedge_delay: float = 0.0      # 蓝图请求超过该时间未返回即并发发出第二个请求
+    map_local_hedge_delay: float = 0.0          # LLM 链路超过该时间未完成即并发启动本地提供器
+
+    # 走廊规划：最小生成树之外额外补充的回路边比例（× (房间数-1)，从环境变量加载，见 _load_from_env）
+    corridor_loop_ratio: float = 0.15
+
     # 任务进度控制设置（已优化）
     max_quest_floors: int = 3                   # 开发阶段：任务最大楼层数
     # 注意：任务进度在UI中始终显示，不受调试模式控制
@@ -518,6 +578,111 @@ class Config:
             except ValueError:
                 pass
 
+        if tts_cache_enabled := os.getenv("TTS_CACHE_ENABLED"):
+            self.tts.cache_enabled = tts_cache_enabled.lower() in ("true", "1", "yes", "on")
+
+        if tts_cache_memory := os.getenv("TTS_CACHE_MEMORY_MAX_BYTES"):
+            try:
+                self.tts.cache_memory_max_bytes = max(0, int(tts_cache_memory))
+            except ValueError:
+                pass
+
+        if tts_cache_disk := os.getenv("TTS_CACHE_DISK_MAX_BYTES"):
+            try:
+                self.tts.cache_disk_max_bytes = max(0, int(tts_cache_disk))
+            except ValueError:
+                pass
+
+        if tts_cache_persist := os.getenv("TTS_CACHE_PERSIST"):
+            self.tts.cache_persist = tts_cache_persist.lower() in ("true", "1", "yes", "on")
+
+        if tts_cache_max_age := os.getenv("TTS_CACHE_BROWSER_MAX_AGE"):
+            try:
+                self.tts.cache_browser_max_age = max(0, int(tts_cache_max_age))
+            except ValueError:
+                pass
+
+        if tts_stream_enabled := os.getenv("TTS_STREAM_ENABLED"):
+            self.tts.stream_enabled = tts_stream_enabled.lower() in ("true", "1", "yes", "on")
+
+        if tts_stream_min_chars := os.getenv("TTS_STREAM_MIN_CHARS"):
+            try:
+                self.tts.stream_min_chars = max(0, int(tts_stream_min_chars))
+            except ValueError:
+                pass
+
+        if tts_segment_min := os.getenv("TTS_SEGMENT_MIN_CHARS"):
+            try:
+                self.tts.segment_min_chars = max(0, int(tts_segment_min))
+            except ValueError:
+                pass
+
+        if tts_segment_max := os.getenv("TTS_SEGMENT_MAX_CHARS"):
+            try:
+                self.tts.segment_max_chars = max(0, int(tts_segment_max))
+            except ValueError:
+                pass
+
+        if tts_segment_concurrency := os.getenv("TTS_SEGMENT_MAX_CONCURRENCY"):
+            try:
+                self.tts.segment_max_concurrency = max(1, int(tts_segment_concurrency))
+            except ValueError:
+                pass
+
+        if tts_qwen_pool_size := os.getenv("TTS_QWEN_POOL_SIZE"):
+            try:
+                self.tts.qwen_pool_size = max(1, int(tts_qwen_pool_size))
+            except ValueError:
+                pass
+
+        if tts_qwen_pool_idle := os.getenv("TTS_QWEN_POOL_MAX_IDLE_SECONDS"):
+            try:
+                self.tts.qwen_pool_max_idle_seconds = max(0.0, float(tts_qwen_pool_idle))
+            except ValueError:
+                pass
+
+        if tts_max_concurrency := os.getenv("TTS_MAX_CONCURRENCY"):
+            try:
+                self.tts.max_concurrency = max(0, int(tts_max_concurrency))
+            except ValueError:
+                pass
+
+        if tts_prefetch_enabled := os.getenv("TTS_PREFETCH_ENABLED"):
+            self.tts.prefetch_enabled = tts_prefetch_enabled.lower() in ("true", "1", "yes", "on")
+
+        if tts_prefetch_concurrent := os.getenv("TTS_PREFETCH_MAX_CONCURRENT"):
+            try:
+                self.tts.prefetch_max_concurrent = max(0, int(tts_prefetch_concurrent))
+            except ValueError:
+                pass
+
+        if tts_prefetch_min_chars := os.getenv("TTS_PREFETCH_MIN_CHARS"):
+            try:
+                self.tts.prefetch_min_chars = max(1, int(tts_prefetch_min_chars))
+            except ValueError:
+                pass
+
+        if tts_transcode_enabled := os.getenv("TTS_TRANSCODE_ENABLED"):
+            self.tts.transcode_enabled = tts_transcode_enabled.lower() in ("true", "1", "yes", "on")
+
+        if tts_transcode_formats := os.getenv("TTS_TRANSCODE_FORMATS"):
+            self.tts.transcode_formats = tts_transcode_formats.strip()
+
+        if tts_transcode_bitrate := os.getenv("TTS_TRANSCODE_BITRATE_KBPS"):
+            try:
+                self.tts.transcode_bitrate_kbps = max(8, int(tts_transcode_bitrate))
+            except ValueError:
+                pass
+
+        if tts_transcode_ffmpeg := os.getenv("TTS_TRANSCODE_FFMPEG_PATH"):
+            self.tts.transcode_ffmpeg_path = tts_transcode_ffmpeg.strip()
+
+        if tts_transcode_timeout := os.getenv("TTS_TRANSCODE_TIMEOUT_SECONDS"):
+            try:
+                self.tts.transcode_timeout_seconds = max(1.0, float(tts_transcode_timeout))
+            except ValueError:
+                pass
+
         # 语音白名单分级覆盖：TTS_VOICE_<CATEGORY>=true|false
         voice_whitelist_env = {
             "TTS_VOICE_NARRATIVE": "voice_whitelist_narrative",
@@ -701,6 +866,92 @@ class Config:
         if trap_fallback := os.getenv("TRAP_NARRATIVE_FALLBACK_TO_LOCAL"):
             self.game.trap_narrative_fallback_to_local = trap_fallback.lower() in ("true", "1", "yes")
 
+        if idempotency_backend := os.getenv("IDEMPOTENCY_STORE_BACKEND"):
+            backend = idempotency_backend.strip().lower()
+            if backend in ("memory", "sqlite"):
+                self.game.idempotency_store_backend = backend
+
+        if idempotency_sqlite_path := os.getenv("IDEMPOTENCY_SQLITE_PATH"):
+            self.game.idempotency_sqlite_path = idempotency_sqlite_path.strip()
+
+        if idempotency_ttl := os.getenv("IDEMPOTENCY_TTL_SECONDS"):
+            try:
+                self.game.idempotency_ttl_seconds = max(1, int(idempotency_ttl))
+            except ValueError:
+                pass
+
+        if idempotency_max_entries := os.getenv("IDEMPOTENCY_MAX_ENTRIES"):
+            try:
+                self.game.idempotency_max_entries = max(1, int(idempotency_max_entries))
+            except ValueError:
+                pass
+
+        if map_pool_enabled := os.getenv("MAP_POOL_ENABLED"):
+            self.game.map_pool_enabled = map_pool_enabled.lower() in ("true", "1", "yes")
+
+        if map_pool_size := os.getenv("MAP_POOL_SIZE"):
+            try:
+                self.game.map_pool_size = max(1, int(map_pool_size))
+            except ValueError:
+                pass
+
+        if map_pool_max_depth := os.getenv("MAP_POOL_MAX_DEPTH"):
+            try:
+                self.game.map_pool_max_depth = max(1, int(map_pool_max_depth))
+            except ValueError:
+                pass
+
+        if map_pool_max_specs := os.getenv("MAP_POOL_MAX_SPECS"):
+            try:
+                self.game.map_pool_max_specs = max(1, int(map_pool_max_specs))
+            except ValueError:
+                pass
+
+        if map_cache_enabled := os.getenv("MAP_CACHE_ENABLED"):
+            self.game.map_cache_enabled = map_cache_enabled.lower() in ("true", "1", "yes")
+
+        if map_cache_max_entries := os.getenv("MAP_CACHE_MAX_ENTRIES"):
+            try:
+                self.game.map_cache_max_entries = max(1, int(map_cache_max_entries))
+            except ValueError:
+                pass
+
+        if map_cache_persist := os.getenv("MAP_CACHE_PERSIST"):
+            self.game.map_cache_persist = map_cache_persist.lower() in ("true", "1", "yes")
+
+        if map_process_pool := os.getenv("MAP_GENERATION_PROCESS_POOL"):
+            self.game.map_generation_process_pool = map_process_pool.lower() in ("true", "1", "yes")
+
+        if map_process_workers := os.getenv("MAP_GENERATION_PROCESS_WORKERS"):
+            try:
+                self.game.map_generation_process_workers = max(1, int(map_process_workers))
+            except ValueError:
+                pass
+
+        if loop_lag_interval := os.getenv("LOOP_LAG_SAMPLE_INTERVAL"):
+            try:
+                self.game.loop_lag_sample_interval = float(loop_lag_interval)
+            except ValueError:
+                pass
+
+        if blueprint_hedge_delay := os.getenv("MAP_BLUEPRINT_HEDGE_DELAY"):
+            try:
+                self.game.map_blueprint_hedge_delay = float(blueprint_hedge_delay)
+            except ValueError:
+                pass
+
+        if local_hedge_delay := os.getenv("MAP_LOCAL_HEDGE_DELAY"):
+            try:
+                self.game.map_local_hedge_delay = float(local_hedge_delay)
+            except ValueError:
+                pass
+
+        if corridor_loop_ratio := os.getenv("CORRIDOR_LOOP_RATIO"):
+            try:
+                self.game.corridor_loop_ratio = max(0.0, float(corridor_loop_ratio))
+            except ValueError:
+                pass
+
         # 调试配置
         if debug_enabled := os.getenv("DEBUG_ENABLED"):
             self.debug.enabled = debug_enabled.lower() in ("true", "1", "yes")
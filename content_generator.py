@@ -11,7 +11,8 @@ import uuid
 import json
 import hashlib
 from collections import deque
-from typing import List, Dict, Optional, Tuple, Any
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 from dataclasses import asdict
 from enum import Enum
 
@@ -22,18 +23,36 @@ from data_models import (
 )
 from llm_service import llm_service
 from prompt_manager import prompt_manager
-from async_task_manager import async_performance_monitor
+from async_task_manager import async_performance_monitor, async_task_manager
 from generation_contract import (
     CONTRACT_VERSION,
     contract_hash,
     extract_contract_request,
     resolve_generation_contract,
 )
+from corridor_planner import CorridorPlan, l_segments, plan_corridors, rasterize_segments
+from map_cache import make_map_cache_key, map_cache, stable_hash
+from map_grid import DOOR, FLOOR, MASK4, POPCOUNT, MapGrid, NeighborMasks
+from room_spatial_index import RoomSpatialIndex
 
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def _seeded_global_random(seed: int):
+    """在固定种子下运行使用全局 random 的代码段，退出时恢复原随机状态
+
+    只能包裹不会让出事件循环的代码：期间若切换到其它协程，它们会消耗同一随机序列。
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+
+
 class LLMInteractionType(Enum):
     """LLM交互类型"""
     MOVEMENT = "movement"
@@ -114,8 +133,39 @@ class ContentGenerator:
     @async_performance_monitor
     async def generate_dungeon_map(self, width: int = 20, height: int = 20,
                                  depth: int = 1, theme: str = "classic",
-                                 quest_context: Optional[Dict[str, Any]] = None) -> GameMap:
-        """生成地下城地图"""
+                                 quest_context: Optional[Dict[str, Any]] = None,
+                                 seed: Optional[int] = None,
+                                 blueprint: Optional[Dict[str, Any]] = None) -> GameMap:
+        """生成地下城地图
+
+        seed 控制蓝图落地阶段的全部随机性；blueprint 为显式蓝图（如复现包中记录的蓝图），
+        提供时不再请求 LLM 生成蓝图。显式指定 seed 时结果进入内容寻址缓存，相同请求直接复用。
+        """
+        explicit_seed = seed is not None
+        seed = int(seed) if explicit_seed else random.getrandbits(32)
+
+        provided_contract, requested_contract_version, contract_source_hint = extract_contract_request(quest_context)
+        contract_resolution = resolve_generation_contract(
+            provided_contract=provided_contract,
+            requested_version=requested_contract_version,
+            source_hint=contract_source_hint,
+        )
+        generation_contract = contract_resolution.contract
+        generation_contract_hash = contract_hash(generation_contract)
+
+        cache_key: Optional[str] = None
+        if explicit_seed:
+            # 未提供蓝图时以蓝图请求的输入（任务上下文）代替蓝图哈希
+            blueprint_hash = stable_hash(blueprint) if isinstance(blueprint, dict) else stable_hash(quest_context or {})
+            cache_key = make_map_cache_key(
+                seed, width, height, depth, theme, generation_contract_hash, blueprint_hash
+            )
+            cached = map_cache.get(cache_key)
+            if cached is not None:
+                cached_map = cached[0]
+                cached_map.generation_metadata["map_cache"] = {"hit": True, "key": cache_key}
+                return cached_map
+
         game_map = GameMap()
         game_map.width = width
         game_map.height = height
@@ -228,21 +278,14 @@ class ContentGenerator:
             # 【修复】使用推断的主题而不是总是使用"normal"
             game_map.floor_theme = inferred_theme if inferred_theme in ["normal", "magic", "abandoned", "cave", "combat", "grassland", "desert", "farmland", "snowfield", "town"] else "normal"
             logger.info(f"Using fallback floor_theme: {game_map.floor_theme}")
-        
-        provided_contract, requested_contract_version, contract_source_hint = extract_contract_request(quest_context)
-        contract_resolution = resolve_generation_contract(
-            provided_contract=provided_contract,
-            requested_version=requested_contract_version,
-            source_hint=contract_source_hint,
-        )
-        generation_contract = contract_resolution.contract
-        generation_contract_hash = contract_hash(generation_contract)
 
         # 生成基础地图结构（优先蓝图驱动，失败自动回退）
         layout_metadata = await self._generate_map_layout(
             game_map,
             quest_context,
             generation_contract=generation_contract,
+            seed=seed,
+            blueprint=blueprint,
         )
 
         if not isinstance(game_map.generation_metadata, dict):
@@ -262,10 +305,16 @@ class ContentGenerator:
                     generation_contract=generation_contract,
                     generation_contract_hash=generation_contract_hash,
                     game_map=game_map,
+                    seed=seed,
+                    layout_metadata=layout_metadata,
                 ),
             }
         )
 
+        if cache_key is not None:
+            game_map.generation_metadata["map_cache"] = {"hit": False, "key": cache_key}
+            map_cache.put(cache_key, game_map)
+
         return game_map
     
     async def _generate_map_layout(
@@ -273,6 +322,8 @@ class ContentGenerator:
         game_map: GameMap,
         quest_context: Optional[Dict[str, Any]] = None,
         generation_contract: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        blueprint: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """生成地图布局（蓝图驱动优先，稳定算法回退）"""
         self._reset_map_tiles_to_walls(game_map)
@@ -288,14 +339,69 @@ class ContentGenerator:
             "blueprint_fallback_reason": "",
         }
 
-        blueprint: Optional[Dict[str, Any]] = None
-        try:
-            blueprint = await self._generate_map_blueprint(
-                game_map,
-                room_requirements,
+        blueprint_error: Optional[Exception] = None
+        if not isinstance(blueprint, dict):
+            try:
+                blueprint = await self._generate_map_blueprint_hedged(
+                    game_map,
+                    room_requirements,
+                    quest_context,
+                    contract,
+                    layout_meta,
+                )
+            except Exception as e:
+                blueprint_error = e
+        else:
+            layout_meta["blueprint_source"] = "provided"
+        if isinstance(blueprint, dict):
+            layout_meta["blueprint"] = blueprint
+            layout_meta["blueprint_hash"] = stable_hash(blueprint)
+
+        # 蓝图就绪后的落地阶段不再让出事件循环，可在固定种子下运行（蓝图 + seed 即可复现地图）
+        layout_seed = seed if seed is not None else random.getrandbits(32)
+        layout_meta["seed"] = layout_seed
+
+        if async_task_manager.process_pool_enabled:
+            # 进程池中落地，只回传紧凑网格与元数据；主进程一次性物化瓦片
+            grid, layout_meta = await async_task_manager.run_cpu_bound(
+                realize_blueprint_layout,
+                {
+                    "width": game_map.width,
+                    "height": game_map.height,
+                    "depth": game_map.depth,
+                    "name": game_map.name,
+                    "floor_theme": game_map.floor_theme,
+                },
                 quest_context,
-                generation_contract=contract,
+                contract,
+                room_requirements,
+                layout_meta,
+                blueprint,
+                str(blueprint_error) if blueprint_error is not None else None,
+                layout_seed,
             )
+            grid.materialize(game_map)
+            return layout_meta
+
+        with _seeded_global_random(layout_seed):
+            return await self._realize_map_layout(
+                game_map, quest_context, contract, room_requirements, layout_meta, blueprint, blueprint_error
+            )
+
+    async def _realize_map_layout(
+        self,
+        game_map: GameMap,
+        quest_context: Optional[Dict[str, Any]],
+        contract: Dict[str, Any],
+        room_requirements: Dict[str, Any],
+        layout_meta: Dict[str, Any],
+        blueprint: Optional[Dict[str, Any]],
+        blueprint_error: Optional[Exception],
+    ) -> Dict[str, Any]:
+        """蓝图落地（失败时回退稳定算法）；调用方负责随机种子"""
+        try:
+            if blueprint_error is not None:
+                raise blueprint_error
             validated_blueprint, blueprint_report = self._validate_and_fix_blueprint(
                 blueprint=blueprint,
                 room_requirements=room_requirements,
@@ -323,6 +429,8 @@ class ContentGenerator:
             rooms = await self._validate_and_adjust_room_types(game_map, rooms, quest_context)
             await self._place_special_terrain(game_map, rooms)
             event_report = await self._generate_map_events(game_map, rooms, quest_context, blueprint=validated_blueprint)
+            # 以上生成阶段直接改写瓦片，写完后统一失效一次地形修订号
+            game_map.mark_tiles_changed()
 
             monster_hints = self._build_monster_hints_from_blueprint(game_map, rooms, validated_blueprint, quest_context)
             layout_meta.update(
@@ -355,18 +463,17 @@ class ContentGenerator:
         rooms = await self._validate_and_adjust_room_types(game_map, rooms, quest_context)
         await self._place_special_terrain(game_map, rooms)
         await self._generate_map_events(game_map, rooms, quest_context)
+        game_map.mark_tiles_changed()
 
         layout_meta["blueprint_used"] = False
         layout_meta["reachability_proof"] = self._build_reachability_proof(game_map)
         return layout_meta
 
     def _build_reachability_proof(self, game_map: GameMap) -> Dict[str, Any]:
-        walkable = {
-            pos
-            for pos, tile in game_map.tiles.items()
-            if tile.terrain in {TerrainType.FLOOR, TerrainType.DOOR, TerrainType.TRAP, TerrainType.TREASURE, TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}
-        }
-        if not walkable:
+        # 一份入口距离场回答所有目标（按地形修订号缓存，地形写入方负责失效）
+        distance_field = game_map.get_distance_field()
+        start = distance_field.start
+        if start is None:
             return {
                 "start": None,
                 "targets": [],
@@ -375,56 +482,27 @@ class ContentGenerator:
                 "proof_ok": False,
             }
 
-        stairs_up = next((pos for pos, tile in game_map.tiles.items() if tile.terrain == TerrainType.STAIRS_UP), None)
-        start = stairs_up if stairs_up in walkable else next(iter(walkable))
-
         targets: List[Dict[str, Any]] = []
-        mandatory_positions = [
-            pos
-            for pos, tile in game_map.tiles.items()
-            if tile.has_event and isinstance(tile.event_data, dict) and tile.event_data.get("is_mandatory") is True
-        ]
-        for pos in mandatory_positions:
-            targets.append({"type": "mandatory_event", "position": [pos[0], pos[1]]})
-
-        stairs_down = next((pos for pos, tile in game_map.tiles.items() if tile.terrain == TerrainType.STAIRS_DOWN), None)
+        stairs_down: Optional[Tuple[int, int]] = None
+        for pos, tile in game_map.tiles.items():
+            if tile.has_event and isinstance(tile.event_data, dict) and tile.event_data.get("is_mandatory") is True:
+                targets.append({"type": "mandatory_event", "position": pos})
+            if stairs_down is None and tile.terrain == TerrainType.STAIRS_DOWN:
+                stairs_down = pos
         if stairs_down:
-            targets.append({"type": "stairs_down", "position": [stairs_down[0], stairs_down[1]]})
-
-        def _bfs_shortest_path_len(start_pos: Tuple[int, int], target_pos: Tuple[int, int]) -> int:
-            if target_pos not in walkable:
-                return -1
-            if start_pos == target_pos:
-                return 0
-            visited = {start_pos}
-            queue = deque([(start_pos[0], start_pos[1], 0)])
-            while queue:
-                x, y, dist = queue.popleft()
-                for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                    nx, ny = x + dx, y + dy
-                    nxt = (nx, ny)
-                    if nxt not in walkable or nxt in visited:
-                        continue
-                    if nxt == target_pos:
-                        return dist + 1
-                    visited.add(nxt)
-                    queue.append((nx, ny, dist + 1))
-            return -1
+            targets.append({"type": "stairs_down", "position": stairs_down})
 
         resolved_targets: List[Dict[str, Any]] = []
         reachable_count = 0
         for target in targets:
-            pos_raw = target.get("position", [])
-            if not isinstance(pos_raw, list) or len(pos_raw) != 2:
-                continue
-            tx, ty = int(pos_raw[0]), int(pos_raw[1])
-            path_len = _bfs_shortest_path_len(start, (tx, ty))
+            tx, ty = target["position"]
+            path_len = distance_field.path_length((tx, ty))
             reachable = path_len >= 0
             if reachable:
                 reachable_count += 1
             resolved_targets.append(
                 {
-                    "type": target.get("type", "unknown"),
+                    "type": target["type"],
                     "position": [tx, ty],
                     "reachable": reachable,
                     "path_length": path_len,
@@ -446,8 +524,11 @@ class ContentGenerator:
         generation_contract: Dict[str, Any],
         generation_contract_hash: str,
         game_map: GameMap,
+        seed: Optional[int] = None,
+        layout_metadata: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         ctx = quest_context if isinstance(quest_context, dict) else {}
+        layout = layout_metadata if isinstance(layout_metadata, dict) else {}
         stable_seed_payload = {
             "quest_type": str(ctx.get("quest_type", "") or ""),
             "title": str(ctx.get("title", "") or ""),
@@ -464,6 +545,10 @@ class ContentGenerator:
             "contract_version": generation_contract.get("contract_version", CONTRACT_VERSION),
             "contract_hash": generation_contract_hash,
             "stable_seed": stable_seed,
+            # seed + 蓝图（generation_metadata["blueprint"]）即可离线重现该地图
+            "seed": seed,
+            "blueprint_hash": layout.get("blueprint_hash"),
+            "blueprint_used": bool(layout.get("blueprint_used", False)),
             "patch_batches": [],
         }
 
@@ -629,6 +714,41 @@ class ContentGenerator:
             raise ValueError("blueprint missing room_nodes")
         return blueprint
 
+    async def _generate_map_blueprint_hedged(
+        self,
+        game_map: GameMap,
+        room_requirements: Dict[str, Any],
+        quest_context: Optional[Dict[str, Any]],
+        generation_contract: Optional[Dict[str, Any]],
+        layout_meta: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """蓝图请求对冲：超过 map_blueprint_hedge_delay 秒未返回时并发发出第二个请求，先到的有效蓝图胜出。"""
+        hedge_delay = float(getattr(config.game, "map_blueprint_hedge_delay", 0.0) or 0.0)
+
+        def _request() -> Awaitable[Dict[str, Any]]:
+            return self._generate_map_blueprint(
+                game_map,
+                room_requirements,
+                quest_context,
+                generation_contract=generation_contract,
+            )
+
+        if hedge_delay <= 0:
+            return await _request()
+
+        try:
+            blueprint, hedge_info = await async_task_manager.run_hedged(
+                _request,
+                _request,
+                hedge_delay,
+                description="map_blueprint",
+            )
+        except Exception:
+            layout_meta["blueprint_hedge"] = {"hedged": True, "winner": "", "winner_is_hedge": False}
+            raise
+        layout_meta["blueprint_hedge"] = hedge_info
+        return blueprint
+
     def _sanitize_blueprint(
         self,
         blueprint: Dict[str, Any],
@@ -1742,75 +1862,41 @@ class ContentGenerator:
 
         if layout_style == "linear":
             # 线性连接
-            for i in range(len(rooms) - 1):
-                self._connect_two_rooms(game_map, rooms[i], rooms[i + 1])
+            self._carve_room_connections(game_map, rooms, [(i, i + 1) for i in range(len(rooms) - 1)])
         elif layout_style == "hub":
-            # 中心辐射连接
-            if rooms:
-                center_room = rooms[0]  # 第一个房间是中心
-                for room in rooms[1:]:
-                    self._connect_two_rooms(game_map, center_room, room)
+            # 中心辐射连接（第一个房间是中心）
+            self._carve_room_connections(game_map, rooms, [(0, i) for i in range(1, len(rooms))])
         else:
             # 标准连接 - 确保所有房间都连接
             self._connect_all_rooms(game_map, rooms)
 
     def _connect_two_rooms(self, game_map: GameMap, room1: Dict[str, int], room2: Dict[str, int]):
         """连接两个特定房间"""
-        # 获取房间最近的边界点
-        connection_points = self._find_closest_connection_points(room1, room2)
-        if not connection_points:
-            return
-
-        x1, y1, x2, y2 = connection_points
-
-        # 创建L形走廊连接
-        self._carve_corridor(game_map, x1, y1, x2, y1)  # 水平
-        self._carve_corridor(game_map, x2, y1, x2, y2)  # 垂直
-
-    def _connect_all_rooms(self, game_map: GameMap, rooms: List[Dict[str, int]]):
-        """确保所有房间都连接 - 使用最小生成树算法"""
-        if len(rooms) <= 1:
-            return
-
-        # 计算所有房间对之间的距离
-        distances = []
-        for i in range(len(rooms)):
-            for j in range(i + 1, len(rooms)):
-                dist = self._calculate_room_distance(rooms[i], rooms[j])
-                distances.append((dist, i, j))
-
-        # 按距离排序
-        distances.sort()
-
-        # 使用并查集实现最小生成树
-        parent = list(range(len(rooms)))
-
-        def find(x):
-            if parent[x] != x:
-                parent[x] = find(parent[x])
-            return parent[x]
-
-        def union(x, y):
-            px, py = find(x), find(y)
-            if px != py:
-                parent[px] = py
-                return True
-            return False
-
-        # 连接房间
-        connected_edges = 0
-        for dist, i, j in distances:
-            if union(i, j):
-                self._connect_two_rooms(game_map, rooms[i], rooms[j])
-                connected_edges += 1
-                if connected_edges >= len(rooms) - 1:
-                    break
-
-        # 添加一些额外的连接以增加路径选择
-        extra_connections = min(2, len(distances) - connected_edges)
-        for dist, i, j in distances[connected_edges:connected_edges + extra_connections]:
-            if random.random() < 0.3:  # 30%概率添加额外连接
-                self._connect_two_rooms(game_map, rooms[i], rooms[j])
+        self._carve_room_connections(game_map, [room1, room2], [(0, 1)])
+
+    def _carve_room_connections(self, game_map: GameMap, rooms: List[Dict[str, int]],
+                                edges: List[Tuple[int, int]]):
+        """把一组房间连接栅格化为L形走廊并一次性雕刻"""
+        segments = []
+        for i, j in edges:
+            # 获取房间最近的边界点
+            connection_points = self._find_closest_connection_points(rooms[i], rooms[j])
+            if connection_points:
+                segments.extend(l_segments(*connection_points))
+
+        for x, y in rasterize_segments(segments):
+            self._carve_corridor_tile(game_map, x, y)
+
+    def _connect_all_rooms(self, game_map: GameMap, rooms: List[Dict[str, int]]) -> CorridorPlan:
+        """确保所有房间都连接 - k近邻图上的最小生成树 + 按比例补充回路"""
+        # 回路选取使用从全局随机数派生的独立随机源，保证带 seed 的生成可复现
+        plan = plan_corridors(
+            rooms,
+            loop_ratio=config.game.corridor_loop_ratio,
+            rng=random.Random(random.getrandbits(32)),
+        )
+        self._carve_room_connections(game_map, rooms, plan.edges)
+        return plan
 
     def _find_closest_connection_points(self, room1: Dict[str, int], room2: Dict[str, int]) -> tuple:
         """找到两个房间最近的连接点"""
@@ -1876,6 +1962,7 @@ class ContentGenerator:
             return rooms
 
         max_rooms = min(10, max(1, (width * height) // 50))
+        room_index = RoomSpatialIndex(width, height, margin=1)
 
         for _ in range(max_rooms):
             # 根据地图大小调整房间尺寸
@@ -1907,9 +1994,10 @@ class ContentGenerator:
                 "type": "normal"
             }
 
-            # 检查是否与现有房间重叠
-            if not any(self._rooms_overlap(new_room, existing) for existing in rooms):
+            # 检查是否与现有房间重叠（空间索引只比较邻近网格桶内的房间）
+            if not room_index.overlaps(new_room):
                 rooms.append(new_room)
+                room_index.add(new_room)
 
         # 确保至少有一个房间
         if not rooms:
@@ -1922,13 +2010,6 @@ class ContentGenerator:
 
         return rooms
     
-    def _rooms_overlap(self, room1: Dict[str, int], room2: Dict[str, int]) -> bool:
-        """检查两个房间是否重叠"""
-        return (room1["x"] < room2["x"] + room2["width"] and
-                room1["x"] + room1["width"] > room2["x"] and
-                room1["y"] < room2["y"] + room2["height"] and
-                room1["y"] + room1["height"] > room2["y"])
-    
     def _carve_room(self, game_map: GameMap, room: Dict[str, int]):
         """在地图上雕刻房间"""
         room_type = room.get("type", "normal")
@@ -1960,20 +2041,15 @@ class ContentGenerator:
     
     def _carve_corridor(self, game_map: GameMap, x1: int, y1: int, x2: int, y2: int):
         """雕刻走廊"""
-        if x1 == x2:  # 垂直走廊
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                if (x1, y) in game_map.tiles:
-                    tile = game_map.tiles[(x1, y)]
-                    tile.terrain = TerrainType.FLOOR
-                    if not tile.room_type:  # 只有未分配房间类型的瓦片才设为走廊
-                        tile.room_type = "corridor"
-        else:  # 水平走廊
-            for x in range(min(x1, x2), max(x1, x2) + 1):
-                if (x, y1) in game_map.tiles:
-                    tile = game_map.tiles[(x, y1)]
-                    tile.terrain = TerrainType.FLOOR
-                    if not tile.room_type:  # 只有未分配房间类型的瓦片才设为走廊
-                        tile.room_type = "corridor"
+        for x, y in rasterize_segments([(x1, y1, x2, y2)]):
+            self._carve_corridor_tile(game_map, x, y)
+
+    def _carve_corridor_tile(self, game_map: GameMap, x: int, y: int):
+        tile = game_map.tiles.get((x, y))
+        if tile:
+            tile.terrain = TerrainType.FLOOR
+            if not tile.room_type:  # 只有未分配房间类型的瓦片才设为走廊
+                tile.room_type = "corridor"
     
     async def _place_special_terrain(self, game_map: GameMap, rooms: List[Dict[str, int]]):
         """放置特殊地形"""
@@ -2080,6 +2156,9 @@ class ContentGenerator:
 
     def _place_doors_intelligently(self, game_map: GameMap, rooms: List[Dict[str, int]], room_types: List[str]):
         """智能放置门 - 改进版本，确保门的合理连接"""
+        # 雕刻完成后一次性计算邻接掩码，后续门位评分/验证均为查表
+        masks = MapGrid.from_game_map(game_map).neighbor_masks()
+
         # 第一步：为每个重要房间找到最佳门位置
         door_placements = []
 
@@ -2092,7 +2171,7 @@ class ContentGenerator:
                 continue
 
             # 找到该房间的最佳门位置
-            best_door_positions = self._find_best_door_positions(game_map, room, room_type)
+            best_door_positions = self._find_best_door_positions(masks, room, room_type)
 
             if best_door_positions:
                 # 选择最佳位置（优先选择连接质量最高的）
@@ -2100,10 +2179,10 @@ class ContentGenerator:
                 door_placements.append(best_position)
 
         # 第二步：验证门的放置并实际放置
-        validated_doors = self._validate_and_place_doors(game_map, door_placements)
+        validated_doors = self._validate_and_place_doors(game_map, masks, door_placements)
 
         # 第三步：为没有门的重要房间强制添加门
-        self._ensure_critical_rooms_have_doors(game_map, rooms, room_types, validated_doors)
+        self._ensure_critical_rooms_have_doors(game_map, masks, rooms, room_types, validated_doors)
 
         logger.info(f"成功放置 {len(validated_doors)} 个门")
 
@@ -2120,7 +2199,7 @@ class ContentGenerator:
             return random.random() < 0.3
         return False
 
-    def _find_best_door_positions(self, game_map: GameMap, room: Dict[str, int], room_type: str) -> List[tuple]:
+    def _find_best_door_positions(self, masks: NeighborMasks, room: Dict[str, int], room_type: str) -> List[tuple]:
         """为房间找到最佳门位置"""
         candidates = []
 
@@ -2129,7 +2208,7 @@ class ContentGenerator:
 
         for edge_x, edge_y in room_edges:
             # 检查边界位置外侧是否有走廊
-            door_score = self._evaluate_door_position(game_map, edge_x, edge_y, room)
+            door_score = self._evaluate_door_position(masks, edge_x, edge_y, room)
             if door_score > 0:
                 candidates.append((edge_x, edge_y, room_type, door_score))
 
@@ -2159,38 +2238,29 @@ class ContentGenerator:
 
         return edges
 
-    def _evaluate_door_position(self, game_map: GameMap, x: int, y: int, room: Dict[str, int]) -> float:
-        """评估门位置的质量分数"""
-        score = 0.0
+    def _corridor_bits(self, masks: NeighborMasks, x: int, y: int) -> int:
+        """四邻接中“地板且属于走廊”的方向位"""
+        return masks.at(masks.corridor, x, y) & masks.at(masks.floor, x, y)
 
+    def _evaluate_door_position(self, masks: NeighborMasks, x: int, y: int, room: Dict[str, int]) -> float:
+        """评估门位置的质量分数"""
         # 检查该位置是否是房间内的地板
-        tile = game_map.get_tile(x, y)
-        if not tile or tile.terrain != TerrainType.FLOOR:
+        if masks.grid.get(x, y) != FLOOR:
             return 0.0
 
-        # 检查四个方向，寻找走廊连接
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        corridor_connections = 0
-        room_connections = 0
-
-        for dx, dy in directions:
-            adj_x, adj_y = x + dx, y + dy
-            adj_tile = game_map.get_tile(adj_x, adj_y)
-
-            if adj_tile and adj_tile.terrain == TerrainType.FLOOR:
-                if adj_tile.room_type == "corridor":
-                    corridor_connections += 1
-                    score += 10.0  # 连接走廊得高分
-                elif adj_tile.room_type and adj_tile.room_type != "corridor":
-                    # 检查是否连接到不同房间
-                    if not self._is_point_in_room(adj_x, adj_y, room):
-                        room_connections += 1
-                        score += 5.0  # 连接其他房间得中等分
-
-        # 必须至少有一个走廊连接才是有效门位置
+        # 检查四个方向，寻找走廊连接（必须至少有一个走廊连接才是有效门位置）
+        corridor_connections = POPCOUNT[self._corridor_bits(masks, x, y)]
         if corridor_connections == 0:
             return 0.0
 
+        score = 10.0 * corridor_connections  # 连接走廊得高分
+
+        # 检查是否连接到不同房间
+        room_bits = masks.at(masks.room, x, y) & masks.at(masks.floor, x, y)
+        for dx, dy in NeighborMasks.directions(room_bits):
+            if not self._is_point_in_room(x + dx, y + dy, room):
+                score += 5.0  # 连接其他房间得中等分
+
         # 奖励有多个连接的位置（但不要太多）
         if corridor_connections == 1:
             score += 5.0  # 单一走廊连接是理想的
@@ -2201,62 +2271,48 @@ class ContentGenerator:
 
         return score
 
-    def _validate_and_place_doors(self, game_map: GameMap, door_placements: List[tuple]) -> List[tuple]:
+    def _validate_and_place_doors(self, game_map: GameMap, masks: NeighborMasks,
+                                  door_placements: List[tuple]) -> List[tuple]:
         """验证门的放置并实际放置门"""
         validated_doors = []
 
         for x, y, room_type, score in door_placements:
             # 最终验证门的连接质量
-            if self._validate_door_connection(game_map, x, y):
+            if self._validate_door_connection(masks, x, y):
                 # 在房间边界外的走廊位置放置门
-                door_position = self._find_corridor_position_for_door(game_map, x, y)
+                door_position = self._find_corridor_position_for_door(masks, x, y)
                 if door_position:
                     door_x, door_y = door_position
-                    tile = game_map.tiles.get((door_x, door_y))
-                    if tile:
-                        tile.terrain = TerrainType.DOOR
-                        # 保持走廊类型标记
-                        tile.room_type = "corridor"
+                    if self._set_door(game_map, masks, door_x, door_y):
                         validated_doors.append((door_x, door_y, room_type))
                         logger.debug(f"在位置 ({door_x}, {door_y}) 为 {room_type} 房间放置门")
 
         return validated_doors
 
-    def _validate_door_connection(self, game_map: GameMap, x: int, y: int) -> bool:
-        """验证门位置的连接是否合理"""
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        corridor_count = 0
-        room_count = 0
-
-        for dx, dy in directions:
-            adj_x, adj_y = x + dx, y + dy
-            adj_tile = game_map.get_tile(adj_x, adj_y)
-
-            if adj_tile and adj_tile.terrain == TerrainType.FLOOR:
-                if adj_tile.room_type == "corridor":
-                    corridor_count += 1
-                elif adj_tile.room_type and adj_tile.room_type != "corridor":
-                    room_count += 1
+    def _set_door(self, game_map: GameMap, masks: NeighborMasks, x: int, y: int) -> bool:
+        """在走廊瓦片上放门，并同步邻接掩码"""
+        tile = game_map.tiles.get((x, y))
+        if not tile:
+            return False
+        tile.terrain = TerrainType.DOOR
+        # 保持走廊类型标记
+        tile.room_type = "corridor"
+        masks.set_terrain(x, y, DOOR)
+        return True
 
+    def _validate_door_connection(self, masks: NeighborMasks, x: int, y: int) -> bool:
+        """验证门位置的连接是否合理"""
         # 门必须连接走廊和房间，或者连接两个不同区域
-        return corridor_count >= 1 and (room_count >= 1 or corridor_count >= 1)
+        return self._corridor_bits(masks, x, y) != 0
 
-    def _find_corridor_position_for_door(self, game_map: GameMap, room_x: int, room_y: int) -> Optional[tuple]:
+    def _find_corridor_position_for_door(self, masks: NeighborMasks, room_x: int, room_y: int) -> Optional[tuple]:
         """为房间位置找到相邻的走廊位置来放置门"""
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-
-        for dx, dy in directions:
-            corridor_x, corridor_y = room_x + dx, room_y + dy
-            corridor_tile = game_map.get_tile(corridor_x, corridor_y)
-
-            if (corridor_tile and
-                corridor_tile.terrain == TerrainType.FLOOR and
-                corridor_tile.room_type == "corridor"):
-                return (corridor_x, corridor_y)
-
-        return None
+        direction = NeighborMasks.first_direction(self._corridor_bits(masks, room_x, room_y))
+        if direction is None:
+            return None
+        return (room_x + direction[0], room_y + direction[1])
 
-    def _ensure_critical_rooms_have_doors(self, game_map: GameMap, rooms: List[Dict[str, int]],
+    def _ensure_critical_rooms_have_doors(self, game_map: GameMap, masks: NeighborMasks, rooms: List[Dict[str, int]],
                                         room_types: List[str], existing_doors: List[tuple]):
         """确保关键房间都有门"""
         critical_room_types = ["treasure", "boss", "special"]
@@ -2272,32 +2328,20 @@ class ContentGenerator:
 
             if room_type in critical_room_types and room_type not in existing_door_rooms:
                 # 强制为这个房间找一个门位置
-                emergency_door = self._place_emergency_door(game_map, room, room_type)
+                emergency_door = self._place_emergency_door(game_map, masks, room, room_type)
                 if emergency_door:
                     existing_doors.append(emergency_door)
                     logger.warning(f"为关键房间 {room_type} 强制添加紧急门")
 
-    def _place_emergency_door(self, game_map: GameMap, room: Dict[str, int], room_type: str) -> Optional[tuple]:
+    def _place_emergency_door(self, game_map: GameMap, masks: NeighborMasks,
+                              room: Dict[str, int], room_type: str) -> Optional[tuple]:
         """为关键房间强制放置紧急门"""
-        # 获取房间所有边界位置
-        room_edges = self._get_room_edge_positions(room)
-
-        for edge_x, edge_y in room_edges:
-            # 寻找任何可能的走廊连接
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-
-            for dx, dy in directions:
-                corridor_x, corridor_y = edge_x + dx, edge_y + dy
-                corridor_tile = game_map.get_tile(corridor_x, corridor_y)
-
-                if (corridor_tile and
-                    corridor_tile.terrain == TerrainType.FLOOR and
-                    corridor_tile.room_type == "corridor"):
-
-                    # 在走廊位置放置门
-                    corridor_tile.terrain = TerrainType.DOOR
-                    corridor_tile.room_type = "corridor"
-                    return (corridor_x, corridor_y, room_type)
+        # 获取房间所有边界位置，寻找任何可能的走廊连接
+        for edge_x, edge_y in self._get_room_edge_positions(room):
+            position = self._find_corridor_position_for_door(masks, edge_x, edge_y)
+            if position and self._set_door(game_map, masks, *position):
+                # 在走廊位置放置门
+                return (position[0], position[1], room_type)
 
         return None
 
@@ -2323,31 +2367,21 @@ class ContentGenerator:
 
         return edges
 
-    def _is_room_entrance(self, game_map: GameMap, x: int, y: int, room: Dict[str, int]) -> bool:
+    def _is_room_entrance(self, masks: NeighborMasks, x: int, y: int, room: Dict[str, int]) -> bool:
         """检查位置是否是房间入口（连接到走廊）"""
-        tile = game_map.get_tile(x, y)
-        if not tile or tile.terrain != TerrainType.FLOOR:
+        if masks.grid.get(x, y) != FLOOR:
             return False
 
-        # 检查相邻位置是否有走廊
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        has_corridor_connection = False
-
-        for dx, dy in directions:
-            adj_x, adj_y = x + dx, y + dy
-            adj_tile = game_map.get_tile(adj_x, adj_y)
-
-            if adj_tile and adj_tile.terrain == TerrainType.FLOOR:
-                # 使用房间类型信息判断是否为走廊
-                if adj_tile.room_type == "corridor":
-                    has_corridor_connection = True
-                    break
-                # 或者检查是否在房间外（备用方法）
-                elif not self._is_point_in_room(adj_x, adj_y, room):
-                    has_corridor_connection = True
-                    break
+        # 使用房间类型信息判断是否为走廊
+        if self._corridor_bits(masks, x, y):
+            return True
 
-        return has_corridor_connection
+        # 或者检查相邻地板是否在房间外（备用方法）
+        floor_bits = masks.at(masks.floor, x, y) & MASK4
+        return any(
+            not self._is_point_in_room(x + dx, y + dy, room)
+            for dx, dy in NeighborMasks.directions(floor_bits)
+        )
 
     def _is_point_in_room(self, x: int, y: int, room: Dict[str, int]) -> bool:
         """检查点是否在房间内"""
@@ -3245,10 +3279,11 @@ class ContentGenerator:
                                  count: int) -> List[Dict[str, int]]:
         """在地图中添加紧急房间"""
         new_rooms = []
+        room_index = RoomSpatialIndex.from_rooms(game_map.width, game_map.height, existing_rooms, margin=1)
 
         # 寻找可用空间
         for _ in range(count):
-            room_position = self._find_available_space_for_room(game_map, existing_rooms + new_rooms)
+            room_position = self._find_available_space_for_room(game_map, room_index)
             if room_position:
                 new_room = {
                     "x": room_position[0],
@@ -3269,11 +3304,13 @@ class ContentGenerator:
                         self._connect_two_rooms(game_map, new_room, nearest_room)
 
                 new_rooms.append(new_room)
+                room_index.add(new_room)
                 logger.info(f"添加紧急房间: {new_room}")
 
         return new_rooms
 
-    def _find_available_space_for_room(self, game_map: GameMap, existing_rooms: List[Dict[str, int]]) -> Optional[Tuple[int, int, int, int]]:
+    def _find_available_space_for_room(self, game_map: GameMap,
+                                       room_index: RoomSpatialIndex) -> Optional[Tuple[int, int, int, int]]:
         """寻找可用空间来放置新房间"""
         min_room_size = 3
         max_room_size = 6
@@ -3285,35 +3322,17 @@ class ContentGenerator:
             x = random.randint(1, game_map.width - width - 1)
             y = random.randint(1, game_map.height - height - 1)
 
-            # 检查是否与现有房间重叠
+            # 检查是否与现有房间重叠（含1格缓冲区）
             new_room = {"x": x, "y": y, "width": width, "height": height}
-            if not self._room_overlaps_with_existing(new_room, existing_rooms):
+            if not room_index.overlaps(new_room):
                 return (x, y, width, height)
 
-        return None
-
-    def _room_overlaps_with_existing(self, new_room: Dict[str, int], existing_rooms: List[Dict[str, int]]) -> bool:
-        """检查新房间是否与现有房间重叠"""
-        for existing_room in existing_rooms:
-            if self._rooms_overlap(new_room, existing_room):
-                return True
-        return False
-
-    def _rooms_overlap(self, room1: Dict[str, int], room2: Dict[str, int]) -> bool:
-        """检查两个房间是否重叠（包括缓冲区）"""
-        # 添加1格缓冲区
-        r1_left = room1["x"] - 1
-        r1_right = room1["x"] + room1["width"] + 1
-        r1_top = room1["y"] - 1
-        r1_bottom = room1["y"] + room1["height"] + 1
+        # 随机尝试失败时，借助占用积分图扫描最小尺寸房间的空位
+        position = room_index.find_free_position(min_room_size, min_room_size)
+        if position:
+            return (position[0], position[1], min_room_size, min_room_size)
 
-        r2_left = room2["x"] - 1
-        r2_right = room2["x"] + room2["width"] + 1
-        r2_top = room2["y"] - 1
-        r2_bottom = room2["y"] + room2["height"] + 1
-
-        return not (r1_right <= r2_left or r2_right <= r1_left or
-                   r1_bottom <= r2_top or r2_bottom <= r1_top)
+        return None
 
     def _find_nearest_room(self, target_room: Dict[str, int], rooms: List[Dict[str, int]]) -> Optional[Dict[str, int]]:
         """找到距离目标房间最近的房间"""
@@ -3349,4 +3368,34 @@ class ContentGenerator:
 # 全局内容生成器实例
 content_generator = ContentGenerator()
 
+
+def realize_blueprint_layout(
+    map_header: Dict[str, Any],
+    quest_context: Optional[Dict[str, Any]],
+    contract: Dict[str, Any],
+    room_requirements: Dict[str, Any],
+    layout_meta: Dict[str, Any],
+    blueprint: Optional[Dict[str, Any]],
+    blueprint_error: Optional[str],
+    seed: int,
+) -> Tuple[MapGrid, Dict[str, Any]]:
+    """进程池入口：在子进程中按种子落地蓝图，返回 (紧凑网格, 布局元数据)"""
+    game_map = GameMap(
+        width=map_header["width"],
+        height=map_header["height"],
+        depth=map_header["depth"],
+        name=map_header.get("name", ""),
+        floor_theme=map_header.get("floor_theme", "normal"),
+    )
+    content_generator._reset_map_tiles_to_walls(game_map)
+    error = RuntimeError(blueprint_error) if blueprint_error is not None else None
+    with _seeded_global_random(seed):
+        meta = asyncio.run(
+            content_generator._realize_map_layout(
+                game_map, quest_context, contract, room_requirements, layout_meta, blueprint, error
+            )
+        )
+    return MapGrid.from_game_map(game_map), meta
+
+
 __all__ = ["ContentGenerator", "content_generator"]
@@ -0,0 +1,166 @@
+"""
+Labyrinthia AI - 走廊规划
+ContentGenerator 与 LocalMapProvider 共用的房间连接规划：
+以房间中心构建一次 k 近邻图（按 x 排序后向两侧扫描，平均 O(n log n)），
+在其上用 Kruskal 求最小生成树，再按比例补充若干短回路边。房间数不超过 EXACT_LIMIT 时
+近邻图即完全图，生成树与欧氏最小生成树一致；更多房间时为其近似（极少数长边可能不在近邻图中）。
+最后把所有连接一次性栅格化为去重后的 L 形走廊格子，由调用方统一雕刻。
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+Position = Tuple[int, int]
+Edge = Tuple[int, int]
+WeightedEdge = Tuple[float, int, int]
+Segment = Tuple[int, int, int, int]
+
+DEFAULT_NEIGHBORS = 6
+EXACT_LIMIT = 24
+
+
+@dataclass
+class CorridorPlan:
+    """走廊规划结果（边为房间下标对，tree_edges 在前、loop_edges 在后）"""
+
+    tree_edges: List[Edge] = field(default_factory=list)
+    loop_edges: List[Edge] = field(default_factory=list)
+    candidate_edges: int = 0
+
+    @property
+    def edges(self) -> List[Edge]:
+        return self.tree_edges + self.loop_edges
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tree_edges": len(self.tree_edges),
+            "loop_edges": len(self.loop_edges),
+            "candidate_edges": self.candidate_edges,
+        }
+
+
+def room_center(room: Mapping[str, Any]) -> Position:
+    return int(room["x"]) + int(room["width"]) // 2, int(room["y"]) + int(room["height"]) // 2
+
+
+def _distance(a: Position, b: Position) -> float:
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
+
+
+def knn_edges(points: Sequence[Position], k: int = DEFAULT_NEIGHBORS) -> List[WeightedEdge]:
+    """k 近邻图的无向边（去重，按 (距离, i, j) 排序）"""
+    count = len(points)
+    k = max(1, min(int(k), count - 1)) if count > 1 else 0
+    if k == 0:
+        return []
+
+    order = sorted(range(count), key=lambda idx: points[idx])
+    edges: Dict[Edge, float] = {}
+    for rank, i in enumerate(order):
+        px, py = points[i]
+        best: List[Tuple[int, int]] = []  # (距离平方, 下标)，保持升序，最多 k 个
+        for step in (1, -1):
+            cursor = rank + step
+            while 0 <= cursor < count:
+                j = order[cursor]
+                dx = points[j][0] - px
+                # x 方向距离已超过当前第 k 近的距离，更远的点不可能更近
+                if len(best) == k and dx * dx > best[-1][0]:
+                    break
+                dist2 = dx * dx + (points[j][1] - py) ** 2
+                if len(best) < k or dist2 < best[-1][0]:
+                    best.append((dist2, j))
+                    best.sort()
+                    del best[k:]
+                cursor += step
+        for dist2, j in best:
+            edge = (i, j) if i < j else (j, i)
+            edges[edge] = dist2 ** 0.5
+    return sorted((weight, i, j) for (i, j), weight in edges.items())
+
+
+def _find(parent: List[int], x: int) -> int:
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def plan_corridors(
+    rooms: Sequence[Mapping[str, Any]],
+    loop_ratio: float = 0.0,
+    rng: Optional[random.Random] = None,
+    k: int = DEFAULT_NEIGHBORS,
+) -> CorridorPlan:
+    """规划房间连接：k 近邻图上的最小生成树 + 约 loop_ratio × (房间数-1) 条回路边
+
+    回路边取自未入树的最短候选边（前 2 倍数量内由 rng 打乱后选取，未给 rng 时取最短）。
+    """
+    count = len(rooms)
+    plan = CorridorPlan()
+    if count <= 1:
+        return plan
+
+    points = [room_center(room) for room in rooms]
+    candidates = knn_edges(points, count - 1 if count <= EXACT_LIMIT else k)
+    plan.candidate_edges = len(candidates)
+
+    parent = list(range(count))
+    rest: List[WeightedEdge] = []
+    for weight, i, j in candidates:
+        root_i, root_j = _find(parent, i), _find(parent, j)
+        if root_i == root_j:
+            rest.append((weight, i, j))
+            continue
+        parent[root_i] = root_j
+        plan.tree_edges.append((i, j))
+
+    # k 近邻图可能不连通（成簇分布），逐个把孤立分量接到最近的其它分量上
+    while len(plan.tree_edges) < count - 1:
+        root = _find(parent, 0)
+        inside = [idx for idx in range(count) if _find(parent, idx) == root]
+        outside = [idx for idx in range(count) if _find(parent, idx) != root]
+        _, i, j = min(
+            (_distance(points[a], points[b]), min(a, b), max(a, b)) for a in inside for b in outside
+        )
+        parent[_find(parent, i)] = _find(parent, j)
+        plan.tree_edges.append((i, j))
+
+    extra = int(round(max(0.0, float(loop_ratio or 0.0)) * (count - 1)))
+    if extra and rest:
+        pool = rest[: extra * 2]
+        if rng is not None:
+            rng.shuffle(pool)
+        plan.loop_edges = [(i, j) for _, i, j in sorted(pool[:extra])]
+    return plan
+
+
+def l_segments(x1: int, y1: int, x2: int, y2: int) -> List[Segment]:
+    """L 形连接：先水平（沿 y1）再垂直（沿 x2）"""
+    return [(x1, y1, x2, y1), (x2, y1, x2, y2)]
+
+
+def rasterize_segments(segments: Iterable[Segment]) -> List[Position]:
+    """把水平/垂直线段一次性栅格化为格子列表（保持首次出现顺序，去重）"""
+    cells: Dict[Position, None] = {}
+    for x1, y1, x2, y2 in segments:
+        if x1 == x2:
+            for y in range(min(y1, y2), max(y1, y2) + 1):
+                cells[(x1, y)] = None
+        else:
+            for x in range(min(x1, x2), max(x1, x2) + 1):
+                cells[(x, y1)] = None
+    return list(cells)
+
+
+__all__ = [
+    "CorridorPlan",
+    "knn_edges",
+    "l_segments",
+    "plan_corridors",
+    "rasterize_segments",
+    "room_center",
+]
@@ -179,6 +179,9 @@ class DataManager:
         if choice_context_data := data.get("pending_choice_context"):
             game_state.pending_choice_context = self._dict_to_event_choice_context(choice_context_data)
 
+        # 根据玩家与怪物位置重建实体空间索引（同时回填瓦片 character_id）
+        game_state.current_map.rebuild_entity_index(game_state.player, game_state.monsters)
+
         return game_state
     
     def _dict_to_character(self, data: Dict[str, Any]) -> Character:
@@ -479,7 +482,9 @@ class DataManager:
         tile.y = data.get("y", 0)
         tile.is_explored = data.get("is_explored", False)
         tile.is_visible = data.get("is_visible", False)
-        tile.character_id = data.get("character_id")
+        # character_id 为派生数据：由 _dict_to_game_state 根据实体位置重建空间索引时回填，
+        # 不信任存档中的旧值（旧存档常残留过期占用标记）
+        tile.character_id = None
 
         # 房间类型信息
         tile.room_type = data.get("room_type", "")
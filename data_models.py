@@ -9,6 +9,8 @@ from enum import Enum
 import uuid
 from datetime import datetime
 
+from entity_spatial_index import EntitySpatialIndex
+
 
 class CharacterClass(Enum):
     """角色职业枚举"""
@@ -700,6 +702,14 @@ class GameMap:
     floor_theme: str = "normal"  # 地板主题: normal, magic, abandoned, cave, combat
     tiles: Dict[tuple, MapTile] = field(default_factory=dict)
     generation_metadata: Dict[str, Any] = field(default_factory=dict)
+    # 实体空间索引（运行时派生数据，不参与序列化）
+    entity_index: EntitySpatialIndex = field(default_factory=EntitySpatialIndex, repr=False, compare=False)
+    # 地形修订号与连通性索引（运行时派生数据，不参与序列化）
+    terrain_revision: int = field(default=0, repr=False, compare=False)
+    connectivity_index: Optional[Any] = field(default=None, repr=False, compare=False)
+    distance_field: Optional[Any] = field(default=None, repr=False, compare=False)
+    # 快照用的瓦片序列化缓存（运行时派生数据，不参与序列化，见 game_state_snapshot）
+    snapshot_cache: Optional[Any] = field(default=None, repr=False, compare=False)
     
     def get_tile(self, x: int, y: int) -> Optional[MapTile]:
         """获取指定位置的瓦片"""
@@ -710,8 +720,144 @@ class GameMap:
         tile.x = x
         tile.y = y
         self.tiles[(x, y)] = tile
+        self.mark_tiles_changed([(x, y)])
+
+    def mark_tiles_changed(self, positions: Optional[List[tuple]] = None) -> None:
+        """通知瓦片地形/事件发生变化（positions 为 None 表示整图失效）
+
+        直接修改瓦片 terrain / has_event / event_data 后需调用，
+        以便连通性索引增量同步。
+        """
+        self.terrain_revision += 1
+        if self.connectivity_index is not None:
+            self.connectivity_index.mark_dirty(positions)
+
+    def get_connectivity_index(self):
+        """获取已同步的连通性索引（首次调用时全量构建）"""
+        if self.connectivity_index is None:
+            from map_analysis import MapConnectivityIndex
+            self.connectivity_index = MapConnectivityIndex(self)
+        self.connectivity_index.refresh()
+        return self.connectivity_index
+
+    def check_connectivity_index(self) -> List[str]:
+        """一致性检查：增量维护的连通性索引与全量重算比对，返回问题描述列表（空列表表示一致）"""
+        return self.get_connectivity_index().check_consistency()
+
+    def get_distance_field(self, start: Optional[tuple] = None):
+        """获取从 start（默认入口）出发的 BFS 距离场，按地形修订号缓存"""
+        origin = (int(start[0]), int(start[1])) if start is not None else None
+        cached = self.distance_field
+        if cached is not None and cached.revision == self.terrain_revision and cached.origin == origin:
+            return cached
+
+        from map_analysis import DistanceField, resolve_entrance, walkable_positions
+
+        walkable = walkable_positions(self)
+        actual_start = origin if origin is not None else resolve_entrance(self, walkable)
+        self.distance_field = DistanceField.compute(actual_start, walkable, revision=self.terrain_revision)
+        self.distance_field.origin = origin
+        return self.distance_field
+
+    def place_entity(self, entity_id: str, position: tuple) -> bool:
+        """放置或移动实体，同步空间索引与瓦片 character_id
+
+        Returns:
+            目标位置存在瓦片并完成放置时返回 True
+        """
+        if not entity_id:
+            return False
+        try:
+            pos = (int(position[0]), int(position[1]))
+        except (TypeError, ValueError, IndexError):
+            return False
+        tile = self.tiles.get(pos)
+        if tile is None:
+            return False
+
+        old_pos = self.entity_index.position_of(entity_id)
+        if old_pos is not None and old_pos != pos:
+            old_tile = self.tiles.get(old_pos)
+            if old_tile and old_tile.character_id == entity_id:
+                old_tile.character_id = None
+
+        self.entity_index.place(entity_id, pos)
+        tile.character_id = entity_id
+        return True
+
+    def remove_entity(self, entity_id: str) -> Optional[tuple]:
+        """从地图移除实体，返回其原位置"""
+        pos = self.entity_index.remove(entity_id)
+        if pos is not None:
+            tile = self.tiles.get(pos)
+            if tile and tile.character_id == entity_id:
+                tile.character_id = None
+        return pos
+
+    def clear_entities(self) -> None:
+        """清除地图上全部实体标记（仅访问已占用位置）"""
+        for pos in self.entity_index.clear():
+            tile = self.tiles.get(pos)
+            if tile:
+                tile.character_id = None
+
+    def get_entity_at(self, x: int, y: int) -> Optional[str]:
+        """获取指定位置上的实体ID"""
+        return self.entity_index.entity_at((x, y))
+
+    def get_entity_position(self, entity_id: str) -> Optional[tuple]:
+        """获取实体在地图上的位置"""
+        return self.entity_index.position_of(entity_id)
+
+    def is_occupied(self, x: int, y: int) -> bool:
+        """检查指定位置是否已被实体占据"""
+        return self.entity_index.is_occupied((x, y))
+
+    def get_entities_in_range(self, x: int, y: int, radius: int) -> List[tuple]:
+        """查询切比雪夫距离 radius 内的实体，返回 (entity_id, position) 列表（由近到远）"""
+        return self.entity_index.query_range((x, y), radius)
+
+    def rebuild_entity_index(self, player: Optional["Character"] = None, monsters: Optional[List["Character"]] = None) -> None:
+        """根据实体自身位置重建空间索引
+
+        只清理索引中已记录的位置，不再遍历整张地图。
+        """
+        self.clear_entities()
+        for monster in monsters or []:
+            if monster.position:
+                self.place_entity(monster.id, monster.position)
+        if player is not None and player.position:
+            self.place_entity(player.id, player.position)
+
+    def check_entity_index(self, player: Optional["Character"] = None, monsters: Optional[List["Character"]] = None) -> List[str]:
+        """一致性检查：索引内部结构、瓦片 character_id 镜像、实体位置三方比对
+
+        Returns:
+            问题描述列表，空列表表示一致
+        """
+        issues = self.entity_index.check_consistency()
+        for entity_id, pos in self.entity_index:
+            tile = self.tiles.get(pos)
+            if tile is None:
+                issues.append(f"entity {entity_id} indexed at {pos} outside map tiles")
+            elif tile.character_id != entity_id:
+                issues.append(f"tile {pos} character_id={tile.character_id} but index has {entity_id}")
+        for pos, tile in self.tiles.items():
+            if tile.character_id and self.entity_index.entity_at(pos) != tile.character_id:
+                issues.append(f"tile {pos} character_id={tile.character_id} missing from index")
+
+        entities = list(monsters or [])
+        if player is not None:
+            entities.append(player)
+        for entity in entities:
+            position = tuple(entity.position) if entity.position else None
+            indexed = self.entity_index.position_of(entity.id)
+            if position is not None and position in self.tiles and indexed != position:
+                issues.append(f"entity {entity.id} at {position} but indexed at {indexed}")
+        return issues
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, tiles: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """tiles 为已序列化的瓦片（快照复用缓存时传入），缺省时逐个序列化"""
         return {
             "id": self.id,
             "name": self.name,
@@ -721,7 +867,7 @@ class GameMap:
             "depth": self.depth,
             "floor_theme": self.floor_theme,
             "generation_metadata": self.generation_metadata,
-            "tiles": {f"{k[0]},{k[1]}": v.to_dict() for k, v in self.tiles.items()}
+            "tiles": tiles if tiles is not None else {f"{k[0]},{k[1]}": v.to_dict() for k, v in self.tiles.items()}
         }
 
 
@@ -921,8 +1067,26 @@ class GameState:
     pending_map_transition: Optional[str] = None  # 待切换的地图类型 ("stairs_down", "stairs_up", etc.)
     # 新增：事件选择系统
     pending_choice_context: Optional[EventChoiceContext] = None  # 待处理的选择上下文
+    # 怪物 ID → 在 monsters 列表中的下标（运行时派生数据，不参与序列化）
+    monster_lookup: Dict[str, int] = field(default_factory=dict, repr=False, compare=False)
 
-    def to_dict(self) -> Dict[str, Any]:
+    def get_monster(self, monster_id: str) -> Optional[Monster]:
+        """按 ID 获取当前怪物列表中的怪物
+
+        查找表记录下标，命中时直接校验 monsters[下标] 的 ID：列表被替换、增删或元素被替换后
+        校验失败，随即重建查找表。返回的总是列表中实际存在的对象，不会是已移除怪物的旧引用。
+        """
+        if not monster_id:
+            return None
+        index = self.monster_lookup.get(monster_id)
+        if index is not None and index < len(self.monsters) and self.monsters[index].id == monster_id:
+            return self.monsters[index]
+        self.monster_lookup = {m.id: i for i, m in enumerate(self.monsters)}
+        index = self.monster_lookup.get(monster_id)
+        return self.monsters[index] if index is not None else None
+
+    def to_dict(self, current_map: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """current_map 为已序列化的地图（快照传入），缺省时调用 current_map.to_dict()"""
         return {
             "id": self.id,
             "save_version": self.save_version,
@@ -930,7 +1094,7 @@ class GameState:
             "combat_rule_version": self.combat_rule_version,
             "combat_authority_mode": self.combat_authority_mode,
             "player": self.player.to_dict(),
-            "current_map": self.current_map.to_dict(),
+            "current_map": current_map if current_map is not None else self.current_map.to_dict(),
             "combat_rules": self.combat_rules,
             "combat_snapshot": self.combat_snapshot,
             "monsters": [monster.to_dict() for monster in self.monsters],
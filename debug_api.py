@@ -250,7 +250,12 @@ class DebugAPI:
                 "name": game_state.current_map.name,
                 "size": f"{game_state.current_map.width}x{game_state.current_map.height}",
                 "depth": game_state.current_map.depth,
-                "tile_count": len(game_state.current_map.tiles)
+                "tile_count": len(game_state.current_map.tiles),
+                "entity_count": len(game_state.current_map.entity_index),
+                "entity_index_issues": game_state.current_map.check_entity_index(
+                    game_state.player, game_state.monsters
+                )[:20],
+                "connectivity_index_issues": game_state.current_map.check_connectivity_index()[:20],
             }
             
             # 怪物信息
@@ -468,7 +473,10 @@ class DebugAPI:
                     }
                     for task_type, stats in task_stats.items()
                     if stats["total_count"] > 0
-                }
+                },
+                "cpu_tasks": async_task_manager.get_cpu_stats(),
+                "event_loop_lag": async_task_manager.get_loop_lag_stats(),
+                "hedged_requests": async_task_manager.get_hedge_stats(),
             }
 
         except Exception as e:
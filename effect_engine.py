@@ -560,7 +560,7 @@ class EffectEngine:
             return False
         if tile.terrain in (TerrainType.WALL, TerrainType.LAVA, TerrainType.PIT):
             return False
-        return tile.character_id is None
+        return not game_state.current_map.is_occupied(x, y)
 
     def _merge_or_append_status(self, player: Character, incoming: StatusEffect) -> bool:
         if player.active_effects is None:
@@ -0,0 +1,161 @@
+"""
+Labyrinthia AI - 实体空间索引
+维护地图上实体（玩家/怪物）的位置索引：位置 → 实体ID、实体ID → 位置，
+并使用均匀网格分桶支持范围查询，避免全图扫描与逐怪物遍历。
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+Position = Tuple[int, int]
+
+
+def _normalize_position(position: Iterable[int]) -> Optional[Position]:
+    try:
+        x, y = position
+        return int(x), int(y)
+    except (TypeError, ValueError):
+        return None
+
+
+class EntitySpatialIndex:
+    """实体空间索引（双向映射 + 均匀网格）
+
+    一个位置最多对应一个实体，与 MapTile.character_id 的单占用语义保持一致。
+    """
+
+    def __init__(self, cell_size: int = 8):
+        self.cell_size = max(1, int(cell_size or 1))
+        self._pos_to_id: Dict[Position, str] = {}
+        self._id_to_pos: Dict[str, Position] = {}
+        self._grid: Dict[Position, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._id_to_pos)
+
+    def __contains__(self, entity_id: object) -> bool:
+        return entity_id in self._id_to_pos
+
+    def __iter__(self) -> Iterator[Tuple[str, Position]]:
+        return iter(list(self._id_to_pos.items()))
+
+    def _cell_of(self, position: Position) -> Position:
+        return position[0] // self.cell_size, position[1] // self.cell_size
+
+    def _grid_add(self, entity_id: str, position: Position) -> None:
+        self._grid.setdefault(self._cell_of(position), set()).add(entity_id)
+
+    def _grid_discard(self, entity_id: str, position: Position) -> None:
+        cell = self._cell_of(position)
+        bucket = self._grid.get(cell)
+        if bucket is None:
+            return
+        bucket.discard(entity_id)
+        if not bucket:
+            del self._grid[cell]
+
+    def entity_at(self, position: Iterable[int]) -> Optional[str]:
+        """获取指定位置上的实体ID"""
+        pos = _normalize_position(position)
+        if pos is None:
+            return None
+        return self._pos_to_id.get(pos)
+
+    def position_of(self, entity_id: str) -> Optional[Position]:
+        """获取实体所在位置"""
+        return self._id_to_pos.get(entity_id)
+
+    def is_occupied(self, position: Iterable[int]) -> bool:
+        pos = _normalize_position(position)
+        return pos is not None and pos in self._pos_to_id
+
+    def place(self, entity_id: str, position: Iterable[int]) -> Optional[str]:
+        """放置或移动实体
+
+        Returns:
+            被挤出该位置的其他实体ID（若有）。被挤出的实体会从索引中移除，
+            与直接覆盖瓦片 character_id 的旧语义一致。
+        """
+        pos = _normalize_position(position)
+        if pos is None or not entity_id:
+            return None
+
+        old_pos = self._id_to_pos.get(entity_id)
+        if old_pos == pos:
+            return None
+        if old_pos is not None:
+            self._pos_to_id.pop(old_pos, None)
+            self._grid_discard(entity_id, old_pos)
+
+        displaced = self._pos_to_id.get(pos)
+        if displaced is not None and displaced != entity_id:
+            self._id_to_pos.pop(displaced, None)
+            self._grid_discard(displaced, pos)
+        else:
+            displaced = None
+
+        self._pos_to_id[pos] = entity_id
+        self._id_to_pos[entity_id] = pos
+        self._grid_add(entity_id, pos)
+        return displaced
+
+    def remove(self, entity_id: str) -> Optional[Position]:
+        """移除实体，返回其原位置"""
+        pos = self._id_to_pos.pop(entity_id, None)
+        if pos is None:
+            return None
+        if self._pos_to_id.get(pos) == entity_id:
+            del self._pos_to_id[pos]
+        self._grid_discard(entity_id, pos)
+        return pos
+
+    def clear(self) -> List[Position]:
+        """清空索引，返回清空前被占用的位置"""
+        positions = list(self._pos_to_id.keys())
+        self._pos_to_id.clear()
+        self._id_to_pos.clear()
+        self._grid.clear()
+        return positions
+
+    def positions(self) -> List[Position]:
+        return list(self._pos_to_id.keys())
+
+    def query_range(self, center: Iterable[int], radius: int) -> List[Tuple[str, Position]]:
+        """查询切比雪夫距离 radius 内的实体（只访问覆盖范围内的网格桶）"""
+        pos = _normalize_position(center)
+        if pos is None:
+            return []
+        radius = max(0, int(radius))
+        cx, cy = pos
+        min_cell_x, min_cell_y = self._cell_of((cx - radius, cy - radius))
+        max_cell_x, max_cell_y = self._cell_of((cx + radius, cy + radius))
+
+        results: List[Tuple[str, Position]] = []
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_y in range(min_cell_y, max_cell_y + 1):
+                for entity_id in self._grid.get((cell_x, cell_y), ()):
+                    ex, ey = self._id_to_pos[entity_id]
+                    if max(abs(ex - cx), abs(ey - cy)) <= radius:
+                        results.append((entity_id, (ex, ey)))
+        results.sort(key=lambda item: (max(abs(item[1][0] - cx), abs(item[1][1] - cy)), item[1]))
+        return results
+
+    def check_consistency(self) -> List[str]:
+        """检查索引内部结构一致性，返回问题描述列表（空列表表示一致）"""
+        issues: List[str] = []
+        for pos, entity_id in self._pos_to_id.items():
+            if self._id_to_pos.get(entity_id) != pos:
+                issues.append(f"position {pos} -> {entity_id} has no matching reverse entry")
+        for entity_id, pos in self._id_to_pos.items():
+            if self._pos_to_id.get(pos) != entity_id:
+                issues.append(f"entity {entity_id} -> {pos} has no matching forward entry")
+            if entity_id not in self._grid.get(self._cell_of(pos), ()):
+                issues.append(f"entity {entity_id} missing from grid cell {self._cell_of(pos)}")
+        grid_total = sum(len(bucket) for bucket in self._grid.values())
+        if grid_total != len(self._id_to_pos):
+            issues.append(f"grid holds {grid_total} entries but index holds {len(self._id_to_pos)}")
+        return issues
+
+
+__all__ = ["EntitySpatialIndex"]
@@ -773,15 +773,7 @@ class EventChoiceSystem:
     async def _execute_map_transition(self, game_state: GameState, new_map: 'GameMap'):
         """执行地图切换的核心逻辑"""
         # 清除旧地图上的角色标记
-        old_tile = game_state.current_map.get_tile(*game_state.player.position)
-        if old_tile:
-            old_tile.character_id = None
-
-        for monster in game_state.monsters:
-            if monster.position:
-                monster_tile = game_state.current_map.get_tile(*monster.position)
-                if monster_tile:
-                    monster_tile.character_id = None
+        game_state.current_map.clear_entities()
 
         # 更新当前地图
         game_state.current_map = new_map
@@ -791,9 +783,9 @@ class EventChoiceSystem:
         spawn_positions = content_generator.get_spawn_positions(new_map, 1)
         if spawn_positions:
             game_state.player.position = spawn_positions[0]
+            new_map.place_entity(game_state.player.id, game_state.player.position)
             tile = new_map.get_tile(*game_state.player.position)
             if tile:
-                tile.character_id = game_state.player.id
                 tile.is_explored = True
                 tile.is_visible = True
 
@@ -820,9 +812,7 @@ class EventChoiceSystem:
         monster_positions = game_engine._get_monster_spawn_positions(new_map, len(monsters))
         for monster, position in zip(monsters, monster_positions):
             monster.position = position
-            tile = new_map.get_tile(*position)
-            if tile:
-                tile.character_id = monster.id
+            new_map.place_entity(monster.id, position)
             game_state.monsters.append(monster)
 
     # 其他事件类型的处理器（简化实现）
@@ -901,6 +891,7 @@ class EventChoiceSystem:
                 from data_models import TerrainType
                 if tile.terrain == TerrainType.TRAP:
                     tile.terrain = TerrainType.FLOOR
+                    game_state.current_map.mark_tiles_changed([(tile.x, tile.y)])
 
                 message = f"✅ 你成功解除了陷阱！🎲 1d20={result['roll']} + 调整值{result['modifier']:+d} = {result['total']} vs DC {disarm_dc}"
                 events = ["陷阱已被安全解除"]
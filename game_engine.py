@@ -4,6 +4,7 @@ Game engine for the Labyrinthia AI game
 """
 
 import asyncio
+import os
 import random
 import logging
 import copy
@@ -32,11 +33,16 @@ from prompt_manager import prompt_manager
 from event_choice_system import event_choice_system, ChoiceEventType
 from async_task_manager import async_task_manager, TaskType, async_performance_monitor
 from game_state_lock_manager import game_state_lock_manager
+from game_state_snapshot import capture_game_state
 from game_state_modifier import game_state_modifier
+from idempotency_store import IdempotencyStore
 
 
 logger = logging.getLogger(__name__)
 
+# 怪物警戒半径（切比雪夫距离）：半径内的怪物才会追击或攻击玩家（远程怪物攻击范围为 1-4）
+MONSTER_AWARENESS_RADIUS = 5
+
 
 class GameEngine:
     """游戏引擎类"""
@@ -61,11 +67,13 @@ class GameEngine:
         self.auto_save_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
         self.last_access_time: Dict[Tuple[str, str], float] = {}  # 记录最后访问时间
         self.cleanup_task_started = False  # 标记清理任务是否已启动
-        # 幂等结果缓存：key=(user_id, game_id) -> {"{action}:{idempotency_key}": payload}
-        # payload 结构：{"result": Dict[str, Any], "fingerprint": str, "created_at": float}
-        self.action_idempotency_cache: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
-        self.idempotency_cache_ttl_seconds: int = 120
-        self.idempotency_cache_max_entries: int = 256
+        # 幂等结果存储：scope=(user_id, game_id)，key="{action}:{idempotency_key}"
+        # 结果以不可变序列化 bytes 保存；可选 SQLite 持久化以支持重启与多进程
+        self.idempotency_store = IdempotencyStore(
+            ttl_seconds=config.game.idempotency_ttl_seconds,
+            max_entries_per_scope=config.game.idempotency_max_entries,
+            sqlite_path=self._resolve_idempotency_sqlite_path(),
+        )
         # 丢弃撤销缓存：key=(user_id, game_id) -> {undo_token: {item, position, expires_turn}}
         self.drop_undo_cache: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
         self._map_release_hash_seed = str(getattr(config.game, "map_generation_canary_seed", "labyrinthia-map-canary") or "labyrinthia-map-canary")
@@ -98,10 +106,11 @@ class GameEngine:
             result[key] = value
         return result
 
-    def _get_idempotency_cache(self, game_key: Tuple[str, str]) -> Dict[str, Dict[str, Any]]:
-        if game_key not in self.action_idempotency_cache:
-            self.action_idempotency_cache[game_key] = {}
-        return self.action_idempotency_cache[game_key]
+    @staticmethod
+    def _resolve_idempotency_sqlite_path() -> Optional[str]:
+        if str(config.game.idempotency_store_backend or "memory").strip().lower() != "sqlite":
+            return None
+        return config.game.idempotency_sqlite_path or os.path.join(config.data.cache_dir, "action_idempotency.sqlite3")
 
     def _make_idempotency_fingerprint(self, action: str, parameters: Dict[str, Any]) -> str:
         safe_params: Dict[str, Any] = {}
@@ -116,42 +125,7 @@ class GameEngine:
 
         return json.dumps(safe_params, sort_keys=True, ensure_ascii=False)
 
-    def _prune_idempotency_cache(self, game_key: Tuple[str, str]):
-        cache = self._get_idempotency_cache(game_key)
-        if not cache:
-            return
-
-        now_ts = datetime.utcnow().timestamp()
-        ttl = max(1, int(self.idempotency_cache_ttl_seconds))
-
-        expired_keys: List[str] = []
-        for key, payload in cache.items():
-            if not isinstance(payload, dict):
-                continue
-            created_at = payload.get("created_at")
-            if isinstance(created_at, (int, float)) and (now_ts - float(created_at)) > ttl:
-                expired_keys.append(key)
-
-        for key in expired_keys:
-            cache.pop(key, None)
-
-        max_entries = max(1, int(self.idempotency_cache_max_entries))
-        if len(cache) > max_entries:
-            sortable: List[Tuple[str, float]] = []
-            for key, payload in cache.items():
-                created_at = 0.0
-                if isinstance(payload, dict):
-                    created_val = payload.get("created_at")
-                    if isinstance(created_val, (int, float)):
-                        created_at = float(created_val)
-                sortable.append((key, created_at))
-
-            sortable.sort(key=lambda item: item[1])
-            trim_count = len(cache) - max_entries
-            for key, _ in sortable[:trim_count]:
-                cache.pop(key, None)
-
-    def _get_cached_action_result(
+    async def _get_cached_action_result(
         self,
         game_key: Tuple[str, str],
         action: str,
@@ -161,26 +135,16 @@ class GameEngine:
         if not idempotency_key:
             return None
 
-        self._prune_idempotency_cache(game_key)
-
         cache_key = f"{action}:{idempotency_key}"
-        cached = self._get_idempotency_cache(game_key).get(cache_key)
-        if not cached:
+        cached = await self.idempotency_store.aget(game_key, cache_key)
+        if cached is None:
             return None
 
-        cached_result: Optional[Dict[str, Any]] = None
-        cached_fingerprint = ""
-        if isinstance(cached, dict) and "result" in cached:
-            maybe_result = cached.get("result")
-            if isinstance(maybe_result, dict):
-                cached_result = maybe_result
-            cached_fingerprint = str(cached.get("fingerprint", "") or "")
-        elif isinstance(cached, dict):
-            # 兼容旧结构
-            cached_result = cached
-
-        if cached_result is None:
+        # 反序列化即得到独立副本，无需 deepcopy
+        replay = cached.load_result()
+        if replay is None:
             return None
+        cached_fingerprint = cached.fingerprint
 
         request_fingerprint = self._make_idempotency_fingerprint(action, parameters)
         if cached_fingerprint and cached_fingerprint != request_fingerprint:
@@ -192,7 +156,6 @@ class GameEngine:
             )
             return None
 
-        replay = copy.deepcopy(cached_result)
         replay["idempotent_replay"] = True
         if "events" not in replay or not isinstance(replay["events"], list):
             replay["events"] = []
@@ -200,7 +163,7 @@ class GameEngine:
         logger.info(f"Idempotent replay hit for {game_key}, action={action}")
         return replay
 
-    def _store_action_result(
+    async def _store_action_result(
         self,
         game_key: Tuple[str, str],
         action: str,
@@ -211,14 +174,14 @@ class GameEngine:
         if not idempotency_key:
             return
         cache_key = f"{action}:{idempotency_key}"
-        cached_result = copy.deepcopy(result)
+        cached_result = dict(result)
         cached_result.pop("idempotent_replay", None)
-        self._get_idempotency_cache(game_key)[cache_key] = {
-            "result": cached_result,
-            "fingerprint": self._make_idempotency_fingerprint(action, parameters),
-            "created_at": datetime.utcnow().timestamp(),
-        }
-        self._prune_idempotency_cache(game_key)
+        await self.idempotency_store.aput(
+            game_key,
+            cache_key,
+            cached_result,
+            fingerprint=self._make_idempotency_fingerprint(action, parameters),
+        )
 
     def _get_drop_undo_cache(self, game_key: Tuple[str, str]) -> Dict[str, Dict[str, Any]]:
         if game_key not in self.drop_undo_cache:
@@ -980,9 +943,9 @@ class GameEngine:
         if spawn_positions:
             game_state.player.position = spawn_positions[0]
             # 在地图上标记玩家位置
+            game_state.current_map.place_entity(game_state.player.id, game_state.player.position)
             tile = game_state.current_map.get_tile(*game_state.player.position)
             if tile:
-                tile.character_id = game_state.player.id
                 tile.is_explored = True
                 tile.is_visible = True
 
@@ -1004,9 +967,7 @@ class GameEngine:
 
         for monster, position in zip(monsters, monster_positions):
             monster.position = position
-            tile = game_state.current_map.get_tile(*position)
-            if tile:
-                tile.character_id = monster.id
+            game_state.current_map.place_entity(monster.id, position)
             game_state.monsters.append(monster)
 
 
@@ -1141,25 +1102,15 @@ class GameEngine:
         # 重建游戏状态
         game_state = data_manager._dict_to_game_state(save_data)
 
-        # 【修复】清除所有瓦片的character_id（防止存档中有错误数据）
-        for tile in game_state.current_map.tiles.values():
-            tile.character_id = None
-        logger.info(f"Cleared all character_id from {len(game_state.current_map.tiles)} tiles")
-
-        # 【修复】重新设置玩家位置的character_id
+        # 实体空间索引已在 _dict_to_game_state 中按玩家/怪物位置重建
         player_tile = game_state.current_map.get_tile(*game_state.player.position)
         if player_tile:
-            player_tile.character_id = game_state.player.id
             player_tile.is_explored = True
             player_tile.is_visible = True
-            logger.info(f"Player position restored: {game_state.player.position}")
-
-        # 【修复】重新设置怪物位置的character_id
-        for monster in game_state.monsters:
-            monster_tile = game_state.current_map.get_tile(*monster.position)
-            if monster_tile:
-                monster_tile.character_id = monster.id
-                logger.info(f"Monster {monster.name} position restored: {monster.position}")
+        logger.info(
+            f"Entity index restored: player={game_state.player.position}, "
+            f"entities={len(game_state.current_map.entity_index)}"
+        )
 
         # 使用 (user_id, game_id) 作为键
         game_key = (user_id, game_state.id)
@@ -1211,7 +1162,7 @@ class GameEngine:
         self._ensure_combat_defaults(game_state)
 
         if action in {"use_item", "drop_item", "attack"}:
-            replay = self._get_cached_action_result(game_key, action, parameters)
+            replay = await self._get_cached_action_result(game_key, action, parameters)
             if replay is not None:
                 return replay
 
@@ -1424,7 +1375,7 @@ class GameEngine:
             )
 
         if action in {"use_item", "drop_item", "attack"} and bool(result.get("success", False)):
-            self._store_action_result(game_key, action, parameters, result)
+            await self._store_action_result(game_key, action, parameters, result)
 
         return result
 
@@ -1576,11 +1527,7 @@ class GameEngine:
             return {"success": False, "message": "无法移动到该位置"}
 
         # 执行移动（更新状态）
-        old_tile = game_state.current_map.get_tile(current_x, current_y)
-        if old_tile:
-            old_tile.character_id = None
-
-        target_tile.character_id = game_state.player.id
+        game_state.current_map.place_entity(game_state.player.id, (new_x, new_y))
         target_tile.is_explored = True
         target_tile.is_visible = True
         game_state.player.position = (new_x, new_y)
@@ -1612,11 +1559,7 @@ class GameEngine:
         """处理攻击行动（Phase 1：统一战斗求值最小闭环）"""
         target_id = parameters.get("target_id", "")
 
-        target_monster = None
-        for monster in game_state.monsters:
-            if monster.id == target_id:
-                target_monster = monster
-                break
+        target_monster = game_state.get_monster(target_id)
 
         if not target_monster:
             return self._make_action_result(
@@ -1836,9 +1779,7 @@ class GameEngine:
 
             if target_monster in game_state.monsters:
                 game_state.monsters.remove(target_monster)
-            tile = game_state.current_map.get_tile(monster_x, monster_y)
-            if tile:
-                tile.character_id = None
+            game_state.current_map.remove_entity(target_monster.id)
 
             context_data = {
                 "monster_name": target_monster.name,
@@ -2237,13 +2178,9 @@ class GameEngine:
             # 处理位置变化（传送效果）
             if effect_result.position_change:
                 new_x, new_y = effect_result.position_change
-                old_tile = game_state.current_map.get_tile(*game_state.player.position)
-                if old_tile:
-                    old_tile.character_id = None
-
                 new_tile = game_state.current_map.get_tile(new_x, new_y)
                 if new_tile:
-                    new_tile.character_id = game_state.player.id
+                    game_state.current_map.place_entity(game_state.player.id, (new_x, new_y))
                     new_tile.is_explored = True
                     new_tile.is_visible = True
                     game_state.player.position = (new_x, new_y)
@@ -2538,11 +2475,7 @@ class GameEngine:
         # 根据法术类型处理效果
         if spell.damage and target_id:
             # 攻击法术
-            target_monster = None
-            for monster in game_state.monsters:
-                if monster.id == target_id:
-                    target_monster = monster
-                    break
+            target_monster = game_state.get_monster(target_id)
 
             if target_monster:
                 damage = random.randint(spell.level * 5, spell.level * 10)
@@ -2552,6 +2485,7 @@ class GameEngine:
                 if target_monster.stats.hp <= 0:
                     events.append(f"{target_monster.name} 被击败了！")
                     game_state.monsters.remove(target_monster)
+                    game_state.current_map.remove_entity(target_monster.id)
 
         return {
             "success": True,
@@ -2573,6 +2507,7 @@ class GameEngine:
         if tile.terrain == TerrainType.DOOR:
             events.append("打开了门")
             tile.terrain = TerrainType.FLOOR
+            game_state.current_map.mark_tiles_changed([(x, y)])
         elif tile.terrain == TerrainType.TREASURE:
             # 使用LLM生成宝藏物品
             pickup_context = f"玩家在{game_state.current_map.name}的宝藏箱中发现了物品"
@@ -2586,6 +2521,7 @@ class GameEngine:
                 events.append("宝藏箱是空的...")
 
             tile.terrain = TerrainType.FLOOR
+            game_state.current_map.mark_tiles_changed([(x, y)])
 
         elif tile.items:
             # 拾取地图上的物品
@@ -2838,9 +2774,7 @@ class GameEngine:
             spawn_positions = content_generator.get_spawn_positions(game_state.current_map, 1)
             if spawn_positions:
                 monster.position = spawn_positions[0]
-                monster_tile = game_state.current_map.get_tile(*monster.position)
-                if monster_tile:
-                    monster_tile.character_id = monster.id
+                game_state.current_map.place_entity(monster.id, monster.position)
                 game_state.monsters.append(monster)
 
         return f"遭遇了 {len(monsters)} 只怪物！战斗开始！"
@@ -3052,15 +2986,7 @@ class GameEngine:
             return f"你已经到达了本次冒险的最深阶段（第{max_floors}层）！"
 
         # 清除旧地图上的角色标记（在生成新地图前）
-        old_tile = game_state.current_map.get_tile(*game_state.player.position)
-        if old_tile:
-            old_tile.character_id = None
-
-        for monster in game_state.monsters:
-            if monster.position:
-                monster_tile = game_state.current_map.get_tile(*monster.position)
-                if monster_tile:
-                    monster_tile.character_id = None
+        game_state.current_map.clear_entities()
 
         # 获取当前活跃任务的上下文
         quest_context = None
@@ -3093,9 +3019,9 @@ class GameEngine:
             spawn_position = spawn_positions[0] if spawn_positions else (1, 1)
 
         game_state.player.position = spawn_position
+        new_map.place_entity(game_state.player.id, spawn_position)
         tile = new_map.get_tile(*game_state.player.position)
         if tile:
-            tile.character_id = game_state.player.id
             tile.is_explored = True
             tile.is_visible = True
 
@@ -3119,9 +3045,7 @@ class GameEngine:
         monster_positions = self._get_monster_spawn_positions(new_map, len(monsters))
         for monster, position in zip(monsters, monster_positions):
             monster.position = position
-            tile = new_map.get_tile(*position)
-            if tile:
-                tile.character_id = monster.id
+            new_map.place_entity(monster.id, position)
             game_state.monsters.append(monster)
 
         # 【修复】使用新的进程管理器更新任务进度，传递楼层变化信息
@@ -3145,15 +3069,7 @@ class GameEngine:
             return "你已经回到了地面！"
 
         # 清除旧地图上的角色标记（在生成新地图前）
-        old_tile = game_state.current_map.get_tile(*game_state.player.position)
-        if old_tile:
-            old_tile.character_id = None
-
-        for monster in game_state.monsters:
-            if monster.position:
-                monster_tile = game_state.current_map.get_tile(*monster.position)
-                if monster_tile:
-                    monster_tile.character_id = None
+        game_state.current_map.clear_entities()
 
         # 获取当前活跃任务的上下文
         quest_context = None
@@ -3188,9 +3104,9 @@ class GameEngine:
             spawn_position = spawn_positions[0] if spawn_positions else (1, 1)
 
         game_state.player.position = spawn_position
+        new_map.place_entity(game_state.player.id, spawn_position)
         tile = new_map.get_tile(*game_state.player.position)
         if tile:
-            tile.character_id = game_state.player.id
             tile.is_explored = True
             tile.is_visible = True
 
@@ -3214,9 +3130,7 @@ class GameEngine:
         monster_positions = self._get_monster_spawn_positions(new_map, len(monsters))
         for monster, position in zip(monsters, monster_positions):
             monster.position = position
-            tile = new_map.get_tile(*position)
-            if tile:
-                tile.character_id = monster.id
+            new_map.place_entity(monster.id, position)
             game_state.monsters.append(monster)
 
         # 【修复】使用新的进程管理器更新任务进度，传递楼层变化信息
@@ -3439,6 +3353,27 @@ class GameEngine:
         elif int(local_validation.get("unreachable_targets_after", 0) or 0) > 0:
             metrics["unreachable_reports"] = int(metrics.get("unreachable_reports", 0) or 0) + 1
 
+        # 对冲胜出统计：map 为 LLM 链路与本地提供器竞速，blueprint 为蓝图请求的二次发出
+        hedge_metrics = metrics.get("hedge") if isinstance(metrics.get("hedge"), dict) else {}
+        for hedge_kind, hedge_meta in (("map", meta.get("map_hedge")), ("blueprint", meta.get("blueprint_hedge"))):
+            if not isinstance(hedge_meta, dict):
+                continue
+            bucket = hedge_metrics.get(hedge_kind) if isinstance(hedge_metrics.get(hedge_kind), dict) else {}
+            bucket["runs"] = int(bucket.get("runs", 0) or 0) + 1
+            if hedge_meta.get("hedged"):
+                bucket["hedged"] = int(bucket.get("hedged", 0) or 0) + 1
+            if hedge_meta.get("winner_is_hedge"):
+                bucket["hedge_wins"] = int(bucket.get("hedge_wins", 0) or 0) + 1
+            winner = str(hedge_meta.get("winner") or "none")
+            wins = bucket.get("wins") if isinstance(bucket.get("wins"), dict) else {}
+            wins[winner] = int(wins.get(winner, 0) or 0) + 1
+            bucket["wins"] = wins
+            hedged_count = int(bucket.get("hedged", 0) or 0)
+            bucket["hedge_win_rate"] = round(int(bucket.get("hedge_wins", 0) or 0) / hedged_count, 4) if hedged_count else 0.0
+            hedge_metrics[hedge_kind] = bucket
+        if hedge_metrics:
+            metrics["hedge"] = hedge_metrics
+
         patch_batches = game_state.generation_metrics.get("patch_batches") if isinstance(game_state.generation_metrics.get("patch_batches"), list) else []
         if patch_batches and isinstance(patch_batches[-1], dict) and patch_batches[-1].get("rollback_applied"):
             metrics["rollback_used"] = int(metrics.get("rollback_used", 0) or 0) + 1
@@ -3518,14 +3453,19 @@ class GameEngine:
         if selected_chain == "legacy" or provider == "local":
             try:
                 from local_map_provider import local_map_provider
+                from map_pool import map_pool
 
-                local_map, monster_hints = local_map_provider.generate_map(
-                    width=width,
-                    height=height,
-                    depth=depth,
-                    theme=theme,
-                    quest_context=working_context,
-                )
+                pooled = map_pool.take(width, height, depth, theme, working_context)
+                if pooled is not None:
+                    local_map, monster_hints = pooled
+                else:
+                    local_map, monster_hints = await local_map_provider.agenerate_map(
+                        width=width,
+                        height=height,
+                        depth=depth,
+                        theme=theme,
+                        quest_context=working_context,
+                    )
                 _annotate_meta(
                     local_map,
                     {
@@ -3535,6 +3475,7 @@ class GameEngine:
                         "release_stage": release_stage,
                         "selected_chain": selected_chain,
                         "canary_hit": strategy.get("canary_hit", False),
+                        "map_pool_hit": pooled is not None,
                     },
                 )
                 if game_state:
@@ -3569,14 +3510,48 @@ class GameEngine:
                         )
                     raise
 
+        local_hedge_delay = float(getattr(config.game, "map_local_hedge_delay", 0.0) or 0.0)
+        hedge_with_local = local_hedge_delay > 0 and selected_chain != "legacy" and provider != "local"
         try:
-            llm_map = await content_generator.generate_dungeon_map(
-                width=width,
-                height=height,
-                depth=depth,
-                theme=theme,
-                quest_context=working_context,
-            )
+            hedge_info: Optional[Dict[str, Any]] = None
+            if hedge_with_local:
+                winner, llm_map, monster_hints, hedge_info = await self._race_llm_and_local_map(
+                    width, height, depth, theme, working_context, local_hedge_delay
+                )
+                if winner == "local":
+                    _annotate_meta(
+                        llm_map,
+                        {
+                            "map_provider": "local",
+                            "source": source,
+                            "release_stage": release_stage,
+                            "selected_chain": "legacy",
+                            "monster_hints": monster_hints,
+                            "map_hedge": hedge_info,
+                        },
+                    )
+                    if game_state:
+                        self._record_map_generation_metric(
+                            game_state,
+                            release_stage=release_stage,
+                            selected_chain="legacy",
+                            provider="local",
+                            source=source,
+                            success=True,
+                            fallback_used=hedge_info.get("trigger") == "primary_failed",
+                            rollback_used=False,
+                            generation_metadata=llm_map.generation_metadata,
+                        )
+                    logger.info(f"Map generated by hedged local provider ({source}, trigger={hedge_info.get('trigger')})")
+                    return llm_map
+            else:
+                llm_map = await content_generator.generate_dungeon_map(
+                    width=width,
+                    height=height,
+                    depth=depth,
+                    theme=theme,
+                    quest_context=working_context,
+                )
             _annotate_meta(
                 llm_map,
                 {
@@ -3588,6 +3563,8 @@ class GameEngine:
                     "fallback_used": fallback_used,
                 },
             )
+            if hedge_info is not None:
+                llm_map.generation_metadata["map_hedge"] = hedge_info
             if game_state:
                 self._record_map_generation_metric(
                     game_state,
@@ -3602,11 +3579,12 @@ class GameEngine:
                 )
             return llm_map
         except Exception:
-            if selected_chain != "legacy" and provider != "local":
+            # 对冲时本地提供器已参与竞速并失败，不再重复回滚
+            if selected_chain != "legacy" and provider != "local" and not hedge_with_local:
                 try:
                     from local_map_provider import local_map_provider
 
-                    local_map, monster_hints = local_map_provider.generate_map(
+                    local_map, monster_hints = await local_map_provider.agenerate_map(
                         width=width,
                         height=height,
                         depth=depth,
@@ -3654,6 +3632,50 @@ class GameEngine:
                 )
             raise
 
+    async def _race_llm_and_local_map(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]],
+        hedge_delay: float,
+    ) -> Tuple[str, GameMap, Dict[str, Any], Dict[str, Any]]:
+        """LLM 链路超过 hedge_delay 秒未完成（或已失败）时并发启动本地提供器，先完成者胜出。
+
+        返回 (胜出方, 地图, monster_hints, 对冲信息)。
+        """
+        from local_map_provider import local_map_provider
+
+        async def _llm_candidate() -> Tuple[str, GameMap, Dict[str, Any]]:
+            llm_map = await content_generator.generate_dungeon_map(
+                width=width,
+                height=height,
+                depth=depth,
+                theme=theme,
+                quest_context=quest_context,
+            )
+            return "llm", llm_map, {}
+
+        async def _local_candidate() -> Tuple[str, GameMap, Dict[str, Any]]:
+            local_map, monster_hints = await local_map_provider.agenerate_map(
+                width=width,
+                height=height,
+                depth=depth,
+                theme=theme,
+                quest_context=quest_context,
+            )
+            return "local", local_map, monster_hints
+
+        (winner, game_map, monster_hints), hedge_info = await async_task_manager.run_hedged(
+            _llm_candidate,
+            _local_candidate,
+            hedge_delay,
+            labels=("llm", "local"),
+            description="map_generation",
+        )
+        return winner, game_map, monster_hints, hedge_info
+
     def _get_monster_hint_context(self, game_map: GameMap) -> Dict[str, Any]:
         """提取地图中可用的monster_hints上下文。"""
         metadata = game_map.generation_metadata if isinstance(game_map.generation_metadata, dict) else {}
@@ -3718,7 +3740,7 @@ class GameEngine:
             tile = game_map.get_tile(x, y)
             if not tile:
                 continue
-            if tile.character_id:
+            if game_map.is_occupied(x, y):
                 continue
             if tile.terrain not in {
                 TerrainType.FLOOR,
@@ -3829,15 +3851,7 @@ class GameEngine:
             logger.info(f"Generating new map for quest: {new_quest.title}")
 
             # 清除旧地图上的角色标记
-            old_tile = game_state.current_map.get_tile(*game_state.player.position)
-            if old_tile:
-                old_tile.character_id = None
-
-            for monster in game_state.monsters:
-                if monster.position:
-                    monster_tile = game_state.current_map.get_tile(*monster.position)
-                    if monster_tile:
-                        monster_tile.character_id = None
+            game_state.current_map.clear_entities()
 
             # 生成新地图（通常是下一层）
             new_depth = game_state.current_map.depth + 1
@@ -3862,9 +3876,9 @@ class GameEngine:
             spawn_positions = content_generator.get_spawn_positions(new_map, 1)
             if spawn_positions:
                 game_state.player.position = spawn_positions[0]
+                new_map.place_entity(game_state.player.id, game_state.player.position)
                 tile = new_map.get_tile(*game_state.player.position)
                 if tile:
-                    tile.character_id = game_state.player.id
                     tile.is_explored = True
                     tile.is_visible = True
 
@@ -3886,9 +3900,7 @@ class GameEngine:
             monster_positions = self._get_monster_spawn_positions(new_map, len(monsters))
             for monster, position in zip(monsters, monster_positions):
                 monster.position = position
-                tile = new_map.get_tile(*position)
-                if tile:
-                    tile.character_id = monster.id
+                new_map.place_entity(monster.id, position)
                 game_state.monsters.append(monster)
 
             # 添加地图切换通知
@@ -3950,170 +3962,21 @@ class GameEngine:
         await self._trigger_progress_event(game_state, progress_event_type, context)
 
     async def _process_monster_turns(self, game_state: GameState) -> bool:
-        """处理怪物回合，返回是否有怪物事件发生"""
-        combat_events = []
-        combat_data_list = []
+        """处理怪物回合，返回是否有怪物事件发生
 
-        for monster in game_state.monsters[:]:  # 使用切片避免修改列表时的问题
-            if not monster.stats.is_alive():
-                continue
-
-            # 简单的AI：如果玩家在攻击范围内就攻击，否则移动靠近
-            player_x, player_y = game_state.player.position
-            monster_x, monster_y = monster.position
-            distance = max(abs(player_x - monster_x), abs(player_y - monster_y))  # 切比雪夫距离
-
-            # 检查怪物的攻击范围
-            monster_attack_range = getattr(monster, 'attack_range', 1)
-            if distance <= monster_attack_range:
-                deterministic_seed = int(hashlib.sha1(
-                    f"monster_attack|{game_state.id}|{game_state.turn_count}|{monster.id}|{game_state.player.id}".encode("utf-8")
-                ).hexdigest()[:8], 16)
-                trace_id = f"monster-{game_state.turn_count}-{monster.id}"
-                mitigation_rules = (game_state.combat_rules or {}).get("mitigation", {}) if isinstance(game_state.combat_rules, dict) else {}
-                if not isinstance(mitigation_rules, dict):
-                    mitigation_rules = {}
-
-                # 防御向装备效果在怪物攻击时生效（不污染基础存档字段）
-                original_resistances = dict(getattr(game_state.player, "resistances", {}) or {})
-                original_vulnerabilities = dict(getattr(game_state.player, "vulnerabilities", {}) or {})
-                original_ac_components = dict(getattr(game_state.player.stats, "ac_components", {}) or {})
-                original_ac = int(getattr(game_state.player.stats, "ac", 10) or 10)
-
-                runtime_bonuses = (
-                    (((game_state.combat_snapshot or {}).get("equipment", {}) or {}).get("runtime", {}) or {}).get("combat_bonuses", {})
-                )
-                if not isinstance(runtime_bonuses, dict):
-                    runtime_bonuses = {}
-
-                try:
-                    res_min = float(mitigation_rules.get("resistance_clamp_min", 0.0) or 0.0)
-                    res_max = float(mitigation_rules.get("resistance_clamp_max", 0.95) or 0.95)
-                    if res_max < res_min:
-                        res_min, res_max = res_max, res_min
-                    vul_min_mul = float(mitigation_rules.get("vulnerability_min_multiplier", 1.0) or 1.0)
-                    vul_max_mul = float(mitigation_rules.get("vulnerability_max_multiplier", 3.0) or 3.0)
-                    if vul_max_mul < vul_min_mul:
-                        vul_min_mul, vul_max_mul = vul_max_mul, vul_min_mul
-                    vul_value_max = max(0.0, vul_max_mul - 1.0)
-
-                    for dtype, delta in (runtime_bonuses.get("resistance_bonus", {}) or {}).items():
-                        key = str(dtype or "")
-                        if not key:
-                            continue
-                        game_state.player.resistances[key] = max(
-                            res_min,
-                            min(
-                                res_max,
-                                float(game_state.player.resistances.get(key, 0.0) or 0.0) + float(delta or 0.0),
-                            ),
-                        )
-                    for dtype, delta in (runtime_bonuses.get("vulnerability_reduction", {}) or {}).items():
-                        key = str(dtype or "")
-                        if not key:
-                            continue
-                        game_state.player.vulnerabilities[key] = max(
-                            0.0,
-                            min(
-                                vul_value_max,
-                                float(game_state.player.vulnerabilities.get(key, 0.0) or 0.0) - float(delta or 0.0),
-                            ),
-                        )
-
-                    game_state.player.stats.ac_components = dict(original_ac_components)
-                    game_state.player.stats.ac_components["status"] = int(game_state.player.stats.ac_components.get("status", 0) or 0) + int(runtime_bonuses.get("ac_bonus", 0) or 0)
-                    game_state.player.stats.ac = game_state.player.stats.get_effective_ac()
-
-                    eval_result = combat_core_evaluator.evaluate_attack(
-                        monster,
-                        game_state.player,
-                        attack_type="melee",
-                        deterministic_seed=deterministic_seed,
-                        trace_id=trace_id,
-                        mitigation_policy=mitigation_rules,
-                    )
-                finally:
-                    # 同步 combat_runtime（新结构）与 legacy stats 字段
-                    player_runtime = self._get_player_defense_runtime(game_state.player)
-                    player_runtime["shield"] = max(0, int(getattr(game_state.player.stats, "shield", 0) or 0))
-                    player_runtime["temporary_hp"] = max(0, int(getattr(game_state.player.stats, "temporary_hp", 0) or 0))
-                    self._sync_player_defense_runtime(game_state.player)
-
-                    game_state.player.resistances = original_resistances
-                    game_state.player.vulnerabilities = original_vulnerabilities
-                    game_state.player.stats.ac_components = original_ac_components
-                    game_state.player.stats.ac = original_ac
-
-                damage = int(eval_result.final_damage)
-                if eval_result.hit:
-                    combat_events.append(f"{monster.name} 攻击了你，造成 {damage} 点伤害！")
-                else:
-                    combat_events.append(f"{monster.name} 的攻击未命中！")
-
-                if eval_result.critical:
-                    combat_events.append(f"{monster.name} 发动了致命一击！")
-                logger.info(f"{monster.name} 攻击玩家结算 damage={damage}, hit={eval_result.hit}")
-                self._record_combat_telemetry(game_state, damage=damage, attempt=True)
-                self._record_ac_hit_curve(
-                    game_state,
-                    {
-                        "trace_id": trace_id,
-                        "phase": "monster_attack",
-                        "attacker": str(getattr(monster, "id", "") or ""),
-                        "target": str(getattr(game_state.player, "id", "") or ""),
-                        "target_ac": int(eval_result.attack_roll.get("target_ac", 10) or 10),
-                        "attack_total": int(eval_result.attack_roll.get("total", 0) or 0),
-                        "hit": bool(eval_result.hit),
-                    },
-                )
+        采用阶段化批处理，单回合开销只与怪物数量线性相关：
+        1. 意图阶段：基于回合开始时的位置为所有存活怪物决定 attack/move/idle
+        2. 移动阶段：一次性解决移动冲突（由近及远，目标格先到先得）
+        3. 攻击阶段：在同一个防御加成窗口内批量结算攻击，玩家死亡即中止
+        4. 汇总阶段：写入一条聚合事件记录，并至多添加一个防御交互上下文
+        """
+        phase_start = datetime.utcnow().timestamp()
+        intents = self._plan_monster_intents(game_state)
+        attack_intents = [intent for intent in intents if intent["intent"] == "attack"]
+        move_intents = [intent for intent in intents if intent["intent"] == "move"]
 
-                # 记录战斗数据用于LLM上下文
-                combat_data_list.append({
-                    "type": "monster_attack",
-                    "attacker": monster.name,
-                    "damage": damage,
-                    "hit": bool(eval_result.hit),
-                    "critical": bool(eval_result.critical),
-                    "player_hp_remaining": game_state.player.stats.hp,
-                    "player_hp_max": game_state.player.stats.max_hp,
-                    "monster_position": monster.position,
-                    "distance": distance,
-                    "combat_breakdown": eval_result.breakdown,
-                })
-
-                hook_result = effect_engine.process_effect_hooks(
-                    game_state,
-                    hook="on_damage_taken",
-                    actor=monster,
-                    target=game_state.player,
-                    context={"trace_id": trace_id},
-                )
-                regen_bonus = int(
-                    ((((game_state.combat_snapshot or {}).get("equipment", {}) or {}).get("runtime", {}) or {})
-                    .get("combat_bonuses", {})
-                    .get("regen_per_turn", 0)
-                    or 0)
-                )
-                if regen_bonus > 0 and game_state.player.stats.hp > 0:
-                    before_hp = int(game_state.player.stats.hp)
-                    game_state.player.stats.hp = min(int(game_state.player.stats.max_hp), before_hp + regen_bonus)
-                    healed = int(game_state.player.stats.hp) - before_hp
-                    if healed > 0:
-                        combat_events.append(f"装备回复触发，恢复 {healed} 点生命")
-                if hook_result.get("events"):
-                    combat_events.extend(hook_result["events"])
-
-                # 检查玩家是否死亡
-                if game_state.player.stats.hp <= 0:
-                    combat_events.append("你被击败了！游戏结束！")
-                    game_state.is_game_over = True
-                    game_state.game_over_reason = "被怪物击败"
-                    self._record_combat_telemetry(game_state, loss=True, death_source="monster_attack")
-                    break  # 玩家死亡，停止处理其他怪物
-
-            elif distance <= 5:
-                # 移动靠近玩家
-                await self._move_monster_towards_player(game_state, monster)
+        moved_count = self._resolve_monster_movements(game_state, move_intents)
+        combat_events, combat_data_list = self._resolve_monster_attacks(game_state, attack_intents)
 
         # 将战斗事件添加到游戏状态中，以便前端显示
         if combat_events:
@@ -4121,7 +3984,7 @@ class GameEngine:
                 game_state.pending_events = []
             game_state.pending_events.extend(combat_events)
 
-            # 如果有战斗事件，创建防御交互上下文并添加到LLM管理器
+            # 如果有战斗事件，创建防御交互上下文并添加到LLM管理器（每回合至多一个）
             if combat_data_list:
                 defense_context = InteractionContext(
                     interaction_type=InteractionType.COMBAT_DEFENSE,
@@ -4136,39 +3999,258 @@ class GameEngine:
                 )
                 llm_interaction_manager.add_context(defense_context)
 
+        self._ensure_combat_defaults(game_state)
+        game_state.combat_snapshot["monster_phase"] = {
+            "turn": int(game_state.turn_count),
+            "monsters_considered": len(intents),
+            "attacks_planned": len(attack_intents),
+            "attacks_resolved": len(combat_data_list),
+            "moves_planned": len(move_intents),
+            "moves_resolved": moved_count,
+            "total_damage": sum(data["damage"] for data in combat_data_list),
+            "player_defeated": bool(game_state.is_game_over),
+            "elapsed_ms": max(0, int((datetime.utcnow().timestamp() - phase_start) * 1000)),
+        }
+
         # 返回是否有怪物事件发生（主要是攻击事件）
         return len(combat_events) > 0
 
-    async def _move_monster_towards_player(self, game_state: GameState, monster: Monster):
-        """移动怪物靠近玩家"""
+    def _plan_monster_intents(self, game_state: GameState) -> List[Dict[str, Any]]:
+        """意图阶段：只读计算每只怪物本回合的行动意图
+
+        常规路径只考察玩家警戒半径内的怪物（实体空间索引范围查询，由近及远）；
+        索引与怪物列表不一致（有怪物未入索引，或范围内出现未知实体）时退回逐怪物扫描，
+        避免放置失败的怪物从此不再行动。
+        """
+        player = game_state.player
+        player_x, player_y = player.position
+        game_map = game_state.current_map
+        indexed_entities = len(game_map.entity_index) - (1 if player.id in game_map.entity_index else 0)
+
+        candidates: List[Tuple[Monster, Tuple[int, int]]] = []
+        index_consistent = indexed_entities == len(game_state.monsters)
+        if index_consistent:
+            for entity_id, position in game_map.get_entities_in_range(player_x, player_y, MONSTER_AWARENESS_RADIUS):
+                if entity_id == player.id:
+                    continue
+                monster = game_state.get_monster(entity_id)
+                if monster is None:
+                    index_consistent = False
+                    break
+                candidates.append((monster, position))
+        if not index_consistent:
+            logger.warning(
+                "Entity index out of sync for game %s (indexed=%s, monsters=%s); scanning monster list",
+                game_state.id, indexed_entities, len(game_state.monsters),
+            )
+            candidates = [(monster, tuple(monster.position)) for monster in game_state.monsters]
+
+        intents: List[Dict[str, Any]] = []
+        for monster, (monster_x, monster_y) in candidates:
+            if not monster.stats.is_alive():
+                continue
+
+            # 简单的AI：如果玩家在攻击范围内就攻击，否则移动靠近
+            distance = max(abs(player_x - monster_x), abs(player_y - monster_y))  # 切比雪夫距离
+            monster_attack_range = getattr(monster, 'attack_range', 1)
+            if distance <= monster_attack_range:
+                intent = "attack"
+            elif distance <= MONSTER_AWARENESS_RADIUS:
+                intent = "move"
+            else:
+                continue
+            intents.append({"monster": monster, "intent": intent, "distance": distance})
+        return intents
+
+    def _resolve_monster_movements(self, game_state: GameState, move_intents: List[Dict[str, Any]]) -> int:
+        """移动阶段：一次性解决移动冲突，返回实际移动的怪物数量
+
+        由近及远处理，前排怪物先让出位置；占用检查走实体空间索引，避免逐怪物扫描。
+        """
+        game_map = game_state.current_map
         player_x, player_y = game_state.player.position
-        monster_x, monster_y = monster.position
+        moved = 0
+        for intent in sorted(move_intents, key=lambda item: item["distance"]):
+            monster = intent["monster"]
+            monster_x, monster_y = monster.position
+
+            # 简单的寻路：朝玩家方向移动一格
+            dx = 0 if player_x == monster_x else (1 if player_x > monster_x else -1)
+            dy = 0 if player_y == monster_y else (1 if player_y > monster_y else -1)
+            new_x, new_y = monster_x + dx, monster_y + dy
+
+            # 检查新位置是否有效
+            target_tile = game_map.get_tile(new_x, new_y)
+            if (target_tile and target_tile.terrain != TerrainType.WALL and
+                not game_map.is_occupied(new_x, new_y)):
+                game_map.place_entity(monster.id, (new_x, new_y))
+                monster.position = (new_x, new_y)
+                moved += 1
+        return moved
+
+    def _resolve_monster_attacks(
+        self,
+        game_state: GameState,
+        attack_intents: List[Dict[str, Any]],
+    ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """攻击阶段：批量结算怪物攻击，返回 (战斗事件, 战斗数据)"""
+        combat_events: List[str] = []
+        combat_data_list: List[Dict[str, Any]] = []
+        if not attack_intents:
+            return combat_events, combat_data_list
+
+        player = game_state.player
+        mitigation_rules = (game_state.combat_rules or {}).get("mitigation", {}) if isinstance(game_state.combat_rules, dict) else {}
+        if not isinstance(mitigation_rules, dict):
+            mitigation_rules = {}
+        runtime_bonuses = (
+            (((game_state.combat_snapshot or {}).get("equipment", {}) or {}).get("runtime", {}) or {}).get("combat_bonuses", {})
+        )
+        if not isinstance(runtime_bonuses, dict):
+            runtime_bonuses = {}
+        regen_bonus = int(runtime_bonuses.get("regen_per_turn", 0) or 0)
+
+        res_min = float(mitigation_rules.get("resistance_clamp_min", 0.0) or 0.0)
+        res_max = float(mitigation_rules.get("resistance_clamp_max", 0.95) or 0.95)
+        if res_max < res_min:
+            res_min, res_max = res_max, res_min
+        vul_min_mul = float(mitigation_rules.get("vulnerability_min_multiplier", 1.0) or 1.0)
+        vul_max_mul = float(mitigation_rules.get("vulnerability_max_multiplier", 3.0) or 3.0)
+        if vul_max_mul < vul_min_mul:
+            vul_min_mul, vul_max_mul = vul_max_mul, vul_min_mul
+        vul_value_max = max(0.0, vul_max_mul - 1.0)
+
+        for intent in attack_intents:
+            monster = intent["monster"]
+            deterministic_seed = int(hashlib.sha1(
+                f"monster_attack|{game_state.id}|{game_state.turn_count}|{monster.id}|{player.id}".encode("utf-8")
+            ).hexdigest()[:8], 16)
+            trace_id = f"monster-{game_state.turn_count}-{monster.id}"
+
+            # 防御向装备效果只在本次攻击判定期间生效（不污染基础存档字段），
+            # 判定后立即还原，on_damage_taken 钩子与回复结算看到的是玩家真实属性
+            original_resistances = dict(getattr(player, "resistances", {}) or {})
+            original_vulnerabilities = dict(getattr(player, "vulnerabilities", {}) or {})
+            original_ac_components = dict(getattr(player.stats, "ac_components", {}) or {})
+            original_ac = int(getattr(player.stats, "ac", 10) or 10)
 
-        # 简单的寻路：朝玩家方向移动一格
-        dx = 0 if player_x == monster_x else (1 if player_x > monster_x else -1)
-        dy = 0 if player_y == monster_y else (1 if player_y > monster_y else -1)
+            try:
+                for dtype, delta in (runtime_bonuses.get("resistance_bonus", {}) or {}).items():
+                    key = str(dtype or "")
+                    if not key:
+                        continue
+                    player.resistances[key] = max(
+                        res_min,
+                        min(
+                            res_max,
+                            float(player.resistances.get(key, 0.0) or 0.0) + float(delta or 0.0),
+                        ),
+                    )
+                for dtype, delta in (runtime_bonuses.get("vulnerability_reduction", {}) or {}).items():
+                    key = str(dtype or "")
+                    if not key:
+                        continue
+                    player.vulnerabilities[key] = max(
+                        0.0,
+                        min(
+                            vul_value_max,
+                            float(player.vulnerabilities.get(key, 0.0) or 0.0) - float(delta or 0.0),
+                        ),
+                    )
 
-        new_x, new_y = monster_x + dx, monster_y + dy
+                player.stats.ac_components = dict(original_ac_components)
+                player.stats.ac_components["status"] = int(player.stats.ac_components.get("status", 0) or 0) + int(runtime_bonuses.get("ac_bonus", 0) or 0)
+                player.stats.ac = player.stats.get_effective_ac()
+
+                eval_result = combat_core_evaluator.evaluate_attack(
+                    monster,
+                    player,
+                    attack_type="melee",
+                    deterministic_seed=deterministic_seed,
+                    trace_id=trace_id,
+                    mitigation_policy=mitigation_rules,
+                )
+            finally:
+                # 同步 combat_runtime（新结构）与 legacy stats 字段
+                player_runtime = self._get_player_defense_runtime(player)
+                player_runtime["shield"] = max(0, int(getattr(player.stats, "shield", 0) or 0))
+                player_runtime["temporary_hp"] = max(0, int(getattr(player.stats, "temporary_hp", 0) or 0))
+                self._sync_player_defense_runtime(player)
+
+                player.resistances = original_resistances
+                player.vulnerabilities = original_vulnerabilities
+                player.stats.ac_components = original_ac_components
+                player.stats.ac = original_ac
 
-        # 检查新位置是否有效
-        target_tile = game_state.current_map.get_tile(new_x, new_y)
-        if (target_tile and target_tile.terrain != TerrainType.WALL and
-            not target_tile.character_id):
+            damage = int(eval_result.final_damage)
+            if eval_result.hit:
+                combat_events.append(f"{monster.name} 攻击了你，造成 {damage} 点伤害！")
+            else:
+                combat_events.append(f"{monster.name} 的攻击未命中！")
+
+            if eval_result.critical:
+                combat_events.append(f"{monster.name} 发动了致命一击！")
+            logger.info(f"{monster.name} 攻击玩家结算 damage={damage}, hit={eval_result.hit}")
+            self._record_combat_telemetry(game_state, damage=damage, attempt=True)
+            self._record_ac_hit_curve(
+                game_state,
+                {
+                    "trace_id": trace_id,
+                    "phase": "monster_attack",
+                    "attacker": str(getattr(monster, "id", "") or ""),
+                    "target": str(getattr(player, "id", "") or ""),
+                    "target_ac": int(eval_result.attack_roll.get("target_ac", 10) or 10),
+                    "attack_total": int(eval_result.attack_roll.get("total", 0) or 0),
+                    "hit": bool(eval_result.hit),
+                },
+            )
+
+            # 记录战斗数据用于LLM上下文
+            combat_data_list.append({
+                "type": "monster_attack",
+                "attacker": monster.name,
+                "damage": damage,
+                "hit": bool(eval_result.hit),
+                "critical": bool(eval_result.critical),
+                "player_hp_remaining": player.stats.hp,
+                "player_hp_max": player.stats.max_hp,
+                "monster_position": monster.position,
+                "distance": intent["distance"],
+                "combat_breakdown": eval_result.breakdown,
+            })
+
+            hook_result = effect_engine.process_effect_hooks(
+                game_state,
+                hook="on_damage_taken",
+                actor=monster,
+                target=player,
+                context={"trace_id": trace_id},
+            )
+            if regen_bonus > 0 and player.stats.hp > 0:
+                before_hp = int(player.stats.hp)
+                player.stats.hp = min(int(player.stats.max_hp), before_hp + regen_bonus)
+                healed = int(player.stats.hp) - before_hp
+                if healed > 0:
+                    combat_events.append(f"装备回复触发，恢复 {healed} 点生命")
+            if hook_result.get("events"):
+                combat_events.extend(hook_result["events"])
 
-            # 移动怪物
-            old_tile = game_state.current_map.get_tile(monster_x, monster_y)
-            if old_tile:
-                old_tile.character_id = None
+            # 检查玩家是否死亡
+            if player.stats.hp <= 0:
+                combat_events.append("你被击败了！游戏结束！")
+                game_state.is_game_over = True
+                game_state.game_over_reason = "被怪物击败"
+                self._record_combat_telemetry(game_state, loss=True, death_source="monster_attack")
+                break  # 玩家死亡，停止处理其他怪物
 
-            target_tile.character_id = monster.id
-            monster.position = (new_x, new_y)
+        return combat_events, combat_data_list
 
     @async_performance_monitor
     async def _save_game_async(self, game_state: GameState, user_id: str, retry_count: int = 3):
         """
         异步保存游戏（带重试机制，保存到用户目录）
 
-        使用锁保护，防止保存时与其他操作冲突
+        只在读锁内生成快照，JSON 编码与写盘在锁外进行，不阻塞游戏操作
 
         Args:
             game_state: 游戏状态
@@ -4182,21 +4264,21 @@ class GameEngine:
                 # 导入 user_session_manager
                 from user_session_manager import user_session_manager
 
-                # 使用锁保护游戏状态的读取
-                async with game_state_lock_manager.lock_game_state(user_id, game_state.id, "auto_save"):
-                    # 转换为字典格式（在锁内进行，确保数据一致性）
-                    game_data = game_state.to_dict()
-                    # 保存最近N条LLM上下文到存档
-                    try:
-                        from llm_context_manager import llm_context_manager
-                        game_data["llm_context_logs"] = [
-                            e.to_dict() for e in llm_context_manager.get_recent_context(
-                                max_entries=getattr(config.llm, "save_context_entries", 20),
-                                context_key=f"{user_id}:{game_state.id}",
-                            )
-                        ]
-                    except Exception as _e:
-                        logger.warning(f"[auto_save] Failed to attach LLM context logs: {_e}")
+                # 锁内只生成只读快照（未变化的瓦片复用缓存），JSON 编码与写盘在锁外
+                async with game_state_lock_manager.read_game_state(user_id, game_state.id, "auto_save"):
+                    game_data = capture_game_state(game_state).to_dict()
+
+                # 保存最近N条LLM上下文到存档
+                try:
+                    from llm_context_manager import llm_context_manager
+                    game_data["llm_context_logs"] = [
+                        e.to_dict() for e in llm_context_manager.get_recent_context(
+                            max_entries=getattr(config.llm, "save_context_entries", 20),
+                            context_key=f"{user_id}:{game_state.id}",
+                        )
+                    ]
+                except Exception as _e:
+                    logger.warning(f"[auto_save] Failed to attach LLM context logs: {_e}")
 
                 # 使用统一的IO线程池，保存到用户目录（在锁外进行，避免阻塞）
                 await loop.run_in_executor(
@@ -4291,6 +4373,9 @@ class GameEngine:
             del self.active_games[game_key]
             logger.info(f"Game {game_id} closed for user {user_id}")
 
+        # 释放该游戏的幂等记录（内存与 SQLite）
+        await self.idempotency_store.aclear(game_key)
+
         # 清理游戏状态锁
         await game_state_lock_manager.remove_lock(user_id, game_id)
 
@@ -1,188 +1,387 @@
 """
 Labyrinthia AI - 游戏状态锁管理器
 提供游戏状态的并发访问控制，防止竞态条件
+
+- 每局游戏一把写优先的读写锁：只读接口（任务列表、进度、存档序列化）之间并发，
+  写操作（行动、战斗结算、地图切换等）独占；
+- 查找按局锁时先无锁读字典，未命中才在按键分片的创建锁内创建，不再让所有玩家
+  在同一把全局锁上排队；
+- 按读/写模式与操作名统计等待、持有时间直方图，见 /api/debug/locks。
 """
 
 import asyncio
 import logging
-from typing import Dict, Tuple, Optional
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 from contextlib import asynccontextmanager
 from datetime import datetime
 import time
 
 logger = logging.getLogger(__name__)
 
+LOCK_MODES = ("read", "write")
+LOCK_STRIPES = 16
+# 直方图桶上界（毫秒），最后一个桶为 +Inf
+LOCK_HISTOGRAM_BOUNDS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_OPERATION_HISTOGRAMS = 128
+SLOW_WAIT_SECONDS = 0.1
+
+
+class LockHistogram:
+    """固定分桶的耗时直方图（毫秒）"""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(LOCK_HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        value_ms = max(0.0, float(value_ms))
+        index = len(LOCK_HISTOGRAM_BOUNDS_MS)
+        for position, bound in enumerate(LOCK_HISTOGRAM_BOUNDS_MS):
+            if value_ms <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def quantile(self, fraction: float) -> float:
+        """按桶上界估算分位数（落在 +Inf 桶时返回观测到的最大值）"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * fraction)))
+        seen = 0
+        for position, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                if position < len(LOCK_HISTOGRAM_BOUNDS_MS):
+                    return float(min(LOCK_HISTOGRAM_BOUNDS_MS[position], self.max_ms))
+                return self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}" for bound in LOCK_HISTOGRAM_BOUNDS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5), 3),
+            "p95_ms": round(self.quantile(0.95), 3),
+            "p99_ms": round(self.quantile(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class AsyncRWLock:
+    """写优先的异步读写锁
+
+    读者之间并发、写者独占；等待者按到达顺序排队，队首连续的读者一起放行。
+    一旦有写者在排队，新到的读者排在它后面，避免写者饥饿。
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiters: Deque[Tuple[str, "asyncio.Future[bool]"]] = deque()
+
+    @property
+    def readers(self) -> int:
+        return self._readers
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, future in self._waiters if not future.done())
+
+    def locked(self) -> bool:
+        return self._writer or self._readers > 0
+
+    def write_locked(self) -> bool:
+        return self._writer
+
+    def _can_grant(self, mode: str) -> bool:
+        if mode == "write":
+            return not self._writer and self._readers == 0
+        return not self._writer
+
+    def _grant(self, mode: str) -> None:
+        if mode == "write":
+            self._writer = True
+        else:
+            self._readers += 1
+
+    async def acquire(self, mode: str = "write") -> None:
+        if not self._waiters and self._can_grant(mode):
+            self._grant(mode)
+            return
+
+        future: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        self._waiters.append((mode, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已被授予但调用方在恢复前被取消：归还后再抛出
+                self.release(mode)
+            else:
+                self._wake()
+            raise
+
+    def release(self, mode: str = "write") -> None:
+        if mode == "write":
+            if not self._writer:
+                return
+            self._writer = False
+        else:
+            if self._readers <= 0:
+                return
+            self._readers -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            mode, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._can_grant(mode):
+                break
+            self._waiters.popleft()
+            self._grant(mode)
+            future.set_result(True)
+            if mode == "write":
+                break
+
 
 class GameStateLock:
     """单个游戏状态的锁"""
 
     def __init__(self, game_key: Tuple[str, str]):
         self.game_key = game_key
-        self.lock = asyncio.Lock()
+        self.lock = AsyncRWLock()
         self.last_access = time.time()
         self.access_count = 0
+        self.read_count = 0
         self.current_operation: Optional[str] = None
         self.current_acquired_at: float = 0.0
         self.last_wait_ms: int = 0
         self.last_hold_ms: int = 0
 
-    async def acquire(self, operation: str = "unknown"):
-        """获取锁"""
-        await self.lock.acquire()
+    async def acquire(self, operation: str = "unknown", mode: str = "write") -> float:
+        """获取锁，返回获得锁的时间戳（释放读锁时用于计算持有时长）"""
+        await self.lock.acquire(mode)
         now_ts = time.time()
         self.last_access = now_ts
         self.access_count += 1
-        self.current_operation = operation
-        self.current_acquired_at = now_ts
-        logger.debug(f"Lock acquired for {self.game_key} - operation: {operation}")
+        if mode == "write":
+            self.current_operation = operation
+            self.current_acquired_at = now_ts
+        else:
+            self.read_count += 1
+        logger.debug(f"Lock acquired for {self.game_key} - operation: {operation}, mode: {mode}")
+        return now_ts
 
-    def release(self):
-        """释放锁"""
-        operation = self.current_operation
+    def release(self, mode: str = "write", acquired_at: Optional[float] = None) -> int:
+        """释放锁，返回持有时长（毫秒）"""
+        started = self.current_acquired_at if mode == "write" else (acquired_at or 0.0)
         hold_ms = 0
-        if self.current_acquired_at > 0:
-            hold_ms = int(max(0.0, (time.time() - self.current_acquired_at) * 1000.0))
+        if started > 0:
+            hold_ms = int(max(0.0, (time.time() - started) * 1000.0))
 
-        self.last_hold_ms = hold_ms
-        self.current_acquired_at = 0.0
-        self.current_operation = None
+        operation = None
+        if mode == "write":
+            operation = self.current_operation
+            self.last_hold_ms = hold_ms
+            self.current_acquired_at = 0.0
+            self.current_operation = None
+
+        self.lock.release(mode)
+        logger.debug(f"Lock released for {self.game_key} - operation: {operation}, mode: {mode}, hold_ms={hold_ms}")
+        return hold_ms
 
-        if self.lock.locked():
-            self.lock.release()
-        logger.debug(f"Lock released for {self.game_key} - operation: {operation}, hold_ms={hold_ms}")
-        
     def is_locked(self) -> bool:
-        """检查是否已锁定"""
+        """检查是否已锁定（写锁或仍有读者）"""
         return self.lock.locked()
 
 
 class GameStateLockManager:
     """
     游戏状态锁管理器
-    
-    为每个游戏状态提供独立的锁，防止并发访问导致的数据不一致
+
+    为每个游戏状态提供独立的读写锁，防止并发访问导致的数据不一致
     """
-    
+
     def __init__(self):
         self._locks: Dict[Tuple[str, str], GameStateLock] = {}
-        self._manager_lock = asyncio.Lock()  # 保护 _locks 字典本身的锁
-        
+        # 只在创建 / 删除按局锁时使用，按 game_key 哈希分片
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.lookup_stats: Dict[str, int] = {"fast_path": 0, "created": 0}
+        self._wait_histograms: Dict[str, LockHistogram] = {mode: LockHistogram() for mode in LOCK_MODES}
+        self._hold_histograms: Dict[str, LockHistogram] = {mode: LockHistogram() for mode in LOCK_MODES}
+        self._operation_wait_histograms: Dict[str, LockHistogram] = {}
+
+    def _stripe_for(self, game_key: Tuple[str, str]) -> threading.Lock:
+        return self._stripes[hash(game_key) % len(self._stripes)]
+
+    def _get_lock(self, game_key: Tuple[str, str]) -> GameStateLock:
+        """查找按局锁：命中直接返回，未命中在分片锁内创建"""
+        lock = self._locks.get(game_key)
+        if lock is not None:
+            self.lookup_stats["fast_path"] += 1
+            return lock
+        with self._stripe_for(game_key):
+            lock = self._locks.get(game_key)
+            if lock is None:
+                lock = self._locks.setdefault(game_key, GameStateLock(game_key))
+                self.lookup_stats["created"] += 1
+                logger.debug(f"Created new lock for game {game_key}")
+            return lock
+
     async def _get_or_create_lock(self, game_key: Tuple[str, str]) -> GameStateLock:
         """获取或创建游戏状态锁"""
-        async with self._manager_lock:
-            if game_key not in self._locks:
-                self._locks[game_key] = GameStateLock(game_key)
-                logger.debug(f"Created new lock for game {game_key}")
-            return self._locks[game_key]
-    
+        return self._get_lock(game_key)
+
+    def _observe(self, mode: str, operation: str, wait_ms: float) -> None:
+        self._wait_histograms[mode].observe(wait_ms)
+        key = f"{mode}:{operation}"
+        histogram = self._operation_wait_histograms.get(key)
+        if histogram is None:
+            if len(self._operation_wait_histograms) >= MAX_OPERATION_HISTOGRAMS:
+                key = f"{mode}:other"
+            histogram = self._operation_wait_histograms.setdefault(key, LockHistogram())
+        histogram.observe(wait_ms)
+
     @asynccontextmanager
-    async def lock_game_state(self, user_id: str, game_id: str, operation: str = "unknown"):
+    async def lock_game_state(self, user_id: str, game_id: str, operation: str = "unknown", mode: str = "write"):
         """
         锁定游戏状态的上下文管理器
-        
+
         使用方法:
         async with lock_manager.lock_game_state(user_id, game_id, "save"):
             # 在这里安全地访问和修改游戏状态
             game_state = game_engine.active_games[game_key]
             # ... 进行操作 ...
-        
+
         Args:
             user_id: 用户ID
             game_id: 游戏ID
             operation: 操作描述（用于调试）
+            mode: "write"（默认，独占）或 "read"（与其它读者并发，不得修改游戏状态）
         """
+        if mode not in LOCK_MODES:
+            raise ValueError(f"未知锁模式: {mode!r}")
         game_key = (user_id, game_id)
-        lock = await self._get_or_create_lock(game_key)
-        
+        lock = self._get_lock(game_key)
+
         # 记录等待时间
         wait_start = time.time()
-        lock_acquired = False
+        acquired_at: Optional[float] = None
 
         try:
-            await lock.acquire(operation)
-            lock_acquired = True
-            wait_time = time.time() - wait_start
-            lock.last_wait_ms = int(max(0.0, wait_time * 1000.0))
+            acquired_at = await lock.acquire(operation, mode)
+            wait_time = acquired_at - wait_start
+            if mode == "write":
+                lock.last_wait_ms = int(max(0.0, wait_time * 1000.0))
+            self._observe(mode, operation, wait_time * 1000.0)
 
-            if wait_time > 0.1:  # 如果等待超过100ms，记录警告
+            if wait_time > SLOW_WAIT_SECONDS:  # 如果等待超过100ms，记录警告
                 logger.warning(
-                    f"Lock wait time for {game_key} ({operation}): {wait_time:.3f}s"
+                    f"Lock wait time for {game_key} ({operation}, {mode}): {wait_time:.3f}s"
                 )
 
             yield lock
 
         finally:
-            if lock_acquired:
-                lock.release()
-    
+            if acquired_at is not None:
+                hold_ms = lock.release(mode, acquired_at)
+                self._hold_histograms[mode].observe(hold_ms)
+
+    def read_game_state(self, user_id: str, game_id: str, operation: str = "unknown"):
+        """只读访问的快捷方式：等价于 lock_game_state(..., mode="read")"""
+        return self.lock_game_state(user_id, game_id, operation, mode="read")
+
     async def cleanup_unused_locks(self, timeout_seconds: float = 3600):
         """
         清理长时间未使用的锁
-        
+
         Args:
             timeout_seconds: 超时时间（秒），默认1小时
         """
-        async with self._manager_lock:
-            current_time = time.time()
-            keys_to_remove = []
-            
-            for game_key, lock in self._locks.items():
-                # 如果锁未被使用且超过超时时间，标记为待删除
-                if not lock.is_locked() and (current_time - lock.last_access) > timeout_seconds:
-                    keys_to_remove.append(game_key)
-            
-            # 删除未使用的锁
-            for game_key in keys_to_remove:
-                del self._locks[game_key]
-                logger.info(f"Cleaned up unused lock for game {game_key}")
-            
-            if keys_to_remove:
-                logger.info(f"Cleaned up {len(keys_to_remove)} unused locks")
-    
+        current_time = time.time()
+        removed = 0
+
+        for game_key, lock in list(self._locks.items()):
+            # 如果锁未被使用且超过超时时间，删除
+            if lock.is_locked() or lock.lock.waiting or (current_time - lock.last_access) <= timeout_seconds:
+                continue
+            with self._stripe_for(game_key):
+                if self._locks.get(game_key) is lock:
+                    del self._locks[game_key]
+                    removed += 1
+                    logger.info(f"Cleaned up unused lock for game {game_key}")
+
+        if removed:
+            logger.info(f"Cleaned up {removed} unused locks")
+
     def get_lock_stats(self) -> Dict:
-        """获取锁统计信息"""
-        stats = {
+        """获取锁统计信息（含按模式 / 操作的等待与持有时间直方图）"""
+        stats: Dict[str, Any] = {
             "total_locks": len(self._locks),
             "locked_count": sum(1 for lock in self._locks.values() if lock.is_locked()),
-            "locks": []
+            "lookup": dict(self.lookup_stats),
+            "wait_histograms": {mode: histogram.to_dict() for mode, histogram in self._wait_histograms.items()},
+            "hold_histograms": {mode: histogram.to_dict() for mode, histogram in self._hold_histograms.items()},
+            "operation_wait_histograms": {
+                key: histogram.to_dict() for key, histogram in sorted(self._operation_wait_histograms.items())
+            },
+            "locks": [],
         }
-        
-        for game_key, lock in self._locks.items():
-            stats["locks"].append({
+
+        locks: List[Dict[str, Any]] = stats["locks"]
+        for game_key, lock in list(self._locks.items()):
+            locks.append({
                 "game_key": game_key,
                 "is_locked": lock.is_locked(),
+                "write_locked": lock.lock.write_locked(),
+                "active_readers": lock.lock.readers,
+                "waiting": lock.lock.waiting,
                 "access_count": lock.access_count,
+                "read_count": lock.read_count,
                 "last_access": datetime.fromtimestamp(lock.last_access).isoformat(),
                 "current_operation": lock.current_operation,
                 "last_wait_ms": lock.last_wait_ms,
                 "last_hold_ms": lock.last_hold_ms,
             })
-        
+
         return stats
-    
+
     async def remove_lock(self, user_id: str, game_id: str):
         """
         移除指定游戏的锁（游戏关闭时调用）
-        
+
         Args:
             user_id: 用户ID
             game_id: 游戏ID
         """
         game_key = (user_id, game_id)
-        async with self._manager_lock:
-            if game_key in self._locks:
-                lock = self._locks[game_key]
-                if lock.is_locked():
-                    logger.warning(
-                        f"Removing lock for {game_key} while it's still locked! "
-                        f"Current operation: {lock.current_operation}"
-                    )
-                del self._locks[game_key]
-                logger.debug(f"Removed lock for game {game_key}")
+        with self._stripe_for(game_key):
+            lock = self._locks.pop(game_key, None)
+        if lock is None:
+            return
+        if lock.is_locked():
+            logger.warning(
+                f"Removing lock for {game_key} while it's still locked! "
+                f"Current operation: {lock.current_operation}"
+            )
+        logger.debug(f"Removed lock for game {game_key}")
 
 
 # 全局锁管理器实例
 game_state_lock_manager = GameStateLockManager()
 
-__all__ = ["GameStateLockManager", "game_state_lock_manager"]
-
+__all__ = ["AsyncRWLock", "GameStateLockManager", "LockHistogram", "game_state_lock_manager"]
@@ -4,8 +4,6 @@ Labyrinthia AI - 游戏状态修改器
 """
 
 import logging
-import copy
-from collections import deque
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -18,6 +16,8 @@ from data_models import (
 from config import config
 from entity_manager import entity_manager
 from generation_contract import resolve_generation_contract
+from map_analysis import MapConnectivityIndex
+from patch_journal import PatchJournal
 
 
 logger = logging.getLogger(__name__)
@@ -120,6 +120,8 @@ class GameStateModifier:
         self.modification_history: List[ModificationRecord] = []
         self.max_history_size = 100
         self.max_patch_batches = 200
+        # 当前正在执行的补丁事务日志（apply_patch_batch 期间有效）
+        self._patch_journal: Optional[PatchJournal] = None
         
     def apply_llm_updates(
         self,
@@ -231,7 +233,7 @@ class GameStateModifier:
             )
             return result
 
-        snapshots: List[Dict[str, Any]] = []
+        journals: List[PatchJournal] = []
 
         for idx, patch in enumerate(patches):
             if not isinstance(patch, dict):
@@ -289,10 +291,16 @@ class GameStateModifier:
                     break
                 continue
 
-            snapshot = self._make_patch_snapshot(game_state)
-            snapshots.append({"id": patch_id, "snapshot": snapshot})
+            journal = PatchJournal(game_state, label=patch_id)
+            # 待显示事件可能由补丁触发的下游逻辑间接追加，列表很短，预先记录
+            journal.touch_pending_events()
+            journals.append(journal)
 
-            patch_apply = self._apply_single_patch(game_state, patch, source)
+            self._patch_journal = journal
+            try:
+                patch_apply = self._apply_single_patch(game_state, patch, source)
+            finally:
+                self._patch_journal = None
             patch_apply["intent_reason"] = intent_reason
             patch_apply["risk_level"] = risk_level
 
@@ -301,18 +309,16 @@ class GameStateModifier:
             else:
                 result.rejected_patches.append(patch_apply)
                 if rollback_mode == "partial":
-                    if snapshots:
-                        latest = snapshots[-1]
-                        self._restore_patch_snapshot(game_state, latest["snapshot"])
+                    if journals:
+                        self._rollback_patch_journals(journals[-1:])
                         result.rollback_trace.append({"mode": "partial", "patch_id": patch_id, "rolled_back": True})
                 else:
                     result.success = False
                     break
 
         if not result.success and rollback_mode == "full":
-            if snapshots:
-                first_snapshot = snapshots[0]["snapshot"]
-                self._restore_patch_snapshot(game_state, first_snapshot)
+            if journals:
+                self._rollback_patch_journals(journals)
                 result.rollback_applied = True
                 result.rollback_trace.append({"mode": "full", "rolled_back": True, "batch_id": batch_id})
 
@@ -325,9 +331,8 @@ class GameStateModifier:
                 result.diagnostics.extend(
                     [{"code": "PATCH_POST_CHECK_FAILED", "message": item.get("name", "unknown")} for item in failed_checks]
                 )
-                if snapshots:
-                    first_snapshot = snapshots[0]["snapshot"]
-                    self._restore_patch_snapshot(game_state, first_snapshot)
+                if journals:
+                    self._rollback_patch_journals(journals)
                     result.rollback_applied = True
                     result.rollback_trace.append({"mode": "post_check", "rolled_back": True, "batch_id": batch_id})
 
@@ -414,6 +419,8 @@ class GameStateModifier:
                 binding = patch.get("payload") if isinstance(patch.get("payload"), dict) else {}
                 if not isinstance(game_state.generation_metrics, dict):
                     game_state.generation_metrics = {}
+                if self._patch_journal is not None:
+                    self._patch_journal.touch_metric("quest_bindings")
                 bindings = game_state.generation_metrics.get("quest_bindings")
                 if not isinstance(bindings, list):
                     bindings = []
@@ -429,89 +436,61 @@ class GameStateModifier:
         except Exception as exc:
             return {"id": patch_id, "success": False, "reason": str(exc)}
 
-    def _make_patch_snapshot(self, game_state: GameState) -> Dict[str, Any]:
-        return {
-            "tiles": copy.deepcopy(game_state.current_map.tiles),
-            "monsters": copy.deepcopy(game_state.monsters),
-            "quests": copy.deepcopy(game_state.quests),
-            "pending_events": copy.deepcopy(game_state.pending_events),
-            "generation_metrics": copy.deepcopy(game_state.generation_metrics),
-        }
-
-    def _restore_patch_snapshot(self, game_state: GameState, snapshot: Dict[str, Any]) -> None:
-        game_state.current_map.tiles = snapshot.get("tiles", {})
-        game_state.monsters = snapshot.get("monsters", [])
-        game_state.quests = snapshot.get("quests", [])
-        game_state.pending_events = snapshot.get("pending_events", [])
-        game_state.generation_metrics = snapshot.get("generation_metrics", {})
+    def _rollback_patch_journals(self, journals: List[PatchJournal]) -> None:
+        """按逆序回滚补丁日志（已回滚的日志自动跳过）"""
+        restored = 0
+        for journal in reversed(journals):
+            if not journal.rolled_back:
+                restored += journal.size
+            journal.rollback()
+        logger.debug(f"Patch rollback replayed {len(journals)} journal(s), {restored} entries restored")
 
     def _run_patch_post_checks(self, game_state: GameState) -> List[Dict[str, Any]]:
+        # 连通性/必经事件/楼梯共用一份增量维护的连通性索引，只同步本批次变化的瓦片
+        index = game_state.current_map.get_connectivity_index()
+        if config.game.debug_mode:
+            # 调试模式下与全量重算比对，发现未调用 mark_tiles_changed 的地形写入方
+            issues = index.check_consistency()
+            if issues:
+                logger.warning(f"Connectivity index drift detected, rebuilding: {issues}")
+                index.mark_dirty()
+                index.refresh()
         checks: List[Dict[str, Any]] = []
-        checks.append({"name": "connectivity", "ok": self._check_map_connectivity(game_state)})
-        checks.append({"name": "stairs_legality", "ok": self._check_stairs_legality(game_state)})
-        checks.append({"name": "mandatory_reachable", "ok": self._check_mandatory_reachable(game_state)})
+        checks.append({"name": "connectivity", "ok": self._check_map_connectivity(game_state, index)})
+        checks.append({"name": "stairs_legality", "ok": self._check_stairs_legality(game_state, index)})
+        checks.append({"name": "mandatory_reachable", "ok": self._check_mandatory_reachable(game_state, index)})
         checks.append({"name": "monster_event_conflict", "ok": self._check_monster_event_conflict(game_state)})
         checks.append({"name": "progress_budget_valid", "ok": self._check_progress_budget_valid(game_state)})
         return checks
 
-    def _check_map_connectivity(self, game_state: GameState) -> bool:
-        walkable = {
-            pos for pos, tile in game_state.current_map.tiles.items()
-            if tile.terrain in {TerrainType.FLOOR, TerrainType.DOOR, TerrainType.TRAP, TerrainType.TREASURE, TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}
-        }
-        if not walkable:
-            return False
-        start = next(iter(walkable))
-        visited = set([start])
-        queue = deque([start])
-        while queue:
-            x, y = queue.popleft()
-            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                nxt = (x + dx, y + dy)
-                if nxt in walkable and nxt not in visited:
-                    visited.add(nxt)
-                    queue.append(nxt)
-        return len(visited) == len(walkable)
-
-    def _check_stairs_legality(self, game_state: GameState) -> bool:
+    def _check_map_connectivity(self, game_state: GameState, index: Optional[MapConnectivityIndex] = None) -> bool:
+        index = index or game_state.current_map.get_connectivity_index()
+        return index.walkable_count > 0 and index.is_connected()
+
+    def _check_stairs_legality(self, game_state: GameState, index: Optional[MapConnectivityIndex] = None) -> bool:
+        index = index or game_state.current_map.get_connectivity_index()
         depth = int(game_state.current_map.depth or 1)
         max_floor = int(getattr(config.game, "max_quest_floors", 3) or 3)
-        has_up = any(tile.terrain == TerrainType.STAIRS_UP for tile in game_state.current_map.tiles.values())
-        has_down = any(tile.terrain == TerrainType.STAIRS_DOWN for tile in game_state.current_map.tiles.values())
-        if depth <= 1 and has_up:
+        if depth <= 1 and index.stairs_up_count > 0:
             return False
-        if depth >= max_floor and has_down:
+        if depth >= max_floor and index.stairs_down_count > 0:
             return False
         return True
 
-    def _check_mandatory_reachable(self, game_state: GameState) -> bool:
-        event_tiles = [
-            pos for pos, tile in game_state.current_map.tiles.items()
-            if tile.has_event and isinstance(tile.event_data, dict) and tile.event_data.get("is_mandatory")
-        ]
-        if not event_tiles:
-            return True
-        walkable = {
-            pos for pos, tile in game_state.current_map.tiles.items()
-            if tile.terrain in {TerrainType.FLOOR, TerrainType.DOOR, TerrainType.TRAP, TerrainType.TREASURE, TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}
-        }
-        if not walkable:
-            return False
-        start = next(iter(walkable))
-        visited = set([start])
-        queue = deque([start])
-        while queue:
-            x, y = queue.popleft()
-            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                nxt = (x + dx, y + dy)
-                if nxt in walkable and nxt not in visited:
-                    visited.add(nxt)
-                    queue.append(nxt)
-        return all(pos in visited for pos in event_tiles)
+    def _check_mandatory_reachable(self, game_state: GameState, index: Optional[MapConnectivityIndex] = None) -> bool:
+        """必经事件是否可达
+
+        起点为入口（上行楼梯，多个时取坐标最小者，即玩家进入本层的位置）；
+        没有上行楼梯（如第一层）时以最大连通分量为准。
+        """
+        index = index or game_state.current_map.get_connectivity_index()
+        return index.mandatory_reachable(index.entrance())
 
     def _check_monster_event_conflict(self, game_state: GameState) -> bool:
-        for tile in game_state.current_map.tiles.values():
-            if tile.character_id and tile.has_event:
+        game_map = game_state.current_map
+        for pos in game_map.entity_index.positions():
+            tile = game_map.tiles.get(pos)
+            if tile and tile.has_event:
                 return False
         return True
 
@@ -731,6 +710,9 @@ class GameStateModifier:
                         logger.warning(f"Invalid tile position: ({x}, {y})")
                         continue
 
+                    if self._patch_journal is not None:
+                        self._patch_journal.touch_tile((x, y))
+
                     # 获取或创建瓦片
                     tile = current_map.get_tile(x, y)
                     if not tile:
@@ -766,6 +748,17 @@ class GameStateModifier:
                             if monster_result.records:
                                 result.records.extend(monster_result.records)
 
+                        elif attr_name == "character_id":
+                            # 占用标记由实体空间索引维护，经索引写入以保持镜像一致
+                            old_value = tile.character_id
+                            if value and self._patch_journal is not None:
+                                self._patch_journal.touch_entity(str(value))
+                            if value:
+                                game_state.current_map.place_entity(str(value), (x, y))
+                            elif old_value:
+                                game_state.current_map.remove_entity(old_value)
+                            changes[attr_name] = {"old": old_value, "new": tile.character_id}
+
                         elif hasattr(tile, attr_name):
                             old_value = getattr(tile, attr_name)
                             setattr(tile, attr_name, value)
@@ -775,6 +768,9 @@ class GameStateModifier:
                     if had_event and was_triggered and "event_triggered" not in tile_data:
                         tile.event_triggered = True
 
+                    if changes:
+                        current_map.mark_tiles_changed([(x, y)])
+
                     if changes:
                         record = ModificationRecord(
                             modification_type=ModificationType.MAP_TILE,
@@ -816,6 +812,9 @@ class GameStateModifier:
         result = ModificationResult()
 
         try:
+            if self._patch_journal is not None:
+                self._patch_journal.touch_quests()
+
             # 记录本次更新中被显式设置为激活的任务ID（若有，则强制保持单活跃任务）
             last_set_active_id = None
 
@@ -924,10 +923,16 @@ class GameStateModifier:
             if not tile:
                 return result
 
+            occupant_id = game_state.current_map.get_entity_at(x, y)
+            journal = self._patch_journal
+
             if action == "remove":
-                if tile.character_id:
-                    game_state.monsters = [m for m in game_state.monsters if m.id != tile.character_id]
-                    tile.character_id = None
+                if occupant_id:
+                    if journal is not None:
+                        journal.touch_monster_list()
+                        journal.touch_entity(occupant_id)
+                    game_state.monsters = [m for m in game_state.monsters if m.id != occupant_id]
+                    game_state.current_map.remove_entity(occupant_id)
                     record = ModificationRecord(
                         modification_type=ModificationType.MONSTER,
                         timestamp=datetime.now(),
@@ -939,9 +944,11 @@ class GameStateModifier:
                     logger.info(f"Removed monster from tile ({x}, {y})")
 
             elif action == "update":
-                if tile.character_id:
-                    monster = next((m for m in game_state.monsters if m.id == tile.character_id), None)
+                if occupant_id:
+                    monster = game_state.get_monster(occupant_id)
                     if monster:
+                        if journal is not None:
+                            journal.touch_monster(monster)
                         changes = {}
                         if "name" in monster_data:
                             changes["name"] = {"old": monster.name, "new": monster_data["name"]}
@@ -979,8 +986,11 @@ class GameStateModifier:
                         logger.info(f"Updated monster {monster.name} at ({x}, {y})")
 
             elif action == "add":
-                if tile.character_id:
-                    game_state.monsters = [m for m in game_state.monsters if m.id != tile.character_id]
+                if journal is not None:
+                    journal.touch_monster_list()
+                    journal.touch_tile((x, y))
+                if occupant_id:
+                    game_state.monsters = [m for m in game_state.monsters if m.id != occupant_id]
 
                 monster = Monster()
                 monster.name = monster_data.get("name", "神秘生物")
@@ -1002,8 +1012,10 @@ class GameStateModifier:
                     monster.stats.ac = stats_data.get("ac", 12)
                     monster.stats.level = stats_data.get("level", 1)
 
+                if journal is not None:
+                    journal.touch_entity(monster.id)
                 game_state.monsters.append(monster)
-                tile.character_id = monster.id
+                game_state.current_map.place_entity(monster.id, (x, y))
 
                 record = ModificationRecord(
                     modification_type=ModificationType.MONSTER,
@@ -0,0 +1,165 @@
+"""
+Labyrinthia AI - 游戏状态快照
+在游戏锁内生成与 GameState.to_dict 格式一致的只读快照，JSON 编码与写盘都放到锁外：
+
+- 地图瓦片按 (瓦片对象, 标量字段指纹) 缓存已序列化的字典。自上次快照以来标量字段未变、
+  且不含容器数据（物品 / 事件数据 / 已收集物品）的瓦片直接复用，锁内只重新序列化
+  发生变化的瓦片与少量带容器的瓦片；
+- 其余部分（玩家、怪物、任务、指标等）体积小，每次重新序列化并复制出独立容器。
+
+快照与活动状态不共享任何可变对象，锁外编码时不会与后续写操作互相干扰。
+多个快照之间共享未变化瓦片的字典，因此快照内容只读：GameStateSnapshot.to_dict()
+返回顶层浅拷贝，调用方可以增删顶层键，但不得修改嵌套内容。
+"""
+
+from __future__ import annotations
+
+import operator
+import time
+from dataclasses import MISSING, dataclass, fields
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+from data_models import MapTile
+
+if TYPE_CHECKING:
+    from data_models import GameMap, GameState
+
+Position = Tuple[int, int]
+
+# 以 default_factory 声明的字段是容器（list / dict），其余为标量。
+# 指纹 = 标量字段值 + 容器字段对象；缓存中的指纹把容器部分替换成私有的空容器，
+# 于是一次元组比较即可同时判定“标量未变”且“容器仍为空”（原地 append 也能发现）。
+_TILE_SCALAR_FIELDS = tuple(f.name for f in fields(MapTile) if f.default_factory is MISSING)
+_TILE_CONTAINER_FIELDS = tuple(f.name for f in fields(MapTile) if f.default_factory is not MISSING)
+_EMPTY_CONTAINERS = tuple(f.default_factory() for f in fields(MapTile) if f.default_factory is not MISSING)
+_SCALAR_COUNT = len(_TILE_SCALAR_FIELDS)
+_tile_fingerprint = operator.attrgetter(*_TILE_SCALAR_FIELDS, *_TILE_CONTAINER_FIELDS)
+
+
+def freeze(value: Any) -> Any:
+    """复制 JSON 结构中的 dict / list（标量原样返回），得到与源数据不共享容器的副本"""
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [freeze(item) for item in value]
+    return value
+
+
+class TileSnapshotCache:
+    """单张地图的瓦片序列化缓存（挂在 GameMap.snapshot_cache 上，随地图一起替换）"""
+
+    __slots__ = ("_entries",)
+
+    def __init__(self):
+        # 位置 → (瓦片对象, 指纹；None 表示不可复用, "x,y" 键, 已序列化字典)
+        self._entries: Dict[Position, Tuple[MapTile, Any, str, Dict[str, Any]]] = {}
+
+    def capture(self, tiles: Dict[Position, MapTile]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """返回 ({"x,y": 瓦片字典}, 本次重新序列化的瓦片数)"""
+        entries = self._entries
+        if len(entries) > len(tiles):
+            # 瓦片被移除时清理缓存（只影响内存占用，输出只遍历当前瓦片）
+            for pos in [pos for pos in entries if pos not in tiles]:
+                del entries[pos]
+
+        result: Dict[str, Dict[str, Any]] = {}
+        serialized = 0
+        for pos, tile in tiles.items():
+            cached = entries.get(pos)
+            fingerprint = _tile_fingerprint(tile)
+            if cached is not None and cached[0] is tile and cached[1] == fingerprint:
+                result[cached[2]] = cached[3]
+                continue
+
+            tile_dict = freeze(tile.to_dict())
+            key = cached[2] if cached is not None else f"{pos[0]},{pos[1]}"
+            # 带容器数据的瓦片可能被原地修改（append / 字典赋值），不缓存为可复用
+            reusable = not any(fingerprint[_SCALAR_COUNT:])
+            entries[pos] = (tile, fingerprint[:_SCALAR_COUNT] + _EMPTY_CONTAINERS if reusable else None, key, tile_dict)
+            result[key] = tile_dict
+            serialized += 1
+        return result, serialized
+
+
+@dataclass(frozen=True)
+class GameStateSnapshot:
+    """游戏状态的只读快照"""
+
+    game_id: str
+    data: Dict[str, Any]
+    capture_ms: float
+    tiles_total: int
+    tiles_serialized: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        """与 GameState.to_dict 同格式；顶层为新字典，嵌套内容只读"""
+        return dict(self.data)
+
+
+snapshot_stats: Dict[str, float] = {
+    "captures": 0,
+    "tiles_total": 0,
+    "tiles_serialized": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0,
+}
+
+
+def _tile_cache_for(game_map: "GameMap") -> TileSnapshotCache:
+    cache = getattr(game_map, "snapshot_cache", None)
+    if not isinstance(cache, TileSnapshotCache):
+        cache = TileSnapshotCache()
+        game_map.snapshot_cache = cache
+    return cache
+
+
+def capture_game_state(game_state: "GameState") -> GameStateSnapshot:
+    """生成快照（须在持有游戏锁时调用；返回后即可在锁外编码 / 写盘）"""
+    started = time.perf_counter()
+    game_map = game_state.current_map
+    tiles, serialized = _tile_cache_for(game_map).capture(game_map.tiles)
+
+    map_dict = game_map.to_dict(tiles=tiles)
+    data: Dict[str, Any] = {}
+    for key, value in game_state.to_dict(current_map=map_dict).items():
+        if key == "current_map":
+            data[key] = {name: (item if name == "tiles" else freeze(item)) for name, item in value.items()}
+        else:
+            data[key] = freeze(value)
+
+    capture_ms = (time.perf_counter() - started) * 1000.0
+    snapshot_stats["captures"] += 1
+    snapshot_stats["tiles_total"] += len(tiles)
+    snapshot_stats["tiles_serialized"] += serialized
+    snapshot_stats["total_ms"] += capture_ms
+    snapshot_stats["max_ms"] = max(snapshot_stats["max_ms"], capture_ms)
+    return GameStateSnapshot(
+        game_id=game_state.id,
+        data=data,
+        capture_ms=capture_ms,
+        tiles_total=len(tiles),
+        tiles_serialized=serialized,
+    )
+
+
+def get_snapshot_stats() -> Dict[str, Any]:
+    """快照统计：tile_reuse_rate 为复用缓存的瓦片比例"""
+    captures = int(snapshot_stats["captures"])
+    tiles_total = int(snapshot_stats["tiles_total"])
+    return {
+        "captures": captures,
+        "avg_ms": round(snapshot_stats["total_ms"] / captures, 3) if captures else 0.0,
+        "max_ms": round(snapshot_stats["max_ms"], 3),
+        "tiles_total": tiles_total,
+        "tiles_serialized": int(snapshot_stats["tiles_serialized"]),
+        "tile_reuse_rate": round(1 - snapshot_stats["tiles_serialized"] / tiles_total, 4) if tiles_total else 0.0,
+    }
+
+
+__all__ = [
+    "GameStateSnapshot",
+    "TileSnapshotCache",
+    "capture_game_state",
+    "freeze",
+    "get_snapshot_stats",
+]
@@ -0,0 +1,296 @@
+"""
+Labyrinthia AI - 动作幂等结果存储
+有界 TTL 存储：按插入顺序维护条目，O(1) 淘汰最旧/过期记录；结果序列化为不可变 bytes，
+重放时反序列化得到全新对象，无需 deepcopy。可选 SQLite 持久化，使幂等重试在进程重启
+或多进程部署（命中其他 worker）时依然生效。
+
+事件循环中应使用 aget / aput：内存命中同步返回，SQLite 读写放到线程池执行，不阻塞事件循环。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Scope = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class IdempotencyRecord:
+    """幂等记录（不可变）"""
+    fingerprint: str
+    created_at: float
+    payload: bytes
+
+    def load_result(self) -> Optional[Dict[str, Any]]:
+        """反序列化结果，每次调用返回独立的新对象"""
+        try:
+            result = json.loads(self.payload.decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return result if isinstance(result, dict) else None
+
+
+def _serialize_result(result: Dict[str, Any]) -> bytes:
+    return json.dumps(result, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def _scope_key(scope: Scope) -> str:
+    return f"{scope[0]}\x1f{scope[1]}"
+
+
+class IdempotencyStore:
+    """有界 TTL 幂等存储（内存 + 可选 SQLite）"""
+
+    def __init__(
+        self,
+        ttl_seconds: int = 120,
+        max_entries_per_scope: int = 256,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.max_entries_per_scope = max(1, int(max_entries_per_scope))
+        self._entries: Dict[Scope, "OrderedDict[str, IdempotencyRecord]"] = {}
+        self._lock = threading.Lock()
+        # 内存结构与 SQLite 连接分别加锁，线程池中的慢查询不会阻塞事件循环上的内存访问
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+        self._db_writes_since_sweep = 0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "db_hits": 0}
+        if sqlite_path:
+            self.enable_sqlite(sqlite_path)
+
+    # ------------------------------------------------------------------ sqlite
+
+    def enable_sqlite(self, sqlite_path: str) -> bool:
+        """启用 SQLite 持久化；失败时保持纯内存模式"""
+        try:
+            directory = os.path.dirname(os.path.abspath(sqlite_path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(sqlite_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS action_idempotency ("
+                " scope TEXT NOT NULL,"
+                " cache_key TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " PRIMARY KEY (scope, cache_key))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_action_idempotency_created ON action_idempotency(created_at)")
+        except (sqlite3.Error, OSError) as exc:
+            logger.warning("Idempotency store SQLite backend unavailable (%s): %s", sqlite_path, exc)
+            return False
+
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+            self._db = db
+            self._db_path = sqlite_path
+        logger.info("Idempotency store persisted to SQLite: %s", sqlite_path)
+        return True
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def backend(self) -> str:
+        return "sqlite" if self._db is not None else "memory"
+
+    def _db_get(self, scope: Scope, cache_key: str) -> Optional[IdempotencyRecord]:
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return None
+                row = self._db.execute(
+                    "SELECT fingerprint, created_at, payload FROM action_idempotency WHERE scope = ? AND cache_key = ?",
+                    (_scope_key(scope), cache_key),
+                ).fetchone()
+        except sqlite3.Error as exc:
+            logger.warning("Idempotency SQLite read failed: %s", exc)
+            return None
+        if not row:
+            return None
+        return IdempotencyRecord(fingerprint=str(row[0] or ""), created_at=float(row[1]), payload=bytes(row[2]))
+
+    def _db_put(self, scope: Scope, cache_key: str, record: IdempotencyRecord) -> None:
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return
+                self._db.execute(
+                    "INSERT OR REPLACE INTO action_idempotency (scope, cache_key, fingerprint, created_at, payload)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (_scope_key(scope), cache_key, record.fingerprint, record.created_at, record.payload),
+                )
+                self._db_writes_since_sweep += 1
+                if self._db_writes_since_sweep >= 64:
+                    self._db_writes_since_sweep = 0
+                    self._db.execute(
+                        "DELETE FROM action_idempotency WHERE created_at < ?",
+                        (time.time() - self.ttl_seconds,),
+                    )
+        except sqlite3.Error as exc:
+            logger.warning("Idempotency SQLite write failed: %s", exc)
+
+    # ------------------------------------------------------------------ core
+
+    def _is_expired(self, record: IdempotencyRecord, now_ts: float) -> bool:
+        return (now_ts - record.created_at) > self.ttl_seconds
+
+    def _prune_locked(self, scope: Scope, now_ts: float) -> None:
+        entries = self._entries.get(scope)
+        if not entries:
+            return
+        # 插入顺序即创建时间顺序：过期与超额淘汰都只需从队头弹出
+        while entries:
+            oldest_key = next(iter(entries))
+            if not self._is_expired(entries[oldest_key], now_ts) and len(entries) <= self.max_entries_per_scope:
+                break
+            entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        if not entries:
+            self._entries.pop(scope, None)
+
+    def _memory_get(self, scope: Scope, cache_key: str) -> Optional[IdempotencyRecord]:
+        now_ts = time.time()
+        with self._lock:
+            self._prune_locked(scope, now_ts)
+            entries = self._entries.get(scope)
+            record = entries.get(cache_key) if entries else None
+            if record is not None and self._is_expired(record, now_ts):
+                # 队头淘汰之外的兜底：命中时也校验 TTL
+                del entries[cache_key]
+                self.stats["evictions"] += 1
+                record = None
+            return record
+
+    def _load_from_db(self, scope: Scope, cache_key: str) -> Optional[IdempotencyRecord]:
+        """回查 SQLite，命中的未过期记录回填内存（阻塞调用）"""
+        record = self._db_get(scope, cache_key)
+        now_ts = time.time()
+        if record is None or self._is_expired(record, now_ts):
+            return None
+        with self._lock:
+            self.stats["db_hits"] += 1
+            self._remember_locked(scope, cache_key, record, now_ts)
+        return record
+
+    def _count_lookup(self, record: Optional[IdempotencyRecord]) -> Optional[IdempotencyRecord]:
+        with self._lock:
+            self.stats["hits" if record is not None else "misses"] += 1
+        return record
+
+    def get(self, scope: Scope, cache_key: str) -> Optional[IdempotencyRecord]:
+        """查找未过期的幂等记录（内存未命中时回查 SQLite，同步阻塞）"""
+        record = self._memory_get(scope, cache_key)
+        if record is None and self._db is not None:
+            record = self._load_from_db(scope, cache_key)
+        return self._count_lookup(record)
+
+    async def aget(self, scope: Scope, cache_key: str) -> Optional[IdempotencyRecord]:
+        """get 的事件循环版本：SQLite 回查在线程池中执行"""
+        record = self._memory_get(scope, cache_key)
+        if record is None and self._db is not None:
+            record = await asyncio.to_thread(self._load_from_db, scope, cache_key)
+        return self._count_lookup(record)
+
+    def _remember_locked(self, scope: Scope, cache_key: str, record: IdempotencyRecord, now_ts: float) -> None:
+        entries = self._entries.setdefault(scope, OrderedDict())
+        entries.pop(cache_key, None)
+        if entries and entries[next(reversed(entries))].created_at > record.created_at:
+            # 从 SQLite 回填的旧记录：按 created_at 插入，维持“插入顺序即创建时间顺序”
+            ordered = sorted([*entries.items(), (cache_key, record)], key=lambda item: item[1].created_at)
+            entries.clear()
+            entries.update(ordered)
+        else:
+            entries[cache_key] = record
+        self._prune_locked(scope, now_ts)
+
+    def _remember(self, scope: Scope, cache_key: str, result: Dict[str, Any], fingerprint: str) -> IdempotencyRecord:
+        now_ts = time.time()
+        record = IdempotencyRecord(
+            fingerprint=str(fingerprint or ""),
+            created_at=now_ts,
+            payload=_serialize_result(result),
+        )
+        with self._lock:
+            self._remember_locked(scope, cache_key, record, now_ts)
+            self.stats["stores"] += 1
+        return record
+
+    def put(self, scope: Scope, cache_key: str, result: Dict[str, Any], fingerprint: str = "") -> IdempotencyRecord:
+        """写入幂等结果（立即序列化，之后对 result 的修改不会影响已存记录；SQLite 写入同步阻塞）"""
+        record = self._remember(scope, cache_key, result, fingerprint)
+        if self._db is not None:
+            self._db_put(scope, cache_key, record)
+        return record
+
+    async def aput(self, scope: Scope, cache_key: str, result: Dict[str, Any], fingerprint: str = "") -> IdempotencyRecord:
+        """put 的事件循环版本：内存立即可见，SQLite 写入在线程池中执行并等待完成"""
+        record = self._remember(scope, cache_key, result, fingerprint)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, scope, cache_key, record)
+        return record
+
+    def _db_delete(self, scope: Optional[Scope]) -> None:
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return
+                if scope is None:
+                    self._db.execute("DELETE FROM action_idempotency")
+                else:
+                    self._db.execute("DELETE FROM action_idempotency WHERE scope = ?", (_scope_key(scope),))
+        except sqlite3.Error as exc:
+            logger.warning("Idempotency SQLite delete failed: %s", exc)
+
+    def _clear_memory(self, scope: Optional[Scope]) -> None:
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(scope, None)
+
+    def clear(self, scope: Optional[Scope] = None) -> None:
+        """清理指定作用域（或全部）的记录，内存与 SQLite 一并删除（同步阻塞）"""
+        self._clear_memory(scope)
+        if self._db is not None:
+            self._db_delete(scope)
+
+    async def aclear(self, scope: Optional[Scope] = None) -> None:
+        """clear 的事件循环版本：SQLite 删除在线程池中执行"""
+        self._clear_memory(scope)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_delete, scope)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "sqlite_path": self._db_path,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries_per_scope": self.max_entries_per_scope,
+                "scopes": len(self._entries),
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                **self.stats,
+            }
+
+
+__all__ = ["IdempotencyRecord", "IdempotencyStore"]
@@ -217,11 +217,11 @@ class LLMInteractionManager:
         
         # 检查周围怪物
         nearby_monsters = []
-        for monster in game_state.monsters:
-            mx, my = monster.position
-            px, py = player_pos
-            distance = max(abs(mx - px), abs(my - py))
-            if distance <= 3:
+        px, py = player_pos
+        for entity_id, (mx, my) in game_state.current_map.get_entities_in_range(px, py, 3):
+            monster = game_state.get_monster(entity_id)
+            if monster is not None:
+                distance = max(abs(mx - px), abs(my - py))
                 nearby_monsters.append(f"{monster.name}(距离{distance})")
         
         if nearby_monsters:
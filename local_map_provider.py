@@ -8,16 +8,48 @@ from __future__ import annotations
 import logging
 import random
 import re
-from collections import deque
 from typing import Any, Dict, List, Optional, Set, Tuple
 
 from config import config
-from data_models import GameMap, MapTile, TerrainType
+from corridor_planner import l_segments, plan_corridors, rasterize_segments
+from data_models import GameMap, TerrainType
 from generation_contract import CONTRACT_VERSION, contract_hash, extract_contract_request, resolve_generation_contract
+from map_analysis import DistanceField
+from map_cache import make_map_cache_key, map_cache, stable_hash
+from map_grid import (
+    DOOR,
+    FLOOR,
+    MASK4,
+    STAIRS_CODES,
+    STAIRS_DOWN,
+    STAIRS_UP,
+    TRAP,
+    TREASURE,
+    WALKABLE_CODES,
+    WALL,
+    MapGrid,
+)
+from room_spatial_index import RoomSpatialIndex
 
 
 logger = logging.getLogger(__name__)
 
+POOL_EVENT_PREFIX = "__pool_event_"
+
+
+def _to_bool(value: Any, default_value: bool = False) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in {"true", "1", "yes", "y", "on"}:
+            return True
+        if normalized in {"false", "0", "no", "n", "off", ""}:
+            return False
+    if value is None:
+        return default_value
+    return bool(value)
+
 
 class LocalMapProvider:
     """后端本地地图提供器（轻量可回退实现）"""
@@ -38,15 +70,102 @@ class LocalMapProvider:
         depth: int,
         theme: str,
         quest_context: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
     ) -> Tuple[GameMap, Dict[str, Any]]:
-        """生成本地地图并返回 (GameMap, monster_hints)"""
-        game_map = GameMap()
-        game_map.width = width
-        game_map.height = height
-        game_map.depth = max(1, depth)
-        game_map.floor_theme = self._infer_floor_theme(theme, quest_context)
-        game_map.name = self._build_map_name(theme, game_map.depth)
-        game_map.description = self._build_map_description(game_map.floor_theme, quest_context)
+        """生成本地地图并返回 (GameMap, monster_hints)
+
+        所有随机性来自以 seed 初始化的独立随机源，相同输入 + 相同 seed 生成的地图完全一致。
+        未指定 seed 时从全局随机源派生一个并写入 generation_metadata，事后可据此重现；
+        显式指定 seed 时结果进入内容寻址缓存，相同请求直接复用。
+        """
+        cache_key, seed = self._resolve_seed_and_cache_key(width, height, depth, theme, quest_context, seed)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        game_map, grid, monster_hints = self.build_map_grid(width, height, depth, theme, quest_context, seed)
+        return self._finish_map(game_map, grid, monster_hints, cache_key)
+
+    async def agenerate_map(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+    ) -> Tuple[GameMap, Dict[str, Any]]:
+        """generate_map 的异步版本：网格生成与校验在 CPU 进程池（未启用时为线程池）中执行，
+        事件循环只负责缓存查询与最终的瓦片物化"""
+        from async_task_manager import async_task_manager
+
+        cache_key, seed = self._resolve_seed_and_cache_key(width, height, depth, theme, quest_context, seed)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        game_map, grid, monster_hints = await async_task_manager.run_cpu_bound(
+            build_local_map_grid, width, height, depth, theme, quest_context, seed
+        )
+        return self._finish_map(game_map, grid, monster_hints, cache_key)
+
+    def _resolve_seed_and_cache_key(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]],
+        seed: Optional[int],
+    ) -> Tuple[Optional[str], int]:
+        if seed is None:
+            return None, random.getrandbits(32)
+
+        seed = int(seed)
+        provided_contract, requested_contract_version, contract_source_hint = extract_contract_request(quest_context)
+        contract = resolve_generation_contract(
+            provided_contract=provided_contract,
+            requested_version=requested_contract_version,
+            source_hint=contract_source_hint,
+        ).contract
+        # 本地链路没有 LLM 蓝图，任务上下文就是它的"蓝图"输入
+        cache_key = make_map_cache_key(
+            seed, width, height, max(1, depth), theme, contract_hash(contract), stable_hash(quest_context or {})
+        )
+        return cache_key, seed
+
+    def _get_cached(self, cache_key: Optional[str]) -> Optional[Tuple[GameMap, Dict[str, Any]]]:
+        if cache_key is None:
+            return None
+        cached = map_cache.get(cache_key)
+        if cached is not None:
+            cached[0].generation_metadata["map_cache"] = {"hit": True, "key": cache_key}
+        return cached
+
+    def _finish_map(
+        self,
+        game_map: GameMap,
+        grid: MapGrid,
+        monster_hints: Dict[str, Any],
+        cache_key: Optional[str],
+    ) -> Tuple[GameMap, Dict[str, Any]]:
+        grid.materialize(game_map)
+        if cache_key is not None:
+            game_map.generation_metadata["map_cache"] = {"hit": False, "key": cache_key}
+            map_cache.put(cache_key, game_map, monster_hints)
+        return game_map, monster_hints
+
+    def build_map_grid(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]],
+        seed: int,
+    ) -> Tuple[GameMap, MapGrid, Dict[str, Any]]:
+        """纯计算部分：返回 (不含瓦片的 GameMap, 网格, monster_hints)，结果可 pickle 跨进程传输"""
+        rng = random.Random(seed)
 
         provided_contract, requested_contract_version, contract_source_hint = extract_contract_request(quest_context)
         contract_resolution = resolve_generation_contract(
@@ -56,36 +175,112 @@ class LocalMapProvider:
         )
         generation_contract = contract_resolution.contract
 
+        game_map = GameMap()
+        game_map.width = width
+        game_map.height = height
+        game_map.depth = max(1, depth)
+        game_map.floor_theme = self._infer_floor_theme(theme, quest_context)
+        game_map.name = self._build_map_name(theme, game_map.depth)
+        game_map.description = self._build_map_description(game_map.floor_theme, quest_context)
+
         requirements = self._analyze_quest_requirements(quest_context, game_map.depth)
-        rooms = self._build_rooms(width, height, requirements)
-
-        self._init_walls(game_map)
-        self._carve_rooms(game_map, rooms)
-        self._connect_rooms(game_map, rooms, requirements)
-        self._assign_room_types(rooms, game_map.depth, requirements)
-        self._paint_room_types(game_map, rooms)
-        stairs = self._place_stairs(game_map, rooms, game_map.depth)
-        self._place_special_terrain(game_map, rooms, stairs, generation_contract)
-        self._place_events(game_map, quest_context)
-
-        validation_report = self._validate_and_repair_map(game_map, rooms, stairs, quest_context)
-        monster_hints = self._build_monster_hints(game_map, rooms, quest_context)
-
-        if not isinstance(game_map.generation_metadata, dict):
-            game_map.generation_metadata = {}
-        game_map.generation_metadata.update(
+        rooms = self._build_rooms(width, height, requirements, rng)
+
+        # 全流程在紧凑网格上进行，最后一次性物化为 MapTile
+        grid = self._init_walls(width, height)
+        self._carve_rooms(grid, rooms)
+        self._connect_rooms(grid, rooms, requirements, rng)
+        self._assign_room_types(rooms, game_map.depth, requirements, rng)
+        self._paint_room_types(grid, rooms)
+        stairs = self._place_stairs(grid, rooms, game_map.depth)
+        self._place_special_terrain(grid, rooms, stairs, generation_contract, rng)
+        self._place_events(grid, game_map.depth, quest_context, rng)
+
+        validation_report = self._validate_and_repair_map(grid, game_map.depth, rooms, stairs, quest_context)
+        monster_hints = self._build_monster_hints(game_map, grid, rooms, quest_context, rng)
+
+        game_map.generation_metadata = {
+            "seed": seed,
+            "local_requirements": requirements,
+            "local_validation": validation_report,
+            "contract_version": generation_contract.get("contract_version", CONTRACT_VERSION),
+            "contract_hash": contract_hash(generation_contract),
+            "contract_source": contract_resolution.source,
+            "generation_contract": generation_contract,
+            "contract_warnings": contract_resolution.warnings,
+        }
+        return game_map, grid, monster_hints
+
+    # ==================== 预生成地图池支持 ====================
+
+    def build_pool_shape(self, quest_context: Optional[Dict[str, Any]], depth: int) -> Dict[str, Any]:
+        """提取任务上下文中影响地图结构的部分（任务形状）
+
+        同一形状下生成的地图结构等价；任务专属事件以占位符代替，
+        取用时由 personalize_pooled_map 填回真实内容。
+        """
+        if not isinstance(quest_context, dict):
+            return {}
+
+        current_depth = max(1, int(depth or 1))
+        shape: Dict[str, Any] = {"quest_type": str(quest_context.get("quest_type", "exploration"))}
+        themes = quest_context.get("map_themes")
+        if isinstance(themes, list) and themes:
+            shape["map_themes"] = [str(t) for t in themes if isinstance(t, str)]
+        for key in ("generation_contract", "contract_version"):
+            if quest_context.get(key):
+                shape[key] = quest_context[key]
+
+        events = quest_context.get("special_events") if isinstance(quest_context.get("special_events"), list) else []
+        shape["special_events"] = [
             {
-                "local_requirements": requirements,
-                "local_validation": validation_report,
-                "contract_version": generation_contract.get("contract_version", CONTRACT_VERSION),
-                "contract_hash": contract_hash(generation_contract),
-                "contract_source": contract_resolution.source,
-                "generation_contract": generation_contract,
-                "contract_warnings": contract_resolution.warnings,
+                "id": f"{POOL_EVENT_PREFIX}{idx}",
+                "event_type": event.get("event_type", "story"),
+                "is_mandatory": _to_bool(event.get("is_mandatory", False), default_value=False),
+                "floor_number": current_depth,
             }
-        )
+            for idx, event in enumerate(
+                e for e in events if isinstance(e, dict) and self._matches_depth_hint(e, current_depth)
+            )
+        ]
+        monsters = quest_context.get("special_monsters") if isinstance(quest_context.get("special_monsters"), list) else []
+        shape["special_monsters"] = [
+            {"floor_number": current_depth}
+            for m in monsters
+            if isinstance(m, dict) and self._matches_depth_hint(m, current_depth)
+        ]
+        return shape
 
-        return game_map, monster_hints
+    def personalize_pooled_map(self, game_map: GameMap, quest_context: Optional[Dict[str, Any]]) -> None:
+        """把按任务形状预生成的地图填回真实任务内容（描述与任务专属事件）"""
+        game_map.description = self._build_map_description(game_map.floor_theme, quest_context)
+
+        events: List[Dict[str, Any]] = []
+        if isinstance(quest_context, dict) and isinstance(quest_context.get("special_events"), list):
+            current_depth = max(1, int(game_map.depth or 1))
+            events = [
+                e for e in quest_context["special_events"]
+                if isinstance(e, dict) and self._matches_depth_hint(e, current_depth)
+            ]
+
+        for tile in game_map.tiles.values():
+            if not tile.has_event or not isinstance(tile.event_data, dict):
+                continue
+            placeholder = str(tile.event_data.get("quest_event_id") or "")
+            if not placeholder.startswith(POOL_EVENT_PREFIX):
+                continue
+            try:
+                event_data = events[int(placeholder[len(POOL_EVENT_PREFIX):])]
+            except (ValueError, IndexError):
+                continue
+            tile.event_type = event_data.get("event_type", "story")
+            tile.event_data = {
+                "quest_event_id": event_data.get("id") or event_data.get("event_id"),
+                "name": event_data.get("name", "任务事件"),
+                "description": event_data.get("description", ""),
+                "progress_value": event_data.get("progress_value", 0.0),
+                "is_mandatory": _to_bool(event_data.get("is_mandatory", False), default_value=False),
+            }
 
     def _infer_floor_theme(self, theme: str, quest_context: Optional[Dict[str, Any]]) -> str:
         valid = {
@@ -148,16 +343,15 @@ class LocalMapProvider:
         }
         return theme_narratives.get(theme, "未知的领域中，光影交错，空气中弥漫着难以名状的气息，等待勇者探索。")
 
-    def _init_walls(self, game_map: GameMap) -> None:
-        for x in range(game_map.width):
-            for y in range(game_map.height):
-                game_map.tiles[(x, y)] = MapTile(x=x, y=y, terrain=TerrainType.WALL)
+    def _init_walls(self, width: int, height: int) -> MapGrid:
+        return MapGrid(width, height, fill=WALL)
 
     def _build_rooms(
         self,
         width: int,
         height: int,
-        requirements: Optional[Dict[str, Any]] = None,
+        requirements: Optional[Dict[str, Any]],
+        rng: random.Random,
     ) -> List[Dict[str, Any]]:
         req = requirements or {}
 
@@ -172,18 +366,19 @@ class LocalMapProvider:
         room_count = max(min_rooms, min(max_rooms, (width * height) // 120 if width * height > 0 else min_rooms))
 
         rooms: List[Dict[str, Any]] = []
+        room_index = RoomSpatialIndex(width, height, margin=1)
         attempts = room_count * 24
         room_id = 1
 
         while len(rooms) < room_count and attempts > 0:
             attempts -= 1
-            rw = random.randint(4, 8)
-            rh = random.randint(4, 8)
+            rw = rng.randint(4, 8)
+            rh = rng.randint(4, 8)
             if width - rw - 2 <= 1 or height - rh - 2 <= 1:
                 break
 
-            rx = random.randint(1, width - rw - 2)
-            ry = random.randint(1, height - rh - 2)
+            rx = rng.randint(1, width - rw - 2)
+            ry = rng.randint(1, height - rh - 2)
             room = {
                 "id": f"room-{room_id}",
                 "x": rx,
@@ -193,10 +388,11 @@ class LocalMapProvider:
                 "type": "normal",
             }
 
-            if any(self._overlap(room, r) for r in rooms):
+            if room_index.overlaps(room):
                 continue
 
             rooms.append(room)
+            room_index.add(room)
             room_id += 1
 
         if not rooms:
@@ -212,34 +408,27 @@ class LocalMapProvider:
 
         return rooms
 
-    def _overlap(self, a: Dict[str, Any], b: Dict[str, Any]) -> bool:
-        margin = 1
-        return (
-            a["x"] - margin < b["x"] + b["width"] + margin
-            and a["x"] + a["width"] + margin > b["x"] - margin
-            and a["y"] - margin < b["y"] + b["height"] + margin
-            and a["y"] + a["height"] + margin > b["y"] - margin
-        )
-
-    def _carve_rooms(self, game_map: GameMap, rooms: List[Dict[str, Any]]) -> None:
+    def _carve_rooms(self, grid: MapGrid, rooms: List[Dict[str, Any]]) -> None:
         for room in rooms:
-            for x in range(room["x"], room["x"] + room["width"]):
-                for y in range(room["y"], room["y"] + room["height"]):
-                    tile = game_map.get_tile(x, y)
-                    if not tile:
-                        continue
-                    tile.terrain = TerrainType.FLOOR
-                    tile.room_id = room["id"]
-                    tile.room_type = room["type"]
+            grid.fill_rect(
+                room["x"],
+                room["y"],
+                room["width"],
+                room["height"],
+                FLOOR,
+                room_id=room["id"],
+                room_type=room["type"],
+            )
 
     def _center(self, room: Dict[str, Any]) -> Tuple[int, int]:
         return room["x"] + room["width"] // 2, room["y"] + room["height"] // 2
 
     def _connect_rooms(
         self,
-        game_map: GameMap,
+        grid: MapGrid,
         rooms: List[Dict[str, Any]],
-        requirements: Optional[Dict[str, Any]] = None,
+        requirements: Optional[Dict[str, Any]],
+        rng: random.Random,
     ) -> None:
         if len(rooms) <= 1:
             return
@@ -248,52 +437,57 @@ class LocalMapProvider:
         style = str(req.get("layout_style", "standard"))
 
         if style == "hub":
-            center = rooms[0]
-            for room in rooms[1:]:
-                self._connect_two_rooms(game_map, center, room)
-            return
-
-        if style == "linear":
-            for idx in range(len(rooms) - 1):
-                self._connect_two_rooms(game_map, rooms[idx], rooms[idx + 1])
-            return
-
-        self._connect_all_rooms(game_map, rooms)
-
-    def _carve_corridor(self, game_map: GameMap, x1: int, y1: int, x2: int, y2: int) -> None:
+            edges = [(0, idx) for idx in range(1, len(rooms))]
+        elif style == "linear":
+            edges = [(idx, idx + 1) for idx in range(len(rooms) - 1)]
+        else:
+            edges = plan_corridors(rooms, loop_ratio=config.game.corridor_loop_ratio, rng=rng).edges
+
+        self._carve_connections(grid, rooms, edges)
+
+    def _carve_connections(self, grid: MapGrid, rooms: List[Dict[str, Any]], edges: List[Tuple[int, int]]) -> None:
+        """所有连接（中心到中心的 L 形走廊）一次性栅格化后雕刻"""
+        segments = []
+        for i, j in edges:
+            x1, y1 = self._center(rooms[i])
+            x2, y2 = self._center(rooms[j])
+            segments.extend(l_segments(x1, y1, x2, y2))
+        for x, y in rasterize_segments(segments):
+            self._set_corridor_tile(grid, x, y)
+
+    def _carve_corridor(self, grid: MapGrid, x1: int, y1: int, x2: int, y2: int) -> List[Tuple[int, int]]:
+        """雕刻直线走廊，返回走廊经过的位置"""
         if x1 == x2:
-            for y in range(min(y1, y2), max(y1, y2) + 1):
-                self._set_corridor_tile(game_map, x1, y)
-            return
+            path = [(x1, y) for y in range(min(y1, y2), max(y1, y2) + 1)]
+        else:
+            path = [(x, y1) for x in range(min(x1, x2), max(x1, x2) + 1)]
+        for x, y in path:
+            self._set_corridor_tile(grid, x, y)
+        return path
 
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            self._set_corridor_tile(game_map, x, y1)
+    _CORRIDOR_PROTECTED = frozenset({STAIRS_UP, STAIRS_DOWN, TRAP, TREASURE, DOOR})
 
-    def _set_corridor_tile(self, game_map: GameMap, x: int, y: int) -> None:
-        tile = game_map.get_tile(x, y)
-        if not tile:
+    def _set_corridor_tile(self, grid: MapGrid, x: int, y: int) -> None:
+        if not grid.in_bounds(x, y):
             return
 
-        if tile.terrain in {
-            TerrainType.STAIRS_UP,
-            TerrainType.STAIRS_DOWN,
-            TerrainType.TRAP,
-            TerrainType.TREASURE,
-            TerrainType.DOOR,
-        }:
+        idx = grid.index(x, y)
+        code = grid.terrain[idx]
+        if code in self._CORRIDOR_PROTECTED:
             return
 
-        if tile.terrain == TerrainType.WALL:
-            tile.terrain = TerrainType.FLOOR
+        if code == WALL:
+            grid.terrain[idx] = FLOOR
 
-        if not tile.room_type:
-            tile.room_type = "corridor"
+        if not grid.room_type[idx]:
+            grid.room_type[idx] = "corridor"
 
     def _assign_room_types(
         self,
         rooms: List[Dict[str, Any]],
         depth: int,
-        requirements: Optional[Dict[str, Any]] = None,
+        requirements: Optional[Dict[str, Any]],
+        rng: random.Random,
     ) -> None:
         if not rooms:
             return
@@ -328,25 +522,25 @@ class LocalMapProvider:
                 assigned_special += 1
                 continue
 
-            roll = random.random()
+            roll = rng.random()
             if roll < 0.2:
                 rooms[i]["type"] = "treasure"
             elif roll < 0.45:
                 rooms[i]["type"] = "special"
 
-    def _paint_room_types(self, game_map: GameMap, rooms: List[Dict[str, Any]]) -> None:
+    def _paint_room_types(self, grid: MapGrid, rooms: List[Dict[str, Any]]) -> None:
         for room in rooms:
             room_type = room.get("type", "normal")
             room_id = room["id"]
-            for x in range(room["x"], room["x"] + room["width"]):
-                for y in range(room["y"], room["y"] + room["height"]):
-                    tile = game_map.get_tile(x, y)
-                    if tile and tile.room_id == room_id:
-                        tile.room_type = room_type
+            for x in range(max(0, room["x"]), min(grid.width, room["x"] + room["width"])):
+                for y in range(max(0, room["y"]), min(grid.height, room["y"] + room["height"])):
+                    idx = grid.index(x, y)
+                    if grid.room_id[idx] == room_id:
+                        grid.room_type[idx] = room_type
 
     def _place_stairs(
         self,
-        game_map: GameMap,
+        grid: MapGrid,
         rooms: List[Dict[str, Any]],
         depth: int,
     ) -> Dict[str, Optional[Tuple[int, int]]]:
@@ -356,26 +550,25 @@ class LocalMapProvider:
 
         if depth > 1:
             ux, uy = self._center(rooms[0])
-            tile = game_map.get_tile(ux, uy)
-            if tile:
-                tile.terrain = TerrainType.STAIRS_UP
+            if grid.in_bounds(ux, uy):
+                grid.set(ux, uy, STAIRS_UP)
                 stairs["up"] = (ux, uy)
 
         if depth < config.game.max_quest_floors and len(rooms) > 1:
             dx, dy = self._center(rooms[-1])
-            tile = game_map.get_tile(dx, dy)
-            if tile:
-                tile.terrain = TerrainType.STAIRS_DOWN
+            if grid.in_bounds(dx, dy):
+                grid.set(dx, dy, STAIRS_DOWN)
                 stairs["down"] = (dx, dy)
 
         return stairs
 
     def _place_special_terrain(
         self,
-        game_map: GameMap,
+        grid: MapGrid,
         rooms: List[Dict[str, Any]],
         stairs: Dict[str, Optional[Tuple[int, int]]],
-        generation_contract: Optional[Dict[str, Any]] = None,
+        generation_contract: Optional[Dict[str, Any]],
+        rng: random.Random,
     ) -> None:
         blocked = set()
         if stairs.get("up"):
@@ -383,12 +576,9 @@ class LocalMapProvider:
         if stairs.get("down"):
             blocked.add(stairs["down"])
 
-        floor_tiles = [
-            pos for pos, tile in game_map.tiles.items()
-            if tile.terrain == TerrainType.FLOOR and pos not in blocked
-        ]
+        floor_tiles = [pos for pos in grid.positions_with((FLOOR,)) if pos not in blocked]
 
-        random.shuffle(floor_tiles)
+        rng.shuffle(floor_tiles)
         trap_count = min(4, max(1, len(floor_tiles) // 30))
         treasure_count = min(3, max(1, len(floor_tiles) // 40))
 
@@ -402,95 +592,66 @@ class LocalMapProvider:
             if not floor_tiles:
                 break
             x, y = floor_tiles.pop()
-            tile = game_map.get_tile(x, y)
-            if tile:
-                tile.terrain = TerrainType.TRAP
-                tile.trap_detected = False
-                tile.trap_disarmed = False
+            grid.set(x, y, TRAP)
 
         for _ in range(treasure_count):
             if not floor_tiles:
                 break
             x, y = floor_tiles.pop()
-            tile = game_map.get_tile(x, y)
-            if tile and tile.terrain == TerrainType.FLOOR:
-                tile.terrain = TerrainType.TREASURE
+            if grid.get(x, y) == FLOOR:
+                grid.set(x, y, TREASURE)
 
-        self._place_doors(game_map, blocked)
+        self._place_doors(grid, blocked, rng)
 
-    def _place_doors(self, game_map: GameMap, blocked: set[Tuple[int, int]]) -> None:
+    def _place_doors(self, grid: MapGrid, blocked: set[Tuple[int, int]], rng: random.Random) -> None:
+        masks = grid.neighbor_masks()
+        corridor, room, wall = masks.corridor, masks.room, masks.wall
         candidates: List[Tuple[int, int]] = []
-        for (x, y), tile in game_map.tiles.items():
+        for x, y in grid.positions_with((FLOOR,)):
             if (x, y) in blocked:
                 continue
-            if tile.terrain != TerrainType.FLOOR:
-                continue
-
-            neighbors = [
-                game_map.get_tile(x + 1, y),
-                game_map.get_tile(x - 1, y),
-                game_map.get_tile(x, y + 1),
-                game_map.get_tile(x, y - 1),
-            ]
-            has_corridor = any(n and n.room_type == "corridor" for n in neighbors)
-            has_room = any(n and n.room_type not in ("", "corridor") for n in neighbors)
-            wall_count = sum(1 for n in neighbors if n and n.terrain == TerrainType.WALL)
-
-            if has_corridor and has_room and wall_count >= 1:
+            idx = grid.index(x, y)
+            if corridor[idx] and room[idx] and wall[idx] & MASK4:
                 candidates.append((x, y))
 
-        random.shuffle(candidates)
+        rng.shuffle(candidates)
         door_target = min(8, max(1, len(candidates) // 3))
         for x, y in candidates[:door_target]:
-            tile = game_map.get_tile(x, y)
-            if tile and tile.terrain == TerrainType.FLOOR:
-                tile.terrain = TerrainType.DOOR
-
-    def _place_events(self, game_map: GameMap, quest_context: Optional[Dict[str, Any]]) -> None:
-        event_tiles = [
-            (x, y)
-            for (x, y), tile in game_map.tiles.items()
-            if tile.terrain in {TerrainType.FLOOR, TerrainType.DOOR}
-            and not tile.has_event
-            and not tile.character_id
-        ]
-        random.shuffle(event_tiles)
-
-        def _to_bool(value: Any, default_value: bool = False) -> bool:
-            if isinstance(value, bool):
-                return value
-            if isinstance(value, str):
-                normalized = value.strip().lower()
-                if normalized in {"true", "1", "yes", "y", "on"}:
-                    return True
-                if normalized in {"false", "0", "no", "n", "off", ""}:
-                    return False
-            if value is None:
-                return default_value
-            return bool(value)
+            if grid.get(x, y) == FLOOR:
+                grid.set(x, y, DOOR)
+
+    def _place_events(
+        self,
+        grid: MapGrid,
+        depth: int,
+        quest_context: Optional[Dict[str, Any]],
+        rng: random.Random,
+    ) -> None:
+        event_tiles = [pos for pos in grid.positions_with((FLOOR, DOOR)) if pos not in grid.events]
+        rng.shuffle(event_tiles)
 
         def _default_event_payload(event_type: str) -> Dict[str, Any]:
             if event_type == "combat":
                 return {
-                    "monster_count": random.randint(1, 3),
-                    "difficulty": random.choice(["easy", "medium", "hard"]),
+                    "monster_count": rng.randint(1, 3),
+                    "difficulty": rng.choice(["easy", "medium", "hard"]),
                 }
             if event_type == "treasure":
                 return {
-                    "treasure_type": random.choice(["gold", "item", "magic_item"]),
-                    "value": random.randint(50, 300),
+                    "treasure_type": rng.choice(["gold", "item", "magic_item"]),
+                    "value": rng.randint(50, 300),
                 }
             if event_type == "trap":
                 from trap_schema import trap_validator
 
-                trap_type = random.choice(["damage", "debuff", "teleport"])
+                trap_type = rng.choice(["damage", "debuff", "teleport"])
                 payload = {
                     "trap_type": trap_type,
                     "trap_name": "本地生成陷阱",
-                    "detect_dc": random.randint(12, 18),
-                    "disarm_dc": random.randint(15, 20),
-                    "save_dc": random.randint(12, 16),
-                    "damage": random.randint(6, 24),
+                    "detect_dc": rng.randint(12, 18),
+                    "disarm_dc": rng.randint(15, 20),
+                    "save_dc": rng.randint(12, 16),
+                    "damage": rng.randint(6, 24),
                 }
                 try:
                     normalized = trap_validator.validate_and_normalize(payload)
@@ -508,12 +669,12 @@ class LocalMapProvider:
                     "damage": payload["damage"],
                 }
             if event_type == "mystery":
-                return {"mystery_type": random.choice(["puzzle", "riddle", "choice"])}
-            return {"story_type": random.choice(["discovery", "memory", "vision", "encounter"])}
+                return {"mystery_type": rng.choice(["puzzle", "riddle", "choice"])}
+            return {"story_type": rng.choice(["discovery", "memory", "vision", "encounter"])}
 
         # 任务专属事件（按楼层过滤）
         if quest_context and isinstance(quest_context.get("special_events"), list):
-            current_depth = max(1, int(getattr(game_map, "depth", 1)))
+            current_depth = max(1, int(depth or 1))
             for event_data in quest_context["special_events"]:
                 if not isinstance(event_data, dict):
                     continue
@@ -523,19 +684,18 @@ class LocalMapProvider:
                 if not event_tiles:
                     break
                 x, y = event_tiles.pop()
-                tile = game_map.get_tile(x, y)
-                if not tile:
-                    continue
-                tile.has_event = True
-                tile.event_type = event_data.get("event_type", "story")
-                tile.is_event_hidden = True
-                tile.event_triggered = False
-                tile.event_data = {
-                    "quest_event_id": event_data.get("id") or event_data.get("event_id"),
-                    "name": event_data.get("name", "任务事件"),
-                    "description": event_data.get("description", ""),
-                    "progress_value": event_data.get("progress_value", 0.0),
-                    "is_mandatory": _to_bool(event_data.get("is_mandatory", False), default_value=False),
+                grid.events[(x, y)] = {
+                    "has_event": True,
+                    "event_type": event_data.get("event_type", "story"),
+                    "is_event_hidden": True,
+                    "event_triggered": False,
+                    "event_data": {
+                        "quest_event_id": event_data.get("id") or event_data.get("event_id"),
+                        "name": event_data.get("name", "任务事件"),
+                        "description": event_data.get("description", ""),
+                        "progress_value": event_data.get("progress_value", 0.0),
+                        "is_mandatory": _to_bool(event_data.get("is_mandatory", False), default_value=False),
+                    },
                 }
 
         # 普通事件
@@ -545,22 +705,23 @@ class LocalMapProvider:
             if not event_tiles:
                 break
             x, y = event_tiles.pop()
-            tile = game_map.get_tile(x, y)
-            if not tile:
-                continue
 
-            event_type = random.choice(event_types)
-            tile.has_event = True
-            tile.event_type = event_type
-            tile.is_event_hidden = random.choice([True, True, False])
-            tile.event_triggered = False
-            tile.event_data = _default_event_payload(event_type)
+            event_type = rng.choice(event_types)
+            grid.events[(x, y)] = {
+                "has_event": True,
+                "event_type": event_type,
+                "is_event_hidden": rng.choice([True, True, False]),
+                "event_triggered": False,
+                "event_data": _default_event_payload(event_type),
+            }
 
     def _build_monster_hints(
         self,
         game_map: GameMap,
+        grid: MapGrid,
         rooms: List[Dict[str, Any]],
         quest_context: Optional[Dict[str, Any]],
+        rng: random.Random,
     ) -> Dict[str, Any]:
         quest_type = "exploration"
         if quest_context and isinstance(quest_context.get("quest_type"), str):
@@ -573,18 +734,12 @@ class LocalMapProvider:
             "investigation": "normal",
         }
 
-        floor_tiles = [
-            (x, y, tile)
-            for (x, y), tile in game_map.tiles.items()
-            if tile.terrain in self.WALKABLE_TERRAINS and tile.terrain not in {TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}
-        ]
-
         normal_candidates: List[Tuple[int, int]] = []
         boss_candidates: List[Tuple[int, int]] = []
         special_candidates: List[Tuple[int, int]] = []
 
-        for x, y, tile in floor_tiles:
-            room_type = tile.room_type or "normal"
+        for x, y in grid.positions_with(WALKABLE_CODES - STAIRS_CODES):
+            room_type = grid.room_type[grid.index(x, y)] or "normal"
             if room_type == "boss":
                 boss_candidates.append((x, y))
             elif room_type == "special":
@@ -592,9 +747,9 @@ class LocalMapProvider:
             else:
                 normal_candidates.append((x, y))
 
-        random.shuffle(normal_candidates)
-        random.shuffle(boss_candidates)
-        random.shuffle(special_candidates)
+        rng.shuffle(normal_candidates)
+        rng.shuffle(boss_candidates)
+        rng.shuffle(special_candidates)
 
         depth = max(1, game_map.depth)
         encounter_count = max(1, min(8, max(1, len(rooms) // 2)))
@@ -719,94 +874,20 @@ class LocalMapProvider:
 
         return requirements
 
-    def _connect_two_rooms(self, game_map: GameMap, room1: Dict[str, Any], room2: Dict[str, Any]) -> None:
-        x1, y1 = self._center(room1)
-        x2, y2 = self._center(room2)
-        self._carve_corridor(game_map, x1, y1, x2, y1)
-        self._carve_corridor(game_map, x2, y1, x2, y2)
-
-    def _connect_all_rooms(self, game_map: GameMap, rooms: List[Dict[str, Any]]) -> None:
-        if len(rooms) <= 1:
-            return
-
-        distances: List[Tuple[float, int, int]] = []
-        for i in range(len(rooms)):
-            for j in range(i + 1, len(rooms)):
-                x1, y1 = self._center(rooms[i])
-                x2, y2 = self._center(rooms[j])
-                d = abs(x1 - x2) + abs(y1 - y2)
-                distances.append((d, i, j))
-        distances.sort(key=lambda item: item[0])
-
-        parent = list(range(len(rooms)))
-
-        def find(x: int) -> int:
-            while parent[x] != x:
-                parent[x] = parent[parent[x]]
-                x = parent[x]
-            return x
-
-        def union(a: int, b: int) -> bool:
-            pa = find(a)
-            pb = find(b)
-            if pa == pb:
-                return False
-            parent[pa] = pb
-            return True
-
-        used_edges: List[Tuple[int, int]] = []
-        for _, i, j in distances:
-            if union(i, j):
-                self._connect_two_rooms(game_map, rooms[i], rooms[j])
-                used_edges.append((i, j))
-                if len(used_edges) >= len(rooms) - 1:
-                    break
-
-        extra_edges = min(2, max(0, len(distances) - len(used_edges)))
-        for _, i, j in distances[-extra_edges:]:
-            if random.random() < 0.3:
-                self._connect_two_rooms(game_map, rooms[i], rooms[j])
-
     def _neighbors4(self, x: int, y: int) -> List[Tuple[int, int]]:
         return [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
 
-    def _is_walkable_for_pathing(self, tile: Optional[MapTile]) -> bool:
-        if not tile:
-            return False
-        return tile.terrain in self.WALKABLE_TERRAINS
-
-    def _collect_reachable_positions(self, game_map: GameMap, start: Tuple[int, int]) -> Set[Tuple[int, int]]:
-        start_tile = game_map.get_tile(*start)
-        if not self._is_walkable_for_pathing(start_tile):
-            return set()
-
-        visited: Set[Tuple[int, int]] = {start}
-        queue: deque[Tuple[int, int]] = deque([start])
-
-        while queue:
-            cx, cy = queue.popleft()
-            for nx, ny in self._neighbors4(cx, cy):
-                if (nx, ny) in visited:
-                    continue
-                tile = game_map.get_tile(nx, ny)
-                if not self._is_walkable_for_pathing(tile):
-                    continue
-                visited.add((nx, ny))
-                queue.append((nx, ny))
-
-        return visited
-
-    def _get_key_targets(self, game_map: GameMap, stairs: Dict[str, Optional[Tuple[int, int]]]) -> List[Tuple[int, int]]:
+    def _get_key_targets(self, grid: MapGrid, stairs: Dict[str, Optional[Tuple[int, int]]]) -> List[Tuple[int, int]]:
         targets: List[Tuple[int, int]] = []
         if stairs.get("up"):
             targets.append(stairs["up"])
         if stairs.get("down"):
             targets.append(stairs["down"])
 
-        for (x, y), tile in game_map.tiles.items():
-            if not tile.has_event:
+        for (x, y), event in grid.events.items():
+            if not event.get("has_event"):
                 continue
-            event_data = tile.event_data if isinstance(tile.event_data, dict) else {}
+            event_data = event.get("event_data") if isinstance(event.get("event_data"), dict) else {}
             if event_data.get("is_mandatory") is True:
                 targets.append((x, y))
 
@@ -820,12 +901,14 @@ class LocalMapProvider:
 
     def _repair_unreachable_targets(
         self,
-        game_map: GameMap,
-        reachable: Set[Tuple[int, int]],
+        grid: MapGrid,
+        reachable: DistanceField,
         targets: List[Tuple[int, int]],
+        walkable: Set[Tuple[int, int]],
     ) -> int:
+        """为不可达目标雕刻走廊；reachable 与 walkable 随雕刻增量更新"""
         repaired = 0
-        if not reachable:
+        if not len(reachable):
             return repaired
 
         for tx, ty in targets:
@@ -834,7 +917,7 @@ class LocalMapProvider:
 
             best_src: Optional[Tuple[int, int]] = None
             best_dist = 10**9
-            for sx, sy in reachable:
+            for sx, sy in reachable.distances:
                 dist = abs(tx - sx) + abs(ty - sy)
                 if dist < best_dist:
                     best_dist = dist
@@ -845,30 +928,29 @@ class LocalMapProvider:
 
             sx, sy = best_src
             end_x, end_y = tx, ty
-            target_tile = game_map.get_tile(tx, ty)
-            if target_tile and target_tile.terrain in {TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}:
+            if grid.get(tx, ty) in STAIRS_CODES:
                 neighbor_candidates: List[Tuple[int, int]] = []
                 for nx, ny in self._neighbors4(tx, ty):
-                    ntile = game_map.get_tile(nx, ny)
-                    if not ntile:
-                        continue
-                    if ntile.terrain in {TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN}:
+                    code = grid.get(nx, ny)
+                    if code is None or code in STAIRS_CODES:
                         continue
                     neighbor_candidates.append((nx, ny))
                 if neighbor_candidates:
                     neighbor_candidates.sort(key=lambda pos: abs(pos[0] - sx) + abs(pos[1] - sy))
                     end_x, end_y = neighbor_candidates[0]
 
-            self._carve_corridor(game_map, sx, sy, end_x, sy)
-            self._carve_corridor(game_map, end_x, sy, end_x, end_y)
+            carved = self._carve_corridor(grid, sx, sy, end_x, sy)
+            carved += self._carve_corridor(grid, end_x, sy, end_x, end_y)
             repaired += 1
-            reachable.update(self._collect_reachable_positions(game_map, (sx, sy)))
+            walkable.update(pos for pos in carved if grid.is_walkable(*pos))
+            reachable.extend([best_src, *carved], walkable)
 
         return repaired
 
     def _validate_and_repair_map(
         self,
-        game_map: GameMap,
+        grid: MapGrid,
+        depth: int,
         rooms: List[Dict[str, Any]],
         stairs: Dict[str, Optional[Tuple[int, int]]],
         quest_context: Optional[Dict[str, Any]],
@@ -890,33 +972,33 @@ class LocalMapProvider:
             report["connectivity_ok"] = False
             return report
 
+        # 一次 BFS 距离场回答全部目标的可达性；修复时只增量扩展新连通的区域
         start = stairs.get("up") or self._center(rooms[0])
-        reachable = self._collect_reachable_positions(game_map, start)
-        targets = self._get_key_targets(game_map, stairs)
+        walkable = set(grid.positions_with(WALKABLE_CODES))
+        reachable = DistanceField.compute(start, walkable)
+        targets = self._get_key_targets(grid, stairs)
         report["required_target_count"] = len(targets)
 
         unreachable_before = [t for t in targets if t not in reachable]
         report["unreachable_targets_before"] = len(unreachable_before)
 
         if unreachable_before:
-            repaired = self._repair_unreachable_targets(game_map, reachable, unreachable_before)
+            repaired = self._repair_unreachable_targets(grid, reachable, unreachable_before, walkable)
             report["repaired_targets"] = repaired
-            reachable = self._collect_reachable_positions(game_map, start)
 
         unreachable_after = [t for t in targets if t not in reachable]
         report["unreachable_targets_after"] = len(unreachable_after)
         report["connectivity_ok"] = len(unreachable_after) == 0
         report["key_objective_unreachable"] = len(unreachable_after) > 0
 
-        walkable = sum(1 for tile in game_map.tiles.values() if tile.terrain in self.WALKABLE_TERRAINS)
-        report["walkable_tiles"] = walkable
+        report["walkable_tiles"] = len(walkable)
 
-        min_walkable = max(20, int(game_map.width * game_map.height * 0.15))
-        if walkable < min_walkable:
+        min_walkable = max(20, int(grid.width * grid.height * 0.15))
+        if len(walkable) < min_walkable:
             report["warnings"].append("walkable_area_low")
 
         if quest_context and isinstance(quest_context.get("special_events"), list):
-            current_depth = max(1, int(getattr(game_map, "depth", 1)))
+            current_depth = max(1, int(depth or 1))
             mandatory_total = sum(
                 1
                 for e in quest_context["special_events"]
@@ -926,10 +1008,10 @@ class LocalMapProvider:
             )
             placed_mandatory = sum(
                 1
-                for tile in game_map.tiles.values()
-                if tile.has_event
-                and isinstance(tile.event_data, dict)
-                and tile.event_data.get("is_mandatory") is True
+                for event in grid.events.values()
+                if event.get("has_event")
+                and isinstance(event.get("event_data"), dict)
+                and event["event_data"].get("is_mandatory") is True
             )
             report["mandatory_events_expected"] = mandatory_total
             report["mandatory_events_placed"] = placed_mandatory
@@ -937,10 +1019,10 @@ class LocalMapProvider:
             if mandatory_total > placed_mandatory:
                 report["warnings"].append("mandatory_events_partially_placed")
 
-        stairs_up_count = sum(1 for t in game_map.tiles.values() if t.terrain == TerrainType.STAIRS_UP)
-        stairs_down_count = sum(1 for t in game_map.tiles.values() if t.terrain == TerrainType.STAIRS_DOWN)
+        stairs_up_count = grid.count(STAIRS_UP)
+        stairs_down_count = grid.count(STAIRS_DOWN)
         max_floor = max(1, int(getattr(config.game, "max_quest_floors", 3) or 3))
-        depth = max(1, int(getattr(game_map, "depth", 1) or 1))
+        depth = max(1, int(depth or 1))
         stair_violations = 0
         if depth <= 1 and stairs_up_count > 0:
             stair_violations += stairs_up_count
@@ -973,3 +1055,16 @@ class LocalMapProvider:
 
 
 local_map_provider = LocalMapProvider()
+
+
+def build_local_map_grid(
+    width: int,
+    height: int,
+    depth: int,
+    theme: str,
+    quest_context: Optional[Dict[str, Any]],
+    seed: int,
+) -> Tuple[GameMap, MapGrid, Dict[str, Any]]:
+    """进程池入口（模块级函数才能被 pickle）"""
+    return local_map_provider.build_map_grid(width, height, depth, theme, quest_context, seed)
+
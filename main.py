@@ -21,7 +21,7 @@ from dataclasses import dataclass
 from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -30,6 +30,17 @@ from game_engine import game_engine
 from data_manager import data_manager
 from llm_service import llm_service, LLMUnavailableError
 from tts_gateway import TTSGateway, TTSProviderBase
+from openai_api_tool import close_async_http_clients
+from tts_cache import TTSCacheEntry, etag_matches, make_tts_cache_key, make_tts_variant_key, tts_cache
+from tts_pipeline import (
+    AudioFormatMismatch,
+    AudioStitcher,
+    finalize_stream,
+    run_segments_in_order,
+    split_sentences,
+)
+from tts_prefetch import tts_prefetcher
+from tts_transcode import media_type_for, tts_transcoder
 import qwen_tts_adapter  # noqa: F401  # import side effect: 注册 qwen_gradio provider
 from progress_manager import progress_manager
 from event_choice_system import event_choice_system
@@ -38,8 +49,10 @@ from user_session_manager import user_session_manager
 from async_task_manager import async_task_manager
 from input_validator import input_validator
 from game_state_lock_manager import game_state_lock_manager
+from game_state_snapshot import capture_game_state, get_snapshot_stats
 from entity_manager import entity_manager
 from trap_manager import initialize_trap_manager
+from map_pool import map_pool
 
 
 # 配置日志
@@ -67,6 +80,7 @@ class OpeningTTSEntry:
 _opening_tts_cache: Dict[Tuple[str, str, str], OpeningTTSEntry] = {}
 _opening_tts_semaphore: Optional[asyncio.Semaphore] = None
 _opening_tts_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+_tts_provider_semaphores: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore, int]] = {}
 
 
 # Pydantic模型
@@ -99,6 +113,8 @@ class TTSRequest(BaseModel):
     category: str = "narrative"
     style_hint: Optional[str] = None
     voice: Optional[str] = None
+    # True 时按句流式返回（分块传输），首句合成完成即可开始播放
+    stream: bool = False
 
 
 def _tts_media_type(output_format: str) -> str:
@@ -107,7 +123,8 @@ def _tts_media_type(output_format: str) -> str:
         "mp3": "audio/mpeg",
         "pcm16": "application/octet-stream",
     }
-    return format_map.get(str(output_format or "wav").lower(), "application/octet-stream")
+    normalized = str(output_format or "wav").lower()
+    return format_map.get(normalized) or media_type_for(normalized) or "application/octet-stream"
 
 
 def _get_tts_response_format() -> str:
@@ -198,6 +215,17 @@ def _get_opening_tts_semaphore() -> asyncio.Semaphore:
     return _opening_tts_semaphore
 
 
+def _get_tts_provider_semaphore(provider_name: str, limit: int) -> asyncio.Semaphore:
+    """每个 provider 一个并发上限（跨请求共享），分段并行合成与高并发请求不会压垮上游"""
+    loop = asyncio.get_running_loop()
+    current = _tts_provider_semaphores.get(provider_name)
+    if current is None or current[0] is not loop or current[2] != limit:
+        semaphore = asyncio.Semaphore(max(1, int(limit)))
+        _tts_provider_semaphores[provider_name] = (loop, semaphore, limit)
+        return semaphore
+    return current[1]
+
+
 def _validate_tts_request_text(text: str) -> str:
     if not config.tts.enabled:
         raise HTTPException(
@@ -262,41 +290,326 @@ def _get_tts_provider() -> TTSProviderBase:
 _build_tts_client = _get_tts_provider
 
 
-async def _synthesize_tts_bytes(
+@dataclass
+class TTSJob:
+    """一次合成请求解析后的参数（校验、provider、缓存键均已确定）"""
+    provider: TTSProviderBase
+    text: str
+    voice: Optional[str]
+    style_hint: str
+    response_format: str
+    cache_key: str
+
+
+def _prepare_tts_job(
     text: str,
     category: str = "narrative",
     voice: Optional[str] = None,
     style_hint: Optional[str] = None,
-) -> Tuple[bytes, str]:
+) -> TTSJob:
     normalized = _validate_tts_request_text(text)
     provider = _get_tts_provider()
     requested_voice = str(voice or config.tts.default_voice or "").strip() or None
     resolved_style_hint = _build_tts_style_hint(category, style_hint)
+    response_format = provider.__class__.get_effective_response_format(config.tts.output_format)
+    cache_key = make_tts_cache_key(
+        config.tts.provider,
+        config.tts.model_name,
+        requested_voice,
+        resolved_style_hint,
+        response_format,
+        normalized,
+    )
+    return TTSJob(
+        provider=provider,
+        text=normalized,
+        voice=requested_voice,
+        style_hint=resolved_style_hint,
+        response_format=response_format,
+        cache_key=cache_key,
+    )
 
-    try:
-        response_format = provider.__class__.get_effective_response_format(config.tts.output_format)
-        audio_bytes, resolved_voice = await asyncio.to_thread(
-            provider.synthesize,
-            text=normalized,
-            voice=requested_voice,
-            response_format=response_format,
-            style_hint=resolved_style_hint,
-        )
-    except ValueError as exc:
+
+def _tts_synthesis_error(exc: Exception) -> HTTPException:
+    """provider 异常 → 502（ValueError 视为参数无效，其余视为上游失败）"""
+    if isinstance(exc, ValueError):
         # 参数无效 / 未知音色 / 文本为空（理论上已被前置 validate 拦截）
         logger.warning("TTS synthesis rejected: %s", str(exc)[:500])
-        raise HTTPException(
+        return HTTPException(
             status_code=502,
             detail={"error_code": "TTS_VOICE_UNKNOWN", "message": "语音合成参数无效"}
-        ) from exc
+        )
+    logger.warning("TTS synthesis failed: %s", str(exc)[:500])
+    return HTTPException(
+        status_code=502,
+        detail={"error_code": "TTS_SYNTHESIS_FAILED", "message": "语音合成失败"}
+    )
+
+
+def _split_tts_segments(job: TTSJob) -> List[str]:
+    """长文本按句切分为独立合成的分段；短文本整段合成"""
+    min_chars = max(0, int(getattr(config.tts, "segment_min_chars", 60) or 0))
+    if not min_chars or len(job.text) < min_chars:
+        return [job.text]
+    max_chars = max(0, int(getattr(config.tts, "segment_max_chars", 200) or 0))
+    return split_sentences(job.text, max_chars=max_chars) or [job.text]
+
+
+async def _synthesize_tts_raw(job: TTSJob, text: str) -> Tuple[bytes, str]:
+    """直接调用 provider 合成一段文本（受 provider 并发上限与超时约束，不经缓存）
+
+    原生异步的 provider 不占线程；同步 provider 由其专属线程池执行。
+    """
+    limit = job.provider.get_max_concurrency(config)
+    timeout = max(1, int(getattr(config.tts, "timeout", 120) or 120))
+    async with _get_tts_provider_semaphore(config.tts.provider, limit):
+        try:
+            return await asyncio.wait_for(
+                job.provider.asynthesize(
+                    text,
+                    voice=job.voice,
+                    response_format=job.response_format,
+                    style_hint=job.style_hint,
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError as exc:
+            raise RuntimeError(f"TTS 合成超时（{timeout}s）") from exc
+
+
+async def _synthesize_tts_segment(job: TTSJob, text: str) -> TTSCacheEntry:
+    """合成单个分段；每个分段按自身内容独立缓存，可被其它长文本复用"""
+    key = make_tts_cache_key(
+        config.tts.provider,
+        config.tts.model_name,
+        job.voice,
+        job.style_hint,
+        job.response_format,
+        text,
+    )
+    entry, _ = await tts_cache.get_or_create(key, lambda: _synthesize_tts_raw(job, text), job.response_format)
+    return entry
+
+
+async def _iter_tts_segments(job: TTSJob, segments: List[str]):
+    """并行合成各分段，按顺序产出 (分段缓存条目)"""
+    concurrency = max(1, int(getattr(config.tts, "segment_max_concurrency", 3) or 1))
+    async for entry in run_segments_in_order(
+        segments,
+        lambda text: _synthesize_tts_segment(job, text),
+        concurrency=concurrency,
+    ):
+        yield entry
+
+
+async def _synthesize_tts_entry(
+    text: str,
+    category: str = "narrative",
+    voice: Optional[str] = None,
+    style_hint: Optional[str] = None,
+) -> Tuple[TTSCacheEntry, str]:
+    """经内容寻址缓存合成语音，返回 (缓存条目, 缓存状态)。
+
+    长文本先按句切分、分段并行合成（各段独立缓存），再按顺序拼接为完整音频。
+    """
+    job = _prepare_tts_job(text, category=category, voice=voice, style_hint=style_hint)
+    segments = _split_tts_segments(job)
+
+    async def _synthesize() -> Tuple[bytes, str]:
+        if len(segments) == 1:
+            return await _synthesize_tts_raw(job, job.text)
+        stitcher = AudioStitcher(job.response_format)
+        resolved_voice = ""
+        try:
+            async for entry in _iter_tts_segments(job, segments):
+                stitcher.feed(entry.audio)
+                resolved_voice = resolved_voice or entry.voice
+        except AudioFormatMismatch as exc:
+            logger.warning("TTS segment format mismatch, synthesizing whole text: %s", exc)
+            return await _synthesize_tts_raw(job, job.text)
+        return stitcher.finalize(), resolved_voice
+
+    try:
+        return await tts_cache.get_or_create(job.cache_key, _synthesize, job.response_format)
     except Exception as exc:
-        logger.warning("TTS synthesis failed: %s", str(exc)[:500])
-        raise HTTPException(
-            status_code=502,
-            detail={"error_code": "TTS_SYNTHESIS_FAILED", "message": "语音合成失败"}
-        ) from exc
+        raise _tts_synthesis_error(exc) from exc
+
+
+def _provider_streams_natively(provider: TTSProviderBase) -> bool:
+    return type(provider).synthesize_stream is not TTSProviderBase.synthesize_stream
+
+
+async def _iter_tts_stream(job: TTSJob):
+    """按顺序产出 (音频块, 音色)：provider 自带流式接口时直接转发，否则走分段并行管线"""
+    if _provider_streams_natively(job.provider):
+        chunks = job.provider.synthesize_stream(
+            job.text,
+            voice=job.voice,
+            response_format=job.response_format,
+            style_hint=job.style_hint,
+        )
+        try:
+            while True:
+                item = await asyncio.to_thread(next, chunks, None)
+                if item is None:
+                    return
+                yield item
+        finally:
+            try:
+                chunks.close()
+            except Exception:
+                pass
+
+    stitcher = AudioStitcher(job.response_format)
+    segments = _split_tts_segments(job)
+    async for entry in _iter_tts_segments(job, segments):
+        yield stitcher.feed(entry.audio), entry.voice
+
+
+async def _synthesize_tts_streaming(
+    text: str,
+    category: str = "narrative",
+    voice: Optional[str] = None,
+    style_hint: Optional[str] = None,
+    request: Optional[Request] = None,
+) -> Response:
+    """流式合成入口：已缓存时直接返回完整音频，否则按句分块输出。"""
+    job = _prepare_tts_job(text, category=category, voice=voice, style_hint=style_hint)
+    cached = await asyncio.to_thread(tts_cache.get, job.cache_key)
+    if cached is not None:
+        tts_prefetcher.record_lookup(job.cache_key, "hit")
+        return _tts_entry_response(*await _negotiate_tts_entry(cached, "hit", request), request, negotiated=True)
+    if job.cache_key in tts_prefetcher.inflight_keys():
+        # 同一文本正在后台预合成：等待其结果，而不是再发起一次流式合成
+        entry, state = await _synthesize_tts_entry(text, category=category, voice=voice, style_hint=style_hint)
+        tts_prefetcher.record_lookup(entry.key, state)
+        return _tts_entry_response(*await _negotiate_tts_entry(entry, state, request), request, negotiated=True)
+    return await _stream_tts_response(job)
+
+
+async def _stream_tts_response(job: TTSJob) -> Response:
+    """流式合成：首块（首句）就绪后立即开始输出，完整流结束后写入缓存。"""
+    chunks = _iter_tts_stream(job)
+    started = time.perf_counter()
+    try:
+        first_chunk, resolved_voice = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise _tts_synthesis_error(RuntimeError("TTS 流未返回任何音频"))
+    except Exception as exc:
+        await chunks.aclose()
+        raise _tts_synthesis_error(exc) from exc
+    first_chunk_ms = int((time.perf_counter() - started) * 1000)
 
-    return audio_bytes, resolved_voice
+    async def _body():
+        parts = [first_chunk]
+        completed = False
+        try:
+            yield first_chunk
+            async for chunk, _ in chunks:
+                parts.append(chunk)
+                yield chunk
+            completed = True
+        except AudioFormatMismatch as exc:
+            # 分段格式不一致：本次流只能截断，后台整段合成写入缓存供后续请求使用
+            logger.warning("TTS stream aborted, scheduling whole-text synthesis: %s", exc)
+            tts_prefetcher.schedule(
+                job.cache_key,
+                lambda: tts_cache.get_or_create(
+                    job.cache_key, lambda: _synthesize_tts_raw(job, job.text), job.response_format
+                ),
+                tts_cache.contains,
+            )
+        except Exception as exc:
+            # 响应头已发出，只能截断流；不完整的音频不写入缓存
+            logger.warning("TTS stream aborted: %s", str(exc)[:500])
+        finally:
+            if not completed:
+                await chunks.aclose()
+        if completed:
+            audio = finalize_stream(b"".join(parts), job.response_format)
+            await asyncio.to_thread(tts_cache.put, job.cache_key, audio, resolved_voice, job.response_format)
+
+    return StreamingResponse(
+        _body(),
+        media_type=_tts_media_type(job.response_format),
+        headers={
+            "Cache-Control": "no-store",
+            "X-TTS-Cache": "stream",
+            "X-TTS-Cache-Key": job.cache_key,
+            "X-TTS-First-Chunk-Ms": str(first_chunk_ms),
+            "X-TTS-Provider": config.tts.provider,
+            "X-TTS-Model": config.tts.model_name,
+            "X-TTS-Voice": resolved_voice,
+        },
+    )
+
+
+async def _synthesize_tts_bytes(
+    text: str,
+    category: str = "narrative",
+    voice: Optional[str] = None,
+    style_hint: Optional[str] = None,
+) -> Tuple[bytes, str]:
+    entry, _ = await _synthesize_tts_entry(text, category=category, voice=voice, style_hint=style_hint)
+    return entry.audio, entry.voice
+
+
+async def _negotiate_tts_entry(
+    entry: TTSCacheEntry,
+    cache_state: str,
+    request: Optional[Request],
+) -> Tuple[TTSCacheEntry, str]:
+    """按 Accept 头把源音频转码为 Opus / MP3（结果以派生键与源音频并存于缓存）。
+
+    未启用、本机无编码器、客户端未显式要求或转码失败时原样返回源条目。
+    """
+    accept = request.headers.get("accept") if request is not None else None
+    target = tts_transcoder.choose(accept, entry.response_format)
+    if target is None:
+        return entry, cache_state
+
+    async def _transcode() -> Tuple[bytes, str]:
+        return await tts_transcoder.transcode(entry.audio, target), entry.voice
+
+    try:
+        return await tts_cache.get_or_create(make_tts_variant_key(entry.key, target), _transcode, target)
+    except Exception as exc:
+        logger.warning("TTS transcode to %s failed, serving %s: %s", target, entry.response_format, str(exc)[:300])
+        return entry, cache_state
+
+
+def _tts_entry_response(
+    entry: TTSCacheEntry,
+    cache_state: str,
+    request: Optional[Request] = None,
+    negotiated: bool = False,
+) -> Response:
+    """缓存条目 → 音频响应；带强 ETag，If-None-Match 命中时返回 304。
+
+    negotiated=True 表示响应编码经 Accept 协商（_negotiate_tts_entry），会附带 Vary: Accept。
+    """
+    max_age = max(0, int(getattr(config.tts, "cache_browser_max_age", 86400) or 0))
+    headers = {
+        "Cache-Control": f"private, max-age={max_age}" if tts_cache.enabled and max_age else "no-store",
+        "ETag": entry.etag,
+        "X-TTS-Cache": cache_state,
+        "X-TTS-Cache-Key": entry.key,
+        "X-TTS-Provider": config.tts.provider,
+        "X-TTS-Model": config.tts.model_name,
+        "X-TTS-Voice": entry.voice,
+    }
+    if tts_cache.enabled:
+        headers["Content-Location"] = f"/api/tts/audio/{entry.key}"
+    if negotiated and tts_transcoder.available_targets():
+        # 同一请求按 Accept 可能得到不同编码
+        headers["Vary"] = "Accept"
+    if request is not None and etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=entry.audio,
+        media_type=_tts_media_type(entry.response_format or _get_tts_response_format()),
+        headers=headers,
+    )
 
 
 def _opening_tts_cache_key(user_id: str, game_id: str, segment_id: str) -> Tuple[str, str, str]:
@@ -352,14 +665,23 @@ def _can_prefetch_opening_tts() -> bool:
     """判断当前 provider 是否具备开场预合成能力。
 
     - 必须 `config.tts.enabled` 与 `opening_prefetch_enabled`
+    - 其余条件见 `_can_prefetch_tts`
+    """
+    if not getattr(config.tts, "opening_prefetch_enabled", True):
+        return False
+    return _can_prefetch_tts()
+
+
+def _can_prefetch_tts() -> bool:
+    """判断当前 provider 是否允许后台预合成。
+
+    - 必须 `config.tts.enabled`
     - provider 必须已注册 (`TTSGateway.is_known`)
     - provider 类必须 `supports_prefetch=True`
     - provider 声明的 `required_config_fields` 必须全部在 `config.tts` 中非空
     """
     if not config.tts.enabled:
         return False
-    if not getattr(config.tts, "opening_prefetch_enabled", True):
-        return False
     provider_cls = TTSGateway.peek(config.tts.provider)
     if provider_cls is None or not getattr(provider_cls, "supports_prefetch", False):
         return False
@@ -437,6 +759,33 @@ def _schedule_opening_tts_prefetch(
     return enhanced_segments
 
 
+def _prefetch_tts_for_result(result: Any, events_category: Optional[str] = None) -> int:
+    """按接口结果预测前端即将朗读的文本并后台预合成，返回实际提交的数量。
+
+    narrative 固定按 narrative 分类；events 仅在给出 events_category 时预合成
+    （与前端对应页面的朗读分类一致）；pending_choice_context 按选项汇总文本预合成。
+    """
+    if not isinstance(result, dict) or not tts_prefetcher.enabled or not _can_prefetch_tts():
+        return 0
+
+    scheduled = 0
+    llm_busy = async_task_manager.is_llm_saturated()
+    for text, category in tts_prefetcher.collect_texts(result, events_category=events_category):
+        try:
+            job = _prepare_tts_job(text, category=category)
+        except HTTPException:
+            continue
+
+        def _factory(text: str = text, category: str = category):
+            return _synthesize_tts_entry(text, category=category)
+
+        if tts_prefetcher.schedule(job.cache_key, _factory, tts_cache.contains, llm_busy=llm_busy):
+            scheduled += 1
+    if scheduled:
+        logger.debug("tts_prefetch_scheduled count=%s inflight=%s", scheduled, len(tts_prefetcher.inflight_keys()))
+    return scheduled
+
+
 def _normalize_action_response(
     action: str,
     trace_id: str,
@@ -501,8 +850,11 @@ def _build_context_key(user_id: str, game_id: str) -> str:
 
 
 def _serialize_game_state_for_client(game_state: GameState) -> Dict[str, Any]:
-    """序列化游戏状态给前端，并消费一次性特效队列，避免重复弹窗。"""
-    state_dict = game_state.to_dict()
+    """序列化游戏状态给前端，并消费一次性特效队列，避免重复弹窗。
+
+    返回只读快照（未变化的瓦片复用缓存），可在锁外安全地编码。
+    """
+    state_dict = capture_game_state(game_state).to_dict()
 
     # pending_effects 是一次性消费队列，返回给前端后立即清理
     if hasattr(game_state, 'pending_effects') and game_state.pending_effects:
@@ -577,20 +929,13 @@ def _repair_character_tile_index(game_state: GameState) -> None:
     if not game_state or not game_state.current_map:
         return
 
-    for tile in game_state.current_map.tiles.values():
-        tile.character_id = None
+    game_state.current_map.rebuild_entity_index(game_state.player, game_state.monsters)
 
     player_tile = game_state.current_map.get_tile(*game_state.player.position)
     if player_tile:
-        player_tile.character_id = game_state.player.id
         player_tile.is_explored = True
         player_tile.is_visible = True
 
-    for monster in game_state.monsters:
-        monster_tile = game_state.current_map.get_tile(*monster.position)
-        if monster_tile:
-            monster_tile.character_id = monster.id
-
 
 def _merge_frontend_map_computational_state(
     backend_game_state: GameState,
@@ -958,6 +1303,7 @@ async def lifespan(app: FastAPI):
     try:
         # 初始化异步任务管理器
         async_task_manager.initialize()
+        async_task_manager.start_loop_lag_monitor()
 
         # 初始化陷阱管理器
         initialize_trap_manager(entity_manager)
@@ -965,6 +1311,9 @@ async def lifespan(app: FastAPI):
         # 启动游戏会话清理任务
         game_engine._start_cleanup_task()
 
+        # 恢复预生成地图池并在后台补齐
+        map_pool.start()
+
         logger.info("Server started successfully")
         yield
 
@@ -993,8 +1342,12 @@ async def lifespan(app: FastAPI):
             except Exception as e:
                 logger.error(f"Failed to save game {game_id}: {e}")
 
-        # 3. 清理仍在等待的开场语音预合成任务
+        # 3. 清理仍在等待的开场语音预合成任务，并关闭 qwen 热 client 池
         _cancel_opening_tts_cache()
+        tts_prefetcher.cancel_all()
+        qwen_tts_adapter.QwenGradioTTSProvider.close_client_pools()
+        TTSProviderBase.shutdown_executors()
+        await close_async_http_clients()
 
         # 4. 关闭LLM服务
         llm_service.close()
@@ -1135,25 +1488,15 @@ async def load_game(save_id: str, request: Request, response: Response):
         # 使用data_manager重建GameState对象
         game_state = data_manager._dict_to_game_state(save_data)
 
-        # 【修复】清除所有瓦片的character_id（防止存档中有错误数据）
-        for tile in game_state.current_map.tiles.values():
-            tile.character_id = None
-        logger.info(f"[/api/load] Cleared all character_id from {len(game_state.current_map.tiles)} tiles")
-
-        # 【修复】重新设置玩家位置的character_id
+        # 实体空间索引已在 _dict_to_game_state 中按玩家/怪物位置重建
         player_tile = game_state.current_map.get_tile(*game_state.player.position)
         if player_tile:
-            player_tile.character_id = game_state.player.id
             player_tile.is_explored = True
             player_tile.is_visible = True
-            logger.info(f"[/api/load] Player position restored: {game_state.player.position}")
-
-        # 【修复】重新设置怪物位置的character_id
-        for monster in game_state.monsters:
-            monster_tile = game_state.current_map.get_tile(*monster.position)
-            if monster_tile:
-                monster_tile.character_id = monster.id
-                logger.info(f"[/api/load] Monster {monster.name} position restored: {monster.position}")
+        logger.info(
+            f"[/api/load] Entity index restored: player={game_state.player.position}, "
+            f"entities={len(game_state.current_map.entity_index)}"
+        )
 
         # 恢复LLM上下文（兼容旧存档无该字段的情况）
         try:
@@ -1217,25 +1560,15 @@ async def get_game_state(game_id: str, request: Request, response: Response):
                 # 重建游戏状态并加载到内存
                 game_state = data_manager._dict_to_game_state(save_data)
 
-                # 【修复】清除所有瓦片的character_id（防止存档中有错误数据）
-                for tile in game_state.current_map.tiles.values():
-                    tile.character_id = None
-                logger.info(f"[lazy load] Cleared all character_id from {len(game_state.current_map.tiles)} tiles")
-
-                # 【修复】重新设置玩家位置的character_id
+                # 实体空间索引已在 _dict_to_game_state 中按玩家/怪物位置重建
                 player_tile = game_state.current_map.get_tile(*game_state.player.position)
                 if player_tile:
-                    player_tile.character_id = game_state.player.id
                     player_tile.is_explored = True
                     player_tile.is_visible = True
-                    logger.info(f"[lazy load] Player position restored: {game_state.player.position}")
-
-                # 【修复】重新设置怪物位置的character_id
-                for monster in game_state.monsters:
-                    monster_tile = game_state.current_map.get_tile(*monster.position)
-                    if monster_tile:
-                        monster_tile.character_id = monster.id
-                        logger.info(f"[lazy load] Monster {monster.name} position restored: {monster.position}")
+                logger.info(
+                    f"[lazy load] Entity index restored: player={game_state.player.position}, "
+                    f"entities={len(game_state.current_map.entity_index)}"
+                )
 
                 # 恢复LLM上下文（在懒加载路径）
                 try:
@@ -1281,28 +1614,30 @@ async def get_game_quests(game_id: str, request: Request, response: Response):
     user_id = user_session_manager.get_or_create_user_id(request, response)
     game_key = (user_id, game_id)
 
-    if game_key not in game_engine.active_games:
-        raise HTTPException(status_code=404, detail="游戏未找到")
-
-    game_state = game_engine.active_games[game_key]
-
-    # 返回任务列表
-    quests = []
-    for quest in game_state.quests:
-        quest_dict = {
-            "id": quest.id,
-            "title": quest.title,
-            "description": quest.description,
-            "objectives": quest.objectives,
-            "completed_objectives": quest.completed_objectives,
-            "is_active": quest.is_active,
-            "is_completed": quest.is_completed,
-            "progress_percentage": quest.progress_percentage,
-            "quest_type": quest.quest_type,
-            "experience_reward": quest.experience_reward,
-            "story_context": quest.story_context
-        }
-        quests.append(quest_dict)
+    # 只读：与其它读者并发，不在写操作之间插入读取
+    async with game_state_lock_manager.read_game_state(user_id, game_id, "get_quests"):
+        if game_key not in game_engine.active_games:
+            raise HTTPException(status_code=404, detail="游戏未找到")
+
+        game_state = game_engine.active_games[game_key]
+
+        # 返回任务列表
+        quests = []
+        for quest in game_state.quests:
+            quest_dict = {
+                "id": quest.id,
+                "title": quest.title,
+                "description": quest.description,
+                "objectives": list(quest.objectives),
+                "completed_objectives": list(quest.completed_objectives),
+                "is_active": quest.is_active,
+                "is_completed": quest.is_completed,
+                "progress_percentage": quest.progress_percentage,
+                "quest_type": quest.quest_type,
+                "experience_reward": quest.experience_reward,
+                "story_context": quest.story_context
+            }
+            quests.append(quest_dict)
 
     return quests
 
@@ -1399,6 +1734,7 @@ async def perform_action(request: ActionRequest, http_request: Request, response
             )
 
         normalized_result = _normalize_action_response(request.action, trace_id, result)
+        _prefetch_tts_for_result(normalized_result)
 
         game_state_for_log = game_engine.active_games.get((user_id, request.game_id))
         authority_mode_for_log = _safe_authority_mode(
@@ -1551,6 +1887,7 @@ async def handle_llm_event(request: LLMEventRequest, http_request: Request, resp
                     from data_models import TerrainType
 
                     tile.terrain = TerrainType.FLOOR
+                    game_state.current_map.mark_tiles_changed([(position[0], position[1])])
 
                 return {
                     "success": True,
@@ -2089,20 +2426,17 @@ async def process_combat_result(game_id: str, request: Request, response: Respon
 
             game_state = game_engine.active_games[game_key]
 
-            game_engine._prune_idempotency_cache(game_key)
-            cache = game_engine._get_idempotency_cache(game_key)
             combat_cache_key = f"combat_result:{idempotency_key}"
-            cached_payload = cache.get(combat_cache_key)
+            cached_payload = await game_engine.idempotency_store.aget(game_key, combat_cache_key)
             expected_fingerprint = json.dumps(
                 {"monster_id": str(monster_id), "damage_dealt": int(damage_dealt)},
                 sort_keys=True,
                 ensure_ascii=False,
             )
-            if isinstance(cached_payload, dict):
-                cached_fingerprint = str(cached_payload.get("fingerprint", "") or "")
-                cached_result = cached_payload.get("result")
-                if cached_fingerprint == expected_fingerprint and isinstance(cached_result, dict):
-                    replay_result = dict(cached_result)
+            if cached_payload is not None:
+                cached_result = cached_payload.load_result()
+                if cached_payload.fingerprint == expected_fingerprint and isinstance(cached_result, dict):
+                    replay_result = cached_result
                     replay_result["idempotent_replay"] = True
                     replay_result["trace_id"] = trace_id
                     response_payload = replay_result
@@ -2117,11 +2451,7 @@ async def process_combat_result(game_id: str, request: Request, response: Respon
 
             if not replay_hit:
                 # 查找怪物
-                monster = None
-                for m in game_state.monsters:
-                    if m.id == monster_id:
-                        monster = m
-                        break
+                monster = game_state.get_monster(monster_id)
 
                 if not monster:
                     raise HTTPException(
@@ -2138,9 +2468,7 @@ async def process_combat_result(game_id: str, request: Request, response: Respon
             if not replay_hit:
                 # 【新增】从后端游戏状态中移除被击败的怪物，并清理地图标记
                 try:
-                    tile = game_state.current_map.get_tile(monster.position[0], monster.position[1])
-                    if tile:
-                        tile.character_id = None
+                    game_state.current_map.remove_entity(monster.id)
                     if monster in game_state.monsters:
                         game_state.monsters.remove(monster)
                     logger.debug(f"Removed defeated monster from backend state: {monster.name}")
@@ -2220,12 +2548,12 @@ async def process_combat_result(game_id: str, request: Request, response: Respon
                 result_dict["client_trace_id"] = client_trace_id
                 response_payload = result_dict
 
-                cache[combat_cache_key] = {
-                    "result": dict(result_dict),
-                    "fingerprint": expected_fingerprint,
-                    "created_at": datetime.utcnow().timestamp(),
-                }
-                game_engine._prune_idempotency_cache(game_key)
+                await game_engine.idempotency_store.aput(
+                    game_key,
+                    combat_cache_key,
+                    result_dict,
+                    fingerprint=expected_fingerprint,
+                )
 
         lock_obj = await game_state_lock_manager._get_or_create_lock(game_key)
         lock_hold_ms = getattr(lock_obj, "last_hold_ms", 0)
@@ -2341,12 +2669,15 @@ async def process_event_choice(request: EventChoiceRequest, http_request: Reques
                 # 处理选择后的游戏状态更新（包括新任务生成）
                 await _process_post_choice_updates(game_state)
 
-                return {
+                choice_response = {
                     "success": True,
                     "message": result.message,
                     "events": result.events,
                     "game_state": _serialize_game_state_for_client(game_state),
                 }
+                # 前端把选择结果事件按 narrative 朗读
+                _prefetch_tts_for_result(choice_response, events_category="narrative")
+                return choice_response
 
             return {
                 "success": False,
@@ -2513,26 +2844,27 @@ async def save_game(game_id: str, request: Request, response: Response):
         user_id = user_session_manager.get_or_create_user_id(request, response)
         game_key = (user_id, game_id)
 
-        # 使用锁保护手动保存操作
-        async with game_state_lock_manager.lock_game_state(user_id, game_id, "manual_save"):
+        # 使用读锁保护手动保存操作（只序列化，不修改状态）
+        async with game_state_lock_manager.read_game_state(user_id, game_id, "manual_save"):
             if game_key not in game_engine.active_games:
                 raise HTTPException(status_code=404, detail="游戏未找到")
 
             game_state = game_engine.active_games[game_key]
 
-            # 使用用户会话管理器保存游戏
-            game_data = game_state.to_dict()
-            # 保存最近N条LLM上下文到存档
-            try:
-                from llm_context_manager import llm_context_manager
-                game_data["llm_context_logs"] = [
-                    e.to_dict() for e in llm_context_manager.get_recent_context(
-                        max_entries=getattr(config.llm, "save_context_entries", 20),
-                        context_key=_build_context_key(user_id, game_id),
-                    )
-                ]
-            except Exception as _e:
-                logger.warning(f"Failed to attach LLM context logs to save: {_e}")
+            # 锁内只生成快照，序列化与写盘都在锁外
+            game_data = capture_game_state(game_state).to_dict()
+
+        # 保存最近N条LLM上下文到存档
+        try:
+            from llm_context_manager import llm_context_manager
+            game_data["llm_context_logs"] = [
+                e.to_dict() for e in llm_context_manager.get_recent_context(
+                    max_entries=getattr(config.llm, "save_context_entries", 20),
+                    context_key=_build_context_key(user_id, game_id),
+                )
+            ]
+        except Exception as _e:
+            logger.warning(f"Failed to attach LLM context logs to save: {_e}")
 
         # 在锁外执行文件IO操作
         success = user_session_manager.save_game_for_user(user_id, game_data)
@@ -2704,6 +3036,8 @@ async def get_config():
                     "opening_cache_ttl_seconds": int(config.tts.opening_cache_ttl_seconds),
                     "opening_cache_max_entries": int(config.tts.opening_cache_max_entries),
                     "opening_fetch_wait_seconds": float(config.tts.opening_fetch_wait_seconds),
+                    "stream_enabled": bool(config.tts.stream_enabled),
+                    "stream_min_chars": int(config.tts.stream_min_chars),
                     "voice_whitelist_defaults": {
                         "narrative": bool(config.tts.voice_whitelist_narrative),
                         "event": bool(config.tts.voice_whitelist_event),
@@ -2732,27 +3066,71 @@ async def get_config():
 
 
 @app.post("/api/tts/synthesize")
-async def synthesize_tts(request: TTSRequest):
-    """按需合成语音，仅返回音频字节，不做服务端缓存。"""
-    audio_bytes, voice = await _synthesize_tts_bytes(
+async def synthesize_tts(request: TTSRequest, http_request: Request):
+    """按需合成语音；结果按内容寻址缓存，响应带强 ETag 与 /api/tts/audio/{key} 地址。
+
+    `stream=true` 且未命中缓存时改为按句分块流式返回，首句就绪即开始输出。
+    """
+    if request.stream:
+        return await _synthesize_tts_streaming(
+            request.text,
+            category=request.category,
+            voice=request.voice,
+            style_hint=request.style_hint,
+            request=http_request,
+        )
+
+    entry, cache_state = await _synthesize_tts_entry(
         text=request.text,
         category=request.category,
         voice=request.voice,
         style_hint=request.style_hint,
     )
+    tts_prefetcher.record_lookup(entry.key, cache_state)
+    entry, cache_state = await _negotiate_tts_entry(entry, cache_state, http_request)
+    return _tts_entry_response(entry, cache_state, http_request, negotiated=True)
 
-    return Response(
-        content=audio_bytes,
-        media_type=_tts_media_type(_get_tts_response_format()),
-        headers={
-            "Cache-Control": "no-store",
-            "X-TTS-Provider": config.tts.provider,
-            "X-TTS-Model": config.tts.model_name,
-            "X-TTS-Voice": voice,
-        },
+
+@app.get("/api/tts/stream")
+async def stream_tts(
+    request: Request,
+    text: str,
+    category: str = "narrative",
+    voice: Optional[str] = None,
+    style_hint: Optional[str] = None,
+):
+    """流式合成的 GET 版本，可直接作为 <audio> 地址边下载边播放。"""
+    return await _synthesize_tts_streaming(
+        text,
+        category=category,
+        voice=voice,
+        style_hint=style_hint,
+        request=request,
     )
 
 
+@app.get("/api/tts/audio/{cache_key}")
+async def get_cached_tts_audio(cache_key: str, request: Request):
+    """按缓存键读取已合成音频（可直接作为 <audio> 地址，支持 304 协商）。"""
+    if not config.tts.enabled:
+        raise HTTPException(
+            status_code=503,
+            detail={"error_code": "TTS_DISABLED", "message": "语音GM未启用"}
+        )
+    if not re.fullmatch(r"[0-9a-f]{64}", str(cache_key or "")):
+        raise HTTPException(
+            status_code=400,
+            detail={"error_code": "TTS_CACHE_BAD_KEY", "message": "语音缓存标识无效"}
+        )
+    entry = await asyncio.to_thread(tts_cache.get, cache_key)
+    if entry is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error_code": "TTS_CACHE_MISS", "message": "语音缓存未命中"}
+        )
+    return _tts_entry_response(entry, "hit", request)
+
+
 @app.get("/api/tts/opening/{game_id}/{segment_id}")
 async def get_opening_tts_audio(game_id: str, segment_id: str, request: Request):
     """读取新游戏开场语音预合成结果；未命中时由前端回退到普通合成。"""
@@ -2945,6 +3323,7 @@ async def transition_map(game_id: str, transition_data: Dict[str, Any], request:
                     response_data["pending_choice_context"] = game_state.pending_choice_context.to_dict()
                     logger.info(f"Returning pending choice context in transition result: {game_state.pending_choice_context.title}")
 
+                _prefetch_tts_for_result(response_data, events_category="event")
                 return response_data
             else:
                 return result
@@ -2964,11 +3343,12 @@ async def get_progress_summary(game_id: str, request: Request, response: Respons
         user_id = user_session_manager.get_or_create_user_id(request, response)
         game_key = (user_id, game_id)
 
-        if game_key not in game_engine.active_games:
-            raise HTTPException(status_code=404, detail="游戏未找到")
+        async with game_state_lock_manager.read_game_state(user_id, game_id, "get_progress"):
+            if game_key not in game_engine.active_games:
+                raise HTTPException(status_code=404, detail="游戏未找到")
 
-        game_state = game_engine.active_games[game_key]
-        summary = progress_manager.get_progress_summary(game_state)
+            game_state = game_engine.active_games[game_key]
+            summary = progress_manager.get_progress_summary(game_state)
 
         return {
             "success": True,
@@ -3311,24 +3691,12 @@ if config.game.debug_mode:
             # 重建游戏状态
             game_state = data_manager._dict_to_game_state(save_data)
 
-            # 清除所有瓦片的character_id（防止存档中有错误数据）
-            for tile in game_state.current_map.tiles.values():
-                tile.character_id = None
-            logger.info(f"[DEBUG] Cleared all character_id from {len(game_state.current_map.tiles)} tiles")
-
-            # 重新设置玩家位置的character_id
+            # 实体空间索引已在 _dict_to_game_state 中按玩家/怪物位置重建
             player_tile = game_state.current_map.get_tile(*game_state.player.position)
             if player_tile:
-                player_tile.character_id = game_state.player.id
                 player_tile.is_explored = True
                 player_tile.is_visible = True
 
-            # 重新设置怪物位置的character_id
-            for monster in game_state.monsters:
-                monster_tile = game_state.current_map.get_tile(*monster.position)
-                if monster_tile:
-                    monster_tile.character_id = monster.id
-
             # 获取当前会话用户ID
             current_session_user_id = user_session_manager.get_or_create_user_id(request, response)
 
@@ -3582,8 +3950,35 @@ if config.game.debug_mode:
 
     @app.get("/api/debug/locks")
     async def debug_get_lock_stats():
-        """调试：获取游戏状态锁统计信息"""
-        return game_state_lock_manager.get_lock_stats()
+        """调试：获取游戏状态锁统计信息（含读/写等待与持有时间直方图、快照耗时）"""
+        return {**game_state_lock_manager.get_lock_stats(), "snapshots": get_snapshot_stats()}
+
+    @app.get("/api/debug/map-pool")
+    async def debug_get_map_pool_stats():
+        """调试：获取预生成地图池统计信息"""
+        return map_pool.get_stats()
+
+    @app.get("/api/debug/map-cache")
+    async def debug_get_map_cache_stats():
+        """调试：获取内容寻址地图缓存统计信息"""
+        from map_cache import map_cache
+
+        return map_cache.get_stats()
+
+    @app.get("/api/debug/tts-cache")
+    async def debug_get_tts_cache_stats():
+        """调试：获取内容寻址 TTS 缓存统计信息（含命中率与转码统计）"""
+        return {**tts_cache.get_stats(), "transcode": tts_transcoder.get_stats()}
+
+    @app.get("/api/debug/tts-pool")
+    async def debug_get_tts_pool_stats():
+        """调试：获取 qwen_gradio 热 client 池统计（按 upstream URL）"""
+        return qwen_tts_adapter.QwenGradioTTSProvider.get_pool_stats()
+
+    @app.get("/api/debug/tts-prefetch")
+    async def debug_get_tts_prefetch_stats():
+        """调试：获取预测式 TTS 预合成统计（提交 / 丢弃 / 命中）"""
+        return tts_prefetcher.get_stats()
 
     # ==================== 配置信息接口 ====================
 
@@ -5311,15 +5706,7 @@ if config.game.debug_mode:
             logger.info(f"Debug teleport: {game_state.current_map.depth} -> {target_floor}")
 
             # 清除旧地图上的角色标记（在生成新地图前）
-            old_tile = game_state.current_map.get_tile(*game_state.player.position)
-            if old_tile:
-                old_tile.character_id = None
-
-            for monster in game_state.monsters:
-                if monster.position:
-                    monster_tile = game_state.current_map.get_tile(*monster.position)
-                    if monster_tile:
-                        monster_tile.character_id = None
+            game_state.current_map.clear_entities()
 
             # 获取当前活跃任务的上下文
             quest_context = None
@@ -5345,9 +5732,9 @@ if config.game.debug_mode:
             spawn_positions = content_generator.get_spawn_positions(new_map, 1)
             if spawn_positions:
                 game_state.player.position = spawn_positions[0]
+                new_map.place_entity(game_state.player.id, game_state.player.position)
                 tile = new_map.get_tile(*game_state.player.position)
                 if tile:
-                    tile.character_id = game_state.player.id
                     tile.is_explored = True
                     tile.is_visible = True
 
@@ -5371,9 +5758,7 @@ if config.game.debug_mode:
             monster_positions = content_generator.get_spawn_positions(new_map, len(monsters))
             for monster, position in zip(monsters, monster_positions):
                 monster.position = position
-                tile = new_map.get_tile(*position)
-                if tile:
-                    tile.character_id = monster.id
+                new_map.place_entity(monster.id, position)
                 game_state.monsters.append(monster)
 
             return {
@@ -5425,14 +5810,9 @@ if config.game.debug_mode:
             if target_tile.terrain == TerrainType.WALL:
                 return {"success": False, "message": "目标位置是墙壁，无法传送"}
 
-            # 清除旧位置的角色标记
-            old_tile = game_state.current_map.get_tile(*game_state.player.position)
-            if old_tile:
-                old_tile.character_id = None
-
-            # 传送玩家
+            # 传送玩家（空间索引会同步清除旧位置的角色标记）
             game_state.player.position = (target_x, target_y)
-            target_tile.character_id = game_state.player.id
+            game_state.current_map.place_entity(game_state.player.id, (target_x, target_y))
             target_tile.is_explored = True
             target_tile.is_visible = True
 
@@ -5478,9 +5858,7 @@ if config.game.debug_mode:
             monster, spawn_pos = result
 
             # 在地图上标记敌人位置
-            tile = game_state.current_map.get_tile(*spawn_pos)
-            if tile:
-                tile.character_id = monster.id
+            game_state.current_map.place_entity(monster.id, spawn_pos)
 
             # 添加到游戏状态
             game_state.monsters.append(monster)
@@ -5542,10 +5920,7 @@ if config.game.debug_mode:
 
             # 清除地图上的敌人标记
             for monster in game_state.monsters:
-                if monster.position:
-                    tile = game_state.current_map.get_tile(*monster.position)
-                    if tile and tile.character_id == monster.id:
-                        tile.character_id = None
+                game_state.current_map.remove_entity(monster.id)
 
             # 清空敌人列表
             game_state.monsters.clear()
@@ -5638,6 +6013,18 @@ if config.game.debug_mode:
 
             current_depth = request_data.get("current_depth", game_state.current_map.depth)
 
+            # 可选：指定 seed 复现地图；reuse_blueprint 时复用当前地图记录的蓝图，不再请求 LLM
+            seed = request_data.get("seed")
+            try:
+                seed = int(seed) if seed is not None else None
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="seed 必须为整数")
+            blueprint = None
+            if request_data.get("reuse_blueprint"):
+                current_meta = game_state.current_map.generation_metadata
+                if isinstance(current_meta, dict) and isinstance(current_meta.get("blueprint"), dict):
+                    blueprint = current_meta["blueprint"]
+
             # 获取当前活跃任务的上下文
             quest_context = None
             active_quest = next((q for q in game_state.quests if q.is_active), None)
@@ -5651,15 +6038,13 @@ if config.game.debug_mode:
                 height=config.game.default_map_size[1],
                 depth=current_depth,
                 theme=f"冒险区域（第{current_depth}阶段/层级）",
-                quest_context=quest_context
+                quest_context=quest_context,
+                seed=seed,
+                blueprint=blueprint,
             )
 
             # 清除旧地图上的所有角色
-            for monster in game_state.monsters:
-                if monster.position:
-                    old_tile = game_state.current_map.get_tile(*monster.position)
-                    if old_tile:
-                        old_tile.character_id = None
+            game_state.current_map.clear_entities()
 
             # 更新地图
             game_state.current_map = new_map
@@ -5668,9 +6053,9 @@ if config.game.debug_mode:
             spawn_positions = content_generator.get_spawn_positions(new_map, 1)
             if spawn_positions:
                 game_state.player.position = spawn_positions[0]
+                new_map.place_entity(game_state.player.id, game_state.player.position)
                 tile = new_map.get_tile(*game_state.player.position)
                 if tile:
-                    tile.character_id = game_state.player.id
                     tile.is_explored = True
                     tile.is_visible = True
 
@@ -5680,7 +6065,8 @@ if config.game.debug_mode:
             return {
                 "success": True,
                 "message": f"地图已重新生成",
-                "new_map_name": new_map.name
+                "new_map_name": new_map.name,
+                "seed": (new_map.generation_metadata or {}).get("seed"),
             }
 
         except Exception as e:
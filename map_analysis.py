@@ -0,0 +1,383 @@
+"""
+Labyrinthia AI - 地图分析
+地图校验共享的分析结构：
+- DistanceField：从入口出发的一次 BFS 距离场，O(1) 回答"是否可达"和"路径长度"，
+  缓存在地图上并以地形修订号作为失效依据
+- MapConnectivityIndex：可增量维护的连通分量标签、楼梯计数与必经事件集合。
+  地形变化通过 GameMap.mark_tiles_changed 通知，索引只在变化瓦片周围更新，
+  补丁复检在常见情况下的开销与变化瓦片数成正比。
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING, Container, Dict, Iterable, List, Optional, Set, Tuple
+
+from data_models import TerrainType
+
+if TYPE_CHECKING:
+    from data_models import GameMap, MapTile
+
+Position = Tuple[int, int]
+
+WALKABLE_TERRAINS = frozenset(
+    {
+        TerrainType.FLOOR,
+        TerrainType.DOOR,
+        TerrainType.TRAP,
+        TerrainType.TREASURE,
+        TerrainType.STAIRS_UP,
+        TerrainType.STAIRS_DOWN,
+    }
+)
+
+_NEIGHBOR_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def _neighbors(pos: Position) -> List[Position]:
+    x, y = pos
+    return [(x + dx, y + dy) for dx, dy in _NEIGHBOR_OFFSETS]
+
+
+def _is_mandatory_event(tile: "MapTile") -> bool:
+    return bool(tile.has_event and isinstance(tile.event_data, dict) and tile.event_data.get("is_mandatory"))
+
+
+def walkable_positions(game_map: "GameMap") -> Set[Position]:
+    return {pos for pos, tile in game_map.tiles.items() if tile.terrain in WALKABLE_TERRAINS}
+
+
+def resolve_entrance(game_map: "GameMap", walkable: Optional[Container[Position]] = None) -> Optional[Position]:
+    """地图入口：优先上行楼梯，否则取第一个可行走瓦片"""
+    first_walkable: Optional[Position] = None
+    for pos, tile in game_map.tiles.items():
+        if tile.terrain == TerrainType.STAIRS_UP:
+            return pos
+        if first_walkable is None and tile.terrain in WALKABLE_TERRAINS:
+            if walkable is None or pos in walkable:
+                first_walkable = pos
+    return first_walkable
+
+
+class DistanceField:
+    """单源 BFS 距离场
+
+    distances 只包含可达位置；不可达位置的 path_length 为 -1。
+    """
+
+    def __init__(self, start: Optional[Position], revision: Optional[int] = None):
+        self.start = start
+        self.revision = revision
+        # 调用方请求的起点（None 表示入口），用于缓存命中判断
+        self.origin: Optional[Position] = start
+        self.distances: Dict[Position, int] = {}
+
+    @classmethod
+    def compute(
+        cls,
+        start: Optional[Position],
+        walkable: Container[Position],
+        revision: Optional[int] = None,
+    ) -> "DistanceField":
+        field = cls(start, revision=revision)
+        if start is not None and start in walkable:
+            field.distances[start] = 0
+            field._flood(deque([start]), walkable)
+        return field
+
+    def _flood(self, queue: "deque[Position]", walkable: Container[Position]) -> int:
+        distances = self.distances
+        added = 0
+        while queue:
+            current = queue.popleft()
+            next_dist = distances[current] + 1
+            for nxt in _neighbors(current):
+                if nxt in distances or nxt not in walkable:
+                    continue
+                distances[nxt] = next_dist
+                queue.append(nxt)
+                added += 1
+        return added
+
+    def extend(self, seeds: Iterable[Position], walkable: Container[Position]) -> int:
+        """地形新增可行走区域后增量扩展（只遍历新连通的部分）
+
+        从已可达的种子向外扩展，新增位置的距离为经由种子的路径长度（不保证最短）。
+        Returns: 新增可达位置数
+        """
+        queue = deque(pos for pos in seeds if pos in self.distances)
+        return self._flood(queue, walkable)
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def __contains__(self, pos: object) -> bool:
+        return pos in self.distances
+
+    def is_reachable(self, pos: Position) -> bool:
+        return (int(pos[0]), int(pos[1])) in self.distances
+
+    def path_length(self, pos: Position) -> int:
+        return self.distances.get((int(pos[0]), int(pos[1])), -1)
+
+    def reachable_positions(self) -> Set[Position]:
+        return set(self.distances)
+
+
+class MapConnectivityIndex:
+    """地图连通性索引（连通分量标签 + 计数器）
+
+    - 新增可行走瓦片：与相邻分量合并（小分量并入大分量）
+    - 移除可行走瓦片：仅在原分量内做局部 BFS 判断是否分裂
+    - 楼梯与必经事件只按变化瓦片增减
+    """
+
+    def __init__(self, game_map: "GameMap"):
+        self.game_map = game_map
+        self._labels: Dict[Position, int] = {}
+        self._members: Dict[int, Set[Position]] = {}
+        self._next_label = 0
+        self._stairs: Dict[Position, TerrainType] = {}
+        self._mandatory: Set[Position] = set()
+        self._dirty: Set[Position] = set()
+        self._full_dirty = True
+        self._tiles_ref: Optional[dict] = None
+        self.stats: Dict[str, int] = {"full_rebuilds": 0, "incremental_updates": 0, "split_scans": 0}
+
+    # ------------------------------------------------------------------ sync
+
+    def mark_dirty(self, positions: Optional[Iterable[Position]] = None) -> None:
+        """标记变化瓦片；positions 为 None 时下次刷新全量重建"""
+        if positions is None:
+            self._full_dirty = True
+            return
+        for pos in positions:
+            self._dirty.add((int(pos[0]), int(pos[1])))
+
+    def refresh(self) -> None:
+        tiles = self.game_map.tiles
+        # tiles 字典被整体替换（例如读档）时无法增量同步
+        if self._tiles_ref is not tiles:
+            self._full_dirty = True
+        if self._full_dirty:
+            self._rebuild()
+            return
+        dirty, self._dirty = self._dirty, set()
+        for pos in dirty:
+            self._update_position(pos)
+
+    def _rebuild(self) -> None:
+        tiles = self.game_map.tiles
+        self._labels.clear()
+        self._members.clear()
+        self._stairs.clear()
+        self._mandatory.clear()
+        self._dirty.clear()
+        self._next_label = 0
+
+        walkable: Set[Position] = set()
+        for pos, tile in tiles.items():
+            if tile.terrain in WALKABLE_TERRAINS:
+                walkable.add(pos)
+            if tile.terrain in (TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN):
+                self._stairs[pos] = tile.terrain
+            if _is_mandatory_event(tile):
+                self._mandatory.add(pos)
+
+        for start in walkable:
+            if start in self._labels:
+                continue
+            self._label_region(start, walkable)
+
+        self._tiles_ref = tiles
+        self._full_dirty = False
+        self.stats["full_rebuilds"] += 1
+
+    def _label_region(self, start: Position, allowed: Set[Position]) -> Set[Position]:
+        label = self._next_label
+        self._next_label += 1
+        region = {start}
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for nxt in _neighbors(current):
+                if nxt in allowed and nxt not in region:
+                    region.add(nxt)
+                    queue.append(nxt)
+        for pos in region:
+            self._labels[pos] = label
+        self._members[label] = region
+        return region
+
+    def _update_position(self, pos: Position) -> None:
+        tile = self.game_map.tiles.get(pos)
+        walkable_now = tile is not None and tile.terrain in WALKABLE_TERRAINS
+        was_walkable = pos in self._labels
+        if was_walkable and not walkable_now:
+            self._remove_walkable(pos)
+        elif walkable_now and not was_walkable:
+            self._add_walkable(pos)
+
+        if tile is not None and tile.terrain in (TerrainType.STAIRS_UP, TerrainType.STAIRS_DOWN):
+            self._stairs[pos] = tile.terrain
+        else:
+            self._stairs.pop(pos, None)
+
+        if tile is not None and _is_mandatory_event(tile):
+            self._mandatory.add(pos)
+        else:
+            self._mandatory.discard(pos)
+        self.stats["incremental_updates"] += 1
+
+    def _add_walkable(self, pos: Position) -> None:
+        neighbor_labels = {self._labels[n] for n in _neighbors(pos) if n in self._labels}
+        if not neighbor_labels:
+            label = self._next_label
+            self._next_label += 1
+            self._labels[pos] = label
+            self._members[label] = {pos}
+            return
+
+        target = max(neighbor_labels, key=lambda lbl: len(self._members[lbl]))
+        for label in neighbor_labels:
+            if label == target:
+                continue
+            members = self._members.pop(label)
+            for member in members:
+                self._labels[member] = target
+            self._members[target] |= members
+        self._labels[pos] = target
+        self._members[target].add(pos)
+
+    def _remove_walkable(self, pos: Position) -> None:
+        label = self._labels.pop(pos)
+        members = self._members[label]
+        members.discard(pos)
+        if not members:
+            del self._members[label]
+            return
+
+        anchors = [n for n in _neighbors(pos) if self._labels.get(n) == label]
+        if len(anchors) <= 1:
+            return
+
+        # 局部 BFS：从一个邻居出发，若能到达其余所有邻居则分量未分裂（提前结束）
+        self.stats["split_scans"] += 1
+        pending = set(anchors[1:])
+        visited = {anchors[0]}
+        queue = deque([anchors[0]])
+        while queue and pending:
+            current = queue.popleft()
+            for nxt in _neighbors(current):
+                if nxt in members and nxt not in visited:
+                    visited.add(nxt)
+                    pending.discard(nxt)
+                    queue.append(nxt)
+        if not pending:
+            return
+
+        remaining = set(members)
+        del self._members[label]
+        for pos_item in remaining:
+            self._labels.pop(pos_item, None)
+        while remaining:
+            region = self._label_region(next(iter(remaining)), remaining)
+            remaining -= region
+
+    # ------------------------------------------------------------------ queries
+
+    @property
+    def component_count(self) -> int:
+        return len(self._members)
+
+    @property
+    def walkable_count(self) -> int:
+        return len(self._labels)
+
+    @property
+    def stairs_up_count(self) -> int:
+        return sum(1 for terrain in self._stairs.values() if terrain == TerrainType.STAIRS_UP)
+
+    @property
+    def stairs_down_count(self) -> int:
+        return sum(1 for terrain in self._stairs.values() if terrain == TerrainType.STAIRS_DOWN)
+
+    def component_of(self, pos: Position) -> Optional[int]:
+        return self._labels.get((int(pos[0]), int(pos[1])))
+
+    def main_component(self) -> Optional[int]:
+        if not self._members:
+            return None
+        return max(self._members, key=lambda lbl: len(self._members[lbl]))
+
+    def is_connected(self) -> bool:
+        """所有可行走瓦片是否构成单一连通分量"""
+        return len(self._members) == 1
+
+    def mandatory_positions(self) -> List[Position]:
+        return sorted(self._mandatory)
+
+    def entrance(self) -> Optional[Position]:
+        """入口：上行楼梯（多个时取坐标最小者）"""
+        ups = [pos for pos, terrain in self._stairs.items() if terrain == TerrainType.STAIRS_UP]
+        return min(ups) if ups else None
+
+    def mandatory_reachable(self, start: Optional[Position] = None) -> bool:
+        """所有必经事件是否与起点连通（未指定起点或起点不可行走时使用主连通分量）"""
+        if not self._mandatory:
+            return True
+        label = self.component_of(start) if start is not None else None
+        if label is None:
+            label = self.main_component()
+        if label is None:
+            return False
+        return all(self._labels.get(pos) == label for pos in self._mandatory)
+
+    # ------------------------------------------------------------------ debug
+
+    def check_consistency(self) -> List[str]:
+        """与全量重算结果比对（分量划分、楼梯、必经事件），返回问题描述列表（空列表表示一致）
+
+        增量结果只在所有地形写入方都调用 mark_tiles_changed 时正确，本检查用于发现遗漏的写入方。
+        """
+        expected = MapConnectivityIndex(self.game_map)
+        expected._rebuild()
+        issues: List[str] = []
+        actual_regions = {frozenset(members) for members in self._members.values()}
+        expected_regions = {frozenset(members) for members in expected._members.values()}
+        if actual_regions != expected_regions:
+            missing = expected_regions - actual_regions
+            extra = actual_regions - expected_regions
+            issues.append(
+                f"components differ: indexed={len(actual_regions)} recomputed={len(expected_regions)} "
+                f"(missing={len(missing)}, stale={len(extra)})"
+            )
+        stale_labels = set(self._labels) ^ set(expected._labels)
+        if stale_labels:
+            issues.append(f"walkable positions differ at {sorted(stale_labels)[:10]}")
+        if self._stairs != expected._stairs:
+            issues.append(f"stairs differ: indexed={sorted(self._stairs)} recomputed={sorted(expected._stairs)}")
+        if self._mandatory != expected._mandatory:
+            issues.append(
+                f"mandatory events differ: indexed={sorted(self._mandatory)} recomputed={sorted(expected._mandatory)}"
+            )
+        return issues
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "components": self.component_count,
+            "walkable": self.walkable_count,
+            "stairs_up": self.stairs_up_count,
+            "stairs_down": self.stairs_down_count,
+            "mandatory_events": len(self._mandatory),
+            **self.stats,
+        }
+
+
+__all__ = [
+    "WALKABLE_TERRAINS",
+    "DistanceField",
+    "MapConnectivityIndex",
+    "resolve_entrance",
+    "walkable_positions",
+]
@@ -0,0 +1,181 @@
+"""
+Labyrinthia AI - 内容寻址地图缓存
+以 (seed, 宽, 高, 层数, 主题, 契约哈希, 蓝图哈希) 的规范化哈希为键保存已生成的地图，
+相同请求（调试重生成、地图生成测试、灰度对比）直接复用，无需重新计算或再次请求 LLM。
+
+内存层为有界 LRU（存序列化后的 JSON 文本，取出时重建新对象，调用方可随意修改）；
+可选落盘到 <cache_dir>/map_cache，进程重启后仍可命中。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import config
+from data_models import GameMap
+
+logger = logging.getLogger(__name__)
+
+MAP_CACHE_VERSION = 1
+
+
+def stable_hash(payload: Any) -> str:
+    """规范化 JSON 后的 sha256（用于蓝图/任务上下文等输入的内容哈希）"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_map_cache_key(
+    seed: int,
+    width: int,
+    height: int,
+    depth: int,
+    theme: str,
+    contract_hash: str,
+    blueprint_hash: str,
+) -> str:
+    """由生成输入构造内容寻址键"""
+    return stable_hash(
+        {
+            "version": MAP_CACHE_VERSION,
+            "seed": int(seed),
+            "width": int(width),
+            "height": int(height),
+            "depth": int(depth),
+            "theme": str(theme or ""),
+            "contract_hash": str(contract_hash or ""),
+            "blueprint_hash": str(blueprint_hash or ""),
+        }
+    )
+
+
+class MapCache:
+    """内容寻址地图缓存（内存 LRU + 可选磁盘）"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self._cache_dir = cache_dir
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(getattr(config.game, "map_cache_enabled", True))
+
+    @property
+    def max_entries(self) -> int:
+        return max(1, int(getattr(config.game, "map_cache_max_entries", 64) or 1))
+
+    @property
+    def persist(self) -> bool:
+        return bool(getattr(config.game, "map_cache_persist", False))
+
+    @property
+    def cache_dir(self) -> Path:
+        return Path(self._cache_dir or os.path.join(config.data.cache_dir, "map_cache"))
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Tuple[GameMap, Dict[str, Any]]]:
+        """命中时返回新建的 (GameMap, monster_hints)，地图 ID 重新分配"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+
+        if raw is None and self.persist:
+            raw = self._read_disk(key)
+            if raw is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._store_locked(key, raw)
+
+        if raw is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        from data_manager import data_manager
+
+        payload = json.loads(raw)
+        game_map = data_manager._dict_to_game_map(payload["map"])
+        game_map.id = str(uuid.uuid4())
+        return game_map, payload.get("monster_hints") or {}
+
+    def put(self, key: str, game_map: GameMap, monster_hints: Optional[Dict[str, Any]] = None) -> None:
+        if not self.enabled:
+            return
+        raw = json.dumps(
+            {"version": MAP_CACHE_VERSION, "map": game_map.to_dict(), "monster_hints": monster_hints or {}},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            self._store_locked(key, raw)
+            self.stats["stores"] += 1
+        if self.persist:
+            self._write_disk(key, raw)
+
+    def _store_locked(self, key: str, raw: str) -> None:
+        self._entries[key] = raw
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._path_for(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+            if json.loads(raw).get("version") != MAP_CACHE_VERSION:
+                return None
+            return raw
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Ignoring unreadable map cache file {path}: {exc}")
+            return None
+
+    def _write_disk(self, key: str, raw: str) -> None:
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"Failed to persist map cache entry {key}: {exc}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "persist": self.persist,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                **self.stats,
+            }
+
+
+map_cache = MapCache()
+
+__all__ = ["MapCache", "make_map_cache_key", "map_cache", "stable_hash"]
@@ -0,0 +1,302 @@
+"""
+Labyrinthia AI - 紧凑地图网格
+地图生成期使用的扁平数组表示：地形编码存于 bytearray，房间 ID / 房间类型存于定长列表，
+事件以稀疏字典保存。雕刻房间时按列做切片整体赋值，
+生成完成后一次性物化为 GameMap.tiles，避免逐格分配 MapTile 与反复扫描瓦片字典。
+
+下标按列优先（index = x * height + y）排布，遍历顺序与旧的 tiles 字典插入顺序一致。
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from data_models import GameMap, MapTile, TerrainType
+
+Position = Tuple[int, int]
+
+TERRAINS: Tuple[TerrainType, ...] = tuple(TerrainType)
+TERRAIN_CODE: Dict[TerrainType, int] = {terrain: code for code, terrain in enumerate(TERRAINS)}
+
+WALL = TERRAIN_CODE[TerrainType.WALL]
+FLOOR = TERRAIN_CODE[TerrainType.FLOOR]
+DOOR = TERRAIN_CODE[TerrainType.DOOR]
+TRAP = TERRAIN_CODE[TerrainType.TRAP]
+TREASURE = TERRAIN_CODE[TerrainType.TREASURE]
+STAIRS_UP = TERRAIN_CODE[TerrainType.STAIRS_UP]
+STAIRS_DOWN = TERRAIN_CODE[TerrainType.STAIRS_DOWN]
+
+WALKABLE_CODES = frozenset({FLOOR, DOOR, TRAP, TREASURE, STAIRS_UP, STAIRS_DOWN})
+STAIRS_CODES = frozenset({STAIRS_UP, STAIRS_DOWN})
+
+# 邻接方向（位序即方向序号：前 4 位为四邻接，后 4 位为对角）
+NEIGHBORS4: Tuple[Position, ...] = ((0, 1), (0, -1), (1, 0), (-1, 0))
+NEIGHBORS8: Tuple[Position, ...] = NEIGHBORS4 + ((1, 1), (1, -1), (-1, 1), (-1, -1))
+MASK4 = 0x0F
+
+POPCOUNT = bytes(bin(i).count("1") for i in range(256))
+
+
+def code_of(terrain: TerrainType) -> int:
+    return TERRAIN_CODE[terrain]
+
+
+class MapGrid:
+    """列优先扁平网格"""
+
+    def __init__(self, width: int, height: int, fill: int = WALL):
+        self.width = max(0, int(width))
+        self.height = max(0, int(height))
+        size = self.width * self.height
+        self.terrain = bytearray([fill]) * size
+        self.room_id: List[Optional[str]] = [None] * size
+        self.room_type: List[str] = [""] * size
+        self.events: Dict[Position, Dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------ access
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.height + y
+
+    def position(self, index: int) -> Position:
+        return divmod(index, self.height) if self.height else (0, 0)
+
+    def get(self, x: int, y: int) -> Optional[int]:
+        if not self.in_bounds(x, y):
+            return None
+        return self.terrain[x * self.height + y]
+
+    def set(self, x: int, y: int, code: int) -> None:
+        if self.in_bounds(x, y):
+            self.terrain[x * self.height + y] = code
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        code = self.get(x, y)
+        return code is not None and code in WALKABLE_CODES
+
+    def fill_rect(
+        self,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        code: int,
+        room_id: Optional[str] = None,
+        room_type: Optional[str] = None,
+    ) -> None:
+        """矩形区域整体赋值（每列一次切片赋值），越界部分自动裁剪"""
+        x0, x1 = max(0, x), min(self.width, x + width)
+        y0, y1 = max(0, y), min(self.height, y + height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        span = y1 - y0
+        terrain_run = bytes([code]) * span
+        for cx in range(x0, x1):
+            start = cx * self.height + y0
+            self.terrain[start:start + span] = terrain_run
+            if room_id is not None:
+                self.room_id[start:start + span] = [room_id] * span
+            if room_type is not None:
+                self.room_type[start:start + span] = [room_type] * span
+
+    def positions_with(self, codes: Iterable[int]) -> List[Position]:
+        """按列优先顺序列出指定地形的全部位置"""
+        wanted = set(codes)
+        height = self.height
+        return [divmod(i, height) for i, code in enumerate(self.terrain) if code in wanted]
+
+    def count(self, code: int) -> int:
+        return self.terrain.count(code)
+
+    def neighbors4(self, x: int, y: int) -> List[Position]:
+        return [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+
+    # ------------------------------------------------------------------ output
+
+    @classmethod
+    def from_game_map(cls, game_map: GameMap) -> "MapGrid":
+        """从生成期的 GameMap 压缩出网格（地形/房间/事件字段），用于跨进程传输"""
+        grid = cls(game_map.width, game_map.height)
+        height = grid.height
+        for (x, y), tile in game_map.tiles.items():
+            if not grid.in_bounds(x, y):
+                continue
+            i = x * height + y
+            grid.terrain[i] = TERRAIN_CODE[tile.terrain]
+            grid.room_id[i] = tile.room_id
+            grid.room_type[i] = tile.room_type
+            if tile.has_event:
+                grid.events[(x, y)] = {
+                    "has_event": True,
+                    "event_type": tile.event_type,
+                    "event_data": tile.event_data,
+                    "is_event_hidden": tile.is_event_hidden,
+                    "event_triggered": tile.event_triggered,
+                }
+        return grid
+
+    def neighbor_masks(self) -> "NeighborMasks":
+        return NeighborMasks(self)
+
+    def materialize(self, game_map: GameMap) -> None:
+        """一次性写出 MapTile（覆盖 game_map.tiles）"""
+        tiles: Dict[Position, MapTile] = {}
+        height = self.height
+        terrain, room_ids, room_types = self.terrain, self.room_id, self.room_type
+        for x in range(self.width):
+            base = x * height
+            for y in range(height):
+                i = base + y
+                tiles[(x, y)] = MapTile(
+                    x=x,
+                    y=y,
+                    terrain=TERRAINS[terrain[i]],
+                    room_id=room_ids[i],
+                    room_type=room_types[i],
+                )
+        for pos, event in self.events.items():
+            tile = tiles.get(pos)
+            if tile is None:
+                continue
+            for attr_name, value in event.items():
+                setattr(tile, attr_name, value)
+        game_map.tiles = tiles
+        game_map.mark_tiles_changed()
+
+
+def _flag_table(codes: Iterable[int]) -> bytes:
+    wanted = set(codes)
+    return bytes(1 if code in wanted else 0 for code in range(256))
+
+
+_WALKABLE_TABLE = _flag_table(WALKABLE_CODES)
+_FLOOR_TABLE = _flag_table((FLOOR,))
+_WALL_TABLE = _flag_table((WALL,))
+
+
+def _is_corridor(room_type: Optional[str]) -> bool:
+    return room_type == "corridor"
+
+
+def _is_room(room_type: Optional[str]) -> bool:
+    return bool(room_type) and room_type != "corridor"
+
+
+class NeighborMasks:
+    """邻接位掩码表
+
+    每格一个字节，第 k 位表示该格在 NEIGHBORS8[k] 方向上的邻居是否满足条件（越界视为不满足）：
+    walkable 为八邻接可通行，floor / wall 为八邻接地板 / 墙，corridor / room 为四邻接的
+    走廊 / 房间瓦片（按 room_type 判断，不看地形）。
+
+    整张表在一次雕刻完成后按方向做整段移位批量计算（把 0/1 字节串视为大整数做位运算），
+    门位评分等逐格检查随之变成查表 + 位运算；放门等局部修改用 set_terrain 增量维护。
+    """
+
+    def __init__(self, grid: MapGrid):
+        self.grid = grid
+        self.refresh()
+
+    def refresh(self) -> None:
+        grid = self.grid
+        size = grid.width * grid.height
+        self._size = size
+        # dy 方向的列内边界：dy=+1 时每列最后一格无邻居，dy=-1 时每列第一格无邻居
+        height = grid.height
+        self._row_valid = {
+            1: int.from_bytes((b"\x01" * max(0, height - 1) + b"\x00") * grid.width, "little") if height else 0,
+            -1: int.from_bytes((b"\x00" + b"\x01" * max(0, height - 1)) * grid.width, "little") if height else 0,
+        }
+        terrain = bytes(grid.terrain)
+        self.walkable = self._build(terrain.translate(_WALKABLE_TABLE), NEIGHBORS8)
+        self.floor = self._build(terrain.translate(_FLOOR_TABLE), NEIGHBORS8)
+        self.wall = self._build(terrain.translate(_WALL_TABLE), NEIGHBORS8)
+        self.corridor = self._build(bytes(map(_is_corridor, grid.room_type)), NEIGHBORS4)
+        self.room = self._build(bytes(map(_is_room, grid.room_type)), NEIGHBORS4)
+
+    def _build(self, flags: bytes, directions: Tuple[Position, ...]) -> bytearray:
+        size, height = self._size, self.grid.height
+        total = 0
+        for bit, (dx, dy) in enumerate(directions):
+            offset = dx * height + dy
+            if abs(offset) >= size:
+                continue
+            if offset >= 0:
+                shifted = flags[offset:] + bytes(offset)
+            else:
+                shifted = bytes(-offset) + flags[:size + offset]
+            value = int.from_bytes(shifted, "little")
+            if dy:
+                value &= self._row_valid[dy]
+            # 每字节取值 0/1，左移 bit(<8) 位不会进位到相邻字节
+            total |= value << bit
+        return bytearray(total.to_bytes(size, "little")) if size else bytearray()
+
+    # ------------------------------------------------------------------ lookup
+
+    def at(self, mask: bytearray, x: int, y: int) -> int:
+        if not self.grid.in_bounds(x, y):
+            return 0
+        return mask[x * self.grid.height + y]
+
+    @staticmethod
+    def first_direction(bits: int) -> Optional[Position]:
+        """最低位对应的方向（与按 NEIGHBORS8 顺序逐个检查的结果一致）"""
+        if not bits:
+            return None
+        return NEIGHBORS8[(bits & -bits).bit_length() - 1]
+
+    @staticmethod
+    def directions(bits: int) -> List[Position]:
+        return [NEIGHBORS8[bit] for bit in range(8) if bits >> bit & 1]
+
+    # ------------------------------------------------------------------ update
+
+    def set_terrain(self, x: int, y: int, code: int) -> None:
+        """修改单格地形并增量更新其邻居的掩码位"""
+        grid = self.grid
+        if not grid.in_bounds(x, y):
+            return
+        grid.set(x, y, code)
+        flags = (
+            (self.walkable, code in WALKABLE_CODES),
+            (self.floor, code == FLOOR),
+            (self.wall, code == WALL),
+        )
+        height = grid.height
+        for bit, (dx, dy) in enumerate(NEIGHBORS8):
+            # (x, y) 位于邻居 (x-dx, y-dy) 的 bit 方向上
+            nx, ny = x - dx, y - dy
+            if not grid.in_bounds(nx, ny):
+                continue
+            n = nx * height + ny
+            for mask, on in flags:
+                if on:
+                    mask[n] |= 1 << bit
+                else:
+                    mask[n] &= ~(1 << bit) & 0xFF
+
+
+__all__ = [
+    "MapGrid",
+    "NeighborMasks",
+    "NEIGHBORS4",
+    "NEIGHBORS8",
+    "MASK4",
+    "POPCOUNT",
+    "TERRAINS",
+    "TERRAIN_CODE",
+    "WALKABLE_CODES",
+    "STAIRS_CODES",
+    "WALL",
+    "FLOOR",
+    "DOOR",
+    "TRAP",
+    "TREASURE",
+    "STAIRS_UP",
+    "STAIRS_DOWN",
+    "code_of",
+]
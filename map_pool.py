@@ -0,0 +1,291 @@
+"""
+Labyrinthia AI - 预生成地图池
+后台为本地地图提供器维护按 (尺寸, 层数, 主题, 任务形状, 生成契约哈希) 分组的有界地图池，
+新游戏/换层时直接取用现成地图，被取走后由后台任务补齐；池内容持久化到 cache_dir，
+重启后无需重新生成。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from async_task_manager import TaskType, async_task_manager
+from config import config
+from data_models import GameMap
+from generation_contract import contract_hash, extract_contract_request, resolve_generation_contract
+
+logger = logging.getLogger(__name__)
+
+POOL_FILE_VERSION = 1
+
+PoolEntry = Tuple[GameMap, Dict[str, Any]]
+
+
+class MapPool:
+    """预生成地图池（按规格分组，每组有界，规格数量有界并按最近使用淘汰）"""
+
+    def __init__(self, pool_dir: Optional[str] = None):
+        self._pool_dir = pool_dir
+        self._entries: Dict[str, Deque[PoolEntry]] = {}
+        self._specs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._refilling: Dict[str, asyncio.Task] = {}
+        self._loaded_from_disk = False
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "generated": 0, "generate_errors": 0, "loaded": 0}
+
+    # ------------------------------------------------------------------ config
+
+    @property
+    def enabled(self) -> bool:
+        return bool(getattr(config.game, "map_pool_enabled", False))
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(getattr(config.game, "map_pool_size", 2) or 1))
+
+    @property
+    def max_depth(self) -> int:
+        return max(1, int(getattr(config.game, "map_pool_max_depth", 1) or 1))
+
+    @property
+    def max_specs(self) -> int:
+        return max(1, int(getattr(config.game, "map_pool_max_specs", 16) or 1))
+
+    @property
+    def pool_dir(self) -> Path:
+        return Path(self._pool_dir or os.path.join(config.data.cache_dir, "map_pool"))
+
+    # ------------------------------------------------------------------ keys
+
+    def build_spec(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """构造地图池规格：任务形状 + 契约哈希决定地图结构"""
+        from local_map_provider import local_map_provider
+
+        shape = local_map_provider.build_pool_shape(quest_context, depth)
+        provided, requested_version, source_hint = extract_contract_request(shape)
+        contract = resolve_generation_contract(
+            provided_contract=provided,
+            requested_version=requested_version,
+            source_hint=source_hint,
+        ).contract
+        return {
+            "width": int(width),
+            "height": int(height),
+            "depth": max(1, int(depth)),
+            "theme": str(theme or ""),
+            "shape": shape,
+            "contract_hash": contract_hash(contract),
+        }
+
+    @staticmethod
+    def spec_key(spec: Dict[str, Any]) -> str:
+        raw = json.dumps(spec, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    # ------------------------------------------------------------------ take
+
+    def take(
+        self,
+        width: int,
+        height: int,
+        depth: int,
+        theme: str,
+        quest_context: Optional[Dict[str, Any]],
+    ) -> Optional[PoolEntry]:
+        """取用一张预生成地图（已填回任务内容）；未命中返回 None。无论是否命中都会触发后台补齐。"""
+        if not self.enabled or depth > self.max_depth:
+            return None
+
+        self.load_from_disk()
+        spec = self.build_spec(width, height, depth, theme, quest_context)
+        key = self.spec_key(spec)
+
+        with self._lock:
+            self._register_spec_locked(key, spec)
+            queue = self._entries.get(key)
+            entry = queue.popleft() if queue else None
+            self.stats["hits" if entry else "misses"] += 1
+
+        self.schedule_refill(key)
+        if entry is None:
+            return None
+
+        from local_map_provider import local_map_provider
+
+        game_map, monster_hints = entry
+        local_map_provider.personalize_pooled_map(game_map, quest_context)
+        if isinstance(game_map.generation_metadata, dict):
+            game_map.generation_metadata["map_pool"] = {"hit": True, "key": key}
+        return game_map, monster_hints
+
+    def _register_spec_locked(self, key: str, spec: Dict[str, Any]) -> None:
+        self._specs[key] = spec
+        self._specs.move_to_end(key)
+        self._entries.setdefault(key, deque())
+        while len(self._specs) > self.max_specs:
+            evicted, _ = self._specs.popitem(last=False)
+            self._entries.pop(evicted, None)
+            try:
+                self._path_for(evicted).unlink()
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------ refill
+
+    def schedule_refill(self, key: str) -> None:
+        """在事件循环中调度后台补齐（无运行中的事件循环时跳过）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self._refilling.get(key)
+        if task is not None and not task.done():
+            return
+        self._refilling[key] = async_task_manager.create_task(
+            self._refill(key),
+            task_type=TaskType.BACKGROUND,
+            description=f"Map pool refill {key}",
+        )
+
+    async def _refill(self, key: str) -> None:
+        from local_map_provider import local_map_provider
+
+        loop = asyncio.get_running_loop()
+        executor = async_task_manager.io_executor
+        while True:
+            with self._lock:
+                spec = self._specs.get(key)
+                queue = self._entries.get(key)
+                if spec is None or queue is None or len(queue) >= self.capacity:
+                    break
+            try:
+                entry = await local_map_provider.agenerate_map(
+                    width=spec["width"],
+                    height=spec["height"],
+                    depth=spec["depth"],
+                    theme=spec["theme"],
+                    quest_context=spec["shape"] or None,
+                )
+            except Exception as exc:
+                self.stats["generate_errors"] += 1
+                logger.warning(f"Map pool refill failed for {key}: {exc}")
+                break
+            with self._lock:
+                queue = self._entries.get(key)
+                if queue is None:
+                    break
+                queue.append(entry)
+                self.stats["generated"] += 1
+
+        try:
+            await loop.run_in_executor(executor, self.persist, key)
+        except Exception as exc:
+            logger.warning(f"Map pool persist failed for {key}: {exc}")
+
+    # ------------------------------------------------------------------ persistence
+
+    def _path_for(self, key: str) -> Path:
+        return self.pool_dir / f"{key}.json"
+
+    def persist(self, key: str) -> None:
+        """将指定规格的池内容写入 cache_dir（原子替换）"""
+        with self._lock:
+            spec = self._specs.get(key)
+            entries = list(self._entries.get(key, ()))
+        if spec is None:
+            return
+        payload = {
+            "version": POOL_FILE_VERSION,
+            "spec": spec,
+            "saved_at": time.time(),
+            "entries": [{"map": game_map.to_dict(), "monster_hints": hints} for game_map, hints in entries],
+        }
+        path = self._path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    def load_from_disk(self) -> int:
+        """加载持久化的地图池（只在首次调用时执行），返回加载的地图数"""
+        if self._loaded_from_disk:
+            return 0
+        self._loaded_from_disk = True
+        if not self.pool_dir.is_dir():
+            return 0
+
+        from data_manager import data_manager
+
+        loaded = 0
+        for path in sorted(self.pool_dir.glob("*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                if payload.get("version") != POOL_FILE_VERSION or not isinstance(payload.get("spec"), dict):
+                    continue
+                spec = payload["spec"]
+                key = self.spec_key(spec)
+                entries = deque(
+                    (data_manager._dict_to_game_map(item["map"]), item.get("monster_hints") or {})
+                    for item in payload.get("entries", [])
+                    if isinstance(item, dict) and isinstance(item.get("map"), dict)
+                )
+            except Exception as exc:
+                logger.warning(f"Skipping unreadable map pool file {path}: {exc}")
+                continue
+            with self._lock:
+                self._register_spec_locked(key, spec)
+                self._entries[key].extend(entries)
+                while len(self._entries[key]) > self.capacity:
+                    self._entries[key].pop()
+            loaded += len(entries)
+
+        self.stats["loaded"] += loaded
+        if loaded:
+            logger.info(f"Map pool restored {loaded} pre-generated maps from {self.pool_dir}")
+        return loaded
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        """服务启动时调用：恢复持久化内容并为已知规格补齐"""
+        if not self.enabled:
+            return
+        self.load_from_disk()
+        with self._lock:
+            keys = list(self._specs.keys())
+        for key in keys:
+            self.schedule_refill(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "capacity": self.capacity,
+                "max_depth": self.max_depth,
+                "specs": len(self._specs),
+                "ready_maps": sum(len(q) for q in self._entries.values()),
+                **self.stats,
+            }
+
+
+map_pool = MapPool()
+
+__all__ = ["MapPool", "map_pool"]
@@ -373,7 +373,7 @@ class MonsterSpawnManager:
                 new_x, new_y = cx + dx, cy + dy
                 tile = game_map.get_tile(new_x, new_y)
                 
-                if tile and tile.terrain == TerrainType.FLOOR and not tile.character_id:
+                if tile and tile.terrain == TerrainType.FLOOR and not game_map.is_occupied(new_x, new_y):
                     nearby_positions.append((new_x, new_y))
         
         if not nearby_positions:
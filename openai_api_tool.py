@@ -4,7 +4,9 @@ OpenAI API 兼容工具类
 使用 REST 方法与 OpenAI 兼容的 API 进行交互
 """
 
+import asyncio
 import requests
+import httpx
 import json
 import base64
 import copy
@@ -12,6 +14,29 @@ from typing import List, Dict, Optional, Union, Any
 from pathlib import Path
 
 
+# 异步 HTTP client 按事件循环 + 代理复用连接池（httpx.AsyncClient 不能跨事件循环使用）
+_async_http_clients: Dict[Any, Dict[Optional[str], httpx.AsyncClient]] = {}
+
+
+def _get_async_http_client(proxy: Optional[str] = None) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    for stale_loop in [item for item in _async_http_clients if item.is_closed()]:
+        _async_http_clients.pop(stale_loop, None)
+    clients = _async_http_clients.setdefault(loop, {})
+    client = clients.get(proxy)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(proxy=proxy) if proxy else httpx.AsyncClient()
+        clients[proxy] = client
+    return client
+
+
+async def close_async_http_clients() -> None:
+    """关闭当前事件循环上的共享异步 client（应用关闭时调用）"""
+    loop = asyncio.get_running_loop()
+    for client in _async_http_clients.pop(loop, {}).values():
+        await client.aclose()
+
+
 class OpenAIAPITool:
     """OpenAI API 兼容工具类"""
 
@@ -680,21 +705,15 @@ class OpenAIAPITool:
         # TTS API 返回音频字节流
         return self._make_request("audio/speech", data, return_json=False)
 
-    def mimo_text_to_speech_chat(
+    def _build_mimo_tts_payload(
         self,
         text: str,
-        model: Optional[str] = None,
-        voice: str = "mimo_default",
-        response_format: str = "wav",
-        style_hint: Optional[str] = None,
+        model: Optional[str],
+        voice: str,
+        response_format: str,
+        style_hint: Optional[str],
         **kwargs
-    ) -> bytes:
-        """
-        MiMo-V2.5-TTS 语音合成。
-
-        MiMo TTS 使用 chat/completions 协议：待朗读文本必须放在
-        assistant message 中，语音以 message.audio.data 的 base64 返回。
-        """
+    ) -> Dict[str, Any]:
         model = model or self.default_tts_model
         messages: List[Dict[str, Any]] = []
 
@@ -709,7 +728,7 @@ class OpenAIAPITool:
             "content": text,
         })
 
-        data = {
+        return {
             "model": model,
             "messages": messages,
             "audio": {
@@ -719,7 +738,7 @@ class OpenAIAPITool:
             **kwargs
         }
 
-        response = self._make_request("chat/completions", data)
+    def _decode_mimo_tts_response(self, response: Dict[str, Any]) -> bytes:
         message = self._extract_assistant_message(response)
         audio = message.get("audio")
         if not isinstance(audio, dict):
@@ -733,3 +752,64 @@ class OpenAIAPITool:
             return base64.b64decode(audio_data)
         except Exception as exc:
             raise Exception("API 响应 audio.data 不是有效的 base64") from exc
+
+    def mimo_text_to_speech_chat(
+        self,
+        text: str,
+        model: Optional[str] = None,
+        voice: str = "mimo_default",
+        response_format: str = "wav",
+        style_hint: Optional[str] = None,
+        **kwargs
+    ) -> bytes:
+        """
+        MiMo-V2.5-TTS 语音合成。
+
+        MiMo TTS 使用 chat/completions 协议：待朗读文本必须放在
+        assistant message 中，语音以 message.audio.data 的 base64 返回。
+        """
+        data = self._build_mimo_tts_payload(text, model, voice, response_format, style_hint, **kwargs)
+        response = self._make_request("chat/completions", data)
+        return self._decode_mimo_tts_response(response)
+
+    async def amimo_text_to_speech_chat(
+        self,
+        text: str,
+        model: Optional[str] = None,
+        voice: str = "mimo_default",
+        response_format: str = "wav",
+        style_hint: Optional[str] = None,
+        **kwargs
+    ) -> bytes:
+        """
+        MiMo-V2.5-TTS 语音合成（异步版本）。
+
+        协议与 `mimo_text_to_speech_chat` 相同，经共享的 httpx.AsyncClient 发送，
+        等待上游期间不占用线程。
+        """
+        data = self._build_mimo_tts_payload(text, model, voice, response_format, style_hint, **kwargs)
+        response = await self._amake_request("chat/completions", data)
+        return self._decode_mimo_tts_response(response)
+
+    async def _amake_request(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """`_make_request` 的异步 POST 版本（仅 JSON 响应）"""
+        url = f"{self.base_url}/{endpoint}"
+        self.last_request_payload = copy.deepcopy(data)
+        proxy = (self.proxies or {}).get("https") or (self.proxies or {}).get("http")
+        client = _get_async_http_client(proxy)
+        try:
+            response = await client.post(url, headers=self.headers, json=data, timeout=self.timeout)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            error_msg = f"API 请求失败: {str(e) or type(e).__name__}"
+            if isinstance(e, httpx.HTTPStatusError):
+                error_msg += f"\n请求 URL: {url}"
+                error_msg += f"\n状态码: {e.response.status_code}"
+                try:
+                    error_msg += f"\n响应内容: {e.response.text}"
+                except Exception:
+                    pass
+            raise Exception(error_msg) from e
+        response_data = response.json()
+        self.last_response_payload = copy.deepcopy(response_data)
+        return response_data
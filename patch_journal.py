@@ -0,0 +1,161 @@
+"""
+Labyrinthia AI - Patch 事务日志
+写时复制的逆操作日志：只在补丁首次触碰某个瓦片/实体/怪物/任务/待显示事件/指标时保存其原值，
+回滚时按逆序重放，开销与补丁规模成正比，而不是与地图/存档规模成正比。
+"""
+
+from __future__ import annotations
+
+import copy
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from data_models import GameState, Monster, Quest
+
+Position = Tuple[int, int]
+
+_MISSING = object()
+
+
+class PatchJournal:
+    """单个补丁的事务日志
+
+    约定：所有会修改状态的补丁路径在写入前调用对应的 touch_* 方法。
+    同一对象在一个日志内只保存一次（首次触碰时的原值）。
+    """
+
+    def __init__(self, game_state: "GameState", label: str = ""):
+        self.game_state = game_state
+        self.label = label
+        self.rolled_back = False
+        self._tiles: Dict[Position, Any] = {}
+        self._entities: Dict[str, Optional[Position]] = {}
+        self._monster_list: Optional[List["Monster"]] = None
+        self._monsters: Dict[int, Tuple["Monster", Dict[str, Any]]] = {}
+        self._metrics: Dict[str, Any] = {}
+        self._quests: Optional[List[Tuple["Quest", Dict[str, Any]]]] = None
+        self._quest_list: Optional[List["Quest"]] = None
+        self._pending_events: Optional[List[str]] = None
+
+    @property
+    def size(self) -> int:
+        """日志中保存的原值条目数"""
+        return (
+            len(self._tiles)
+            + len(self._entities)
+            + len(self._monsters)
+            + len(self._metrics)
+            + (1 if self._monster_list is not None else 0)
+            + (len(self._quests) if self._quests is not None else 0)
+            + (1 if self._pending_events is not None else 0)
+        )
+
+    # ------------------------------------------------------------------ record
+
+    def touch_tile(self, position: Position) -> None:
+        """记录瓦片原值（瓦片不存在时记录为缺失，回滚时删除），并连带记录其占用实体"""
+        pos = (int(position[0]), int(position[1]))
+        if pos in self._tiles:
+            return
+        game_map = self.game_state.current_map
+        tile = game_map.tiles.get(pos)
+        self._tiles[pos] = copy.deepcopy(tile) if tile is not None else _MISSING
+        occupant = game_map.entity_index.entity_at(pos)
+        if occupant:
+            self.touch_entity(occupant)
+
+    def touch_entity(self, entity_id: str) -> None:
+        """记录实体在空间索引中的原位置，并连带记录原位置瓦片（其 character_id 镜像会被改写）"""
+        if not entity_id or entity_id in self._entities:
+            return
+        position = self.game_state.current_map.entity_index.position_of(entity_id)
+        self._entities[entity_id] = position
+        if position is not None:
+            self.touch_tile(position)
+
+    def touch_monster_list(self) -> None:
+        """记录怪物列表成员（浅拷贝，只保存引用顺序）"""
+        if self._monster_list is None:
+            self._monster_list = list(self.game_state.monsters)
+
+    def touch_monster(self, monster: "Monster") -> None:
+        """记录单个怪物对象的属性原值（原地修改前调用）"""
+        key = id(monster)
+        if key not in self._monsters:
+            self._monsters[key] = (monster, copy.deepcopy(vars(monster)))
+
+    def touch_quests(self) -> None:
+        """记录任务列表成员及各任务属性原值（任务数量少，首次触碰时整体保存）"""
+        if self._quests is None:
+            self._quest_list = list(self.game_state.quests)
+            self._quests = [(quest, copy.deepcopy(vars(quest))) for quest in self._quest_list]
+
+    def touch_pending_events(self) -> None:
+        """记录待显示事件列表（元素为字符串，浅拷贝即可）"""
+        if self._pending_events is None:
+            self._pending_events = list(self.game_state.pending_events or [])
+
+    def touch_metric(self, key: str) -> None:
+        """记录 generation_metrics 中单个键的原值"""
+        if key in self._metrics:
+            return
+        metrics = self.game_state.generation_metrics
+        value = metrics.get(key, _MISSING) if isinstance(metrics, dict) else _MISSING
+        self._metrics[key] = copy.deepcopy(value) if value is not _MISSING else _MISSING
+
+    # ------------------------------------------------------------------ replay
+
+    def rollback(self) -> None:
+        """按逆序重放日志，恢复首次触碰前的状态（重复调用无副作用）"""
+        if self.rolled_back:
+            return
+        self.rolled_back = True
+        game_state = self.game_state
+        game_map = game_state.current_map
+
+        metrics = game_state.generation_metrics
+        if isinstance(metrics, dict):
+            for key, value in self._metrics.items():
+                if value is _MISSING:
+                    metrics.pop(key, None)
+                else:
+                    metrics[key] = value
+
+        if self._quests is not None:
+            for quest, attrs in self._quests:
+                vars(quest).update(attrs)
+            game_state.quests = self._quest_list
+        if self._pending_events is not None:
+            game_state.pending_events = self._pending_events
+
+        for monster, attrs in self._monsters.values():
+            vars(monster).update(attrs)
+        if self._monster_list is not None:
+            game_state.monsters = self._monster_list
+
+        # 先恢复索引再整块换回瓦片：保存的瓦片副本自带原 character_id 镜像
+        for entity_id in self._entities:
+            game_map.entity_index.remove(entity_id)
+        for entity_id, position in self._entities.items():
+            if position is not None:
+                game_map.entity_index.place(entity_id, position)
+
+        for pos, tile in self._tiles.items():
+            if tile is _MISSING:
+                game_map.tiles.pop(pos, None)
+            else:
+                game_map.tiles[pos] = tile
+        if self._tiles:
+            game_map.mark_tiles_changed(list(self._tiles))
+
+        self._tiles.clear()
+        self._entities.clear()
+        self._monster_list = None
+        self._monsters.clear()
+        self._metrics.clear()
+        self._quests = None
+        self._quest_list = None
+        self._pending_events = None
+
+
+__all__ = ["PatchJournal"]
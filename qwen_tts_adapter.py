@@ -29,6 +29,10 @@
   自动映射为默认 `vivian`，避免切换 provider 时 `default_voice` 残留导致请求失败。
 - **lazy 枚举**：`refresh_catalog` 在第一次 `synthesize` 时按需触发；后续按
   upstream URL 复用进程内缓存，避免每次请求重复抓取枚举。
+- **client 池**：`gradio_client.Client` 构造需要握手并下载接口 schema，短句合成时
+  这部分开销占大头。按 upstream URL 维护有界的热 client 池（`GradioClientPool`），
+  合成与枚举抓取共用；闲置过久的 client 丢弃重建，调用失败的 client 直接作废，
+  复用的热 client 失败时换新 client 重试一次（断线重连）。
 """
 
 from __future__ import annotations
@@ -36,8 +40,10 @@ from __future__ import annotations
 import logging
 import os
 import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from tts_gateway import TTSGateway, TTSProviderBase
 
@@ -67,6 +73,135 @@ def _get_config(runtime_config: Optional[Any] = None):
     return config
 
 
+class GradioClientPool:
+    """有界的 gradio client 池（线程安全）
+
+    - 最多同时存在 max_size 个 client；全部借出时等待归还，超过 acquire_timeout 抛 RuntimeError。
+    - 借出前做健康检查：闲置超过 max_idle_seconds 的 client 视为连接可能已失效，关闭后重建。
+    - 归还时 healthy=False 的 client 直接关闭作废，下次借出时重新建立连接。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        max_size: int = 2,
+        max_idle_seconds: float = 300.0,
+    ) -> None:
+        self._factory = factory
+        self.max_size = max(1, int(max_size or 1))
+        self.max_idle_seconds = max(0.0, float(max_idle_seconds or 0.0))
+        self._idle: List[Tuple[Any, float]] = []  # (client, 最近归还时间)，栈顶为最新
+        self._total = 0
+        self._cond = threading.Condition()
+        self.stats: Dict[str, int] = {"created": 0, "reused": 0, "expired": 0, "discarded": 0, "waits": 0}
+
+    @staticmethod
+    def _close(client: Any) -> None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _pop_idle_locked(self, expired: List[Any]) -> Optional[Any]:
+        """取最近归还的闲置 client；闲置过久的放入 expired 待关闭"""
+        now = time.monotonic()
+        while self._idle:
+            client, released_at = self._idle.pop()
+            if self.max_idle_seconds and now - released_at > self.max_idle_seconds:
+                self._total -= 1
+                self.stats["expired"] += 1
+                expired.append(client)
+                continue
+            self.stats["reused"] += 1
+            return client
+        return None
+
+    def acquire(self, timeout: Optional[float] = None, fresh: bool = False) -> Tuple[Any, bool]:
+        """借出一个 client，返回 (client, 是否为复用的热 client)
+
+        fresh=True 时不复用闲置 client（池满时关闭最久未用的闲置 client 腾出名额）。
+        """
+        deadline = None if timeout is None else time.monotonic() + max(0.0, timeout)
+        expired: List[Any] = []
+        client: Optional[Any] = None
+        try:
+            with self._cond:
+                while True:
+                    if not fresh:
+                        client = self._pop_idle_locked(expired)
+                        if client is not None:
+                            break
+                    elif self._idle and self._total >= self.max_size:
+                        stale, _ = self._idle.pop(0)
+                        self._total -= 1
+                        self.stats["expired"] += 1
+                        expired.append(stale)
+                    if self._total < self.max_size:
+                        self._total += 1
+                        break
+                    self.stats["waits"] += 1
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise RuntimeError("qwen client 池已满，等待可用 client 超时")
+                    self._cond.wait(remaining)
+        finally:
+            for stale in expired:
+                self._close(stale)
+
+        if client is not None:
+            return client, True
+
+        try:
+            client = self._factory()
+        except BaseException:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats["created"] += 1
+        return client, False
+
+    def release(self, client: Any, healthy: bool = True) -> None:
+        with self._cond:
+            if healthy:
+                self._idle.append((client, time.monotonic()))
+            else:
+                self._total -= 1
+                self.stats["discarded"] += 1
+            self._cond.notify()
+        if not healthy:
+            self._close(client)
+
+    @contextmanager
+    def client(self, timeout: Optional[float] = None, fresh: bool = False) -> Iterator[Tuple[Any, bool]]:
+        """借出 client 的上下文；块内抛异常时该 client 作废"""
+        client, warm = self.acquire(timeout, fresh=fresh)
+        healthy = False
+        try:
+            yield client, warm
+            healthy = True
+        finally:
+            self.release(client, healthy=healthy)
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for client, _ in idle:
+            self._close(client)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "total": self._total,
+                "idle": len(self._idle),
+                "in_use": self._total - len(self._idle),
+                **self.stats,
+            }
+
+
 def _normalize_option_id(label: object) -> str:
     """从 'Vivian / 十三' 这种枚举显示名抽出小写 id（'vivian'）。"""
     value = str(label or "").strip().lower()
@@ -92,13 +227,20 @@ class QwenGradioTTSProvider(TTSProviderBase):
     supports_prefetch = True
     required_config_fields = ()
     fixed_response_format = "wav"
+    # 公开 Space 排队 + 限流，并发过高只会加剧排队；与默认 client 池大小一致
+    default_max_concurrency = 2
     _catalog_lock = threading.RLock()
     _catalog_cache: Dict[str, Any] = {}
+    _pool_lock = threading.Lock()
+    _client_pools: Dict[str, GradioClientPool] = {}
 
     def __init__(self, runtime_config: Optional[Any] = None) -> None:
         config = _get_config(runtime_config)
         base_url = str(config.tts.base_url or "").strip() or DEFAULT_QWEN_BASE_URL
         self._upstream_url = base_url
+        self._pool_size = max(1, int(getattr(config.tts, "qwen_pool_size", 2) or 1))
+        self._pool_max_idle = float(getattr(config.tts, "qwen_pool_max_idle_seconds", 300.0) or 0.0)
+        self._acquire_timeout = float(getattr(config.tts, "timeout", 120) or 120)
         self._api_name = DEFAULT_QWEN_API_NAME
         self._voices: Dict[str, str] = {}
         self._languages: Dict[str, str] = {}
@@ -115,6 +257,32 @@ class QwenGradioTTSProvider(TTSProviderBase):
             raise RuntimeError("qwen_gradio 需要安装 gradio_client 依赖") from exc
         return Client(self._upstream_url)
 
+    def _get_pool(self) -> GradioClientPool:
+        """按 upstream URL 共享的 client 池（provider 实例按请求创建，池跨实例复用）"""
+        with self._pool_lock:
+            pool = self._client_pools.get(self._upstream_url)
+            if pool is None:
+                pool = GradioClientPool(
+                    self._create_client,
+                    max_size=self._pool_size,
+                    max_idle_seconds=self._pool_max_idle,
+                )
+                self._client_pools[self._upstream_url] = pool
+            return pool
+
+    @classmethod
+    def close_client_pools(cls) -> None:
+        """关闭并清空所有 client 池（进程退出 / 测试隔离）"""
+        with cls._pool_lock:
+            pools, cls._client_pools = list(cls._client_pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    @classmethod
+    def get_pool_stats(cls) -> Dict[str, Any]:
+        with cls._pool_lock:
+            return {url: pool.get_stats() for url, pool in cls._client_pools.items()}
+
     def _refresh_catalog(self, force: bool = False) -> None:
         if not force and self._voices and self._languages:
             return
@@ -133,28 +301,24 @@ class QwenGradioTTSProvider(TTSProviderBase):
 
             voices: Dict[str, str] = {}
             languages: Dict[str, str] = {}
-            client = self._create_client()
             try:
-                for endpoint in client.endpoints.values():
-                    for param in endpoint.parameters_info or []:
-                        pname = param.get("parameter_name")
-                        enum_values = param.get("type", {}).get("enum", []) or []
-                        for display in enum_values:
-                            opt_id = _normalize_option_id(display)
-                            if not opt_id:
-                                continue
-                            if pname == "voice_display":
-                                voices.setdefault(opt_id, str(display))
-                            elif pname == "language_display":
-                                languages.setdefault(opt_id, str(display))
+                # 枚举来自 client 已下载的接口 schema，借用池中的热 client 即可，无需另建连接
+                with self._get_pool().client(timeout=self._acquire_timeout) as (client, _):
+                    for endpoint in client.endpoints.values():
+                        for param in endpoint.parameters_info or []:
+                            pname = param.get("parameter_name")
+                            enum_values = param.get("type", {}).get("enum", []) or []
+                            for display in enum_values:
+                                opt_id = _normalize_option_id(display)
+                                if not opt_id:
+                                    continue
+                                if pname == "voice_display":
+                                    voices.setdefault(opt_id, str(display))
+                                elif pname == "language_display":
+                                    languages.setdefault(opt_id, str(display))
             except Exception as exc:
                 logger.error("[qwen_gradio] 拉取上游枚举失败: %s", exc, exc_info=True)
                 raise RuntimeError(f"qwen 上游枚举抓取失败: {exc}") from exc
-            finally:
-                try:
-                    client.close()
-                except Exception:
-                    pass
 
             if not voices:
                 raise RuntimeError("qwen 上游未返回任何音色")
@@ -250,6 +414,29 @@ class QwenGradioTTSProvider(TTSProviderBase):
                     return candidate
         return None
 
+    def _predict(self, text: str, voice_name: str, language_name: str) -> Optional[str]:
+        """借用池中 client 调用上游；复用的热 client 失败时视为连接失效，换新 client 重试一次"""
+        pool = self._get_pool()
+        attempts = 2
+        for attempt in range(attempts):
+            warm = False
+            try:
+                with pool.client(timeout=self._acquire_timeout, fresh=attempt > 0) as (client, warm):
+                    predict_result = client.predict(
+                        api_name=self._api_name,
+                        text=text,
+                        voice_display=voice_name,
+                        language_display=language_name,
+                    )
+            except Exception as exc:
+                if warm and attempt + 1 < attempts:
+                    logger.warning("[qwen_gradio] 热 client 调用失败，重建连接后重试: %s", exc)
+                    continue
+                logger.error("[qwen_gradio] 上游 predict 失败: %s", exc, exc_info=True)
+                raise RuntimeError(f"qwen 上游合成失败: {exc}") from exc
+            return self._extract_audio_path(predict_result)
+        return None
+
     # ----- TTSProviderBase 接口 -----
     def synthesize(
         self,
@@ -272,24 +459,7 @@ class QwenGradioTTSProvider(TTSProviderBase):
         voice_id, voice_name = self._resolve_voice(voice)
         language_id, language_name = self._resolve_language(None)
 
-        client = self._create_client()
-        audio_path: Optional[str] = None
-        try:
-            predict_result = client.predict(
-                api_name=self._api_name,
-                text=str(text).strip(),
-                voice_display=voice_name,
-                language_display=language_name,
-            )
-            audio_path = self._extract_audio_path(predict_result)
-        except Exception as exc:
-            logger.error("[qwen_gradio] 上游 predict 失败: %s", exc, exc_info=True)
-            raise RuntimeError(f"qwen 上游合成失败: {exc}") from exc
-        finally:
-            try:
-                client.close()
-            except Exception:
-                pass
+        audio_path = self._predict(str(text).strip(), voice_name, language_name)
 
         if not audio_path or not os.path.exists(audio_path):
             raise RuntimeError("qwen 上游未返回有效音频文件")
@@ -0,0 +1,171 @@
+"""
+Labyrinthia AI - 房间空间索引
+维护已放置房间的均匀网格分桶（空间哈希）与占用栅格：
+重叠检测只比较候选房间外扩区域所覆盖网格桶内的房间，
+空位搜索借助占用栅格的积分图按 O(1) 判定任意矩形是否空闲，
+二者都不随已放置房间数线性增长。
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+Position = Tuple[int, int]
+Rect = Tuple[int, int, int, int]  # 左、上、右、下（右/下为开区间）
+
+
+class RoomSpatialIndex:
+    """房间空间索引
+
+    两个房间各自外扩 margin 格后若相交即视为重叠，与旧的逐对检查
+    （_rooms_overlap 带缓冲区版本 / LocalMapProvider._overlap）语义一致。
+    """
+
+    def __init__(self, width: int, height: int, margin: int = 1, cell_size: int = 8):
+        self.width = max(0, int(width))
+        self.height = max(0, int(height))
+        self.margin = max(0, int(margin))
+        self.cell_size = max(1, int(cell_size or 1))
+        self.rooms: List[Mapping[str, Any]] = []
+        self._rects: List[Rect] = []
+        self._grid: Dict[Position, List[int]] = {}
+        # 占用栅格（行优先，记录房间本体）与按需重建的积分图
+        self._occupied = bytearray(self.width * self.height)
+        self._integral: Optional[List[int]] = None
+
+    @classmethod
+    def from_rooms(
+        cls,
+        width: int,
+        height: int,
+        rooms: List[Mapping[str, Any]],
+        margin: int = 1,
+        cell_size: int = 8,
+    ) -> "RoomSpatialIndex":
+        index = cls(width, height, margin=margin, cell_size=cell_size)
+        for room in rooms:
+            index.add(room)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    # ------------------------------------------------------------------ geometry
+
+    def _expanded(self, x: int, y: int, width: int, height: int) -> Rect:
+        m = self.margin
+        return x - m, y - m, x + width + m, y + height + m
+
+    @staticmethod
+    def _rect_of(room: Mapping[str, Any]) -> Tuple[int, int, int, int]:
+        return int(room["x"]), int(room["y"]), int(room["width"]), int(room["height"])
+
+    def _cells(self, rect: Rect) -> List[Position]:
+        size = self.cell_size
+        left, top, right, bottom = rect
+        return [
+            (cx, cy)
+            for cx in range(left // size, (right - 1) // size + 1)
+            for cy in range(top // size, (bottom - 1) // size + 1)
+        ]
+
+    # ------------------------------------------------------------------ index
+
+    def add(self, room: Mapping[str, Any]) -> None:
+        """登记已放置的房间"""
+        x, y, width, height = self._rect_of(room)
+        rect = self._expanded(x, y, width, height)
+        slot = len(self.rooms)
+        self.rooms.append(room)
+        self._rects.append(rect)
+        for cell in self._cells(rect):
+            self._grid.setdefault(cell, []).append(slot)
+
+        x0, x1 = max(0, x), min(self.width, x + width)
+        y0, y1 = max(0, y), min(self.height, y + height)
+        if x0 < x1 and y0 < y1:
+            run = b"\x01" * (x1 - x0)
+            for cy in range(y0, y1):
+                start = cy * self.width + x0
+                self._occupied[start:start + len(run)] = run
+            self._integral = None
+
+    def overlaps(self, room: Mapping[str, Any]) -> bool:
+        """候选房间是否与任一已放置房间重叠（仅检查相关网格桶）"""
+        left, top, right, bottom = self._expanded(*self._rect_of(room))
+        seen: Set[int] = set()
+        for cell in self._cells((left, top, right, bottom)):
+            for slot in self._grid.get(cell, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                o_left, o_top, o_right, o_bottom = self._rects[slot]
+                if left < o_right and o_left < right and top < o_bottom and o_top < bottom:
+                    return True
+        return False
+
+    # ------------------------------------------------------------------ free space
+
+    def _build_integral(self) -> List[int]:
+        """(width+1)*(height+1) 的占用积分图"""
+        width, height = self.width, self.height
+        stride = width + 1
+        integral = [0] * (stride * (height + 1))
+        occupied = self._occupied
+        for y in range(height):
+            row_sum = 0
+            base = y * width
+            above = y * stride
+            current = above + stride
+            for x in range(width):
+                row_sum += occupied[base + x]
+                integral[current + x + 1] = integral[above + x + 1] + row_sum
+        return integral
+
+    def _occupied_count(self, left: int, top: int, right: int, bottom: int) -> int:
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(self.width, right), min(self.height, bottom)
+        if left >= right or top >= bottom:
+            return 0
+        if self._integral is None:
+            self._integral = self._build_integral()
+        integral, stride = self._integral, self.width + 1
+        return (
+            integral[bottom * stride + right]
+            - integral[top * stride + right]
+            - integral[bottom * stride + left]
+            + integral[top * stride + left]
+        )
+
+    def is_free(self, x: int, y: int, width: int, height: int) -> bool:
+        """O(1) 判定：放在 (x, y) 的房间外扩后不与任何已放置房间的外扩区域相交"""
+        grow = self.margin * 2
+        return self._occupied_count(x - grow, y - grow, x + width + grow, y + height + grow) == 0
+
+    def find_free_position(
+        self,
+        width: int,
+        height: int,
+        border: int = 1,
+        rng: Optional[random.Random] = None,
+    ) -> Optional[Position]:
+        """在地图内（四周保留 border 格）找一个能放下 width×height 房间的空位
+
+        给定 rng 时在所有空位中随机选一个，否则返回列优先顺序的第一个。
+        """
+        max_x = self.width - width - border
+        max_y = self.height - height - border
+        candidates: List[Position] = []
+        for x in range(border, max_x + 1):
+            for y in range(border, max_y + 1):
+                if self.is_free(x, y, width, height):
+                    if rng is None:
+                        return x, y
+                    candidates.append((x, y))
+        if not candidates:
+            return None
+        return rng.choice(candidates)
+
+
+__all__ = ["RoomSpatialIndex"]
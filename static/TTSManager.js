@@ -191,6 +191,8 @@ class TTSManager {
             default_voice: 'mimo_default',
             output_format: 'wav',
             max_text_chars: 800,
+            stream_enabled: false,
+            stream_min_chars: 60,
             // 后端可下发的“服务端默认白名单覆盖”（按分类名 -> bool）
             voice_whitelist_defaults: null,
         };
@@ -1175,6 +1177,39 @@ class TTSManager {
         }
     }
 
+    shouldStream(text) {
+        if (!this.config?.stream_enabled) {
+            return false;
+        }
+        const minChars = Number(this.config?.stream_min_chars ?? 60);
+        return String(text || '').length >= minChars;
+    }
+
+    /**
+     * 合成请求的 Accept 头：列出浏览器能播放的压缩格式，后端有编码器时据此转码
+     * （Opus 优先，MP3 次之，WAV 兜底）；无法探测时只声明 WAV，保持源格式。
+     */
+    getAudioAccept() {
+        if (this._audioAccept) {
+            return this._audioAccept;
+        }
+        const types = [];
+        try {
+            const probe = typeof document !== 'undefined' ? document.createElement('audio') : null;
+            if (probe?.canPlayType?.('audio/ogg; codecs="opus"')) {
+                types.push('audio/ogg;codecs=opus');
+            }
+            if (probe?.canPlayType?.('audio/mpeg')) {
+                types.push('audio/mpeg;q=0.9');
+            }
+        } catch (error) {
+            // 忽略探测失败，退回源格式
+        }
+        types.push('audio/wav;q=0.5', '*/*;q=0.1');
+        this._audioAccept = types.join(', ');
+        return this._audioAccept;
+    }
+
     async getAudioUrl(text, category, options = {}) {
         const key = this.buildCacheKey(text, category, options);
         if (this.audioCache.has(key)) {
@@ -1186,9 +1221,20 @@ class TTSManager {
 
         const prefetchUrl = options?.prefetchUrl || options?.prefetch_url || null;
 
+        // 较长文本直接把流式地址交给 <audio>：后端按句合成，首句就绪即可开始播放
+        if (!prefetchUrl && this.shouldStream(text)) {
+            const params = new URLSearchParams({ text, category });
+            if (this.config?.default_voice) {
+                params.set('voice', this.config.default_voice);
+            }
+            const url = `/api/tts/stream?${params.toString()}`;
+            this.audioCache.set(key, url);
+            return url;
+        }
+
         const fetchSynthesize = () => fetch('/api/tts/synthesize', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', Accept: this.getAudioAccept() },
             body: JSON.stringify({
                 text,
                 category,
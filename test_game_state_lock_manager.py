@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from game_state_lock_manager import AsyncRWLock, GameStateLockManager, LockHistogram
+
+
+@pytest.mark.asyncio
+async def test_readers_share_lock_and_writers_are_exclusive():
+    manager = GameStateLockManager()
+    events = []
+    readers_inside = {"now": 0, "peak": 0}
+
+    async def _reader(name):
+        async with manager.read_game_state("u", "g", "get_quests"):
+            readers_inside["now"] += 1
+            readers_inside["peak"] = max(readers_inside["peak"], readers_inside["now"])
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:end")
+            readers_inside["now"] -= 1
+
+    async def _writer():
+        async with manager.lock_game_state("u", "g", "action:move") as lock:
+            assert lock.lock.readers == 0
+            events.append("writer:start")
+            await asyncio.sleep(0.005)
+            events.append("writer:end")
+
+    await asyncio.gather(_reader("r1"), _reader("r2"), _reader("r3"))
+    assert readers_inside["peak"] == 3
+
+    events.clear()
+    await asyncio.gather(_reader("r1"), _writer(), _reader("r2"))
+    # 写者排队后到达的读者排在写者之后
+    assert events.index("writer:start") > events.index("r1:end")
+    assert events.index("r2:start") > events.index("writer:end")
+
+    stats = manager.get_lock_stats()
+    assert stats["total_locks"] == 1
+    assert stats["lookup"]["created"] == 1
+    assert stats["lookup"]["fast_path"] >= 5
+    assert stats["wait_histograms"]["read"]["count"] == 5
+    assert stats["wait_histograms"]["write"]["count"] == 1
+    assert stats["wait_histograms"]["write"]["p95_ms"] > 0
+    assert "write:action:move" in stats["operation_wait_histograms"]
+    assert stats["locks"][0]["read_count"] == 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_lock():
+    lock = AsyncRWLock()
+    await lock.acquire("write")
+
+    waiting_writer = asyncio.create_task(lock.acquire("write"))
+    waiting_reader = asyncio.create_task(lock.acquire("read"))
+    await asyncio.sleep(0)
+    waiting_writer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting_writer
+
+    lock.release("write")
+    await asyncio.wait_for(waiting_reader, timeout=1)
+    assert lock.readers == 1 and not lock.write_locked()
+    lock.release("read")
+    assert not lock.locked()
+
+
+def test_lock_histogram_buckets_and_quantiles():
+    histogram = LockHistogram()
+    for value in [0.5, 3, 3, 40, 120, 9000]:
+        histogram.observe(value)
+
+    data = histogram.to_dict()
+    assert data["count"] == 6
+    assert data["buckets"]["le_1"] == 1
+    assert data["buckets"]["le_5"] == 2
+    assert data["buckets"]["le_50"] == 1
+    assert data["buckets"]["le_250"] == 1
+    assert data["buckets"]["le_inf"] == 1
+    assert data["p50_ms"] == 5
+    assert data["max_ms"] == 9000
@@ -0,0 +1,74 @@
+import copy
+import json
+
+from data_models import GameMap, GameState, Item, MapTile, Monster, TerrainType
+from game_state_snapshot import capture_game_state
+
+
+def _build_state(width: int = 30, height: int = 20) -> GameState:
+    game_state = GameState()
+    game_map = GameMap(width=width, height=height, depth=2)
+    for x in range(width):
+        for y in range(height):
+            game_map.tiles[(x, y)] = MapTile(x=x, y=y, terrain=TerrainType.FLOOR)
+    event_tile = game_map.tiles[(3, 4)]
+    event_tile.has_event = True
+    event_tile.event_type = "treasure"
+    event_tile.event_data = {"gold": 10, "tags": ["chest"]}
+    game_state.current_map = game_map
+    game_state.player.position = (1, 1)
+    game_map.place_entity(game_state.player.id, (1, 1))
+    monster = Monster(name="地精")
+    monster.position = (5, 5)
+    game_state.monsters.append(monster)
+    game_map.place_entity(monster.id, (5, 5))
+    game_state.pending_events.append("你听到了脚步声")
+    return game_state
+
+
+def _as_json(data):
+    return json.loads(json.dumps(data, ensure_ascii=False, sort_keys=True))
+
+
+def test_snapshot_matches_to_dict_and_reuses_unchanged_tiles():
+    game_state = _build_state()
+
+    first = capture_game_state(game_state)
+    assert _as_json(first.to_dict()) == _as_json(game_state.to_dict())
+    assert first.tiles_serialized == first.tiles_total == 600
+
+    second = capture_game_state(game_state)
+    # 只有带事件数据的瓦片每次重新序列化
+    assert second.tiles_serialized == 1
+    assert second.data["current_map"]["tiles"]["0,0"] is first.data["current_map"]["tiles"]["0,0"]
+
+    game_map = game_state.current_map
+    game_map.tiles[(2, 2)].is_explored = True
+    game_map.tiles[(6, 6)].items.append(Item(name="火把"))
+    game_map.tiles[(7, 7)] = copy.deepcopy(game_map.tiles[(7, 7)])
+    game_state.player.position = (2, 1)
+    game_map.place_entity(game_state.player.id, (2, 1))
+
+    third = capture_game_state(game_state)
+    assert _as_json(third.to_dict()) == _as_json(game_state.to_dict())
+    # (2,2) 探索、(6,6) 物品、(7,7) 替换、(1,1)/(2,1) 玩家移动、(3,4) 事件
+    assert third.tiles_serialized == 6
+
+
+def test_snapshot_is_isolated_from_later_mutations():
+    game_state = _build_state()
+    snapshot = capture_game_state(game_state)
+    before = _as_json(snapshot.to_dict())
+
+    game_state.current_map.tiles[(3, 4)].event_data["gold"] = 99
+    game_state.current_map.tiles[(3, 4)].event_data["tags"].append("opened")
+    game_state.pending_events.append("宝箱被打开了")
+    game_state.monsters[0].position = (6, 5)
+    game_state.current_map.generation_metadata["floor_note"] = "changed"
+
+    assert _as_json(snapshot.to_dict()) == before
+
+    # 顶层浅拷贝：调用方附加顶层字段不会污染快照
+    payload = snapshot.to_dict()
+    payload["llm_context_logs"] = []
+    assert "llm_context_logs" not in snapshot.data
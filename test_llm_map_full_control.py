@@ -4,7 +4,7 @@ from typing import Dict, Any
 
 import pytest
 
-from data_models import GameState, GameMap, MapTile, TerrainType, Quest, QuestMonster, QuestEvent, EventChoice, EventChoiceContext, Monster
+from data_models import GameState, GameMap, MapTile, TerrainType, Quest, QuestMonster, QuestEvent, EventChoice, EventChoiceContext, Monster, StatusEffect
 from debug_api import DebugAPI
 from event_choice_system import event_choice_system, ChoiceResult
 from game_engine import game_engine
@@ -500,7 +500,7 @@ def test_local_llm_event_merge_keeps_latest_player_position():
     backend_state.combat_authority_mode = "local"
     backend_state.current_map = _build_basic_map(depth=1)
     backend_state.player.position = (2, 2)
-    backend_state.current_map.tiles[(2, 2)].character_id = backend_state.player.id
+    backend_state.current_map.place_entity(backend_state.player.id, (2, 2))
 
     frontend_state = GameState()
     frontend_state.id = backend_state.id
@@ -857,3 +857,851 @@ def test_blueprint_sanitize_whitelist_follow_contract_override():
 
     assert node.get("size") == "small"
     assert "placement_policy" not in node
+
+
+def test_entity_spatial_index_tracks_moves_and_range_queries():
+    game_map = _build_basic_map(width=20, height=20)
+    player = GameState().player
+    player.position = (2, 2)
+    monster_near = Monster(name="近处怪物", position=(4, 3))
+    monster_far = Monster(name="远处怪物", position=(15, 15))
+    game_map.rebuild_entity_index(player, [monster_near, monster_far])
+
+    assert game_map.get_entity_at(4, 3) == monster_near.id
+    assert game_map.tiles[(2, 2)].character_id == player.id
+    assert [entity_id for entity_id, _ in game_map.get_entities_in_range(2, 2, 3)] == [player.id, monster_near.id]
+
+    game_map.place_entity(monster_near.id, (5, 3))
+    monster_near.position = (5, 3)
+    assert game_map.tiles[(4, 3)].character_id is None
+    assert game_map.get_entity_position(monster_near.id) == (5, 3)
+
+    game_map.remove_entity(monster_far.id)
+    assert not game_map.is_occupied(15, 15)
+    assert game_map.check_entity_index(player, [monster_near]) == []
+
+    # 绕过索引直接改写瓦片会被一致性检查发现
+    game_map.tiles[(7, 7)].character_id = "ghost"
+    assert any("(7, 7)" in issue for issue in game_map.check_entity_index(player, [monster_near]))
+
+
+def test_loaded_save_rebuilds_entity_index_from_positions():
+    from data_manager import data_manager
+
+    state = GameState()
+    state.current_map = _build_basic_map()
+    state.player.position = (3, 3)
+    monster = Monster(name="哥布林", position=(6, 6))
+    state.monsters = [monster]
+    payload = state.to_dict()
+    # 存档中残留的过期占用标记不应被恢复
+    payload["current_map"]["tiles"]["8,8"]["character_id"] = "stale-id"
+
+    loaded = data_manager._dict_to_game_state(payload)
+
+    assert loaded.current_map.tiles[(8, 8)].character_id is None
+    assert loaded.current_map.get_entity_at(3, 3) == state.player.id
+    assert loaded.current_map.get_entity_at(6, 6) == monster.id
+    assert loaded.current_map.check_entity_index(loaded.player, loaded.monsters) == []
+
+
+@pytest.mark.asyncio
+async def test_monster_phase_resolves_moves_without_collisions_and_aggregates_record():
+    state = GameState()
+    state.current_map = _build_basic_map(width=16, height=16)
+    state.player.position = (8, 8)
+    state.player.stats.hp = 500
+    state.player.stats.max_hp = 500
+    # 两只怪物同时想进入 (6, 8)，另一只紧贴玩家直接攻击
+    chasers = [Monster(name=f"追击者{i}", position=pos) for i, pos in enumerate([(5, 7), (5, 9)])]
+    attacker = Monster(name="近战怪", position=(9, 8))
+    state.monsters = chasers + [attacker]
+    state.current_map.rebuild_entity_index(state.player, state.monsters)
+
+    await game_engine._process_monster_turns(state)
+
+    positions = [m.position for m in state.monsters]
+    assert len(set(positions)) == len(positions)
+    assert state.current_map.check_entity_index(state.player, state.monsters) == []
+    record = state.combat_snapshot["monster_phase"]
+    assert record["attacks_planned"] == 1
+    assert record["attacks_resolved"] == 1
+    assert record["moves_planned"] == 2
+    assert record["moves_resolved"] == 1
+    assert (6, 8) in [m.position for m in chasers]
+
+
+def test_monster_lookup_and_intents_go_through_entity_index():
+    state = GameState()
+    state.current_map = _build_basic_map(width=20, height=20)
+    state.player.position = (2, 2)
+    near = Monster(name="近处怪", position=(3, 2))
+    far = Monster(name="远处怪", position=(15, 15))
+    state.monsters = [far, near]
+    state.current_map.rebuild_entity_index(state.player, state.monsters)
+
+    assert state.get_monster(near.id) is near
+    assert state.get_monster(state.player.id) is None
+    intents = game_engine._plan_monster_intents(state)
+    assert [(item["monster"], item["intent"]) for item in intents] == [(near, "attack")]
+
+    # 死亡路径移除索引后不再返回旧引用；怪物列表整体替换后查找表随之重建
+    state.current_map.remove_entity(near.id)
+    state.monsters = [m for m in state.monsters if m is not near]
+    assert state.get_monster(near.id) is None
+    replacement = Monster(id=far.id, name="远处怪", position=(15, 15))
+    state.monsters = [replacement]
+    assert state.get_monster(far.id) is replacement
+
+    # 原地移除（未同步索引）后追加新怪物，列表长度不变也不能返回旧引用
+    newcomer = Monster(name="新来的怪", position=(3, 3))
+    state.monsters.remove(replacement)
+    state.monsters.append(newcomer)
+    assert state.get_monster(far.id) is None
+    assert state.get_monster(newcomer.id) is newcomer
+
+    # newcomer 从未放入索引：意图阶段退回逐怪物扫描，它仍会行动
+    state.current_map.remove_entity(far.id)
+    intents = game_engine._plan_monster_intents(state)
+    assert [(item["monster"], item["intent"]) for item in intents] == [(newcomer, "attack")]
+
+
+def test_monster_attack_hooks_see_real_stats_and_keep_their_changes():
+    state = GameState()
+    state.current_map = _build_basic_map()
+    state.player.position = (4, 4)
+    state.player.stats.hp = 500
+    state.player.stats.max_hp = 500
+    state.player.stats.ac = 12
+    state.combat_snapshot = {"equipment": {"runtime": {"combat_bonuses": {"ac_bonus": 5}}}}
+    state.player.active_effects = [
+        StatusEffect(
+            name="受击硬化",
+            runtime_type="trigger",
+            duration_turns=5,
+            triggers={"on": "on_damage_taken"},
+            hook_payloads={"on_damage_taken": {"stat_changes": {"ac": 1}}},
+        )
+    ]
+    monsters = [Monster(name=f"近战怪{i}", position=pos) for i, pos in enumerate([(5, 4), (3, 4)])]
+    state.monsters = monsters
+    intents = [{"monster": monster, "intent": "attack", "distance": 1} for monster in monsters]
+
+    game_engine._resolve_monster_attacks(state, intents)
+
+    # 装备 AC 加成只在攻击判定期间生效；钩子基于真实 AC 叠加，且不会在批次结束时被还原
+    assert state.player.stats.ac == 14
+
+
+def test_idempotency_store_evicts_in_order_and_survives_restart_via_sqlite(tmp_path):
+    from idempotency_store import IdempotencyStore
+
+    db_path = str(tmp_path / "idempotency.sqlite3")
+    scope = ("user-1", "game-1")
+    store = IdempotencyStore(ttl_seconds=60, max_entries_per_scope=2, sqlite_path=db_path)
+    result = {"success": True, "events": ["命中"]}
+    store.put(scope, "attack:k1", result, fingerprint="fp-1")
+    result["events"].append("后续修改不应影响已存记录")
+    store.put(scope, "attack:k2", {"success": True}, fingerprint="fp-2")
+    store.put(scope, "attack:k3", {"success": True}, fingerprint="fp-3")
+
+    assert store.get_stats()["entries"] == 2
+    assert store.get_stats()["evictions"] == 1
+    store.close()
+
+    # 新进程/新 worker：内存为空，但可从 SQLite 取回
+    restarted = IdempotencyStore(ttl_seconds=60, max_entries_per_scope=2, sqlite_path=db_path)
+    record = restarted.get(scope, "attack:k1")
+    assert record is not None and record.fingerprint == "fp-1"
+    replay = record.load_result()
+    assert replay == {"success": True, "events": ["命中"]}
+    replay["events"].clear()
+    assert restarted.get(scope, "attack:k1").load_result()["events"] == ["命中"]
+    assert restarted.get_stats()["db_hits"] == 1
+    restarted.close()
+
+
+
+
+def test_idempotency_store_expires_sqlite_backfilled_records_and_clear_removes_rows(tmp_path, monkeypatch):
+    import idempotency_store
+    from idempotency_store import IdempotencyStore
+
+    now = [1000.0]
+    monkeypatch.setattr(idempotency_store.time, "time", lambda: now[0])
+    db_path = str(tmp_path / "idempotency.sqlite3")
+    scope = ("user-1", "game-ttl")
+    writer = IdempotencyStore(ttl_seconds=60, sqlite_path=db_path)
+    writer.put(scope, "attack:old", {"success": True})
+    writer.close()
+
+    reader = IdempotencyStore(ttl_seconds=60, sqlite_path=db_path)
+    now[0] = 1050.0
+    reader.put(scope, "attack:new", {"success": True})
+    now[0] = 1055.0
+    assert reader.get(scope, "attack:old") is not None
+    # 回填的旧记录排在新记录之前，过期后不得继续重放
+    now[0] = 1065.0
+    assert reader.get(scope, "attack:old") is None
+    assert reader.get(scope, "attack:new") is not None
+
+    reader.clear(scope)
+    reader.close()
+    restarted = IdempotencyStore(ttl_seconds=60, sqlite_path=db_path)
+    assert restarted.get(scope, "attack:new") is None
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_idempotency_store_async_api_runs_sqlite_off_loop_and_close_game_clears_scope(tmp_path, monkeypatch):
+    import threading
+    from idempotency_store import IdempotencyStore
+
+    db_path = str(tmp_path / "idempotency.sqlite3")
+    scope = ("user-1", "game-async")
+    writer = IdempotencyStore(ttl_seconds=60, sqlite_path=db_path)
+    await writer.aput(scope, "attack:k1", {"success": True}, fingerprint="fp-1")
+    writer.close()
+
+    reader = IdempotencyStore(ttl_seconds=60, sqlite_path=db_path)
+    loop_thread = threading.get_ident()
+    db_threads = []
+    original_db_get = reader._db_get
+
+    def _recording_db_get(*args):
+        db_threads.append(threading.get_ident())
+        return original_db_get(*args)
+
+    monkeypatch.setattr(reader, "_db_get", _recording_db_get)
+    record = await reader.aget(scope, "attack:k1")
+    assert record is not None and record.fingerprint == "fp-1"
+    assert db_threads and loop_thread not in db_threads
+    # 回填内存后再次命中不再访问 SQLite
+    assert await reader.aget(scope, "attack:k1") is not None
+    assert len(db_threads) == 1
+    reader.close()
+
+    game_engine.idempotency_store.put(scope, "attack:k1", {"success": True})
+    await game_engine.close_game(*scope)
+    assert game_engine.idempotency_store.get(scope, "attack:k1") is None
+
+
+def test_patch_journal_full_rollback_restores_only_touched_state():
+    game_state = GameState()
+    game_state.current_map = _build_basic_map(width=20, height=20, depth=1)
+    keeper = Monster(name="守卫")
+    keeper.position = (5, 5)
+    victim = Monster(name="哨兵")
+    victim.position = (6, 6)
+    game_state.monsters = [keeper, victim]
+    game_state.player.position = (2, 2)
+    game_state.current_map.rebuild_entity_index(game_state.player, game_state.monsters)
+    untouched_tile = game_state.current_map.tiles[(10, 10)]
+
+    result = game_state_modifier.apply_patch_batch(
+        game_state,
+        {
+            "patches": [
+                {"id": "m-add", "op": "add", "target": "monster", "tile": "3,3", "risk_level": "low",
+                 "payload": {"name": "新怪", "stats": {"hp": 5, "max_hp": 5}}},
+                {"id": "e-add", "op": "update", "target": "event", "tile": "4,4", "risk_level": "low",
+                 "payload": {"event_type": "story", "event_data": {"id": "e1"}}},
+                {"id": "m-rename", "op": "update", "target": "monster", "tile": "5,5", "risk_level": "low",
+                 "payload": {"name": "改名守卫", "stats": {"max_hp": 1}}},
+                {"id": "m-remove", "op": "remove", "target": "monster", "tile": "6,6", "risk_level": "low"},
+                {"id": "bind", "op": "add", "target": "quest_binding", "risk_level": "low",
+                 "payload": {"quest_monster_id": "qm-1"}},
+                {"id": "conflict", "op": "update", "target": "event", "tile": "3,3", "risk_level": "low",
+                 "payload": {"event_type": "story", "event_data": {"id": "e2"}}},
+            ],
+            "rollback_mode": "full",
+        },
+        source="test",
+    )
+
+    assert len(result.accepted_patches) == 6
+    assert result.success is False
+    assert result.rollback_applied is True
+
+    game_map = game_state.current_map
+    assert [m.id for m in game_state.monsters] == [keeper.id, victim.id]
+    assert keeper.name == "守卫"
+    assert keeper.stats.max_hp != 1
+    assert game_map.get_entity_at(6, 6) == victim.id
+    assert game_map.get_entity_at(3, 3) is None
+    assert game_map.tiles[(3, 3)].has_event is False
+    assert game_map.tiles[(4, 4)].has_event is False
+    assert "quest_bindings" not in game_state.generation_metrics
+    assert game_state.generation_metrics["last_patch_batch_id"]
+    assert game_map.tiles[(10, 10)] is untouched_tile
+    assert game_map.check_entity_index(game_state.player, game_state.monsters) == []
+
+
+def test_patch_journal_rollback_restores_quests_and_pending_events():
+    from patch_journal import PatchJournal
+
+    game_state = GameState()
+    game_state.current_map = _build_basic_map(width=12, height=12, depth=1)
+    quest = _build_active_quest()
+    idle_quest = _build_active_quest()
+    idle_quest.is_active = False
+    game_state.quests = [quest, idle_quest]
+    game_state.pending_events = ["旧事件"]
+    original_progress = quest.progress_percentage
+
+    journal = PatchJournal(game_state, label="quest-patch")
+    journal.touch_pending_events()
+    game_state_modifier._patch_journal = journal
+    try:
+        result = game_state_modifier.apply_quest_updates(
+            game_state,
+            {idle_quest.id: {"is_active": True, "progress_percentage": 42.0}},
+            source="test",
+        )
+        game_state.pending_events.append("补丁事件")
+    finally:
+        game_state_modifier._patch_journal = None
+
+    assert result.success is True
+    assert idle_quest.is_active is True and quest.is_active is False
+
+    journal.rollback()
+
+    assert game_state.quests == [quest, idle_quest]
+    assert quest.is_active is True
+    assert quest.progress_percentage == original_progress
+    assert idle_quest.is_active is False
+    assert idle_quest.progress_percentage != 42.0
+    assert game_state.pending_events == ["旧事件"]
+    assert journal.size == 0
+
+
+def test_connectivity_index_incremental_updates_match_full_rebuild():
+    from map_analysis import MapConnectivityIndex
+
+    rng = random.Random(7)
+    game_map = _build_basic_map(width=16, height=16, depth=1)
+    index = game_map.get_connectivity_index()
+    assert index.is_connected() and index.stats["full_rebuilds"] == 1
+
+    for _ in range(120):
+        x, y = rng.randint(1, 14), rng.randint(1, 14)
+        tile = game_map.tiles[(x, y)]
+        tile.terrain = TerrainType.WALL if tile.terrain == TerrainType.FLOOR else TerrainType.FLOOR
+        game_map.mark_tiles_changed([(x, y)])
+        incremental = game_map.get_connectivity_index()
+
+        fresh = MapConnectivityIndex(game_map)
+        fresh.refresh()
+        assert incremental.component_count == fresh.component_count
+        assert incremental.walkable_count == fresh.walkable_count
+
+    assert index.stats["full_rebuilds"] == 1
+    assert index.stats["incremental_updates"] == 120
+
+
+
+def test_mandatory_reachable_measures_from_up_stairs_then_main_component():
+    game_state = GameState()
+    game_map = _build_basic_map(width=12, height=12, depth=2)
+    game_state.current_map = game_map
+    # x=4 的墙把地图分成左侧小区域与右侧主区域；上行楼梯放在右侧，瓦片字典中首个可行走瓦片 (1,1) 在左侧
+    for y in range(1, 11):
+        game_map.tiles[(4, y)].terrain = TerrainType.WALL
+    game_map.tiles[(1, 1)].terrain = TerrainType.FLOOR
+    game_map.tiles[(9, 1)].terrain = TerrainType.STAIRS_UP
+    event_tile = game_map.tiles[(8, 8)]
+    event_tile.has_event = True
+    event_tile.event_data = {"is_mandatory": True}
+    game_map.mark_tiles_changed()
+
+    assert game_state_modifier._check_mandatory_reachable(game_state) is True
+
+    event_tile.has_event = False
+    event_tile.event_data = {}
+    pocket_tile = game_map.tiles[(2, 2)]
+    pocket_tile.has_event = True
+    pocket_tile.event_data = {"is_mandatory": True}
+    game_map.mark_tiles_changed([(8, 8), (2, 2)])
+    assert game_state_modifier._check_mandatory_reachable(game_state) is False
+
+    # 没有上行楼梯时以最大连通分量（右侧）为起点
+    game_map.tiles[(9, 1)].terrain = TerrainType.FLOOR
+    game_map.mark_tiles_changed([(9, 1)])
+    assert game_state_modifier._check_mandatory_reachable(game_state) is False
+    pocket_tile.has_event = False
+    event_tile.has_event = True
+    event_tile.event_data = {"is_mandatory": True}
+    game_map.mark_tiles_changed([(8, 8), (2, 2)])
+    assert game_state_modifier._check_mandatory_reachable(game_state) is True
+
+
+def test_connectivity_index_consistency_check_detects_unmarked_writes():
+    game_map = _build_basic_map(width=10, height=10, depth=2)
+    assert game_map.check_connectivity_index() == []
+
+    for y in range(1, 9):
+        game_map.tiles[(5, y)].terrain = TerrainType.WALL
+    issues = game_map.check_connectivity_index()
+    assert issues and any("components differ" in issue for issue in issues)
+
+    game_map.mark_tiles_changed([(5, y) for y in range(1, 9)])
+    assert game_map.check_connectivity_index() == []
+
+
+def test_patch_post_check_detects_wall_split_incrementally():
+    game_state = GameState()
+    game_state.current_map = _build_basic_map(width=12, height=12, depth=1)
+    game_state.current_map.tiles[(1, 1)].terrain = TerrainType.FLOOR
+    game_state.current_map.get_connectivity_index()
+
+    wall = {f"6,{y}": {"terrain": "wall"} for y in range(1, 11)}
+    result = game_state_modifier.apply_patch_batch(
+        game_state,
+        {
+            "patches": [
+                {"id": f"w{idx}", "op": "update", "target": "tile", "tile": key, "risk_level": "low", "payload": payload}
+                for idx, (key, payload) in enumerate(wall.items())
+            ],
+            "rollback_mode": "full",
+        },
+        source="test",
+    )
+
+    assert result.success is False
+    assert {"code": "PATCH_POST_CHECK_FAILED", "message": "connectivity"} in result.diagnostics
+    index = game_state.current_map.get_connectivity_index()
+    assert game_state.current_map.tiles[(6, 5)].terrain == TerrainType.FLOOR
+    assert index.is_connected()
+    assert index.stats["full_rebuilds"] == 1
+
+
+def test_local_map_grid_materializes_consistent_tiles():
+    from map_analysis import WALKABLE_TERRAINS
+
+    random.seed(11)
+    quest_context = {
+        "quest_type": "exploration",
+        "special_events": [{"id": "must-1", "name": "必经", "is_mandatory": True}],
+    }
+    game_map, hints = local_map_provider.generate_map(50, 50, 2, "normal", quest_context)
+
+    assert len(game_map.tiles) == 50 * 50
+    assert all(tile.x == x and tile.y == y for (x, y), tile in game_map.tiles.items())
+
+    report = game_map.generation_metadata["local_validation"]
+    walkable = [pos for pos, tile in game_map.tiles.items() if tile.terrain in WALKABLE_TERRAINS]
+    assert report["walkable_tiles"] == len(walkable)
+    assert report["stairs"]["stairs_up"] == sum(
+        1 for tile in game_map.tiles.values() if tile.terrain == TerrainType.STAIRS_UP
+    )
+    mandatory = [
+        pos for pos, tile in game_map.tiles.items()
+        if tile.has_event and tile.event_data.get("quest_event_id") == "must-1"
+    ]
+    assert len(mandatory) == 1 and game_map.tiles[mandatory[0]].event_data["is_mandatory"] is True
+    assert report["mandatory_events_placed"] == 1
+    for point in hints["spawn_points"]:
+        assert game_map.tiles[(point["x"], point["y"])].terrain in WALKABLE_TERRAINS
+
+
+def test_distance_field_is_cached_per_terrain_revision():
+    game_map = _build_basic_map(width=10, height=10, depth=2)
+
+    field = game_map.get_distance_field()
+    assert field.start == (1, 1)
+    assert field.path_length((8, 8)) == 14
+    assert game_map.get_distance_field() is field
+
+    for y in range(1, 9):
+        game_map.tiles[(5, y)].terrain = TerrainType.WALL
+    game_map.mark_tiles_changed([(5, y) for y in range(1, 9)])
+
+    rebuilt = game_map.get_distance_field()
+    assert rebuilt is not field
+    assert rebuilt.is_reachable((4, 4)) and not rebuilt.is_reachable((8, 8))
+    assert rebuilt.path_length((8, 8)) == -1
+
+    proof = content_generator._build_reachability_proof(game_map)
+    assert proof["start"] == [1, 1]
+    assert proof["targets"] == [
+        {"type": "stairs_down", "position": [8, 8], "reachable": False, "path_length": -1}
+    ]
+    assert proof["proof_ok"] is False
+    # 证明复用已缓存的距离场，不会自行推进修订号
+    assert game_map.get_distance_field() is rebuilt
+
+
+def test_neighbor_masks_match_tile_lookups_and_track_doors():
+    from map_grid import DOOR, NEIGHBORS4, NEIGHBORS8, WALKABLE_CODES, WALL, MapGrid
+
+    game_map, _ = local_map_provider.generate_map(24, 18, 1, "normal", seed=5)
+    grid = MapGrid.from_game_map(game_map)
+    masks = grid.neighbor_masks()
+
+    def expected(x, y):
+        walkable = wall = corridor = 0
+        for bit, (dx, dy) in enumerate(NEIGHBORS8):
+            tile = game_map.get_tile(x + dx, y + dy)
+            if tile is None:
+                continue
+            code = grid.get(x + dx, y + dy)
+            walkable |= (code in WALKABLE_CODES) << bit
+            wall |= (code == WALL) << bit
+            if (dx, dy) in NEIGHBORS4:
+                corridor |= (tile.room_type == "corridor") << bit
+        return walkable, wall, corridor
+
+    for x, y in [(0, 0), (23, 17), (0, 9), (12, 0)] + list(game_map.tiles)[::7]:
+        assert (
+            masks.at(masks.walkable, x, y),
+            masks.at(masks.wall, x, y),
+            masks.at(masks.corridor, x, y),
+        ) == expected(x, y)
+
+    x, y = next(pos for pos in game_map.tiles if grid.get(*pos) == WALL and 0 < pos[0] < 23 and 0 < pos[1] < 17)
+    masks.set_terrain(x, y, DOOR)
+    # (x, y) 位于 (x, y-1) 的 (0, 1) 方向，即第 0 位
+    assert masks.at(masks.walkable, x, y - 1) & 1
+    assert not masks.at(masks.wall, x, y - 1) & 1
+
+
+def test_room_spatial_index_matches_pairwise_overlap_and_finds_space():
+    from room_spatial_index import RoomSpatialIndex
+
+    def brute_overlap(a, b, margin=1):
+        return (
+            a["x"] - margin < b["x"] + b["width"] + margin
+            and a["x"] + a["width"] + margin > b["x"] - margin
+            and a["y"] - margin < b["y"] + b["height"] + margin
+            and a["y"] + a["height"] + margin > b["y"] - margin
+        )
+
+    rng = random.Random(3)
+    index = RoomSpatialIndex(120, 90, margin=1)
+    placed = []
+    for _ in range(400):
+        room = {"x": rng.randint(1, 110), "y": rng.randint(1, 80), "width": rng.randint(3, 8), "height": rng.randint(3, 8)}
+        expected = any(brute_overlap(room, other) for other in placed)
+        assert index.overlaps(room) is expected
+        assert index.is_free(room["x"], room["y"], room["width"], room["height"]) is not expected
+        if not expected:
+            placed.append(room)
+            index.add(room)
+    assert len(index) == len(placed) > 10
+
+    position = index.find_free_position(3, 3)
+    if position is not None:
+        candidate = {"x": position[0], "y": position[1], "width": 3, "height": 3}
+        assert not any(brute_overlap(candidate, other) for other in placed)
+
+    full = RoomSpatialIndex.from_rooms(10, 10, [{"x": 1, "y": 1, "width": 8, "height": 8}])
+    assert full.find_free_position(3, 3) is None
+
+
+def test_corridor_planner_builds_mst_with_configured_loops():
+    import itertools
+
+    from corridor_planner import plan_corridors, rasterize_segments, room_center
+
+    rng = random.Random(9)
+    rooms = [
+        {"x": rng.randint(0, 150), "y": rng.randint(0, 150), "width": rng.randint(3, 8), "height": rng.randint(3, 8)}
+        for _ in range(18)
+    ]
+    centers = [room_center(room) for room in rooms]
+
+    def length(edge):
+        (ax, ay), (bx, by) = centers[edge[0]], centers[edge[1]]
+        return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5
+
+    # 参照：完全图上的 Kruskal
+    parent = list(range(len(rooms)))
+
+    def find(x):
+        while parent[x] != x:
+            x = parent[x]
+        return x
+
+    expected = 0.0
+    for i, j in sorted(itertools.combinations(range(len(rooms)), 2), key=length):
+        if find(i) != find(j):
+            parent[find(i)] = find(j)
+            expected += length((i, j))
+
+    plan = plan_corridors(rooms, loop_ratio=0.2, rng=random.Random(1))
+    assert len(plan.tree_edges) == len(rooms) - 1
+    assert abs(sum(map(length, plan.tree_edges)) - expected) < 1e-6
+    assert len(plan.loop_edges) == round(0.2 * (len(rooms) - 1))
+    assert not set(plan.loop_edges) & set(plan.tree_edges)
+    assert plan_corridors(rooms, loop_ratio=0.0).loop_edges == []
+
+    assert rasterize_segments([(1, 1, 4, 1), (4, 1, 4, 3), (4, 3, 4, 1)]) == [
+        (1, 1), (2, 1), (3, 1), (4, 1), (4, 2), (4, 3)
+    ]
+
+    original_ratio = config.game.corridor_loop_ratio
+    try:
+        for ratio in (0.0, 0.5):
+            config.game.corridor_loop_ratio = ratio
+            game_map, _ = local_map_provider.generate_map(40, 40, 1, "normal", seed=13)
+            report = game_map.generation_metadata["local_validation"]
+            assert report["connectivity_ok"] is True
+            assert report["unreachable_targets_before"] == 0
+    finally:
+        config.game.corridor_loop_ratio = original_ratio
+
+
+@pytest.mark.asyncio
+async def test_map_pool_serves_personalized_maps_and_persists(monkeypatch, tmp_path):
+    from map_pool import MapPool
+
+    monkeypatch.setattr(config.game, "map_pool_enabled", True)
+    monkeypatch.setattr(config.game, "map_pool_size", 2)
+    monkeypatch.setattr(config.game, "map_pool_max_depth", 1)
+
+    def _quest(event_id: str, description: str) -> Dict[str, Any]:
+        return {
+            "quest_type": "exploration",
+            "description": description,
+            "special_events": [
+                {"id": event_id, "name": f"事件{event_id}", "event_type": "story", "is_mandatory": True, "floor_number": 1}
+            ],
+        }
+
+    pool = MapPool(pool_dir=str(tmp_path))
+    assert pool.take(20, 20, 1, "normal", _quest("first", "首个任务")) is None
+    assert pool.stats["misses"] == 1
+
+    key = pool.spec_key(pool.build_spec(20, 20, 1, "normal", _quest("other", "其它任务")))
+    await pool._refilling[key]
+    assert pool.get_stats()["ready_maps"] == 2
+
+    taken = pool.take(20, 20, 1, "normal", _quest("real-event", "真实任务描述"))
+    assert taken is not None
+    game_map, hints = taken
+    assert pool.stats["hits"] == 1
+    assert "真实任务描述" in game_map.description
+    event_ids = [tile.event_data.get("quest_event_id") for tile in game_map.tiles.values() if tile.has_event]
+    assert "real-event" in event_ids
+    assert not any(str(eid).startswith("__pool_event_") for eid in event_ids)
+    assert hints.get("spawn_points")
+    await pool._refilling[key]
+
+    restored = MapPool(pool_dir=str(tmp_path))
+    assert restored.load_from_disk() == 2
+    assert restored.take(20, 20, 1, "normal", _quest("again", "再次")) is not None
+    await restored._refilling[key]
+    assert pool.take(20, 20, 2, "normal", _quest("deep", "深层")) is None
+
+
+def test_local_map_seed_reproducible_and_cached():
+    from map_cache import map_cache
+
+    map_cache.clear()
+    quest_context = {
+        "quest_type": "exploration",
+        "special_events": [{"id": "seed-ev", "name": "种子", "is_mandatory": True}],
+    }
+
+    def _terrain(game_map: GameMap):
+        return {pos: tile.terrain for pos, tile in game_map.tiles.items()}
+
+    random.seed(1)
+    unseeded, _ = local_map_provider.generate_map(24, 24, 1, "normal", quest_context)
+    seed = unseeded.generation_metadata["seed"]
+    assert "map_cache" not in unseeded.generation_metadata
+
+    first, first_hints = local_map_provider.generate_map(24, 24, 1, "normal", quest_context, seed=seed)
+    assert _terrain(first) == _terrain(unseeded)
+    assert first.generation_metadata["map_cache"]["hit"] is False
+
+    stores = map_cache.stats["stores"]
+    second, second_hints = local_map_provider.generate_map(24, 24, 1, "normal", quest_context, seed=seed)
+    assert second.generation_metadata["map_cache"]["hit"] is True
+    assert map_cache.stats["stores"] == stores
+    assert second.id != first.id
+    assert _terrain(second) == _terrain(first)
+    assert second_hints == first_hints
+
+    other, _ = local_map_provider.generate_map(24, 24, 1, "normal", quest_context, seed=seed + 1)
+    assert other.generation_metadata["map_cache"]["hit"] is False
+
+
+@pytest.mark.asyncio
+async def test_blueprint_map_seed_and_blueprint_reproduce_without_llm(monkeypatch):
+    from map_cache import map_cache
+
+    map_cache.clear()
+    calls = {"info": 0, "blueprint": 0}
+    blueprint = {
+        "room_nodes": [
+            {"id": "entry", "role": "entrance", "size": "small"},
+            {"id": "hall", "role": "normal", "size": "medium"},
+            {"id": "vault", "role": "treasure", "size": "small"},
+            {"id": "exit", "role": "exit", "size": "small"},
+        ],
+        "corridor_edges": [
+            {"from": "entry", "to": "hall"},
+            {"from": "hall", "to": "vault"},
+            {"from": "hall", "to": "exit"},
+        ],
+    }
+
+    async def _fake_llm_json(_prompt: str, schema=None):
+        if schema is not None:
+            calls["blueprint"] += 1
+            return blueprint
+        calls["info"] += 1
+        return {"name": "种子地牢", "description": "可复现", "floor_theme": "cave"}
+
+    monkeypatch.setattr(llm_service, "_async_generate_json", _fake_llm_json)
+    quest_context = {"quest_type": "exploration", "description": "seeded"}
+
+    def _terrain(game_map: GameMap):
+        return {pos: tile.terrain for pos, tile in game_map.tiles.items()}
+
+    first = await content_generator.generate_dungeon_map(24, 24, 1, "cave", quest_context, seed=42)
+    assert first.generation_metadata["blueprint_used"] is True
+    assert first.generation_metadata["reproduction_bundle"]["seed"] == 42
+    assert calls == {"info": 1, "blueprint": 1}
+
+    cached = await content_generator.generate_dungeon_map(24, 24, 1, "cave", quest_context, seed=42)
+    assert calls == {"info": 1, "blueprint": 1}
+    assert cached.generation_metadata["map_cache"]["hit"] is True
+    assert _terrain(cached) == _terrain(first)
+
+    replayed = await content_generator.generate_dungeon_map(
+        24, 24, 1, "cave", quest_context, seed=42, blueprint=first.generation_metadata["blueprint"]
+    )
+    assert calls == {"info": 2, "blueprint": 1}
+    assert replayed.generation_metadata["map_cache"]["hit"] is False
+    assert _terrain(replayed) == _terrain(first)
+
+
+@pytest.mark.asyncio
+async def test_hedged_map_generation_records_win_rates(monkeypatch):
+    blueprint = {
+        "room_nodes": [
+            {"id": "entry", "role": "entrance", "size": "small"},
+            {"id": "hall", "role": "normal", "size": "medium"},
+            {"id": "exit", "role": "exit", "size": "small"},
+        ],
+        "corridor_edges": [{"from": "entry", "to": "hall"}, {"from": "hall", "to": "exit"}],
+    }
+    state = {"blueprint_calls": 0, "info_delay": 0.0}
+
+    async def _fake_llm_json(_prompt: str, schema=None):
+        if schema is not None:
+            state["blueprint_calls"] += 1
+            # 第一个蓝图请求卡在长尾上，对冲请求立即返回
+            if state["blueprint_calls"] == 1:
+                await asyncio.sleep(5)
+            return blueprint
+        await asyncio.sleep(state["info_delay"])
+        return {"name": "对冲地牢", "description": "先到先得"}
+
+    monkeypatch.setattr(llm_service, "_async_generate_json", _fake_llm_json)
+    monkeypatch.setattr(config.game, "map_generation_provider", "llm")
+    monkeypatch.setattr(config.game, "map_generation_release_stage", "stable")
+    monkeypatch.setattr(config.game, "map_generation_force_legacy_chain", False)
+    monkeypatch.setattr(config.game, "map_blueprint_hedge_delay", 0.02)
+    monkeypatch.setattr(config.game, "map_local_hedge_delay", 0.0)
+
+    game_state = GameState()
+    llm_map = await game_engine._generate_map_with_provider(20, 20, 1, "normal", None, "test", game_state=game_state)
+    assert llm_map.generation_metadata["map_provider"] == "llm"
+    assert llm_map.generation_metadata["blueprint_used"] is True
+    assert llm_map.generation_metadata["blueprint_hedge"]["winner"] == "hedge"
+    assert state["blueprint_calls"] == 2
+
+    # LLM 链路整体超时，本地提供器作为对冲方胜出
+    state["info_delay"] = 5
+    monkeypatch.setattr(config.game, "map_local_hedge_delay", 0.02)
+    local_map = await game_engine._generate_map_with_provider(20, 20, 1, "normal", None, "test", game_state=game_state)
+    assert local_map.generation_metadata["map_provider"] == "local"
+    assert local_map.generation_metadata["map_hedge"]["winner"] == "local"
+
+    hedge = game_state.generation_metrics["map_generation"]["hedge"]
+    assert hedge["blueprint"] == {"runs": 1, "hedged": 1, "hedge_wins": 1, "wins": {"hedge": 1}, "hedge_win_rate": 1.0}
+    assert hedge["map"]["hedge_wins"] == 1 and hedge["map"]["wins"] == {"local": 1}
+
+    from async_task_manager import async_task_manager
+
+    assert async_task_manager.get_hedge_stats()["map_generation"]["hedge_wins"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_map_generation_offloads_to_process_pool(monkeypatch):
+    from async_task_manager import async_task_manager
+    from map_cache import map_cache
+
+    blueprint = {
+        "room_nodes": [
+            {"id": "entry", "role": "entrance", "size": "small"},
+            {"id": "hall", "role": "normal", "size": "medium"},
+            {"id": "exit", "role": "exit", "size": "small"},
+        ],
+        "corridor_edges": [{"from": "entry", "to": "hall"}, {"from": "hall", "to": "exit"}],
+    }
+
+    async def _fake_llm_json(_prompt: str, schema=None):
+        return blueprint if schema is not None else {"name": "进程池", "description": "offload", "floor_theme": "cave"}
+
+    monkeypatch.setattr(llm_service, "_async_generate_json", _fake_llm_json)
+    quest_context = {"quest_type": "exploration", "special_events": [{"id": "pp-ev", "is_mandatory": True}]}
+
+    def _terrain(game_map: GameMap):
+        return {pos: (tile.terrain, tile.room_id, tile.event_type) for pos, tile in game_map.tiles.items()}
+
+    map_cache.clear()
+    inline_local, inline_hints = local_map_provider.generate_map(30, 30, 1, "cave", quest_context, seed=5)
+    inline_blueprint_map = await content_generator.generate_dungeon_map(24, 24, 1, "cave", quest_context, seed=9)
+    map_cache.clear()
+
+    async_task_manager.initialize()
+    async_task_manager.cpu_executor = async_task_manager._create_cpu_executor()
+    try:
+        assert async_task_manager.process_pool_enabled
+        pooled_local, pooled_hints = await local_map_provider.agenerate_map(30, 30, 1, "cave", quest_context, seed=5)
+        pooled_blueprint_map = await content_generator.generate_dungeon_map(24, 24, 1, "cave", quest_context, seed=9)
+    finally:
+        executor, async_task_manager.cpu_executor = async_task_manager.cpu_executor, None
+        executor.shutdown(wait=True)
+        map_cache.clear()
+
+    assert _terrain(pooled_local) == _terrain(inline_local)
+    assert pooled_hints == inline_hints
+    assert pooled_local.generation_metadata["local_validation"] == inline_local.generation_metadata["local_validation"]
+    assert pooled_blueprint_map.generation_metadata["blueprint_used"] is True
+    assert _terrain(pooled_blueprint_map) == _terrain(inline_blueprint_map)
+    assert pooled_blueprint_map.generation_metadata["reachability_proof"] == inline_blueprint_map.generation_metadata["reachability_proof"]
+    assert async_task_manager.get_cpu_stats()["completed"] >= 2
+
+
+@pytest.mark.asyncio
+async def test_cpu_bound_thread_fallback_does_not_use_io_executor():
+    import threading
+    from async_task_manager import async_task_manager
+
+    async_task_manager.initialize()
+    assert async_task_manager.cpu_executor is None
+    thread_name = await async_task_manager.run_cpu_bound(lambda: threading.current_thread().name)
+    assert thread_name.startswith("cpu_worker")
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_records_blocking():
+    import time as _time
+    from async_task_manager import AsyncTaskManager
+
+    manager = AsyncTaskManager()
+    manager.start_loop_lag_monitor(interval=0.01)
+    await asyncio.sleep(0.03)
+    _time.sleep(0.08)
+    await asyncio.sleep(0.03)
+    manager._loop_lag_task.cancel()
+
+    stats = manager.get_loop_lag_stats()
+    assert stats["samples"] >= 2
+    assert stats["max_ms"] >= 50
@@ -2,9 +2,20 @@ from fastapi import HTTPException, Request
 from fastapi.testclient import TestClient
 
 import asyncio
+import struct
+
+import pytest
 
 import main
+import tts_cache
 import tts_gateway
+import tts_pipeline
+
+
+@pytest.fixture(autouse=True)
+def _isolated_tts_cache(monkeypatch, tmp_path):
+    """每个用例使用独立的 TTS 缓存目录，避免用例间互相命中。"""
+    monkeypatch.setattr(main, "tts_cache", tts_cache.TTSCache(cache_dir=str(tmp_path / "tts_cache")))
 
 
 def test_tts_endpoint_disabled(monkeypatch):
@@ -38,7 +49,8 @@ def test_tts_endpoint_uses_default_voice_and_returns_audio(monkeypatch):
     """mimo provider 走 TTSGateway → MimoTTSProvider → OpenAIAPITool 链路。
 
     重构后 mock 点变为 `tts_gateway.OpenAIAPITool`（而非旧版 `main.OpenAIAPITool`），
-    其余断言（透传 model/voice/response_format/text）保持不变。
+    其余断言（透传 model/voice/response_format/text）保持不变。mimo 现已原生异步，
+    fake 同时提供 `amimo_text_to_speech_chat`。
     """
     captured = {}
 
@@ -50,6 +62,10 @@ def test_tts_endpoint_uses_default_voice_and_returns_audio(monkeypatch):
             captured["call"] = kwargs
             return b"RIFF-test-audio"
 
+        async def amimo_text_to_speech_chat(self, **kwargs):
+            # 端点经 asynthesize 走异步 HTTP 路径
+            return self.mimo_text_to_speech_chat(**kwargs)
+
     monkeypatch.setattr(main.config.tts, "enabled", True)
     monkeypatch.setattr(main.config.tts, "provider", "mimo_openai_compatible")
     monkeypatch.setattr(main.config.tts, "api_key", "test-key")
@@ -134,6 +150,545 @@ def test_tts_endpoint_uses_qwen_provider(monkeypatch):
     assert captured["call"]["response_format"] == "wav"
 
 
+def _install_counting_provider(monkeypatch, calls):
+    class CountingProvider(tts_gateway.TTSProviderBase):
+        name = "qwen_gradio"
+        supports_prefetch = True
+        required_config_fields = ("base_url",)
+        fixed_response_format = "wav"
+
+        def synthesize(self, text, voice=None, response_format="wav", style_hint=None):
+            calls.append(text)
+            return f"RIFF-{text}".encode("utf-8"), voice or "vivian"
+
+    monkeypatch.setattr(main.config.tts, "enabled", True)
+    monkeypatch.setattr(main.config.tts, "provider", "qwen_gradio")
+    monkeypatch.setattr(main.config.tts, "base_url", "https://qwen-qwen3-tts-demo.ms.show")
+    monkeypatch.setattr(main.config.tts, "default_voice", "vivian")
+    monkeypatch.setattr(main.config.tts, "max_text_chars", 800)
+    monkeypatch.setitem(tts_gateway.TTSGateway._registry, "qwen_gradio", CountingProvider)
+
+
+def test_tts_synthesize_reuses_content_addressed_cache_with_etag(monkeypatch):
+    calls = []
+    _install_counting_provider(monkeypatch, calls)
+    monkeypatch.setattr(main.config.tts, "cache_browser_max_age", 3600)
+
+    client = TestClient(main.app)
+    first = client.post("/api/tts/synthesize", json={"text": "地牢入口已经打开。", "category": "narrative"})
+    # 首尾/连续空白不影响缓存键
+    second = client.post("/api/tts/synthesize", json={"text": "  地牢入口已经打开。 ", "category": "narrative"})
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["X-TTS-Cache"] == "miss"
+    assert second.headers["X-TTS-Cache"] == "hit"
+    assert second.content == first.content
+    assert calls == ["地牢入口已经打开。"]
+
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert first.headers["Cache-Control"] == "private, max-age=3600"
+
+    revalidated = client.post(
+        "/api/tts/synthesize",
+        json={"text": "地牢入口已经打开。", "category": "narrative"},
+        headers={"If-None-Match": etag},
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+    audio_url = first.headers["Content-Location"]
+    fetched = client.get(audio_url)
+    assert fetched.status_code == 200
+    assert fetched.content == first.content
+    assert client.get(audio_url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/tts/audio/" + "0" * 64).status_code == 404
+
+    # 不同分类带来不同风格提示，必须是不同的缓存键
+    other = client.post("/api/tts/synthesize", json={"text": "地牢入口已经打开。", "category": "combat"})
+    assert other.headers["X-TTS-Cache"] == "miss"
+    assert len(calls) == 2
+
+    stats = main.tts_cache.get_stats()
+    assert stats["stores"] == 2
+    assert stats["hits"] >= 2
+    assert 0 < stats["hit_rate"] < 1
+
+
+def test_tts_cache_coalesces_concurrent_requests_and_evicts_disk_by_size(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.config.tts, "cache_enabled", True)
+    monkeypatch.setattr(main.config.tts, "cache_persist", True)
+    monkeypatch.setattr(main.config.tts, "cache_memory_max_bytes", 10)
+    monkeypatch.setattr(main.config.tts, "cache_disk_max_bytes", 25)
+    cache = tts_cache.TTSCache(cache_dir=str(tmp_path / "disk"))
+    calls = []
+
+    async def _run():
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return b"A" * 8, "v"
+
+        results = await asyncio.gather(*(cache.get_or_create("k1", factory, "wav") for _ in range(3)))
+        return [state for _, state in results]
+
+    states = asyncio.run(_run())
+    assert len(calls) == 1
+    assert sorted(states) == ["coalesced", "coalesced", "miss"]
+
+    cache.put("k2", b"B" * 8, "v", "wav")
+    cache.put("k3", b"C" * 8, "v", "wav")
+    cache.put("k4", b"D" * 8, "v", "wav")
+    stats = cache.get_stats()
+    assert stats["memory_bytes"] <= 10
+    assert stats["disk_bytes"] <= 25
+    assert stats["disk_evictions"] == 1
+    assert not (tmp_path / "disk" / "k1.bin").exists()
+
+    # 新实例从磁盘恢复，内存层按需回填
+    reloaded = tts_cache.TTSCache(cache_dir=str(tmp_path / "disk"))
+    entry = reloaded.get("k3")
+    assert entry is not None and entry.audio == b"C" * 8
+    assert entry.etag == tts_cache.make_etag(b"C" * 8)
+    assert reloaded.get("k1") is None
+    assert reloaded.get_stats()["disk_hits"] == 1
+
+
+def test_tts_cache_leader_cancellation_does_not_fail_coalesced_waiters(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.config.tts, "cache_enabled", True)
+    monkeypatch.setattr(main.config.tts, "cache_persist", False)
+    cache = tts_cache.TTSCache(cache_dir=str(tmp_path / "disk"))
+    calls = []
+
+    async def _run():
+        release = asyncio.Event()
+
+        async def factory():
+            calls.append(1)
+            await release.wait()
+            return b"A" * 8, "v"
+
+        leader = asyncio.create_task(cache.get_or_create("k1", factory, "wav"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_create("k1", factory, "wav"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        entry, state = await follower
+        return leader.cancelled(), entry.audio, state
+
+    leader_cancelled, audio, state = asyncio.run(_run())
+    assert leader_cancelled
+    assert audio == b"A" * 8 and state == "coalesced"
+    assert len(calls) == 1
+    assert cache.contains("k1")
+
+
+def _pcm_wav(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    return tts_pipeline.build_wav_header(fmt, len(pcm)) + pcm
+
+
+def test_tts_stream_yields_sentence_chunks_and_caches_stitched_wav(monkeypatch):
+    calls = []
+
+    class SentenceProvider(tts_gateway.TTSProviderBase):
+        name = "qwen_gradio"
+        required_config_fields = ("base_url",)
+        fixed_response_format = "wav"
+
+        def synthesize(self, text, voice=None, response_format="wav", style_hint=None):
+            calls.append(text)
+            return _pcm_wav(text.encode("utf-8")), "vivian"
+
+    monkeypatch.setattr(main.config.tts, "enabled", True)
+    monkeypatch.setattr(main.config.tts, "provider", "qwen_gradio")
+    monkeypatch.setattr(main.config.tts, "base_url", "https://qwen-qwen3-tts-demo.ms.show")
+    monkeypatch.setattr(main.config.tts, "max_text_chars", 800)
+    monkeypatch.setattr(main.config.tts, "segment_min_chars", 20)
+    monkeypatch.setitem(tts_gateway.TTSGateway._registry, "qwen_gradio", SentenceProvider)
+
+    text = "石门缓缓开启，尘土簌簌落下。火把的光照亮了前方的回廊！远处似乎有什么东西在低语？"
+    client = TestClient(main.app)
+    response = client.get("/api/tts/stream", params={"text": text})
+
+    assert response.status_code == 200
+    assert response.headers["X-TTS-Cache"] == "stream"
+    assert "X-TTS-First-Chunk-Ms" in response.headers
+    assert len(calls) == 3
+    fmt, pcm = tts_pipeline.parse_wav(response.content)
+    assert pcm == text.encode("utf-8")
+    # 流式头部长度为占位值，缓存中的完整文件按实际长度重写
+    assert struct.unpack_from("<I", response.content, 40)[0] == 0xFFFFFFFF
+
+    cached = client.post("/api/tts/synthesize", json={"text": text, "stream": True})
+    assert cached.headers["X-TTS-Cache"] == "hit"
+    assert len(calls) == 3
+    assert struct.unpack_from("<I", cached.content, 40)[0] == len(text.encode("utf-8"))
+    assert tts_pipeline.parse_wav(cached.content) == (fmt, pcm)
+
+
+def test_tts_stitcher_rejects_mismatched_wav_format_and_falls_back_to_whole_text(monkeypatch):
+    stitcher = tts_pipeline.AudioStitcher("wav")
+    stitcher.feed(_pcm_wav(b"aa"))
+    with pytest.raises(tts_pipeline.AudioFormatMismatch):
+        stitcher.feed(_pcm_wav(b"bb", sample_rate=24000))
+
+    calls = []
+
+    class MixedRateProvider(tts_gateway.TTSProviderBase):
+        name = "qwen_gradio"
+        required_config_fields = ("base_url",)
+        fixed_response_format = "wav"
+
+        def synthesize(self, text, voice=None, response_format="wav", style_hint=None):
+            calls.append(text)
+            # 第二句换了采样率，逐段拼接会得到错误的 PCM
+            sample_rate = 24000 if text.startswith("第二") else 16000
+            return _pcm_wav(text.encode("utf-8"), sample_rate=sample_rate), "vivian"
+
+    monkeypatch.setattr(main.config.tts, "enabled", True)
+    monkeypatch.setattr(main.config.tts, "provider", "qwen_gradio")
+    monkeypatch.setattr(main.config.tts, "base_url", "https://qwen-qwen3-tts-demo.ms.show")
+    monkeypatch.setattr(main.config.tts, "max_text_chars", 800)
+    monkeypatch.setattr(main.config.tts, "segment_min_chars", 20)
+    monkeypatch.setitem(tts_gateway.TTSGateway._registry, "qwen_gradio", MixedRateProvider)
+
+    sentences = ["第一句旁白在这里展开。", "第二句描述回廊的尽头。", "第三句提到了古老的符文。"]
+    text = "".join(sentences)
+    client = TestClient(main.app)
+    response = client.post("/api/tts/synthesize", json={"text": text})
+
+    assert response.status_code == 200
+    assert calls[-1] == text
+    assert sorted(calls[:-1]) == sorted(sentences)
+    fmt, pcm = tts_pipeline.parse_wav(response.content)
+    assert pcm == text.encode("utf-8")
+    assert struct.unpack_from("<I", fmt, 4)[0] == 16000
+
+
+def test_tts_pipeline_synthesizes_segments_in_parallel_with_bounded_concurrency(monkeypatch):
+    import threading
+    import time
+
+    state = {"active": 0, "peak": 0, "calls": []}
+    lock = threading.Lock()
+
+    class SlowProvider(tts_gateway.TTSProviderBase):
+        name = "qwen_gradio"
+        required_config_fields = ("base_url",)
+        fixed_response_format = "wav"
+
+        def synthesize(self, text, voice=None, response_format="wav", style_hint=None):
+            with lock:
+                state["calls"].append(text)
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            # 越靠前的分段越慢，验证拼接顺序不受完成顺序影响
+            time.sleep(0.05 if text.startswith("第一") else 0.01)
+            with lock:
+                state["active"] -= 1
+            return _pcm_wav(text.encode("utf-8")), "vivian"
+
+    monkeypatch.setattr(main.config.tts, "enabled", True)
+    monkeypatch.setattr(main.config.tts, "provider", "qwen_gradio")
+    monkeypatch.setattr(main.config.tts, "base_url", "https://qwen-qwen3-tts-demo.ms.show")
+    monkeypatch.setattr(main.config.tts, "max_text_chars", 800)
+    monkeypatch.setattr(main.config.tts, "segment_min_chars", 20)
+    monkeypatch.setattr(main.config.tts, "segment_max_concurrency", 2)
+    monkeypatch.setitem(tts_gateway.TTSGateway._registry, "qwen_gradio", SlowProvider)
+    monkeypatch.setattr(main, "_tts_provider_semaphores", {})
+
+    sentences = ["第一句旁白在这里展开。", "第二句描述回廊的尽头。", "第三句提到了古老的符文。", "第四句是守卫的低语声。"]
+    text = "".join(sentences)
+    client = TestClient(main.app)
+    response = client.post("/api/tts/synthesize", json={"text": text})
+
+    assert response.status_code == 200
+    assert sorted(state["calls"]) == sorted(sentences)
+    assert state["peak"] == 2
+    fmt, pcm = tts_pipeline.parse_wav(response.content)
+    assert pcm == text.encode("utf-8")
+
+    # 分段独立缓存：另一段长文本复用了其中两句，只需合成新句
+    state["calls"].clear()
+    reuse = client.post("/api/tts/synthesize", json={"text": sentences[1] + sentences[3] + "第五句是新出现的内容。"})
+    assert reuse.status_code == 200
+    assert state["calls"] == ["第五句是新出现的内容。"]
+
+
+def test_qwen_provider_reuses_pooled_clients_and_reconnects(monkeypatch, tmp_path):
+    import qwen_tts_adapter
+
+    created = []
+
+    class FakeEndpoint:
+        parameters_info = [
+            {"parameter_name": "voice_display", "type": {"enum": ["Vivian / 十三", "Cherry / 樱桃"]}},
+            {"parameter_name": "language_display", "type": {"enum": ["Auto / 自动"]}},
+        ]
+
+    class FakeClient:
+        def __init__(self):
+            self.endpoints = {"tts": FakeEndpoint()}
+            self.closed = False
+            self.fail_next = False
+            created.append(self)
+
+        def predict(self, **kwargs):
+            if self.fail_next:
+                raise ConnectionError("stale connection")
+            path = tmp_path / f"out-{len(created)}-{kwargs['text']}.wav"
+            path.write_bytes(b"RIFF-" + kwargs["text"].encode("utf-8"))
+            return str(path)
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(main.config.tts, "base_url", "https://pool-test.example")
+    monkeypatch.setattr(main.config.tts, "qwen_pool_size", 1)
+    monkeypatch.setattr(main.config.tts, "qwen_pool_max_idle_seconds", 300.0)
+    monkeypatch.setattr(qwen_tts_adapter.QwenGradioTTSProvider, "_create_client", lambda self: FakeClient())
+    monkeypatch.setattr(qwen_tts_adapter.QwenGradioTTSProvider, "_catalog_cache", {})
+    qwen_tts_adapter.QwenGradioTTSProvider.close_client_pools()
+
+    try:
+        # 每次请求都会新建 provider 实例，client 池按 upstream URL 跨实例共享
+        for text in ("一", "二", "三"):
+            provider = qwen_tts_adapter.QwenGradioTTSProvider(runtime_config=main.config)
+            audio, voice = provider.synthesize(text)
+            assert audio == b"RIFF-" + text.encode("utf-8")
+            assert voice == "vivian"
+        # 枚举抓取与三次合成共用同一个热 client
+        assert len(created) == 1
+        stats = qwen_tts_adapter.QwenGradioTTSProvider.get_pool_stats()["https://pool-test.example"]
+        assert stats["created"] == 1 and stats["reused"] == 3 and stats["idle"] == 1
+
+        # 热 client 断线：作废后换新 client 重试一次
+        created[0].fail_next = True
+        provider = qwen_tts_adapter.QwenGradioTTSProvider(runtime_config=main.config)
+        audio, _ = provider.synthesize("四")
+        assert audio == b"RIFF-" + "四".encode("utf-8")
+        assert len(created) == 2 and created[0].closed
+        stats = qwen_tts_adapter.QwenGradioTTSProvider.get_pool_stats()["https://pool-test.example"]
+        assert stats["discarded"] == 1 and stats["total"] == 1
+    finally:
+        qwen_tts_adapter.QwenGradioTTSProvider.close_client_pools()
+
+
+def test_mimo_provider_synthesizes_over_async_http(monkeypatch, httpx_mock):
+    import base64
+    import json
+    import threading
+
+    monkeypatch.setattr(main.config.tts, "api_key", "test-key")
+    monkeypatch.setattr(main.config.tts, "base_url", "https://mimo.example/v1")
+    monkeypatch.setattr(main.config.tts, "model_name", "mimo-v2.5-tts")
+    monkeypatch.setattr(main.config.tts, "default_voice", "mimo_default")
+    monkeypatch.setattr(main.config.llm, "use_proxy", False)
+    httpx_mock.add_response(
+        url="https://mimo.example/v1/chat/completions",
+        json={"choices": [{"message": {"audio": {"data": base64.b64encode(b"RIFF-async").decode("ascii")}}}]},
+    )
+
+    provider = tts_gateway.MimoTTSProvider(runtime_config=main.config)
+    assert provider.is_async_native()
+    assert provider.get_max_concurrency(main.config) == 8
+
+    threads_before = threading.active_count()
+    audio, voice = asyncio.run(provider.asynthesize("门后传来脚步声。", style_hint="低语"))
+
+    assert audio == b"RIFF-async"
+    assert voice == "mimo_default"
+    assert threading.active_count() == threads_before
+    payload = json.loads(httpx_mock.get_request().content)
+    assert payload["model"] == "mimo-v2.5-tts"
+    assert payload["audio"] == {"format": "wav", "voice": "mimo_default"}
+    assert payload["messages"][-1] == {"role": "assistant", "content": "门后传来脚步声。"}
+
+
+def test_sync_tts_provider_runs_on_dedicated_bounded_executor(monkeypatch):
+    import threading
+    import time
+
+    seen = {"threads": set(), "active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class SyncOnlyProvider(tts_gateway.TTSProviderBase):
+        name = "sync_only_test"
+        default_max_concurrency = 2
+
+        def synthesize(self, text, voice=None, response_format="wav", style_hint=None):
+            with lock:
+                seen["threads"].add(threading.current_thread().name)
+                seen["active"] += 1
+                seen["peak"] = max(seen["peak"], seen["active"])
+            time.sleep(0.02)
+            with lock:
+                seen["active"] -= 1
+            return text.encode("utf-8"), "v"
+
+    monkeypatch.setattr(main.config.tts, "max_concurrency", 0)
+    provider = SyncOnlyProvider()
+    assert not provider.is_async_native()
+
+    async def _run():
+        return await asyncio.gather(*(provider.asynthesize(f"段{i}") for i in range(6)))
+
+    try:
+        results = asyncio.run(_run())
+    finally:
+        tts_gateway.TTSProviderBase.shutdown_executors()
+
+    assert [audio for audio, _ in results] == [f"段{i}".encode("utf-8") for i in range(6)]
+    assert seen["peak"] <= 2
+    assert all(name.startswith("tts-sync_only_test") for name in seen["threads"])
+
+
+def test_tts_prefetch_warms_cache_for_narrative_events_and_choices(monkeypatch):
+    import tts_prefetch
+
+    calls = []
+    _install_counting_provider(monkeypatch, calls)
+    prefetcher = tts_prefetch.TTSPrefetcher()
+    monkeypatch.setattr(main, "tts_prefetcher", prefetcher)
+    monkeypatch.setattr(main.config.tts, "prefetch_enabled", True)
+    monkeypatch.setattr(main.config.tts, "prefetch_max_concurrent", 4)
+    monkeypatch.setattr(main.config.tts, "prefetch_min_chars", 4)
+    for field_name in ("voice_whitelist_narrative", "voice_whitelist_event", "voice_whitelist_choice"):
+        monkeypatch.setattr(main.config.tts, field_name, True)
+
+    choice_context = {
+        "title": "神秘祭坛",
+        "description": "祭坛上的符文微微发光。",
+        "choices": [
+            {"text": "触摸符文", "description": "可能获得力量", "is_available": True},
+            {"text": "离开", "is_available": False},
+        ],
+    }
+    summary = tts_prefetch.build_choice_summary(choice_context)
+    assert summary == "神秘祭坛。祭坛上的符文微微发光。。可选行动：1. 触摸符文，可能获得力量"
+
+    result = {
+        "narrative": "你推开沉重的石门，冷风扑面而来。",
+        "events": ["✓ 你进入了第二层地下城", "短"],
+        "pending_choice_context": choice_context,
+    }
+
+    async def _prefetch():
+        scheduled = main._prefetch_tts_for_result(result, events_category="event")
+        # 同一结果再次到达时不会重复提交
+        assert main._prefetch_tts_for_result(result, events_category="event") == 0
+        await asyncio.gather(*[task for task in prefetcher._inflight.values()])
+        return scheduled
+
+    assert asyncio.run(_prefetch()) == 3
+    assert sorted(calls) == sorted([result["narrative"], "你进入了第二层地下城", summary])
+
+    client = TestClient(main.app)
+    response = client.post("/api/tts/synthesize", json={"text": result["narrative"], "category": "narrative"})
+    assert response.headers["X-TTS-Cache"] == "hit"
+    assert len(calls) == 3
+
+    stats = prefetcher.get_stats()
+    assert stats["completed"] == 3
+    assert stats["skipped_duplicate"] == 3
+    assert stats["hits"] == 1
+
+
+def test_tts_prefetch_drops_when_over_budget_or_llm_busy(monkeypatch):
+    import tts_prefetch
+
+    calls = []
+    _install_counting_provider(monkeypatch, calls)
+    prefetcher = tts_prefetch.TTSPrefetcher()
+    monkeypatch.setattr(main, "tts_prefetcher", prefetcher)
+    monkeypatch.setattr(main.config.tts, "prefetch_enabled", True)
+    monkeypatch.setattr(main.config.tts, "prefetch_max_concurrent", 1)
+    monkeypatch.setattr(main.config.tts, "prefetch_min_chars", 4)
+    monkeypatch.setattr(main.config.tts, "voice_whitelist_narrative", True)
+    monkeypatch.setattr(main.config.tts, "voice_whitelist_event", True)
+
+    result = {"narrative": "远处传来低沉的咆哮声。", "events": ["一只地精从阴影中窜出！"]}
+
+    async def _prefetch(busy: bool):
+        monkeypatch.setattr(main.async_task_manager, "llm_semaphore", asyncio.Semaphore(0 if busy else 1))
+        scheduled = main._prefetch_tts_for_result(result, events_category="event")
+        await asyncio.gather(*[task for task in prefetcher._inflight.values()])
+        return scheduled
+
+    assert asyncio.run(_prefetch(busy=True)) == 0
+    assert prefetcher.stats["dropped_llm_busy"] == 2
+
+    # 预算为 1：第二条在第一条完成前到达，被直接丢弃而不是排队
+    assert asyncio.run(_prefetch(busy=False)) == 1
+    assert prefetcher.stats["dropped_budget"] == 1
+    assert calls == [result["narrative"]]
+
+
+def test_tts_transcode_negotiates_accept_header():
+    import tts_transcode
+
+    targets = ["opus", "mp3"]
+    negotiate = tts_transcode.negotiate_format
+    assert negotiate(None, "wav", targets) is None
+    assert negotiate("*/*", "wav", targets) is None
+    assert negotiate("audio/ogg;codecs=opus, audio/mpeg;q=0.9, audio/wav;q=0.5", "wav", targets) == "opus"
+    assert negotiate("audio/mpeg, audio/ogg;q=0.4", "wav", targets) == "mp3"
+    # 同等 q 值时压缩格式优先；客户端更偏好 WAV 时保持源格式
+    assert negotiate("audio/wav, audio/mpeg", "wav", targets) == "mp3"
+    assert negotiate("audio/wav, audio/ogg;q=0.3", "wav", targets) is None
+    assert negotiate("audio/ogg;q=0", "wav", targets) is None
+    # 不对有损源二次转码，未启用的目标格式不参与协商
+    assert negotiate("audio/ogg", "mp3", targets) is None
+    assert negotiate("audio/ogg", "wav", ["mp3"]) is None
+
+
+def test_tts_synthesize_transcodes_by_accept_and_caches_variant(monkeypatch):
+    calls = []
+    encoded = []
+    _install_counting_provider(monkeypatch, calls)
+    monkeypatch.setattr(main.config.tts, "transcode_enabled", True)
+    monkeypatch.setattr(main.config.tts, "transcode_formats", "opus,mp3")
+
+    async def _fake_transcode(audio, target):
+        encoded.append(target)
+        if target == "mp3":
+            raise RuntimeError("encoder exploded")
+        return b"OggS" + audio[:8]
+
+    monkeypatch.setattr(main.tts_transcoder, "encoder_path", lambda: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(main.tts_transcoder, "transcode", _fake_transcode)
+
+    client = TestClient(main.app)
+    body = {"text": "火把照亮了潮湿的石壁。", "category": "narrative"}
+    opus_accept = {"Accept": "audio/ogg;codecs=opus, audio/wav;q=0.5"}
+
+    plain = client.post("/api/tts/synthesize", json=body)
+    first = client.post("/api/tts/synthesize", json=body, headers=opus_accept)
+    second = client.post("/api/tts/synthesize", json=body, headers=opus_accept)
+
+    assert plain.headers["content-type"] == "audio/wav"
+    assert first.headers["content-type"] == "audio/ogg"
+    assert first.content == b"OggS" + plain.content[:8]
+    assert "Accept" in first.headers["Vary"]
+    assert first.headers["ETag"] != plain.headers["ETag"]
+    assert second.headers["X-TTS-Cache"] == "hit"
+    assert calls == [body["text"]]
+    assert encoded == ["opus"]
+
+    # 转码结果与源音频并存，可按各自的键直接取回
+    assert client.get(first.headers["Content-Location"]).content == first.content
+    assert client.get(plain.headers["Content-Location"]).content == plain.content
+
+    # 转码失败时回退到源音频
+    fallback = client.post("/api/tts/synthesize", json=body, headers={"Accept": "audio/mpeg"})
+    assert fallback.status_code == 200
+    assert fallback.headers["content-type"] == "audio/wav"
+    assert fallback.content == plain.content
+
+
 def test_tts_config_allows_qwen_blank_dedicated_env_vars(monkeypatch):
     """qwen_gradio 允许 API key / model / base_url 显式空串，不回填 mimo 默认值。"""
     import importlib
@@ -349,14 +349,10 @@ class TrapManager:
             new_pos = spawn_positions[0]
             
             # 更新玩家位置
-            old_tile = game_state.current_map.get_tile(*old_pos)
-            if old_tile:
-                old_tile.character_id = None
-            
             game_state.player.position = new_pos
+            game_state.current_map.place_entity(game_state.player.id, new_pos)
             new_tile = game_state.current_map.get_tile(*new_pos)
             if new_tile:
-                new_tile.character_id = game_state.player.id
                 new_tile.is_explored = True
                 new_tile.is_visible = True
             
@@ -0,0 +1,444 @@
+"""
+Labyrinthia AI - 内容寻址 TTS 缓存
+以 (provider, 模型, 音色, 风格提示, 输出格式, 规范化文本) 的哈希为键保存合成好的音频，
+同一段旁白/提示语重复朗读时直接复用，不再重复请求上游 TTS。
+
+内存层为按字节数约束的 LRU；可选落盘到 <cache_dir>/tts_cache（<key>.bin + <key>.json），
+磁盘层按总字节数淘汰最久未使用的条目。每个条目带基于音频内容的强 ETag，
+供 /api/tts/synthesize 与 /api/tts/audio/{key} 做浏览器侧缓存与 304 协商。
+并发的相同请求只会触发一次上游合成（single-flight）。
+转码后的音频（tts_transcode）以 make_tts_variant_key 派生的键与源音频并存。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_VERSION = 1
+
+
+def normalize_tts_text(text: str) -> str:
+    """去掉首尾空白并把连续空白折叠为单个空格"""
+    return " ".join(str(text or "").split())
+
+
+def make_tts_cache_key(
+    provider: str,
+    model: str,
+    voice: Optional[str],
+    style_hint: Optional[str],
+    response_format: str,
+    text: str,
+) -> str:
+    """由合成输入构造内容寻址键"""
+    raw = json.dumps(
+        {
+            "version": TTS_CACHE_VERSION,
+            "provider": str(provider or ""),
+            "model": str(model or ""),
+            "voice": str(voice or ""),
+            "style_hint": str(style_hint or ""),
+            "response_format": str(response_format or ""),
+            "text": normalize_tts_text(text),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_tts_variant_key(source_key: str, response_format: str) -> str:
+    """同一段源音频转码为其它格式后的缓存键（与源条目并存）"""
+    raw = f"{TTS_CACHE_VERSION}:{source_key}:{str(response_format or '').lower()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_etag(audio: bytes) -> str:
+    """基于音频内容的强 ETag（带引号）"""
+    return f'"{hashlib.sha256(audio).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中给定强 ETag（支持逗号分隔列表与 *）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+@dataclass
+class TTSCacheEntry:
+    """缓存条目：音频字节与元数据"""
+
+    key: str
+    audio: bytes
+    voice: str
+    response_format: str
+    etag: str
+
+    @property
+    def size(self) -> int:
+        return len(self.audio)
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "version": TTS_CACHE_VERSION,
+            "voice": self.voice,
+            "response_format": self.response_format,
+            "etag": self.etag,
+            "size": self.size,
+        }
+
+
+class _InflightSynthesis:
+    """进行中的合成任务及其等待者数量"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Tuple[TTSCacheEntry, str]]"):
+        self.task = task
+        self.waiters = 0
+
+
+class TTSCache:
+    """内容寻址 TTS 缓存（内存字节 LRU + 可选磁盘，按大小淘汰）"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self._cache_dir = cache_dir
+        self._entries: "OrderedDict[str, TTSCacheEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        # 磁盘索引：key -> 字节数，按最近使用排序；首次访问时扫描目录重建
+        self._disk_index: Optional["OrderedDict[str, int]"] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _InflightSynthesis] = {}
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(getattr(config.tts, "cache_enabled", True))
+
+    @property
+    def memory_max_bytes(self) -> int:
+        return max(0, int(getattr(config.tts, "cache_memory_max_bytes", 32 * 1024 * 1024) or 0))
+
+    @property
+    def disk_max_bytes(self) -> int:
+        return max(0, int(getattr(config.tts, "cache_disk_max_bytes", 256 * 1024 * 1024) or 0))
+
+    @property
+    def persist(self) -> bool:
+        return bool(getattr(config.tts, "cache_persist", True)) and self.disk_max_bytes > 0
+
+    @property
+    def cache_dir(self) -> Path:
+        return Path(self._cache_dir or os.path.join(config.data.cache_dir, "tts_cache"))
+
+    # ------------------------------------------------------------------ lookup
+
+    def get(self, key: str) -> Optional[TTSCacheEntry]:
+        """按键查找（内存 → 磁盘），命中磁盘时回填内存层"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+
+        if self.persist:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._store_memory_locked(entry)
+                return entry
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """判断键是否已缓存（不计入命中统计、不回填内存层）"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.persist and self._paths_for(key)[0].exists()
+
+    def put(self, key: str, audio: bytes, voice: str, response_format: str) -> TTSCacheEntry:
+        entry = TTSCacheEntry(
+            key=key,
+            audio=bytes(audio),
+            voice=str(voice or ""),
+            response_format=str(response_format or ""),
+            etag=make_etag(audio),
+        )
+        if not self.enabled or not entry.audio:
+            return entry
+        with self._lock:
+            self._store_memory_locked(entry)
+            self.stats["stores"] += 1
+        if self.persist:
+            self._write_disk(entry)
+        return entry
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Tuple[bytes, str]]],
+        response_format: str,
+    ) -> Tuple[TTSCacheEntry, str]:
+        """命中直接返回，否则调用 factory() 合成并写入缓存
+
+        返回 (条目, 状态)，状态为 hit / disk / coalesced / miss / bypass。
+        同一键的并发请求共享一次合成；factory 抛出的异常原样传给所有等待者。
+        """
+        if not self.enabled:
+            audio, voice = await factory()
+            return self.put(key, audio, voice, response_format), "bypass"
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry, "hit"
+
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight.task.get_loop() is loop:
+            with self._lock:
+                self.stats["coalesced"] += 1
+            entry, _ = await self._wait_inflight(key, inflight)
+            return entry, "coalesced"
+
+        # 合成在独立任务中进行，由所有等待者共享：发起请求被取消（客户端断开、预合成被丢弃）
+        # 不会连带取消其它等待者；只有最后一个等待者离开时才取消合成任务
+        inflight = _InflightSynthesis(loop.create_task(self._produce(key, factory, response_format)))
+        self._inflight[key] = inflight
+        return await self._wait_inflight(key, inflight)
+
+    async def _wait_inflight(self, key: str, inflight: "_InflightSynthesis") -> Tuple[TTSCacheEntry, str]:
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            if not inflight.task.done() and inflight.waiters == 1:
+                inflight.task.cancel()
+            raise
+        finally:
+            inflight.waiters -= 1
+
+    async def _produce(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Tuple[bytes, str]]],
+        response_format: str,
+    ) -> Tuple[TTSCacheEntry, str]:
+        try:
+            if self.persist:
+                entry = await asyncio.to_thread(self._read_disk, key)
+                if entry is not None:
+                    with self._lock:
+                        self.stats["disk_hits"] += 1
+                        self._store_memory_locked(entry)
+                    return entry, "disk"
+            with self._lock:
+                self.stats["misses"] += 1
+            audio, voice = await factory()
+            entry = await asyncio.to_thread(self.put, key, audio, voice, response_format)
+            return entry, "miss"
+        finally:
+            self._inflight.pop(key, None)
+
+    # ------------------------------------------------------------------ memory
+
+    def _store_memory_locked(self, entry: TTSCacheEntry) -> None:
+        limit = self.memory_max_bytes
+        if entry.size > limit:
+            return
+        previous = self._entries.pop(entry.key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.size
+        self._entries[entry.key] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > limit and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted.size
+            self.stats["evictions"] += 1
+
+    # ------------------------------------------------------------------ disk
+
+    def _paths_for(self, key: str) -> Tuple[Path, Path]:
+        return self.cache_dir / f"{key}.bin", self.cache_dir / f"{key}.json"
+
+    def _ensure_disk_index_locked(self) -> "OrderedDict[str, int]":
+        if self._disk_index is not None:
+            return self._disk_index
+        index: "OrderedDict[str, int]" = OrderedDict()
+        total = 0
+        try:
+            files = []
+            for path in self.cache_dir.glob("*.bin"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path.stem, stat.st_size))
+            for _, key, size in sorted(files):
+                index[key] = size
+                total += size
+        except OSError as exc:
+            logger.warning(f"Failed to scan TTS cache dir {self.cache_dir}: {exc}")
+        self._disk_index = index
+        self._disk_bytes = total
+        return index
+
+    def _read_disk(self, key: str) -> Optional[TTSCacheEntry]:
+        audio_path, meta_path = self._paths_for(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != TTS_CACHE_VERSION:
+                return None
+            with open(audio_path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Ignoring unreadable TTS cache entry {key}: {exc}")
+            return None
+
+        if not audio:
+            return None
+        try:
+            os.utime(audio_path)
+        except OSError:
+            pass
+        with self._lock:
+            index = self._ensure_disk_index_locked()
+            if key in index:
+                index.move_to_end(key)
+        return TTSCacheEntry(
+            key=key,
+            audio=audio,
+            voice=str(meta.get("voice") or ""),
+            response_format=str(meta.get("response_format") or ""),
+            etag=str(meta.get("etag") or make_etag(audio)),
+        )
+
+    def _write_disk(self, entry: TTSCacheEntry) -> None:
+        if entry.size > self.disk_max_bytes:
+            return
+        audio_path, meta_path = self._paths_for(entry.key)
+        try:
+            audio_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_audio = audio_path.with_suffix(".bin.tmp")
+            with open(tmp_audio, "wb") as f:
+                f.write(entry.audio)
+            tmp_meta = meta_path.with_suffix(".json.tmp")
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(entry.meta(), f, ensure_ascii=False)
+            # 先落元数据再落音频：读取方以 .bin 存在为准，避免读到缺元数据的条目
+            os.replace(tmp_meta, meta_path)
+            os.replace(tmp_audio, audio_path)
+        except OSError as exc:
+            logger.warning(f"Failed to persist TTS cache entry {entry.key}: {exc}")
+            return
+
+        with self._lock:
+            index = self._ensure_disk_index_locked()
+            self._disk_bytes -= index.pop(entry.key, 0)
+            index[entry.key] = entry.size
+            self._disk_bytes += entry.size
+            victims = []
+            while self._disk_bytes > self.disk_max_bytes and len(index) > 1:
+                key, size = index.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats["disk_evictions"] += 1
+                victims.append(key)
+        for key in victims:
+            for path in self._paths_for(key):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as exc:
+                    logger.warning(f"Failed to evict TTS cache file {path}: {exc}")
+
+    # ------------------------------------------------------------------ admin
+
+    def clear(self, disk: bool = False) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+            if not disk:
+                return
+            keys = list(self._ensure_disk_index_locked())
+            self._disk_index = OrderedDict()
+            self._disk_bytes = 0
+        for key in keys:
+            for path in self._paths_for(key):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"] + self.stats["coalesced"]
+            served = lookups - self.stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "persist": self.persist,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_entries": len(self._disk_index) if self._disk_index is not None else None,
+                "disk_bytes": self._disk_bytes if self._disk_index is not None else None,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+                **self.stats,
+            }
+
+
+tts_cache = TTSCache()
+
+__all__ = [
+    "TTSCache",
+    "TTSCacheEntry",
+    "etag_matches",
+    "make_etag",
+    "make_tts_cache_key",
+    "make_tts_variant_key",
+    "normalize_tts_text",
+    "tts_cache",
+]
@@ -12,9 +12,13 @@
 4. 不与 LLM Provider 耦合：TTS 的 `api_key` / `base_url` / `model_name`
    由独立环境变量驱动；`MimoTTSProvider` 仍复用 `config.llm.use_proxy`
    作为代理出口，但不读 LLM 的 `api_key`。
-5. 阻塞调用（如 `gradio_client.predict`）由 provider 内部封装好，
-   外部由 `main.py` 用 `await asyncio.to_thread(provider.synthesize, ...)`
-   包装即可，不在 provider 层引入 asyncio 依赖。
+5. 异步入口 `asynthesize`：原生异步的 provider（如 mimo，走 httpx）直接覆盖它，
+   等待上游期间不占线程；仅实现同步 `synthesize` 的 provider（如 qwen 的
+   `gradio_client.predict`）由默认实现投递到该 provider 专属的有界线程池，
+   不会耗尽事件循环的默认线程池。并发上限见 `get_max_concurrency`。
+6. 可选流式接口 `synthesize_stream`：同步生成器，逐块产出 `(audio_chunk, voice)`。
+   默认实现按句切分后逐句调用 `synthesize` 并拼成一条连续音频流（WAV 只发一次头），
+   上游支持真正分块返回的 provider 可覆盖它。
 
 关于 import 顺序
 -----------------
@@ -27,12 +31,17 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
 import inspect
+import threading
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Tuple, Type
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
 
 from openai_api_tool import OpenAIAPITool
+from tts_pipeline import AudioStitcher, split_sentences
 
 
 logger = logging.getLogger(__name__)
@@ -61,6 +70,11 @@ class TTSProviderBase(ABC):
     supports_prefetch: bool = True
     required_config_fields: Tuple[str, ...] = ()
     fixed_response_format: Optional[str] = None
+    # 未配置 `TTS_MAX_CONCURRENCY` 时该 provider 同时进行的合成上限
+    default_max_concurrency: int = 4
+
+    _executor_lock = threading.Lock()
+    _sync_executors: Dict[str, ThreadPoolExecutor] = {}
 
     @abstractmethod
     def synthesize(
@@ -80,6 +94,82 @@ class TTSProviderBase(ABC):
         """
         raise NotImplementedError
 
+    async def asynthesize(
+        self,
+        text: str,
+        voice: Optional[str] = None,
+        response_format: str = "wav",
+        style_hint: Optional[str] = None,
+    ) -> Tuple[bytes, str]:
+        """异步合成；契约与 `synthesize` 相同。
+
+        默认实现把同步 `synthesize` 投递到该 provider 专属线程池（大小等于并发上限）。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_sync_executor(),
+            functools.partial(
+                self.synthesize,
+                text,
+                voice=voice,
+                response_format=response_format,
+                style_hint=style_hint,
+            ),
+        )
+
+    @classmethod
+    def is_async_native(cls) -> bool:
+        return cls.asynthesize is not TTSProviderBase.asynthesize
+
+    @classmethod
+    def get_max_concurrency(cls, runtime_config: Optional[Any] = None) -> int:
+        """同时进行的合成上限：`config.tts.max_concurrency` > 0 时优先，否则取 provider 默认值"""
+        config = _get_config(runtime_config)
+        configured = int(getattr(config.tts, "max_concurrency", 0) or 0)
+        return max(1, configured or int(cls.default_max_concurrency or 1))
+
+    def _get_sync_executor(self) -> ThreadPoolExecutor:
+        workers = self.get_max_concurrency()
+        key = f"{self.name or type(self).__name__}:{workers}"
+        with self._executor_lock:
+            executor = self._sync_executors.get(key)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"tts-{self.name or 'provider'}")
+                TTSProviderBase._sync_executors[key] = executor
+            return executor
+
+    @classmethod
+    def shutdown_executors(cls) -> None:
+        """关闭同步 provider 的专属线程池（应用关闭时调用）"""
+        with cls._executor_lock:
+            executors = list(TTSProviderBase._sync_executors.values())
+            TTSProviderBase._sync_executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def synthesize_stream(
+        self,
+        text: str,
+        voice: Optional[str] = None,
+        response_format: str = "wav",
+        style_hint: Optional[str] = None,
+    ) -> Iterator[Tuple[bytes, str]]:
+        """流式合成；逐块产出 `(audio_chunk, resolved_voice_id)`。
+
+        所有块按顺序拼接即为一个可播放的音频流（WAV 头部长度为流式占位值）。
+        默认实现按句合成，首句完成即产出第一块；错误语义与 `synthesize` 一致。
+        """
+        sentences = split_sentences(text) or [str(text or "")]
+        stitcher = AudioStitcher(response_format)
+        for sentence in sentences:
+            audio_bytes, resolved_voice = self.synthesize(
+                sentence,
+                voice=voice,
+                response_format=response_format,
+                style_hint=style_hint,
+            )
+            yield stitcher.feed(audio_bytes), resolved_voice
+
     @classmethod
     def get_required_config_fields(cls) -> List[str]:
         return list(cls.required_config_fields)
@@ -104,6 +194,7 @@ class MimoTTSProvider(TTSProviderBase):
     name = "mimo_openai_compatible"
     supports_prefetch = True
     required_config_fields = ("api_key", "base_url", "model_name")
+    default_max_concurrency = 8
 
     def __init__(self, runtime_config: Optional[Any] = None) -> None:
         config = _get_config(runtime_config)
@@ -168,6 +259,33 @@ class MimoTTSProvider(TTSProviderBase):
 
         return bytes(audio_bytes), resolved_voice
 
+    async def asynthesize(
+        self,
+        text: str,
+        voice: Optional[str] = None,
+        response_format: str = "wav",
+        style_hint: Optional[str] = None,
+    ) -> Tuple[bytes, str]:
+        if not text or not str(text).strip():
+            raise ValueError("mimo TTS 文本不能为空")
+
+        resolved_voice = (voice or self._default_voice or "mimo_default").strip() or "mimo_default"
+        try:
+            audio_bytes = await self._client.amimo_text_to_speech_chat(
+                text=text,
+                model=self._model_name,
+                voice=resolved_voice,
+                response_format=response_format or "wav",
+                style_hint=style_hint,
+            )
+        except Exception as exc:  # pragma: no cover - 由 gateway 上游统一翻译
+            raise RuntimeError(f"mimo TTS 合成失败: {exc}") from exc
+
+        if not isinstance(audio_bytes, (bytes, bytearray)) or len(audio_bytes) == 0:
+            raise RuntimeError("mimo TTS 返回空音频")
+
+        return bytes(audio_bytes), resolved_voice
+
 
 class TTSGateway:
     """TTS provider 注册表与统一入口。
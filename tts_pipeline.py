@@ -0,0 +1,219 @@
+"""
+Labyrinthia AI - TTS 分句与音频拼接
+长旁白按句切分后逐段合成，首句就绪即可开始输出；本模块与 provider、配置无关：
+
+- split_sentences: 按中英文句末标点切分，过短的句子并入下一句；
+- run_segments_in_order: 以有界并发同时合成多个分段，按原顺序逐段产出；
+- AudioStitcher: 把逐段合成的音频拼成一条连续流。WAV 只输出一次头部
+  （流式时数据长度写 0xFFFFFFFF），后续段只追加 PCM 数据；finalize()
+  按实际长度重写头部得到完整文件。各段 fmt（声道数/采样率/位深）须与首段
+  一致，否则抛出 AudioFormatMismatch，由调用方改走整段合成。mp3 / pcm16
+  直接按字节拼接。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import struct
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+SENTENCE_PATTERN = re.compile(
+    r"[^。！？!?；;…\n]+(?:[。！？!?；;\n]+|…+|$)[”’」』）)\"']*"
+)
+DEFAULT_MIN_SENTENCE_CHARS = 8
+STREAMING_WAV_SIZE = 0xFFFFFFFF
+
+
+def split_sentences(text: str, min_chars: int = DEFAULT_MIN_SENTENCE_CHARS, max_chars: int = 0) -> List[str]:
+    """按句切分文本；短于 min_chars 的片段并入下一句，max_chars>0 时对超长句再按逗号/长度切"""
+    pieces = [match.group(0).strip() for match in SENTENCE_PATTERN.finditer(str(text or ""))]
+    sentences: List[str] = []
+    pending = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        pending = f"{pending}{piece}" if pending else piece
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences and len(pending) < min_chars:
+            sentences[-1] = f"{sentences[-1]}{pending}"
+        else:
+            sentences.append(pending)
+
+    if max_chars and max_chars > 0:
+        bounded: List[str] = []
+        for sentence in sentences:
+            bounded.extend(_split_long(sentence, max_chars))
+        sentences = bounded
+    return sentences
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    if len(sentence) <= max_chars:
+        return [sentence]
+    parts: List[str] = []
+    rest = sentence
+    while len(rest) > max_chars:
+        cut = max(rest.rfind(mark, 0, max_chars) for mark in "，,、：:")
+        cut = cut + 1 if cut >= max_chars // 2 else max_chars
+        parts.append(rest[:cut].strip())
+        rest = rest[cut:].strip()
+    if rest:
+        parts.append(rest)
+    return parts
+
+
+async def run_segments_in_order(
+    segments: Sequence[str],
+    synthesize_one: Callable[[str], Awaitable[T]],
+    concurrency: int = 2,
+) -> AsyncIterator[T]:
+    """并发合成各分段（同时最多 concurrency 个），按分段顺序产出结果
+
+    前一段未完成时后续段已在合成；任一段失败时取消其余分段并抛出该异常，
+    调用方提前停止迭代时同样取消尚未完成的分段。
+    """
+    semaphore = asyncio.Semaphore(max(1, int(concurrency or 1)))
+
+    async def _run(segment: str) -> T:
+        async with semaphore:
+            return await synthesize_one(segment)
+
+    tasks = [asyncio.create_task(_run(segment)) for segment in segments]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # 回收被取消/失败分段的异常，避免 "exception was never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ---------------------------------------------------------------------- WAV
+
+
+class AudioFormatMismatch(ValueError):
+    """分段音频的 WAV 格式与首段不一致，无法直接拼接 PCM"""
+
+
+def _wav_format_key(fmt: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """取 fmt 块中决定 PCM 布局的字段：(编码, 声道数, 采样率, 位深)"""
+    if len(fmt) < 16:
+        return None
+    audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", fmt)
+    return audio_format, channels, sample_rate, bits
+
+
+def parse_wav(audio: bytes) -> Optional[Tuple[bytes, bytes]]:
+    """解析 RIFF/WAVE，返回 (fmt 块内容, PCM 数据)；不是可识别的 WAV 时返回 None"""
+    if len(audio) < 12 or audio[:4] != b"RIFF" or audio[8:12] != b"WAVE":
+        return None
+    fmt: Optional[bytes] = None
+    offset = 12
+    while offset + 8 <= len(audio):
+        chunk_id = audio[offset:offset + 4]
+        (size,) = struct.unpack_from("<I", audio, offset + 4)
+        body_start = offset + 8
+        if chunk_id == b"fmt ":
+            fmt = audio[body_start:body_start + size]
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            # 流式 WAV 的数据长度可能是占位值，以实际剩余字节为准
+            return fmt, audio[body_start:min(len(audio), body_start + size)]
+        offset = body_start + size + (size & 1)
+    return None
+
+
+def build_wav_header(fmt: bytes, data_size: Optional[int]) -> bytes:
+    """构造 WAV 头；data_size 为 None 时写流式占位长度"""
+    if data_size is None:
+        riff_size = data_size_field = STREAMING_WAV_SIZE
+    else:
+        data_size_field = data_size
+        riff_size = min(STREAMING_WAV_SIZE, 4 + 8 + len(fmt) + 8 + data_size)
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"data" + struct.pack("<I", data_size_field)
+    )
+
+
+class AudioStitcher:
+    """逐段拼接同一格式的音频
+
+    feed() 返回本段应写入输出流的字节；finalize() 返回拼接后的完整文件
+    （WAV 时头部长度已按实际数据重写）。后续段 WAV 格式与首段不同时
+    feed() 抛出 AudioFormatMismatch。
+    """
+
+    def __init__(self, response_format: str):
+        self.response_format = str(response_format or "wav").lower()
+        self._fmt: Optional[bytes] = None
+        self._parts: List[bytes] = []
+        self._raw = self.response_format != "wav"
+
+    @property
+    def segments(self) -> int:
+        return len(self._parts)
+
+    def feed(self, audio: bytes) -> bytes:
+        if self._raw:
+            self._parts.append(audio)
+            return audio
+
+        parsed = parse_wav(audio)
+        if parsed is None:
+            if self._fmt is None:
+                # 无法识别的 WAV，退化为整段字节拼接
+                self._raw = True
+                self._parts.append(audio)
+                return audio
+            parsed = (self._fmt, audio)
+        fmt, pcm = parsed
+        if self._fmt is None:
+            self._fmt = fmt
+            self._parts.append(pcm)
+            return build_wav_header(fmt, None) + pcm
+        if fmt is not self._fmt and _wav_format_key(fmt) != _wav_format_key(self._fmt):
+            raise AudioFormatMismatch(
+                f"WAV 分段格式不一致：首段 {_wav_format_key(self._fmt)}，"
+                f"第 {len(self._parts) + 1} 段 {_wav_format_key(fmt)}"
+            )
+        self._parts.append(pcm)
+        return pcm
+
+    def finalize(self) -> bytes:
+        if self._raw or self._fmt is None:
+            return b"".join(self._parts)
+        data = b"".join(self._parts)
+        return build_wav_header(self._fmt, len(data)) + data
+
+
+def finalize_stream(audio: bytes, response_format: str) -> bytes:
+    """把流式拼接结果整理为完整文件（WAV 按实际数据长度重写头部）"""
+    if str(response_format or "").lower() != "wav":
+        return audio
+    parsed = parse_wav(audio)
+    if parsed is None:
+        return audio
+    fmt, pcm = parsed
+    return build_wav_header(fmt, len(pcm)) + pcm
+
+
+__all__ = [
+    "AudioFormatMismatch",
+    "AudioStitcher",
+    "build_wav_header",
+    "finalize_stream",
+    "parse_wav",
+    "run_segments_in_order",
+    "split_sentences",
+]
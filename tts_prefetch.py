@@ -0,0 +1,203 @@
+"""
+Labyrinthia AI - 预测式 TTS 预合成
+服务端产出叙事、事件描述、选项汇总后立即在后台合成语音并写入内容寻址缓存
+（tts_cache），前端随后请求 /api/tts/synthesize 时直接命中。
+
+预算控制：
+- 同时进行的预合成不超过 prefetch_max_concurrent，超出的直接丢弃（不排队）；
+- LLM 并发已打满时丢弃，避免与关键路径上的 LLM 请求争抢上游与带宽；
+- 已缓存 / 正在预合成的相同键不重复提交。
+
+命中统计：预合成完成的键记录在有界集合中，前端请求命中这些键时计为 prefetch hit。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# 与前端 TTSManager.normalizeText 一致：折叠空白并去掉开头的状态图标
+_LEADING_MARKERS = re.compile(r"^[✓✗○⚠️✅❌🎯📖⭐]+\s*")
+_PREFETCHED_KEY_LIMIT = 512
+
+# 预合成分类 → 控制该分类默认是否朗读的白名单字段
+CATEGORY_WHITELIST_FIELDS = {
+    "narrative": "voice_whitelist_narrative",
+    "event": "voice_whitelist_event",
+    "choice": "voice_whitelist_choice",
+}
+
+
+def normalize_client_text(text: Any) -> str:
+    """按前端朗读前的规范化规则处理文本，保证预合成与前端请求落在同一缓存键"""
+    collapsed = " ".join(str(text or "").split())
+    return _LEADING_MARKERS.sub("", collapsed).strip()
+
+
+def build_choice_summary(choice_context: Mapping[str, Any]) -> str:
+    """复刻 TTSManager.speakChoiceContext 的选项汇总文本"""
+    pieces: List[str] = []
+    if choice_context.get("title"):
+        pieces.append(str(choice_context["title"]))
+    if choice_context.get("description"):
+        pieces.append(str(choice_context["description"]))
+
+    choices = choice_context.get("choices") or []
+    available = [
+        choice for choice in choices
+        if isinstance(choice, Mapping) and choice.get("is_available") is not False
+    ][:4]
+    lines = []
+    for index, choice in enumerate(available, start=1):
+        description = choice.get("description")
+        suffix = f"，{description}" if description else ""
+        lines.append(f"{index}. {choice.get('text') or ''}{suffix}")
+    if lines:
+        pieces.append(f"可选行动：{'；'.join(lines)}")
+    return normalize_client_text("。".join(pieces))
+
+
+class TTSPrefetcher:
+    """后台 TTS 预合成调度器（在事件循环线程中使用）"""
+
+    def __init__(self):
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self._prefetched: "OrderedDict[str, None]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "skipped_cached": 0,
+            "skipped_duplicate": 0,
+            "dropped_budget": 0,
+            "dropped_llm_busy": 0,
+            "hits": 0,
+            "lookups": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(config.tts.enabled) and bool(getattr(config.tts, "prefetch_enabled", True))
+
+    @property
+    def max_concurrent(self) -> int:
+        return max(0, int(getattr(config.tts, "prefetch_max_concurrent", 2) or 0))
+
+    @property
+    def min_chars(self) -> int:
+        return max(1, int(getattr(config.tts, "prefetch_min_chars", 12) or 1))
+
+    def category_enabled(self, category: str) -> bool:
+        field_name = CATEGORY_WHITELIST_FIELDS.get(category)
+        return bool(field_name) and bool(getattr(config.tts, field_name, False))
+
+    def collect_texts(
+        self,
+        result: Mapping[str, Any],
+        events_category: Optional[str] = None,
+    ) -> List[Tuple[str, str]]:
+        """从接口结果中提取前端将会朗读的 (文本, 分类)"""
+        items: List[Tuple[str, str]] = []
+        narrative = result.get("narrative")
+        if isinstance(narrative, str):
+            items.append((normalize_client_text(narrative), "narrative"))
+        if events_category:
+            for event in result.get("events") or []:
+                if isinstance(event, str):
+                    items.append((normalize_client_text(event), events_category))
+        choice_context = result.get("pending_choice_context")
+        if isinstance(choice_context, Mapping):
+            items.append((build_choice_summary(choice_context), "choice"))
+
+        max_chars = int(getattr(config.tts, "max_text_chars", 800) or 800)
+        return [
+            (text, category)
+            for text, category in items
+            if self.min_chars <= len(text) <= max_chars and self.category_enabled(category)
+        ]
+
+    def schedule(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        is_cached: Callable[[str], bool],
+        llm_busy: bool = False,
+    ) -> bool:
+        """按预算提交一次预合成；返回是否真正提交"""
+        if key in self._inflight:
+            self.stats["skipped_duplicate"] += 1
+            return False
+        if is_cached(key):
+            self.stats["skipped_cached"] += 1
+            return False
+        if llm_busy:
+            self.stats["dropped_llm_busy"] += 1
+            return False
+        if len(self._inflight) >= self.max_concurrent:
+            self.stats["dropped_budget"] += 1
+            return False
+
+        task = asyncio.create_task(self._run(key, factory))
+        self._inflight[key] = task
+        self.stats["scheduled"] += 1
+        return True
+
+    async def _run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await factory()
+            self.stats["completed"] += 1
+            self._prefetched[key] = None
+            self._prefetched.move_to_end(key)
+            while len(self._prefetched) > _PREFETCHED_KEY_LIMIT:
+                self._prefetched.popitem(last=False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.stats["failed"] += 1
+            logger.debug("tts_prefetch_failed key=%s error=%s", key[:12], str(exc)[:200])
+        finally:
+            self._inflight.pop(key, None)
+
+    def record_lookup(self, key: str, state: str) -> None:
+        """前端请求的缓存键与状态；命中预合成结果（或加入进行中的预合成）计为 hit"""
+        self.stats["lookups"] += 1
+        if state in ("hit", "disk") and key in self._prefetched:
+            self._prefetched.pop(key, None)
+            self.stats["hits"] += 1
+        elif state == "coalesced" and key in self._inflight:
+            self.stats["hits"] += 1
+
+    def cancel_all(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+
+    def inflight_keys(self) -> Set[str]:
+        return set(self._inflight)
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"]
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "inflight": len(self._inflight),
+            "hit_rate": round(self.stats["hits"] / completed, 4) if completed else 0.0,
+            **self.stats,
+        }
+
+
+tts_prefetcher = TTSPrefetcher()
+
+__all__ = [
+    "TTSPrefetcher",
+    "build_choice_summary",
+    "normalize_client_text",
+    "tts_prefetcher",
+]
@@ -0,0 +1,197 @@
+"""
+Labyrinthia AI - TTS 音频转码
+provider 多数只产出 WAV（qwen_gradio 固定 WAV），移动网络下体积偏大。本机可用
+ffmpeg 时，按请求的 Accept 头把 WAV 转成 Opus(OGG) 或 MP3：
+
+- negotiate_format: 解析 Accept（含 q 值），只有客户端显式接受压缩格式时才转码，
+  `*/*` 或未携带 Accept 时保持源格式，老客户端行为不变；
+- TTSTranscoder: 探测编码器、以子进程方式调用 ffmpeg（stdin → stdout，不落临时文件）。
+
+转码结果由调用方以派生键（tts_cache.make_tts_variant_key）写入内容寻址缓存，
+与源音频并存；转码失败时调用方回退到源音频。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# 目标格式 → (响应 Content-Type, ffmpeg 编码参数)
+TRANSCODE_TARGETS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "opus": ("audio/ogg", ("-c:a", "libopus", "-application", "voip", "-f", "ogg")),
+    "mp3": ("audio/mpeg", ("-c:a", "libmp3lame", "-f", "mp3")),
+}
+
+# Accept 中的媒体类型 → 格式名
+MEDIA_TYPE_FORMATS: Dict[str, str] = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+}
+
+# 只转码无损源，避免 mp3 → opus 之类的二次有损
+TRANSCODABLE_SOURCES = ("wav",)
+
+
+def parse_accept(accept: Optional[str]) -> Dict[str, float]:
+    """解析 Accept 头，返回 {格式名: q}（仅统计可识别的显式音频类型，忽略通配）"""
+    preferences: Dict[str, float] = {}
+    for item in str(accept or "").split(","):
+        parts = [part.strip() for part in item.split(";")]
+        media_type = parts[0].lower()
+        format_name = MEDIA_TYPE_FORMATS.get(media_type)
+        if not format_name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = max(0.0, min(1.0, float(value)))
+                except ValueError:
+                    quality = 0.0
+        preferences[format_name] = max(preferences.get(format_name, 0.0), quality)
+    return preferences
+
+
+def negotiate_format(accept: Optional[str], source_format: str, targets: List[str]) -> Optional[str]:
+    """选择转码目标；返回 None 表示直接使用源格式
+
+    q 值最高者胜出；q 相同时压缩格式优先（按 targets 顺序），源格式垫底。
+    """
+    source = str(source_format or "").lower()
+    if source not in TRANSCODABLE_SOURCES:
+        return None
+    preferences = parse_accept(accept)
+    ranked = [
+        (preferences[name], -index, name)
+        for index, name in enumerate(targets)
+        if name != source and preferences.get(name, 0.0) > 0
+    ]
+    if not ranked:
+        return None
+    quality, _, best = max(ranked)
+    if quality < preferences.get(source, 0.0):
+        return None
+    return best
+
+
+def media_type_for(format_name: str) -> Optional[str]:
+    target = TRANSCODE_TARGETS.get(str(format_name or "").lower())
+    return target[0] if target else None
+
+
+class TTSTranscoder:
+    """基于本机 ffmpeg 的可选转码阶段"""
+
+    def __init__(self):
+        self._encoder: Optional[Tuple[str, Optional[str]]] = None
+        self.stats: Dict[str, int] = {
+            "transcoded": 0,
+            "failed": 0,
+            "source_bytes": 0,
+            "output_bytes": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(getattr(config.tts, "transcode_enabled", True))
+
+    @property
+    def targets(self) -> List[str]:
+        raw = str(getattr(config.tts, "transcode_formats", "opus,mp3") or "")
+        names = [name.strip().lower() for name in raw.split(",")]
+        return [name for index, name in enumerate(names) if name in TRANSCODE_TARGETS and name not in names[:index]]
+
+    @property
+    def bitrate_kbps(self) -> int:
+        return max(8, int(getattr(config.tts, "transcode_bitrate_kbps", 32) or 32))
+
+    @property
+    def timeout(self) -> float:
+        return max(1.0, float(getattr(config.tts, "transcode_timeout_seconds", 15.0) or 15.0))
+
+    def encoder_path(self) -> Optional[str]:
+        """按配置查找 ffmpeg 可执行文件（结果按配置值缓存）"""
+        configured = str(getattr(config.tts, "transcode_ffmpeg_path", "") or "").strip() or "ffmpeg"
+        if self._encoder is None or self._encoder[0] != configured:
+            self._encoder = (configured, shutil.which(configured))
+            if self._encoder[1] is None:
+                logger.info("TTS transcoding disabled: encoder %r not found", configured)
+        return self._encoder[1]
+
+    def available_targets(self) -> List[str]:
+        if not self.enabled or not self.targets:
+            return []
+        return self.targets if self.encoder_path() else []
+
+    def choose(self, accept: Optional[str], source_format: str) -> Optional[str]:
+        """按 Accept 选择转码目标；未启用、无编码器或客户端未要求时返回 None"""
+        targets = self.available_targets()
+        if not targets:
+            return None
+        return negotiate_format(accept, source_format, targets)
+
+    async def transcode(self, audio: bytes, target: str) -> bytes:
+        """把 WAV 音频转为 target 格式；失败抛 RuntimeError"""
+        encoder = self.encoder_path()
+        if encoder is None:
+            raise RuntimeError("TTS 转码器不可用")
+        _, codec_args = TRANSCODE_TARGETS[target]
+        process = await asyncio.create_subprocess_exec(
+            encoder, "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-i", "pipe:0", "-vn", "-ac", "1", "-b:a", f"{self.bitrate_kbps}k",
+            *codec_args, "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            output, errors = await asyncio.wait_for(process.communicate(audio), timeout=self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            self.stats["failed"] += 1
+            raise
+        if process.returncode != 0 or not output:
+            self.stats["failed"] += 1
+            message = errors.decode("utf-8", "replace").strip()[:300]
+            raise RuntimeError(f"TTS 转码失败（{target}, exit={process.returncode}）: {message}")
+
+        self.stats["transcoded"] += 1
+        self.stats["source_bytes"] += len(audio)
+        self.stats["output_bytes"] += len(output)
+        return output
+
+    def get_stats(self) -> Dict[str, Any]:
+        source_bytes = self.stats["source_bytes"]
+        return {
+            "enabled": self.enabled,
+            "encoder": self.encoder_path() if self.enabled else None,
+            "targets": self.available_targets(),
+            "bitrate_kbps": self.bitrate_kbps,
+            "compression_ratio": round(self.stats["output_bytes"] / source_bytes, 4) if source_bytes else 0.0,
+            **self.stats,
+        }
+
+
+tts_transcoder = TTSTranscoder()
+
+__all__ = [
+    "TRANSCODE_TARGETS",
+    "TTSTranscoder",
+    "media_type_for",
+    "negotiate_format",
+    "parse_accept",
+    "tts_transcoder",
+]